@@ -56,7 +56,10 @@ NOTES
 #include "systemio.h"
 #include "sigs.h"
 #include "psems.h"
+#include "seqlock.h"
 #include "usbjs.h"
+#include "hsamp.h"
+#include "zones.h"
 
 #define ANALOG		0	/* eye tracker mode flags */
 #define ISCAN		1
@@ -110,6 +113,17 @@ static int standalone = 0;
 // debug mode
 static int debug = 0;
 
+// high-rate sampling (comedi command mode, see hsamp.c)
+static int	adrate = 0;	/* --adrate: scan rate if pype doesn't set one */
+static int	ad_fd = -1;	/* comedi fd, >= 0 while streaming */
+static int	ad_nchan = 0;	/* channels per scan (0..ad_nchan-1) */
+static int	ad_lsampl = 0;	/* subdev returns lsampl_t, not sampl_t */
+static double	ad_t0;		/* timestamp of scan #0 (us) */
+static unsigned long ad_nscans;	/* scans read since start */
+static HSAMP	hs;
+static char	ad_buf[(MAXADRATE / 10) * NADC * sizeof(lsampl_t)];
+static int	ad_nbuf = 0;	/* bytes (partial scan) left in ad_buf */
+
 #define ERROR(s) perror2(s, __FILE__, __LINE__)
 
 void perror2(char *s, char *file, int line)
@@ -549,6 +563,119 @@ int ad_in(int chan)
   }
 }
 
+void ad_stream_stop()
+{
+  if (ad_fd >= 0) {
+    comedi_cancel(comedi_dev, analog_in);
+    ad_fd = -1;
+  }
+  dacq_data->ad_rate_actual = 0;
+  hsamp_init(&hs, SAMP_RATE);	/* back to one scan per tick */
+}
+
+int ad_stream_start(int rate, int nchan)
+{
+  comedi_cmd cmd;
+  static unsigned int chanlist[NADC];
+  int i;
+
+  ad_stream_stop();
+  if (nodacq || analog_in < 0 || rate <= 0) {
+    return(0);
+  }
+  if (rate > MAXADRATE) {
+    rate = MAXADRATE;
+  }
+
+  memset(&cmd, 0, sizeof(cmd));
+  if (comedi_get_cmd_generic_timed(comedi_dev, analog_in, &cmd,
+				   nchan, 1000000000 / rate) < 0) {
+    comedi_perror("comedi_get_cmd_generic_timed");
+    return(0);
+  }
+  for (i = 0; i < nchan; i++) {
+    chanlist[i] = CR_PACK(i, analog_range, AREF_GROUND);
+  }
+  cmd.chanlist = chanlist;
+  cmd.chanlist_len = nchan;
+  cmd.scan_end_arg = nchan;
+  cmd.stop_src = TRIG_NONE;	/* run until comedi_cancel() */
+  cmd.stop_arg = 0;
+
+  // first test can adjust the args (eg, rounding the timing to the
+  // board's clock); second should come back clean
+  comedi_command_test(comedi_dev, &cmd);
+  if (comedi_command_test(comedi_dev, &cmd) != 0) {
+    fprintf(stderr, "%s: can't stream a/d at %d Hz\n", progname, rate);
+    return(0);
+  }
+  if (comedi_command(comedi_dev, &cmd) < 0) {
+    comedi_perror("comedi_command");
+    return(0);
+  }
+  ad_fd = comedi_fileno(comedi_dev);
+  fcntl(ad_fd, F_SETFL, fcntl(ad_fd, F_GETFL) | O_NONBLOCK);
+  ad_lsampl = (comedi_get_subdevice_flags(comedi_dev, analog_in)
+	       & SDF_LSAMPL) != 0;
+  ad_nchan = nchan;
+  ad_nbuf = 0;
+  ad_nscans = 0;
+  ad_t0 = timestamp();
+
+  // board may not be able to hit the requested rate exactly
+  rate = (int)(0.5 + 1.0e9 / cmd.scan_begin_arg);
+  hsamp_init(&hs, rate);
+  dacq_data->ad_rate_actual = rate;
+  fprintf(stderr, "%s: streaming a/d, %d chans at %d Hz\n",
+	  progname, nchan, rate);
+  return(1);
+}
+
+int ad_stream_read(DACQCFG *cfg, int store)
+{
+  static int scans[(sizeof(ad_buf) / sizeof(sampl_t))];
+  int i, n, nsamps, nscans, ssize;
+  double t0, now;
+
+  ssize = ad_lsampl ? sizeof(lsampl_t) : sizeof(sampl_t);
+  while (ad_fd >= 0) {
+    n = read(ad_fd, ad_buf + ad_nbuf, sizeof(ad_buf) - ad_nbuf);
+    if (n <= 0) {
+      if (n < 0 && errno != EAGAIN) {
+	// usually a buffer overrun -- drop back to one read per tick
+	perror("ad_stream_read");
+	ad_stream_stop();
+	return(0);
+      }
+      break;
+    }
+    now = timestamp();
+    ad_nbuf += n;
+    nscans = ad_nbuf / (ssize * ad_nchan);
+    nsamps = nscans * ad_nchan;
+    for (i = 0; i < nsamps; i++) {
+      scans[i] = ad_lsampl ? (int)((lsampl_t *)ad_buf)[i] :
+	(int)((sampl_t *)ad_buf)[i];
+    }
+    // keep any partial scan for next time
+    ad_nbuf -= nsamps * ssize;
+    memmove(ad_buf, ad_buf + (nsamps * ssize), ad_nbuf);
+
+    if (nscans > 0) {
+      // timestamps come from the board's clock (scan count), but a
+      // scan can't arrive before it was taken, so pull t0 back if
+      // the host clock says we're running ahead of it
+      if (ad_t0 + ((ad_nscans + nscans - 1) * hs.dt) > now) {
+	ad_t0 = now - ((ad_nscans + nscans - 1) * hs.dt);
+      }
+      t0 = ad_t0 + (ad_nscans * hs.dt);
+      hsamp_block(&hs, dacq_data, cfg, scans, nscans, ad_nchan, t0, store);
+      ad_nscans += nscans;
+    }
+  }
+  return(1);
+}
+
 void dig_in()
 {
   int i, last;
@@ -557,11 +684,9 @@ void dig_in()
   if (nodacq) {
     // just lock these down -- polarities are
     // from the old taks -- hardcoded to work in NAF...
-    LOCK(semid);
     dacq_data->din[0] = 0;	/* monkey bar NOT down */
     dacq_data->din[2] = 1;	/* user button 2 NOT down */
     dacq_data->din[3] = 1;	/* user button 1 NOT down */
-    UNLOCK(semid);
   } else {
     if (use8255) {
       comedi_dio_bitfield(comedi_dev,dig_io,PCI_NOWRITEMASK,&bits);
@@ -571,19 +696,17 @@ void dig_in()
     }
     /* unpack inp word into the first 8 slots of the dacq struct's din array */
     for (i = 0; i < 4; i++) {
-      LOCK(semid);
       last = dacq_data->din[i];
       dacq_data->din[i] = ((bits & 1<<i) != 0);
       if (dacq_data->din[i] != last) {
-	dacq_data->din_changes[i] += 1;
-	if (dacq_data->din_intmask[i]) {
-	  dacq_data->int_class = INT_DIN;
+	ATOMIC_ADD(dacq_data->din_changes[i], 1);
+	if (XCHG(dacq_data->din_intmask[i], 0)) {
+	  /* ints must be re-enabled */
 	  dacq_data->int_arg = i;
-	  dacq_data->din_intmask[i] = 0; /* ints must be re-enabled */
+	  dacq_data->int_class = INT_DIN;
 	  kill(pypepid, SIGUSR1);
 	}
       }
-      UNLOCK(semid);
     }
   }
 }
@@ -597,9 +720,7 @@ void dig_out()
     return;
   } else {
     for (i = 0; i < 8 && i < NDIGOUT; i++) {
-      LOCK(semid);
       bits = bits | (dacq_data->dout[i] << i);
-      UNLOCK(semid);
     }
     if (use8255) {
       bits = bits<<BANK_B;
@@ -682,7 +803,7 @@ void iscan_init(char *dev)
 #endif
 }
 
-#define A(r,c) (dacq_data->eye_affine[(r)-1][(c)-1])
+#define A(r,c) (cfg.eye_affine[(r)-1][(c)-1])
 
 void mainloop(void)
 {
@@ -699,6 +820,10 @@ void mainloop(void)
   unsigned long msts, last_parent_check = 0;
   int ncores;
   pid_t pypeid;
+  DACQCFG cfg;
+  unsigned int cfglast = 1;
+  int xx, xy, xpa, xlast;
+  int rate, ad_rate_cur = -1;
 
   x = y = pa = -1.0;
   eyenew = sumx = sumy = 0;
@@ -708,9 +833,14 @@ void mainloop(void)
   }
   si = 0;
 
-  LOCK(semid);
+  // get initial config from pype (this is the only time we ever wait)
+  while (! seq_cfg_read(dacq_data, &cfg, &cfglast)) {
+    usleep(100);
+  }
+  xx = xy = xpa = 0;
+  xlast = dacq_data->xnew;
+
   k = dacq_data->dacq_pri;
-  UNLOCK(semid);
 
   lastpri = dosetpri = 0;
   if (geteuid() == 0) {
@@ -748,27 +878,33 @@ void mainloop(void)
   fprintf(stderr, "%s: %.1f kHz sampling\n", progname, SAMP_RATE / 1000.0);
 
   /* signal client we're ready */
-  LOCK(semid);
-  dacq_data->servers_avail += 1;
   pypeid = dacq_data->pype_pid;
-  UNLOCK(semid);
+  ATOMIC_ADD(dacq_data->servers_avail, 1);
   fprintf(stderr, "%s: ready\n", progname);
 
 
   /* this is the sampling main loop */
 
   do {
-    LOCK(semid);
-    if (dacq_data->clock_reset) {
+    if (XCHG(dacq_data->clock_reset, 0)) {
       // this is basically a one-shot; client sets clock_reset to
       // force clock reset on next iteration through mainloop
-      UNLOCK(semid);
       dacq_data->ts0 = timestamp() / 1.0e6; /* secs */
-      dacq_data->clock_reset = 0;
-      LOCK(semid);
       last_usts = -1.0;
     }
-    UNLOCK(semid);
+
+    // pending requests from pype and config changes -- do these
+    // before waiting for the next sample period
+    seq_server_requests(dacq_data);
+    seq_cfg_read(dacq_data, &cfg, &cfglast);
+
+    // (re)start a/d streaming if the scan rate's changed; 0 means
+    // go back to reading each channel once per tick with ad_in()
+    rate = (cfg.ad_rate > 0) ? cfg.ad_rate : adrate;
+    if (rate != ad_rate_cur) {
+      ad_rate_cur = rate;
+      ad_stream_start(rate, lastadc_chan + 1);
+    }
 
     // throttle sampling down to specificed sampling rate by
     // waiting until the next sample period in a tight loop
@@ -790,9 +926,17 @@ void mainloop(void)
       last_parent_check = msts;
     }
     
-    for (i=firstadc_chan; i<=lastadc_chan; i++) {
-      // sample all (in-use) converters fast as possible
-      dacq_data->adc[i] = ad_in(i);
+    if (ad_fd >= 0) {
+      // streaming: all channels (incl 0,1 -- tracker data overwrites
+      // them below); adc[] gets the most recent scan
+      ad_stream_read(&cfg, dacq_data->adbuf_on);
+    } else {
+      for (i=firstadc_chan; i<=lastadc_chan; i++) {
+	// sample all (in-use) converters fast as possible
+	dacq_data->adc[i] = ad_in(i);
+      }
+      // ttl edges at tick resolution
+      hsamp_tick(&hs, dacq_data, &cfg, usts);
     }
     if (itracker == ISCAN) {	// maybe read iscan from serial port..
       while (iscan_read()) {
@@ -803,9 +947,7 @@ void mainloop(void)
     if (usbjs_dev > 0) {	// joystick, only if enabled
       if (usbjs_query(usbjs_dev, &jsbut, &jsnum, &jsval, &jstime)) {
 	if (jsbut && jsnum < NJOYBUT) {
-	  LOCK(semid);
 	  dacq_data->js[jsnum] = jsval; // button # jsnum: up or down?
-	  UNLOCK(semid);
 	} else if (jsbut == 0 && jsnum == 0) {
 	  dacq_data->js_x = jsval; // x motion; jsval=current position */
 	} else if (jsbut == 0 && jsnum == 1) {
@@ -815,8 +957,7 @@ void mainloop(void)
     }
 
     // try to reconnect to eyelink
-    if (dacq_data->elrestart) {
-      dacq_data->elrestart = 0;
+    if (XCHG(dacq_data->elrestart, 0)) {
       // only allow resets if initial connection was eyelink and
       // no longer currently connected (analog fallback mode)
       if (port != NULL && itracker == NONE) {
@@ -859,11 +1000,12 @@ void mainloop(void)
 	 * In general, this means something running in a thread in the
 	 * parent process.. mouse, usb tracker etc..
 	 */
-	dacq_data->adc[0] = x = dacq_data->xx;
-	dacq_data->adc[1] = y = dacq_data->xy;
-	pa = dacq_data->xpa;
-	eyenew = dacq_data->xnew;
-	dacq_data->xnew = 0;
+	if ((eyenew = seq_xtracker(dacq_data, &xx, &xy, &xpa, &xlast)) < 0) {
+	  eyenew = 0;		/* pype's mid-update, use last sample */
+	}
+	dacq_data->adc[0] = x = xx;
+	dacq_data->adc[1] = y = xy;
+	pa = xpa;
 	break;
       }
 
@@ -893,24 +1035,22 @@ void mainloop(void)
       rx = (x * A(1,1)) + (y * A(2,1)) + (1.0 * A(3,1));
       ry = (x * A(1,2)) + (y * A(2,2)) + (1.0 * A(3,2));
 
-      LOCK(semid);
-
       // 2nd: apply gain/offset
-      x = (dacq_data->eye_xgain * rx) + dacq_data->eye_xoff;
-      y = (dacq_data->eye_ygain * ry) + dacq_data->eye_yoff;
+      x = (cfg.eye_xgain * rx) + cfg.eye_xoff;
+      y = (cfg.eye_ygain * ry) + cfg.eye_yoff;
 
       // 3rd: apply supplemental rotation for ACM..
-      if (dacq_data->eye_rot != 0) {
+      if (cfg.eye_rot != 0) {
 	float r,th;
 	r = hypot(x, y);
-	th = atan2(y, x) - (M_PI * dacq_data->eye_rot / 180.);
+	th = atan2(y, x) - (M_PI * cfg.eye_rot / 180.);
 	x = r * cos(th);
 	y = r * sin(th);
       }
-    } else {
-      // pass through iscan out of bounds signal unchanged..
-      LOCK(semid);
     }
+    // (otherwise, pass through iscan out of bounds signal unchanged..)
+
+    SEQ_WRITE_BEGIN(dacq_data->seq);
 
     // stash these before they get changed..
     dacq_data->eye_rawx = F2I(x);
@@ -918,7 +1058,7 @@ void mainloop(void)
 
     rx = x;
     ry = y;
-    if ((sumn = dacq_data->eye_smooth) > MAXSMOOTH) {
+    if ((sumn = cfg.eye_smooth) > MAXSMOOTH) {
       sumn = MAXSMOOTH;
     }
 
@@ -928,7 +1068,6 @@ void mainloop(void)
 	  (itracker != ISCAN || x != ISCAN_NODATA || y != ISCAN_NODATA)) {
 	// if eye data is new and not out of bounds, then include it in
 	// the smoothing buffer and generate the next smoothed point.
-	UNLOCK(semid);
 	sumx += -sbx[si] + x;	/* pop */
 	sumy += -sby[si] + y;
 	sbx[si] = x;		/* push */
@@ -936,7 +1075,6 @@ void mainloop(void)
 	si = (si + 1) % sumn;	/* advance pointer */
 	lsx = x = sumx / sumn;		/* compute smoothed mean */
 	lsy = y = sumy / sumn;
-	LOCK(semid);
       } else {
 	// Otherwise, just use the last smooth value available.
       	x = lsx; y = lsy;
@@ -947,7 +1085,7 @@ void mainloop(void)
     dacq_data->eye_x = F2I(x);
     dacq_data->eye_y = F2I(y);
     dacq_data->eye_pa = pa;
-    UNLOCK(semid);
+    SEQ_WRITE_END(dacq_data->seq);
     
     /* read digital input lines */
     if (usbjs_dev >= 0) {
@@ -955,27 +1093,24 @@ void mainloop(void)
        * Make joystick button 1 acts as bar (DIN#0); other buttons should
        * be read using dacq_jsbut() API function.
        */
-      LOCK(semid);
       last = dacq_data->din[0];
       dacq_data->din[0] = dacq_data->js[0];
       if (dacq_data->din[0] != last) {
-	dacq_data->din_changes[0] += 1;
-	if (dacq_data->din_intmask[0]) {
-	  dacq_data->int_class = INT_DIN;
+	ATOMIC_ADD(dacq_data->din_changes[0], 1);
+	if (XCHG(dacq_data->din_intmask[0], 0)) {
+	  /* ints must be re-enabled */
 	  dacq_data->int_arg = 0;
-	  dacq_data->din_intmask[0] = 0; /* ints must be re-enabled */
+	  dacq_data->int_class = INT_DIN;
 	  kill(pypepid, SIGUSR1);
 	}
       }
-      UNLOCK(semid);
 
       /* other buttons generate ints only if joyint is set: */
       for (button = 1; dacq_data->joyint && button < NJOYBUT; button++) {
-	if (dacq_data->js[button]) {
-	  dacq_data->joyint = 0;		/* force manual reset! */
-	  dacq_data->int_class = INT_JOYBUT;
+	if (dacq_data->js[button] && XCHG(dacq_data->joyint, 0)) {
+	  /* force manual reset! */
 	  dacq_data->int_arg = button;
-	  dacq_data->joyint = 0;	      /* ints must be re-enabled */
+	  dacq_data->int_class = INT_JOYBUT;
 	  kill(pypepid, SIGUSR1);
 	}
       }
@@ -985,36 +1120,36 @@ void mainloop(void)
     }
 
     /* set digital output lines, only if the strobe's been set */
-    LOCK(semid);
-    k = dacq_data->dout_strobe;
-    UNLOCK(semid);
-    if (k) {
+    if (dacq_data->dout_strobe) {
+      SEQ_BARRIER();		/* pype sets dout[] before the strobe */
       dig_out();
       /* reset the strobe (as if it were a latch */
-      LOCK(semid);
+      SEQ_BARRIER();
       dacq_data->dout_strobe = 0;
-      UNLOCK(semid);
     }
 
-    LOCK(semid);
+    SEQ_WRITE_BEGIN(dacq_data->seq);
     dacq_data->timestamp = msts; /* in 'ms' (for backwards compat) */
     dacq_data->usts = usts;	 /* us */
+    SEQ_WRITE_END(dacq_data->seq);
 
     /* check alarm status */
-    if (dacq_data->alarm_time && 
-	(dacq_data->timestamp >= dacq_data->alarm_time)) {
+    k = dacq_data->alarm_time;
+    if (k && msts >= k && CAS(dacq_data->alarm_time, k, 0)) {
       // alarm set and expired -- clear and send interupt to pype
-      dacq_data->alarm_time = 0;
-      dacq_data->int_class = INT_ALARM;
       dacq_data->int_arg = 0;
+      dacq_data->int_class = INT_ALARM;
       kill(pypepid, SIGUSR1);
     }
-    k = dacq_data->adbuf_on;
-    UNLOCK(semid);
 
-    if (k) {
-      LOCK(semid);
-      k = dacq_data->adbuf_ptr;
+    if (dacq_data->adbuf_on) {
+      // a/d buffers are a ring -- pype drains samples out as they
+      // come in (adbuf_tail), so we only lose data (and flag the
+      // overflow) if it falls a whole buffer behind
+      if (dacq_data->adbuf_head - dacq_data->adbuf_tail >= ADBUFLEN) {
+	dacq_data->adbuf_overflow++;
+      }
+      k = dacq_data->adbuf_head % ADBUFLEN;
       dacq_data->adbuf_t[k] = usts;
       dacq_data->adbuf_x[k] = rx; /* raw (unsmoothed) x pos */
       dacq_data->adbuf_y[k] = ry; /* raw (unsmoothed) y pos */
@@ -1026,30 +1161,23 @@ void mainloop(void)
       for (ii=0; ii <= lastadc_chan; ii++) {
 	dacq_data->adbufs[ii][k] = dacq_data->adc[ii];
       }
-      if (++dacq_data->adbuf_ptr > ADBUFLEN) {
-	dacq_data->adbuf_overflow++;
-	dacq_data->adbuf_ptr = 0;
-      }
-      UNLOCK(semid);
+      // publish sample -- everything below adbuf_head is valid
+      SEQ_BARRIER();
+      dacq_data->adbuf_head += 1;
     }
 
     /* check fixwins for in/out events */
     for (i = 0; i < NFIXWIN; i++) {
-      LOCK(semid);
-      k = dacq_data->fixwin[i].active;
-      UNLOCK(semid);
-      if (k) {
+      if (cfg.fixwin[i].active) {
 	float dx, dy;
-	LOCK(semid);
-	dx = dacq_data->eye_x - dacq_data->fixwin[i].cx;
-	dy = (dacq_data->eye_y - dacq_data->fixwin[i].cy) /
-	  dacq_data->fixwin[i].vbias;
-	UNLOCK(semid);
+	dx = dacq_data->eye_x - cfg.fixwin[i].cx;
+	dy = (dacq_data->eye_y - cfg.fixwin[i].cy) / cfg.fixwin[i].vbias;
 	
 	z = (dx * dx) + (dy * dy);
 	
-	LOCK(semid);
-	if (z < dacq_data->fixwin[i].rad2) {
+	k = 0;
+	SEQ_WRITE_BEGIN(dacq_data->seq);
+	if (z < cfg.fixwin[i].rad2) {
 	  // eye in fixwin -- stop counting transient breaks
 	  dacq_data->fixwin[i].state = INSIDE;
 	  dacq_data->fixwin[i].fcount = 0;
@@ -1065,33 +1193,37 @@ void mainloop(void)
 	  if (dacq_data->fixwin[i].fcount) {
 	    dacq_data->fixwin[i].nout += 1;
 	    if (dacq_data->fixwin[i].nout >
-		(dacq_data->fixbreak_tau_ms * SAMP_RATE / 1000)) {
+		(cfg.fixbreak_tau_ms * SAMP_RATE / 1000)) {
 	      // # ms outside exceeds fixbreak_tau_ms --> real fixbreak!
 	      if (dacq_data->fixwin[i].broke == 0) {
 		// save break time
 		dacq_data->fixwin[i].break_time =  dacq_data->timestamp;
 	      }
 	      dacq_data->fixwin[i].broke = 1;
-	      if (dacq_data->fixwin[i].genint) {
-		// alert parent process
-		dacq_data->int_class = INT_FIXWIN;
-		dacq_data->int_arg = 0;
-		dacq_data->fixwin[i].genint = 0; /* must be re-enabled */
-		kill(pypepid, SIGUSR1);
-		//fprintf(stderr,"das: sent int, disabled\n");
-	      }
+	      // alert parent process (once SEQ_WRITE_END'd)
+	      k = XCHG(dacq_data->fixwin[i].genint, 0); /* must be re-enabled */
 	    }
 	  }
 	}
-	UNLOCK(semid);
+	SEQ_WRITE_END(dacq_data->seq);
+	if (k) {
+	  dacq_data->int_arg = 0;
+	  dacq_data->int_class = INT_FIXWIN;
+	  kill(pypepid, SIGUSR1);
+	}
       }
     }
 
+    /* landing zones (see zones.c) */
+    if ((k = zones_tick(dacq_data, &cfg, usts, &ii)) >= 0) {
+      dacq_data->int_arg = k | (ii << 8);
+      dacq_data->int_class = INT_ZONE;
+      kill(pypepid, SIGUSR1);
+    }
+
     /* if doing priority changes (root access etc)..*/
     if (dosetpri) {
-      LOCK(semid);
       k = dacq_data->dacq_pri;
-      UNLOCK(semid);
       /* and requested dacq_pri has changed.... */
       if (lastpri != k) {
 	errno = 0;
@@ -1106,10 +1238,10 @@ void mainloop(void)
 	}
       }
     }
-    LOCK(semid);
-    k = dacq_data->terminate;
-    UNLOCK(semid);
-  } while (! k);
+
+    /* loop latency (us) -- sample time to end of loop */
+    seq_looplat(dacq_data, timestamp() - usts);
+  } while (! dacq_data->terminate);
 
   fprintf(stderr, "%s: terminate signal received\n", progname);
   iscan_halt();
@@ -1118,10 +1250,10 @@ void mainloop(void)
     usbjs_close(usbjs_dev);
   }
 
+  ad_stream_stop();
+
   /* no longer ready */
-  LOCK(semid);
-  dacq_data->servers_avail -= 1;
-  UNLOCK(semid);
+  ATOMIC_ADD(dacq_data->servers_avail, -1);
 }
 
 int main(int ac, char **av)
@@ -1139,6 +1271,7 @@ int main(int ac, char **av)
       {"usbjs",   optional_argument, 0, 'j'}, /* dev file for usbjs */
       {"swapxy",  optional_argument, 0, 's'}, /* swap xy channels? */
       {"arange",  optional_argument, 0, 'a'}, /* set dacq analog range */
+      {"adrate",  optional_argument, 0, 'r'}, /* a/d scan rate (Hz) */
       {"standalone",  no_argument,   0, 'x'}, /* standalone mode */
       {"debug",   no_argument,       0, 'd'}, /* debug mode */
       {0, 0, 0, 0}
@@ -1154,7 +1287,7 @@ int main(int ac, char **av)
 	  progname);
   fprintf(stderr, "%s: pid=%d\n", progname, getpid());
 
-  while ((c = getopt_long(ac, av, "t:p:e:c:j:s:a:d:",
+  while ((c = getopt_long(ac, av, "t:p:e:c:j:s:a:r:d:",
 			  long_options, &option_index)) != -1) {
     switch (c)
       {
@@ -1198,6 +1331,11 @@ int main(int ac, char **av)
 	  arange = f;
 	}
 	break;
+      case 'r':
+	if (sscanf(optarg, "%d", &i) == 1) {
+	  adrate = i;
+	}
+	break;
       default:
 	abort();
       }
@@ -1229,9 +1367,7 @@ int main(int ac, char **av)
       fprintf(stderr, "%s: can't open joystick %s\n", progname, usbjs);
     } else {
       fprintf(stderr, "%s: joystick at %s configured\n", progname, usbjs);
-      LOCK(semid);
       dacq_data->js_enabled = 1;
-      UNLOCK(semid);
     }
   }
 
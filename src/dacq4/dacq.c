@@ -2,6 +2,43 @@
 ** author:  jamie mazer
 ** created: Thu Dec 10 21:12:55 1998 mazer 
 ** info:    python bindings to talk to "das_server"
+** history:
+**
+** Sun Oct 18 16:02:37 2026 mazer
+**   no more LOCK()/UNLOCK() -- everything goes through the lock-free
+**   protocol in seqlock.h. Config changes (calibration, smoothing,
+**   fixwin geometry) are published under cfgseq, server state is
+**   read under seq and resets of server-owned state are requests
+**   the server acks at the next sample. Added dacq_looplat() and
+**   dacq_looplat_reset() to get at the server's loop latency histogram.
+**
+** Sun Oct 18 17:05:48 2026 mazer
+**   a/d buffers are a ring (see dacqinfo.h). dacq_adbuf_size() is
+**   the number of samples since the last clear (can be > ADBUFLEN),
+**   the per-sample getters wrap and dacq_adbuf_tail() tells the
+**   server how far pype's drained. dacq_adbuf_clear() doesn't zero
+**   the buffers anymore -- nothing past adbuf_head is ever read.
+**
+** Sun Oct 18 18:10:26 2026 mazer
+**   high-rate sampling: dacq_ad_rate(), dacq_hs_decim() and dacq_ttl()
+**   configure it; dacq_hs_size()/dacq_hs_tail()/dacq_hs_addr() get at
+**   the per-channel rings the same way the dacq_adbuf_xxx() calls do.
+**
+** Sun Oct 18 19:02:11 2026 mazer
+**   dacq_ttl_head(), dacq_ttl_t(), dacq_ttl_chan() and dacq_ttl_addr()
+**   for reading the ttl event ring.
+**
+** Sun Oct 18 20:31:07 2026 mazer
+**   dacq_zone_xxx() calls for the server-side landing zones (see
+**   zones.c) and their event ring.
+**
+** Sun Oct 18 21:14:52 2026 mazer
+**   dacq_request() gives up after REQ_TIMEOUT_US (50ms) of wall clock
+**   time instead of 1000 usleep()s (which could run well over 1s).
+**
+** Sun Oct 18 22:03:40 2026 mazer
+**   dacq_zone_state() bit 2 is the zone's sticky broke flag (set on
+**   exit, cleared by reset); dacq_zone() rejects vbias <= 0.
 */
 
 #include <sys/types.h>
@@ -29,6 +66,7 @@
 #include "dacqinfo.h"
 #include "psems.h"
 #include "dacq.h"
+#include "seqlock.h"
 
 
 static DACQINFO *dacq_data = NULL;
@@ -43,9 +81,7 @@ static void dacq_sigchld_handler(int signum)
    * that seems to cause problems.. so we'll stick with the old logic..
    */
 
-  LOCK(semid);
   tflag = dacq_data->terminate;
-  UNLOCK(semid);
 
   if ((e = kill(server_pid, 0)) < 0) {
     if (errno == ESRCH && tflag) {
@@ -102,7 +138,17 @@ static void shm_init(void)
   for (i = 0; i < NFIXWIN; i++) {
     dacq_data->fixwin[i].active = 0;
     dacq_data->fixwin[i].genint = 0;
+    dacq_data->fixwin[i].reset_req = dacq_data->fixwin[i].reset_ack = 0;
+    dacq_data->fixwin[i].clear_req = dacq_data->fixwin[i].clear_ack = 0;
   }
+
+  for (i = 0; i < NZONES; i++) {
+    dacq_data->zone[i].shape = ZONE_OFF;
+    dacq_data->zone[i].genint = 0;
+    dacq_data->zone[i].reset_req = dacq_data->zone[i].reset_ack = 0;
+    seq_zone_clear(&dacq_data->zone[i]);
+  }
+  dacq_data->zone_ev_head = 0;
   
   for (i = 0; i < NJOYBUT; i++) {
     dacq_data->js[i] = 0;
@@ -112,8 +158,22 @@ static void shm_init(void)
   dacq_data->js_enabled = 0;
   
   dacq_data->adbuf_on = 0;
-  dacq_data->adbuf_ptr = 0;
+  dacq_data->adbuf_head = 0;
+  dacq_data->adbuf_tail = 0;
   dacq_data->adbuf_overflow = 0;
+  dacq_data->adbuf_clear_req = dacq_data->adbuf_clear_ack = 0;
+
+  dacq_data->ad_rate = 0;
+  dacq_data->ad_rate_actual = 0;
+  for (i = 0; i < NADC; i++) {
+    dacq_data->hs_decim[i] = 0;
+    dacq_data->ttl_mode[i] = TTL_OFF;
+    dacq_data->ttl_thresh[i] = 0;
+    dacq_data->hs_head[i] = 0;
+    dacq_data->hs_tail[i] = 0;
+  }
+  dacq_data->ttl_head = 0;
+
   for (i = 0; i < ADBUFLEN; i++) {
     dacq_data->adbuf_t[i] = 0.0;
     dacq_data->adbuf_x[i] = 0;
@@ -146,9 +206,67 @@ static void shm_init(void)
 
   dacq_data->clock_reset = 0;
 
+  dacq_data->xnew = 0;
+
+  /* even == nothing in progress */
+  dacq_data->seq = 0;
+  dacq_data->cfgseq = 0;
+  dacq_data->xseq = 0;
+
+  memset(dacq_data->looplat, 0, sizeof(dacq_data->looplat));
+  dacq_data->looplat_max = 0;
+  dacq_data->looplat_late = 0;
+  dacq_data->looplat_req = dacq_data->looplat_ack = 0;
+
   dacq_data->pype_pid = getpid();
 }
 
+/*
+ * Longest dacq_request() waits for the server's ack (us). The server
+ * acks at its next sample (<1ms at SAMP_RATE), so this is only hit if
+ * it's hung, stopped or gone -- in which case the caller goes ahead
+ * and does the reset itself, rather than holding up pype.
+ */
+#define REQ_TIMEOUT_US	50000
+#define REQ_POLL_US	100
+
+static double req_clock(void)	/* us, CLOCK_MONOTONIC */
+{
+  struct timespec t;
+
+  clock_gettime(CLOCK_MONOTONIC, &t);
+  return((1.0e6 * (double)t.tv_sec) + (1.0e-3 * (double)t.tv_nsec));
+}
+
+/*
+ * Ask the server to reset some server-owned state (see
+ * seq_server_requests) and wait (at most REQ_TIMEOUT_US) for it to
+ * happen. Returns 0 if there's no server running or it didn't ack in
+ * time, in which case the caller should just do the reset itself.
+ */
+static int dacq_request(volatile unsigned int *req, volatile unsigned int *ack)
+{
+  unsigned int r;
+  double deadline;
+  struct timespec poll = { 0, REQ_POLL_US * 1000 };
+
+  if (dacq_data->servers_avail <= 0) {
+    return(0);
+  }
+  r = __sync_add_and_fetch(req, 1);
+  deadline = req_clock() + REQ_TIMEOUT_US;
+  while (*ack != r) {
+    if (req_clock() > deadline) {
+      fprintf(stderr, "dacq: server didn't ack request in %dms\n",
+	      REQ_TIMEOUT_US / 1000);
+      return(0);
+    }
+    nanosleep(&poll, NULL);
+  }
+  SEQ_BARRIER();
+  return(1);
+}
+
 
 int dacq_start(char *server, char *tracker, char *port, char *elopt,
 	       char *elcam, char *swapxy, char *usbjs, int force)
@@ -201,6 +319,9 @@ int dacq_start(char *server, char *tracker, char *port, char *elopt,
   // will block at the first LOCK() if pype is not running.
   //
   // That's correct/fine -- unless you're trying to debug...
+  //
+  // After that handshake the semaphore's not used anymore, see
+  // seqlock.h.
 
   if ((semid = psem_init(SEMKEY)) < 0) {
     perror("psem_init");
@@ -224,9 +345,7 @@ int dacq_start(char *server, char *tracker, char *port, char *elopt,
   } else {
     /* parent waits for server to become ready */
     do {
-      LOCK(semid);
       i = dacq_data->servers_avail;
-      UNLOCK(semid);
       usleep(1000);
     } while (i == 0);
   }
@@ -240,9 +359,7 @@ void dacq_stop(void)
   if (server_pid >= 0) {
     fprintf(stderr, "dacq_stop: waiting for server (pid=%d) shutdown.\n",
 	    server_pid);
-    LOCK(semid);
     dacq_data->terminate = 1;
-    UNLOCK(semid);
     waitpid(server_pid, &status, 0);
     fprintf(stderr, "dacq_stop: server has terminated.\n");
   }
@@ -252,10 +369,10 @@ int dacq_release(void)
 {
   /* release semaphore if we own it -- this is for inside
   ** interupt handlers only!!
+  **
+  ** pype never holds the semaphore anymore (see seqlock.h), so
+  ** there's nothing to release; kept for compatibility.
   */
-  if ((semid)>=0) {
-    return(psem_incr_mine(semid));
-  }
   return(1);
 }
 
@@ -263,7 +380,6 @@ static int dacq_dig_in(int n)
 {
   int i;
 
-  LOCK(semid);
 #ifdef BUT_TEST
   fprintf(stderr, "%d: ", n);
   for (i=0; i < 4; i++) {
@@ -272,47 +388,42 @@ static int dacq_dig_in(int n)
   fprintf(stderr, "\n");
 #endif
   i = dacq_data->din[n];
-  UNLOCK(semid);
 
   return(i);
 }
 
 void dacq_dig_out(int n, int val)
 {
-  int i;
-  /* wait for strobe to be clear */
-  do {
-    LOCK(semid);
-    i = dacq_data->dout_strobe;
-    UNLOCK(semid);
+  /* wait for strobe to be clear (server's done with dout[]) */
+  while (dacq_data->dout_strobe) {
     usleep(100);
-  } while (i);
+  }
+  SEQ_BARRIER();
 
-  LOCK(semid);  
   dacq_data->dout[n] = val ? 1 : 0;
 
   /* signal server digital output pending */
+  SEQ_BARRIER();
   dacq_data->dout_strobe = 1;
-  UNLOCK(semid);  
 }
 
 int dacq_eye_params(double xgain, double ygain, int xoff, int yoff, double rot)
 {
-  LOCK(semid);
+  SEQ_WRITE_BEGIN(dacq_data->cfgseq);
   dacq_data->eye_xgain = xgain;
   dacq_data->eye_ygain = ygain;
   dacq_data->eye_xoff = xoff;
   dacq_data->eye_yoff = yoff;
   dacq_data->eye_rot = rot;
-  UNLOCK(semid);
+  SEQ_WRITE_END(dacq_data->cfgseq);
   return(1);
 }
 
 int dacq_eye_setaffine_coef(int r, int c, double val)
 {
-  LOCK(semid);
+  SEQ_WRITE_BEGIN(dacq_data->cfgseq);
   dacq_data->eye_affine[r][c] = val;
-  UNLOCK(semid);
+  SEQ_WRITE_END(dacq_data->cfgseq);
   return(1);
 }
 
@@ -320,63 +431,72 @@ double dacq_eye_getaffine_coef(int r, int c)
 {
   double f;
 
-  LOCK(semid);
   f = dacq_data->eye_affine[r][c];
-  UNLOCK(semid);
   return(f);
 }
 
 int dacq_eye_read(int which)
 {
   int i;
+  unsigned int q;
 
-  LOCK(semid);
-  switch (which)
-    {
-    case 1:
-      i = dacq_data->eye_x;
-      break;
-    case 2:
-      i = dacq_data->eye_y;
-      break;
-    case -1:
-      i = dacq_data->eye_rawx;
-      break;
-    case -2:
-      i = dacq_data->eye_rawy;
-      break;
-    default:
-      i = 0;
-      break;
-  }
-  UNLOCK(semid);
+  do {
+    q = seq_read_begin(&dacq_data->seq);
+    switch (which)
+      {
+      case 1:
+	i = dacq_data->eye_x;
+	break;
+      case 2:
+	i = dacq_data->eye_y;
+	break;
+      case -1:
+	i = dacq_data->eye_rawx;
+	break;
+      case -2:
+	i = dacq_data->eye_rawy;
+	break;
+      default:
+	i = 0;
+	break;
+      }
+  } while (seq_read_retry(&dacq_data->seq, q));
   return(i);
 }
 
 unsigned long dacq_ts(void)	/* this is timestamp to nearest MS */
 {
   unsigned long i;
-  LOCK(semid);
-  i = dacq_data->timestamp;
-  UNLOCK(semid);
+  unsigned int q;
+
+  do {
+    q = seq_read_begin(&dacq_data->seq);
+    i = dacq_data->timestamp;
+  } while (seq_read_retry(&dacq_data->seq, q));
   return(i);
 }
 
 double dacq_usts(void)		/* us timestamp as double */
 {
   double f;
-  LOCK(semid);
-  f = dacq_data->usts;
-  UNLOCK(semid);
+  unsigned int q;
+
+  do {
+    q = seq_read_begin(&dacq_data->seq);
+    f = dacq_data->usts;
+  } while (seq_read_retry(&dacq_data->seq, q));
   return(f);
 }
 
 double dacq_ts0(void)		/* retrieve raw timestamp 0-basis */
 {
   double f;
-  LOCK(semid);
-  f = dacq_data->ts0;		/* ts0 is time  comedi server */
-  UNLOCK(semid);		/* was initialized */
+  unsigned int q;
+
+  do {
+    q = seq_read_begin(&dacq_data->seq);
+    f = dacq_data->ts0;		/* ts0 is time  comedi server */
+  } while (seq_read_retry(&dacq_data->seq, q)); /* was initialized */
   return(f);
 }
 
@@ -393,37 +513,22 @@ int dacq_bar(void)
 // dacq_bar_genint(0/1): disable/enable bar-generated interupts
 int dacq_bar_genint(int b)
 {
-  int i;
-
-  //LOCK(semid);
-  i = dacq_data->din_intmask[0];
-  dacq_data->din_intmask[0] = b;
-  //LOCK(semid);
-  return(i);
+  return(XCHG(dacq_data->din_intmask[0], b));
 }
 
 // dacq_joy_genint(0/1): disable/enable joystick-generated interupts
 int dacq_joy_genint(int b)
 {
-  int i;
-
-  //LOCK(semid);
-  i = dacq_data->joyint;
-  dacq_data->joyint = b;
-  //LOCK(semid);
-  return(i);
+  return(XCHG(dacq_data->joyint, b));
 }
 
 int dacq_bar_transitions(int reset)
 {
-  int i;
-  LOCK(semid);
-  i = dacq_data->din_changes[0];
   if (reset) {
-    dacq_data->din_changes[0] = 0;
+    return(XCHG(dacq_data->din_changes[0], 0));
+  } else {
+    return(dacq_data->din_changes[0]);
   }
-  UNLOCK(semid);
-  return(i);
 }
 
 void dacq_juice(int on)
@@ -445,14 +550,10 @@ int dacq_juice_drip(int ms)
   unsigned long endat;
 
   dacq_juice(1);
-  LOCK(semid);
-  endat = dacq_data->timestamp + ms;
-  while (dacq_data->timestamp <= endat) {
-    UNLOCK(semid);
+  endat = dacq_ts() + ms;
+  while (dacq_ts() <= endat) {
     usleep(1000);
-    LOCK(semid);
   }
-  UNLOCK(semid);
   dacq_juice(0);
   return(1);
 }
@@ -463,53 +564,68 @@ void dacq_fixbreak_tau_ms(int nms)
    * set time period (in ms) the eye must be outside the fixation
    * window before it counts as a break
    */
-  LOCK(semid);
+  SEQ_WRITE_BEGIN(dacq_data->cfgseq);
   dacq_data->fixbreak_tau_ms = nms;
-  UNLOCK(semid);
+  SEQ_WRITE_END(dacq_data->cfgseq);
 }
   
+/* reset server-owned fixwin state; server does it, unless there's no server */
+static void fixwin_reset_state(int n)
+{
+  if (! dacq_request(&dacq_data->fixwin[n].reset_req,
+		     &dacq_data->fixwin[n].reset_ack)) {
+    dacq_data->fixwin[n].state = 0;
+    dacq_data->fixwin[n].broke = 0;
+    dacq_data->fixwin[n].break_time = 0;
+    dacq_data->fixwin[n].fcount = 0;
+    dacq_data->fixwin[n].nout = 0;
+  }
+}
+
+/* caller must be inside SEQ_WRITE_BEGIN/END(cfgseq) */
+static void fixwin_move(int n, int cx, int cy, int radius)
+{
+  dacq_data->fixwin[n].cx = cx;
+  dacq_data->fixwin[n].cy = cy;
+  if (radius > 0) {
+    dacq_data->fixwin[n].rad2 = (radius * radius);
+  }
+}
+
 int dacq_fixwin(int n, int cx, int cy, int radius, double vbias)
 {
   if (n < 0) {
     return(NFIXWIN);
-  } else if (n > NFIXWIN) {
+  } else if (n >= NFIXWIN) {
     return(0);
   } else {
-    LOCK(semid);
+    SEQ_WRITE_BEGIN(dacq_data->cfgseq);
+    dacq_data->fixwin[n].active = 0;
+    SEQ_WRITE_END(dacq_data->cfgseq);
     if (radius > 0) {
-      dacq_data->fixwin[n].active = 0;
+      dacq_data->fixwin[n].genint = 0;
+      fixwin_reset_state(n);
 
+      SEQ_WRITE_BEGIN(dacq_data->cfgseq);
       dacq_data->fixwin[n].xchn = 0;
       dacq_data->fixwin[n].ychn = 1;
       dacq_data->fixwin[n].vbias = vbias;
-      dacq_data->fixwin[n].state = 0;
-      dacq_data->fixwin[n].broke = 0;
-      dacq_data->fixwin[n].genint = 0;
-      dacq_data->fixwin[n].break_time = 0;
-      dacq_data->fixwin[n].fcount = 0;
-      dacq_data->fixwin[n].nout = 0;
-
-      dacq_fixwin_move(n, cx, cy, radius);
-
+      fixwin_move(n, cx, cy, radius);
       dacq_data->fixwin[n].active = 1;
-    } else {
-      dacq_data->fixwin[n].active = 0;
+      SEQ_WRITE_END(dacq_data->cfgseq);
     }
-    UNLOCK(semid);
     return(1);
   }
 }
 
 int dacq_fixwin_move(int n, int cx, int cy, int radius)
 {
-  if (n < 0 || n > NFIXWIN) {
+  if (n < 0 || n >= NFIXWIN) {
     return(0);
   } else {
-    dacq_data->fixwin[n].cx = cx;
-    dacq_data->fixwin[n].cy = cy;
-    if (radius > 0) {
-      dacq_data->fixwin[n].rad2 = (radius * radius);
-    }
+    SEQ_WRITE_BEGIN(dacq_data->cfgseq);
+    fixwin_move(n, cx, cy, radius);
+    SEQ_WRITE_END(dacq_data->cfgseq);
     return(1);
   }
 }
@@ -518,12 +634,11 @@ int dacq_fixwin_genint(int n, int b)
 {
   int i = -1;
   if (n >= 0) {  
-    LOCK(semid);
-    i = dacq_data->fixwin[n].genint;
     if (b >= 0) {
-      dacq_data->fixwin[n].genint = b;
+      i = XCHG(dacq_data->fixwin[n].genint, b);
+    } else {
+      i = dacq_data->fixwin[n].genint;
     }
-    UNLOCK(semid);
   }
   return(i);
 }
@@ -531,117 +646,300 @@ int dacq_fixwin_genint(int n, int b)
 int dacq_fixwin_reset(int n)
 {
   if (n >= 0) {
-    LOCK(semid);
+    SEQ_WRITE_BEGIN(dacq_data->cfgseq);
     dacq_data->fixwin[n].active = 0;
+    SEQ_WRITE_END(dacq_data->cfgseq);
 
-    dacq_data->fixwin[n].state = 0;
-    dacq_data->fixwin[n].broke = 0;
     dacq_data->fixwin[n].genint = 0;
-    dacq_data->fixwin[n].break_time = 0;
-    dacq_data->fixwin[n].fcount = 0;
-    dacq_data->fixwin[n].nout = 0;
+    fixwin_reset_state(n);
 
+    SEQ_WRITE_BEGIN(dacq_data->cfgseq);
     dacq_data->fixwin[n].active = 1;
-    UNLOCK(semid);
+    SEQ_WRITE_END(dacq_data->cfgseq);
   }
   return(1);
 }
 
 int dacq_fixwin_state(int n)
 {
-  int s;
+  int s, b;
+  unsigned int q;
+
+  do {
+    q = seq_read_begin(&dacq_data->seq);
+    s = dacq_data->fixwin[n].state;
+    b = dacq_data->fixwin[n].broke;
+  } while (seq_read_retry(&dacq_data->seq, q));
 
   /* if eye gets inside window, then reset broke flag */
-  LOCK(semid);
-  s = dacq_data->fixwin[n].state;
-  if (s) {
-    dacq_data->fixwin[n].broke = 0;
+  if (s && b) {
+    // broke belongs to the server -- ask it to clear the flag
+    if (! dacq_request(&dacq_data->fixwin[n].clear_req,
+		       &dacq_data->fixwin[n].clear_ack)) {
+      dacq_data->fixwin[n].broke = 0;
+    }
     // Tue Sep 24 17:40:53 2013 mazer 
     //   not sure why checking the fixation window was
     //   turning off the interupt generator, but it's
     //   almost certainly WRONG.
     //dacq_data->fixwin[n].genint = 0;
   }
-  UNLOCK(semid);
   return(s);
 }
   
 int dacq_fixwin_broke(int n)
 {
-  int i;
-  LOCK(semid);
-  i = dacq_data->fixwin[n].broke;
-  UNLOCK(semid);
-  return(i);
+  return(dacq_data->fixwin[n].broke);
 }
 
 long dacq_fixwin_break_time(int n)
 {
   long i;
+  unsigned int q;
 
-  LOCK(semid);
-  i = dacq_data->fixwin[n].break_time;
-  UNLOCK(semid);
+  do {
+    q = seq_read_begin(&dacq_data->seq);
+    i = dacq_data->fixwin[n].break_time;
+  } while (seq_read_retry(&dacq_data->seq, q));
   return(i);
 }
 
-int dacq_adbuf_toggle(int on)
+/* reset server-owned zone state; server does it, unless there's no server */
+static void zone_reset_state(int n)
+{
+  if (! dacq_request(&dacq_data->zone[n].reset_req,
+		     &dacq_data->zone[n].reset_ack)) {
+    seq_zone_clear(&dacq_data->zone[n]);
+  }
+}
+
+/*
+ * Set up landing zone n (see zones.c) and reset its state -- the
+ * zone's off while this happens, so no stale events. shape is
+ * ZONE_CIRCLE (rin, angle and subtense are ignored), ZONE_SECTOR or
+ * ZONE_OFF to turn the zone off. Interrupts are disabled (see
+ * dacq_zone_genint) and the dwell/exit timing (dacq_zone_timing) is
+ * left alone. n < 0 returns the number of zones available; a bad zone
+ * number or vbias <= 0 returns 0 (and leaves the zone alone).
+ */
+int dacq_zone(int n, int shape, int cx, int cy, double rin, double rout,
+	      double vbias, double angle, double subtense)
+{
+  if (n < 0) {
+    return(NZONES);
+  } else if (n >= NZONES || (shape != ZONE_OFF && vbias <= 0.0)) {
+    return(0);
+  }
+  SEQ_WRITE_BEGIN(dacq_data->cfgseq);
+  dacq_data->zone[n].shape = ZONE_OFF;
+  SEQ_WRITE_END(dacq_data->cfgseq);
+  dacq_data->zone[n].genint = 0;
+  if (shape != ZONE_OFF) {
+    zone_reset_state(n);
+
+    SEQ_WRITE_BEGIN(dacq_data->cfgseq);
+    dacq_data->zone[n].cx = cx;
+    dacq_data->zone[n].cy = cy;
+    dacq_data->zone[n].rin = rin;
+    dacq_data->zone[n].rout = rout;
+    dacq_data->zone[n].vbias = vbias;
+    dacq_data->zone[n].angle = angle;
+    dacq_data->zone[n].subtense = subtense;
+    dacq_data->zone[n].shape = shape;
+    SEQ_WRITE_END(dacq_data->cfgseq);
+  }
+  return(1);
+}
+
+/* ms inside before landed, ms outside before exit */
+int dacq_zone_timing(int n, int dwell_ms, int tau_ms)
+{
+  if (n < 0 || n >= NZONES) {
+    return(0);
+  }
+  SEQ_WRITE_BEGIN(dacq_data->cfgseq);
+  dacq_data->zone[n].dwell_ms = dwell_ms;
+  dacq_data->zone[n].tau_ms = tau_ms;
+  SEQ_WRITE_END(dacq_data->cfgseq);
+  return(1);
+}
+
+/* move a live zone without touching its state (pursuit etc) */
+int dacq_zone_move(int n, int cx, int cy)
+{
+  if (n < 0 || n >= NZONES) {
+    return(0);
+  }
+  SEQ_WRITE_BEGIN(dacq_data->cfgseq);
+  dacq_data->zone[n].cx = cx;
+  dacq_data->zone[n].cy = cy;
+  SEQ_WRITE_END(dacq_data->cfgseq);
+  return(1);
+}
+
+/*
+ * Set the zone's interrupt mask: bit (1 << ZONE_xxx) generates an
+ * INT_ZONE for that event. The mask's cleared when an interrupt's
+ * sent. mask < 0 just returns the current mask.
+ */
+int dacq_zone_genint(int n, int mask)
+{
+  if (n < 0 || n >= NZONES) {
+    return(-1);
+  } else if (mask >= 0) {
+    return(XCHG(dacq_data->zone[n].genint, mask));
+  } else {
+    return(dacq_data->zone[n].genint);
+  }
+}
+
+/* clear inside/landed/broke/times/count, leaving geometry and ints alone */
+int dacq_zone_reset(int n)
+{
+  if (n < 0 || n >= NZONES) {
+    return(0);
+  }
+  zone_reset_state(n);
+  return(1);
+}
+
+/*
+ * bit 0: inside, bit 1: landed, bit 2: broke (exited since reset;
+ * stays set after the eye comes back)
+ */
+int dacq_zone_state(int n)
+{
+  int i, l, b;
+  unsigned int q;
+
+  do {
+    q = seq_read_begin(&dacq_data->seq);
+    i = dacq_data->zone[n].inside;
+    l = dacq_data->zone[n].landed;
+    b = dacq_data->zone[n].broke;
+  } while (seq_read_retry(&dacq_data->seq, q));
+  return(i | (l << 1) | (b << 2));
+}
+
+/* entries since reset */
+int dacq_zone_count(int n)
+{
+  return(dacq_data->zone[n].nenter);
+}
+
+/* time (ms, same clock as dacq_ts) of last ZONE_xxx event; 0 for none */
+double dacq_zone_time(int n, int which)
+{
+  double t;
+  unsigned int q;
+
+  do {
+    q = seq_read_begin(&dacq_data->seq);
+    switch (which)
+      {
+      case ZONE_ENTER:
+	t = dacq_data->zone[n].enter_t;
+	break;
+      case ZONE_EXIT:
+	t = dacq_data->zone[n].exit_t;
+	break;
+      case ZONE_LANDED:
+	t = dacq_data->zone[n].landed_t;
+	break;
+      default:
+	t = 0.0;
+	break;
+      }
+  } while (seq_read_retry(&dacq_data->seq, q));
+  return(t / 1000.0);
+}
+
+/*
+ * zone event ring -- same rules as the ttl ring. dacq_zone_ev_addr(0)
+ * is the timestamps (double, us), 1 the zone numbers (int) and 2 the
+ * event types (int).
+ */
+int dacq_zone_ev_len(void) { return(NZONEEV); }
+
+int dacq_zone_ev_head(void)
 {
   int i;
 
-  LOCK(semid);
+  i = dacq_data->zone_ev_head;
+  SEQ_BARRIER();			/* events below i are valid now */
+  return(i);
+}
+
+unsigned long dacq_zone_ev_addr(int which)
+{
+  if (dacq_data == NULL) {
+    return(0);
+  }
+  switch (which)
+    {
+    case 0:
+      return((unsigned long) dacq_data->zone_ev_t);
+    case 1:
+      return((unsigned long) dacq_data->zone_ev_zone);
+    default:
+      return((unsigned long) dacq_data->zone_ev_type);
+    }
+}
+
+int dacq_adbuf_toggle(int on)
+{
   dacq_data->adbuf_on = 0;
-  UNLOCK(semid);
   if (on) {
     dacq_adbuf_clear();
-    LOCK(semid);
+    SEQ_BARRIER();
     dacq_data->adbuf_on = 1;
-    UNLOCK(semid);
     return(1);
   } else {
-    LOCK(semid);
-    i = dacq_data->adbuf_overflow;
-    UNLOCK(semid);
-    return(i);
+    return(dacq_data->adbuf_overflow);
   }
 }
 
 void dacq_adbuf_clear()
 {
-  int i, ii;
-
-  LOCK(semid);
   dacq_data->adbuf_on = 0;		/* turn off sampling */
-  dacq_data->adbuf_ptr = 0;		/* reset pointer beginning */
-  dacq_data->adbuf_overflow = 0;	/* reset overflow flag */
-  for (i = 0; i < ADBUFLEN; i++) {	/* clear buffers. */
-    dacq_data->adbuf_t[i] = 0.0;
-    dacq_data->adbuf_x[i] = 0;
-    dacq_data->adbuf_y[i] = 0;
-    for (ii=0; ii < NADC; ii++) {
-      dacq_data->adbufs[ii][i] = 0;
-    }
+  /* reset cursors and overflow flag -- these belong to the server */
+  if (! dacq_request(&dacq_data->adbuf_clear_req,
+		     &dacq_data->adbuf_clear_ack)) {
+    dacq_data->adbuf_head = 0;
+    dacq_data->adbuf_tail = 0;
+    memset((void *)dacq_data->hs_head, 0, sizeof(dacq_data->hs_head));
+    memset((void *)dacq_data->hs_tail, 0, sizeof(dacq_data->hs_tail));
+    dacq_data->adbuf_overflow = 0;
   }
-  UNLOCK(semid);
 }
 
 int dacq_adbuf_size()
 {
   int i;
 
-  LOCK(semid);
-  i = dacq_data->adbuf_ptr;
-  UNLOCK(semid);
+  i = dacq_data->adbuf_head;
+  SEQ_BARRIER();			/* samples below i are valid now */
   return(i);
 }
 
+/*
+ * pype's drained everything below n out of the ring; server's free to
+ * reuse those slots. n < 0 just queries.
+ */
+int dacq_adbuf_tail(int n)
+{
+  if (n >= 0) {
+    SEQ_BARRIER();			/* done reading before release */
+    dacq_data->adbuf_tail = n;
+  }
+  return(dacq_data->adbuf_tail);
+}
+
 double dacq_adbuf_t(int ix) /* 10/12/2010: adbuf_t now in US! */
 {
   double f;
 
-  LOCK(semid);
-  f = dacq_data->adbuf_t[ix];
-  UNLOCK(semid);
+  f = dacq_data->adbuf_t[ix % ADBUFLEN];
   return(f);
 }
 
@@ -649,9 +947,7 @@ void print_adbuf_t(int ix)
 {
   double f;
 
-  LOCK(semid);
-  f = dacq_data->adbuf_t[ix];
-  UNLOCK(semid);
+  f = dacq_data->adbuf_t[ix % ADBUFLEN];
   fprintf(stdout, "<%f>", f);
   fflush(stdout);
 }
@@ -660,9 +956,7 @@ int dacq_adbuf_x(int ix)
 {
   int i;
 
-  LOCK(semid);
-  i = dacq_data->adbuf_x[ix];
-  UNLOCK(semid);
+  i = dacq_data->adbuf_x[ix % ADBUFLEN];
   return(i);
 }
 
@@ -670,9 +964,7 @@ int dacq_adbuf_y(int ix)
 {
   int i;
 
-  LOCK(semid);
-  i = dacq_data->adbuf_y[ix];
-  UNLOCK(semid);
+  i = dacq_data->adbuf_y[ix % ADBUFLEN];
   return(i);
 }
 
@@ -680,9 +972,7 @@ int dacq_adbuf_pa(int ix)
 {
   int i;
 
-  LOCK(semid);
-  i = dacq_data->adbuf_pa[ix];
-  UNLOCK(semid);
+  i = dacq_data->adbuf_pa[ix % ADBUFLEN];
   return(i);
 }
 
@@ -690,9 +980,7 @@ int dacq_adbuf_new(int ix)
 {
   int i;
 
-  LOCK(semid);
-  i = dacq_data->adbuf_new[ix];
-  UNLOCK(semid);
+  i = dacq_data->adbuf_new[ix % ADBUFLEN];
   return(i);
 }
 
@@ -700,9 +988,7 @@ int dacq_adbuf(int n, int ix)
 {
   int i;
 
-  LOCK(semid);
-  i = dacq_data->adbufs[n][ix];
-  UNLOCK(semid);
+  i = dacq_data->adbufs[n][ix % ADBUFLEN];
   return(i);
 }
 
@@ -715,22 +1001,187 @@ int dacq_adbuf_c2(int ix) { return(dacq_adbuf(2, ix)); }
 int dacq_adbuf_c3(int ix) { return(dacq_adbuf(3, ix)); }
 int dacq_adbuf_c4(int ix) { return(dacq_adbuf(4, ix)); }
 
+/*
+ * bulk access to the a/d buffers: dacq_adbuf_addr() returns the address
+ * of one of the buffers inside the attached shm segment so the python
+ * side can wrap it as a numpy array (see dacq.i.pre) instead of making
+ * one call per sample per channel. n >= 0 selects adbufs[n], n < 0
+ * selects one of the ADBUF_xxx pseudo channels (see dacq.h). Returns 0
+ * for invalid channels.
+ */
+int dacq_adbuf_len(void) { return(ADBUFLEN); }
+int dacq_adbuf_nchan(void) { return(NADC); }
+
+unsigned long dacq_adbuf_addr(int n)
+{
+  if (dacq_data == NULL) {
+    return(0);
+  }
+  switch (n)
+    {
+    case ADBUF_T:
+      return((unsigned long) dacq_data->adbuf_t);
+    case ADBUF_X:
+      return((unsigned long) dacq_data->adbuf_x);
+    case ADBUF_Y:
+      return((unsigned long) dacq_data->adbuf_y);
+    case ADBUF_PA:
+      return((unsigned long) dacq_data->adbuf_pa);
+    case ADBUF_NEW:
+      return((unsigned long) dacq_data->adbuf_new);
+    default:
+      if (n >= 0 && n < NADC) {
+	return((unsigned long) dacq_data->adbufs[n]);
+      }
+      return(0);
+    }
+}
+
+/*
+ * high-rate sampling (see hsamp.c). dacq_ad_rate() asks the server to
+ * scan the a/d at hz (0 for once per sample tick, < 0 to just query)
+ * and returns the rate it's actually running at -- the server picks
+ * up changes on its next tick, so that's the old rate until then.
+ * dacq_hs_decim() sets how many scans get averaged into each sample
+ * stored for chan (0 for none) and dacq_ttl() sets up edge detection
+ * on chan (mode is TTL_OFF, TTL_RISING or TTL_FALLING).
+ */
+int dacq_ad_rate(int hz)
+{
+  if (hz >= 0) {
+    SEQ_WRITE_BEGIN(dacq_data->cfgseq);
+    dacq_data->ad_rate = (hz > MAXADRATE) ? MAXADRATE : hz;
+    SEQ_WRITE_END(dacq_data->cfgseq);
+  }
+  return(dacq_data->ad_rate_actual);
+}
+
+int dacq_hs_decim(int chan, int n)
+{
+  if (chan < 0 || chan >= NADC) {
+    return(0);
+  }
+  if (n >= 0) {
+    SEQ_WRITE_BEGIN(dacq_data->cfgseq);
+    dacq_data->hs_decim[chan] = n;
+    SEQ_WRITE_END(dacq_data->cfgseq);
+  }
+  return(dacq_data->hs_decim[chan]);
+}
+
+int dacq_ttl(int chan, int mode, int thresh)
+{
+  if (chan < 0 || chan >= NADC) {
+    return(0);
+  }
+  SEQ_WRITE_BEGIN(dacq_data->cfgseq);
+  dacq_data->ttl_mode[chan] = mode;
+  dacq_data->ttl_thresh[chan] = thresh;
+  SEQ_WRITE_END(dacq_data->cfgseq);
+  return(1);
+}
+
+/*
+ * high-rate rings work just like the a/d ring, one per channel:
+ * sample i is in slot i % HSBUFLEN, dacq_hs_size() is the number
+ * stored since the last dacq_adbuf_clear() and dacq_hs_tail() is
+ * how far pype's drained. dacq_hs_addr(chan, 0) is the timestamps
+ * (double, us), dacq_hs_addr(chan, 1) the samples (int).
+ */
+int dacq_hs_len(void) { return(HSBUFLEN); }
+
+int dacq_hs_size(int chan)
+{
+  int i;
+
+  if (chan < 0 || chan >= NADC) {
+    return(0);
+  }
+  i = dacq_data->hs_head[chan];
+  SEQ_BARRIER();
+  return(i);
+}
+
+int dacq_hs_tail(int chan, int n)
+{
+  if (chan < 0 || chan >= NADC) {
+    return(0);
+  }
+  if (n >= 0) {
+    SEQ_BARRIER();
+    dacq_data->hs_tail[chan] = n;
+  }
+  return(dacq_data->hs_tail[chan]);
+}
+
+unsigned long dacq_hs_addr(int chan, int which)
+{
+  if (dacq_data == NULL || chan < 0 || chan >= NADC) {
+    return(0);
+  }
+  if (which == 0) {
+    return((unsigned long) dacq_data->hsbuf_t[chan]);
+  } else {
+    return((unsigned long) dacq_data->hsbuf[chan]);
+  }
+}
+
+/*
+ * ttl event ring (see hsamp.c): event i is in slot i % NTTLEV and
+ * dacq_ttl_head() is the number of events since the server started
+ * (it's never reset). Readers keep their own cursor and fetch events
+ * cursor..head-1; anything below head - NTTLEV has been overwritten.
+ * Events are in time order on each channel, but not across channels.
+ * dacq_ttl_addr(0) is the timestamps (double, us), dacq_ttl_addr(1)
+ * the channel numbers (int).
+ */
+int dacq_ttl_len(void) { return(NTTLEV); }
+
+int dacq_ttl_head(void)
+{
+  int i;
+
+  i = dacq_data->ttl_head;
+  SEQ_BARRIER();			/* events below i are valid now */
+  return(i);
+}
+
+double dacq_ttl_t(int ix)
+{
+  return(dacq_data->ttl_t[(unsigned int)ix % NTTLEV]);
+}
+
+int dacq_ttl_chan(int ix)
+{
+  return(dacq_data->ttl_chan[(unsigned int)ix % NTTLEV]);
+}
+
+unsigned long dacq_ttl_addr(int which)
+{
+  if (dacq_data == NULL) {
+    return(0);
+  }
+  if (which == 0) {
+    return((unsigned long) dacq_data->ttl_t);
+  } else {
+    return((unsigned long) dacq_data->ttl_chan);
+  }
+}
+
 int dacq_eye_smooth(int kn)
 {
   int i;
 
-  LOCK(semid);
+  SEQ_WRITE_BEGIN(dacq_data->cfgseq);
   dacq_data->eye_smooth = kn;
   i = dacq_data->eye_smooth;
-  UNLOCK(semid);
+  SEQ_WRITE_END(dacq_data->cfgseq);
   return(i);
 }
 
 void dacq_set_pri(int dacq_pri)
 {
-  LOCK(semid);
   dacq_data->dacq_pri = dacq_pri;
-  UNLOCK(semid);
 }
 
 int dacq_set_rt(int rt)
@@ -779,20 +1230,12 @@ int dacq_set_mypri(int pri)
 
 int dacq_int_class(void)
 {
-  int i;
-  LOCK(semid);
-  i = dacq_data->int_class;
-  UNLOCK(semid);
-  return(i);
+  return(dacq_data->int_class);
 }
 
 int dacq_int_arg(void)
 {
-  int i;
-  LOCK(semid);
-  i = dacq_data->int_arg;
-  UNLOCK(semid);
-  return(i);
+  return(dacq_data->int_arg);
 }
 
 int dacq_jsbut(int n)
@@ -802,13 +1245,11 @@ int dacq_jsbut(int n)
   /* read the nth joystick button; or if n < 0, query to see if
    * joystick is available
    */
-  LOCK(semid);
   if (n < 0) {
     i = dacq_data->js_enabled;
   } else {
     i = (n < NJOYBUT) ? dacq_data->js[n] : -1;
   }
-  UNLOCK(semid);
   return(i);
 }
 
@@ -817,9 +1258,7 @@ int dacq_js_x()
   int i;
 
   /* read the joystick's x-axis value */
-  LOCK(semid);
   i = dacq_data->js_x;
-  UNLOCK(semid);
   return(i);
 }
 
@@ -829,37 +1268,64 @@ int dacq_js_y()
   int i;
 
   /* read the joystick's y-axis value */
-  LOCK(semid);
   i = dacq_data->js_y;
-  UNLOCK(semid);
   return(i);
 }
 
 void dacq_set_alarm(int ms_from_now)
 {
-  LOCK(semid);
   if (ms_from_now) {
-    dacq_data->alarm_time = dacq_data->timestamp + ms_from_now;
+    dacq_data->alarm_time = dacq_ts() + ms_from_now;
   } else {
     dacq_data->alarm_time = 0;
   }
-  UNLOCK(semid);
 }
 
 void dacq_elrestart(void)
 {
-  LOCK(semid);
   dacq_data->elrestart = 1;
-  UNLOCK(semid);
 }
 
 void dacq_set_xtracker(int x, int y, int pa)
 {
   /* set externally read tracker (eg, eyetribe or similar) */
-  LOCK(semid);
+  SEQ_WRITE_BEGIN(dacq_data->xseq);
   dacq_data->xx = x;
   dacq_data->xy = y;
   dacq_data->xpa = pa;
-  dacq_data->xnew = 1;
-  UNLOCK(semid);
+  dacq_data->xnew += 1;		/* server watches for changes */
+  SEQ_WRITE_END(dacq_data->xseq);
+}
+
+/*
+ * server loop latency histogram (see seq_looplat): n >= 0 is the
+ * count in bin n (LATBIN_US us wide; the last bin is everything
+ * longer), -1 is the number of bins, -2 the longest loop seen (us)
+ * and -3 the number of loops that overran the sample period.
+ */
+int dacq_looplat(int n)
+{
+  if (n >= 0) {
+    return((n < NLATBIN) ? dacq_data->looplat[n] : 0);
+  }
+  switch (n)
+    {
+    case -1:
+      return(NLATBIN);
+    case -2:
+      return(dacq_data->looplat_max);
+    case -3:
+      return(dacq_data->looplat_late);
+    default:
+      return(0);
+    }
+}
+
+void dacq_looplat_reset(void)
+{
+  if (! dacq_request(&dacq_data->looplat_req, &dacq_data->looplat_ack)) {
+    memset(dacq_data->looplat, 0, sizeof(dacq_data->looplat));
+    dacq_data->looplat_max = 0;
+    dacq_data->looplat_late = 0;
+  }
 }
@@ -31,8 +31,53 @@
 ** Mon May 14 10:06:46 2012 mazer 
 **   added dacq_fixwin_move(x,y,size) to update position/size w/o
 **   changing anything else (like for pursuit!)
+**
+** Sun Oct 18 10:12:40 2026 mazer
+**   added dacq_adbuf_len(), dacq_adbuf_nchan() and dacq_adbuf_addr()
+**   for bulk (zero-copy) access to the a/d buffers from python
+**
+** Sun Oct 18 16:02:37 2026 mazer
+**   added dacq_looplat() and dacq_looplat_reset() for the server's
+**   loop latency histogram
+**
+** Sun Oct 18 17:05:48 2026 mazer
+**   added dacq_adbuf_tail() -- a/d buffers are a ring now
+**
+** Sun Oct 18 18:10:26 2026 mazer
+**   added dacq_ad_rate(), dacq_hs_decim(), dacq_ttl() and the
+**   dacq_hs_xxx() calls for high-rate sampling
+**
+** Sun Oct 18 19:02:11 2026 mazer
+**   added dacq_ttl_xxx() calls for the ttl event ring
+**
+** Sun Oct 18 20:31:07 2026 mazer
+**   added dacq_zone_xxx() calls for server-side landing zones
 */
 
+/* pseudo-channel numbers for dacq_adbuf_addr(); n >= 0 is adbufs[n] */
+#define ADBUF_T		-1
+#define ADBUF_X		-2
+#define ADBUF_Y		-3
+#define ADBUF_PA	-4
+#define ADBUF_NEW	-5
+
+/* dacq_ttl() modes (same as dacqinfo.h, but swig only sees this file) */
+#ifndef TTL_OFF
+#define TTL_OFF		0
+#define TTL_RISING	1
+#define TTL_FALLING	2
+#endif
+
+/* dacq_zone() shapes and zone events (see dacqinfo.h) */
+#ifndef ZONE_OFF
+#define ZONE_OFF	0
+#define ZONE_CIRCLE	1
+#define ZONE_SECTOR	2
+#define ZONE_ENTER	1
+#define ZONE_EXIT	2
+#define ZONE_LANDED	3
+#endif
+
 extern int dacq_start(char *server, char *tracker, char *port, char *elopt,
 		      char *elcam, char *swapxy, char *usbjs, int force);
 extern void dacq_stop(void);
@@ -67,10 +112,24 @@ extern int dacq_fixwin_state(int n);
 extern int dacq_fixwin_broke(int n);
 extern long dacq_fixwin_break_time(int n);
 
+extern int dacq_zone(int n, int shape, int cx, int cy, double rin,
+		     double rout, double vbias, double angle, double subtense);
+extern int dacq_zone_timing(int n, int dwell_ms, int tau_ms);
+extern int dacq_zone_move(int n, int cx, int cy);
+extern int dacq_zone_genint(int n, int mask);
+extern int dacq_zone_reset(int n);
+extern int dacq_zone_state(int n);
+extern int dacq_zone_count(int n);
+extern double dacq_zone_time(int n, int which);
+extern int dacq_zone_ev_len(void);
+extern int dacq_zone_ev_head(void);
+extern unsigned long dacq_zone_ev_addr(int which);
+
 extern int dacq_adbuf_toggle(int on);
 extern void dacq_adbuf_clear(void);
 
 extern int dacq_adbuf_size(void);
+extern int dacq_adbuf_tail(int n);
 extern double dacq_adbuf_t(int ix);
 extern void print_adbuf_t(int ix);
 extern int dacq_adbuf_x(int ix);
@@ -84,6 +143,23 @@ extern int dacq_adbuf_c2(int ix);
 extern int dacq_adbuf_c3(int ix);
 extern int dacq_adbuf_c4(int ix);
 
+extern int dacq_adbuf_len(void);
+extern int dacq_adbuf_nchan(void);
+extern unsigned long dacq_adbuf_addr(int n);
+
+extern int dacq_ad_rate(int hz);
+extern int dacq_hs_decim(int chan, int n);
+extern int dacq_ttl(int chan, int mode, int thresh);
+extern int dacq_hs_len(void);
+extern int dacq_hs_size(int chan);
+extern int dacq_hs_tail(int chan, int n);
+extern unsigned long dacq_hs_addr(int chan, int which);
+extern int dacq_ttl_len(void);
+extern int dacq_ttl_head(void);
+extern double dacq_ttl_t(int ix);
+extern int dacq_ttl_chan(int ix);
+extern unsigned long dacq_ttl_addr(int which);
+
 extern int dacq_eye_smooth(int kn);
 extern void dacq_set_pri(int dacq_pri);
 
@@ -104,4 +180,7 @@ extern void dacq_elrestart(void);
 
 extern void dacq_set_xtracker(int x, int y, int pa);
 
+extern int dacq_looplat(int n);
+extern void dacq_looplat_reset(void);
+
 
@@ -2,6 +2,37 @@
 ** author:  jamie mazer
 ** created: Wed Jan  6 23:14:57 1999 mazer 
 ** info:    generic dacq interface structure
+** history:
+**
+** Sun Oct 18 15:20:11 2026 mazer
+**   no more semaphore locking -- the server is the only writer of the
+**   sample state and pype is the only writer of the config; see
+**   seqlock.h for the protocol.
+**
+** Sun Oct 18 17:05:48 2026 mazer
+**   a/d buffers are a real ring now: adbuf_head counts samples stored
+**   since the last clear (server) and adbuf_tail counts samples pype
+**   has drained out (pype), so trials can be any length as long as
+**   pype keeps up. Replaces adbuf_ptr.
+**
+** Sun Oct 18 18:10:26 2026 mazer
+**   high-rate sampling (see hsamp.c): the a/d can be run at ad_rate
+**   scans/sec (up to MAXADRATE) instead of once per SAMP_RATE tick.
+**   Each channel can also be stored at ad_rate/hs_decim[] in its own
+**   ring (hsbuf) and TTL edges on any channel are timestamped at the
+**   full rate into the ttl event ring.
+**
+** Sun Oct 18 19:02:11 2026 mazer
+**   ttl event times are interpolated to the threshold crossing and
+**   the server fills the ring at tick rate when not streaming, so
+**   pype can count spikes/syncs from the ring instead of rescanning
+**   the analog traces (dacq_ttl_head() etc).
+**
+** Sun Oct 18 20:31:07 2026 mazer
+**   landing zones (see zones.c): NZONES circles/ellipses/annular
+**   sectors checked against the eye position every sample, with
+**   dwell timers, enter/exit/landed timestamps, an event ring and
+**   optional interrupts (INT_ZONE).
 */
 
 #define SHMKEY	0xDA01
@@ -16,12 +47,35 @@
 #define ADBUFLEN ((SAMP_RATE) * 60)
 #define MAXSMOOTH 100
 #define NJOYBUT	10
+#define NLATBIN	100		/* sampler loop latency histogram bins.. */
+#define LATBIN_US 10		/* ..each this many us wide */
+#define MAXADRATE 20000		/* max a/d scan rate (Hz) */
+#define HSBUFLEN ((MAXADRATE) * 2) /* high-rate ring, per channel */
+#define NTTLEV	4096		/* ttl event ring */
+#define NZONES	32		/* landing zones */
+#define NZONEEV	1024		/* zone event ring */
+
+/* ttl edge detection modes (ttl_mode[]) */
+#define TTL_OFF		0
+#define TTL_RISING	1
+#define TTL_FALLING	2
+
+/* zone shapes (zone[].shape) */
+#define ZONE_OFF	0
+#define ZONE_CIRCLE	1	/* circle/ellipse: rout, vbias */
+#define ZONE_SECTOR	2	/* annular sector: rin..rout, angle+-subtense */
+
+/* zone events; bit (1 << ZONE_xxx) of zone[].genint enables the int */
+#define ZONE_ENTER	1
+#define ZONE_EXIT	2
+#define ZONE_LANDED	3
 
 /* pseudo-interupt codes */
 #define INT_DIN		1
 #define INT_FIXWIN	2
 #define INT_ALARM	3
 #define INT_JOYBUT	4
+#define INT_ZONE	5	/* int_arg is zone | (event << 8) */
 #define INT_FATAL	666
 
 #include <unistd.h>		/* for pid_t */
@@ -38,12 +92,44 @@ typedef struct {
   int fcount;			/* internal.. */
   int nout;			/* internal.. */
   int genint;			/* generate an SIGUSR2 on break?? */
+  volatile unsigned int reset_req, reset_ack; /* reset state (pype->server) */
+  volatile unsigned int clear_req, clear_ack; /* clear broke if inside */
 } FIXWIN;
 
+typedef struct {
+  /* geometry/timing -- pype, under cfgseq */
+  int shape;			/* ZONE_xxx; ZONE_OFF for inactive */
+  int cx, cy;			/* center (sectors: center of the annulus) */
+  float vbias;			/* vertical elongation factor */
+  float rin, rout;		/* inner (sectors only) & outer radius */
+  float angle, subtense;	/* sectors: direction and half-width (deg) */
+  int dwell_ms;			/* time inside before it counts as landed */
+  int tau_ms;			/* time outside before it counts as exit */
+
+  /* pype <-> server (atomic) */
+  int genint;			/* event mask; cleared when an int is sent */
+  volatile unsigned int reset_req, reset_ack; /* reset state (pype->server) */
+
+  /* state -- server, under seq */
+  int inside;			/* eye inside (exits debounced by tau_ms) */
+  int landed;			/* inside for dwell_ms */
+  int broke;			/* exited since reset (sticky, like fixwins) */
+  int nenter;			/* entries since reset */
+  double enter_t;		/* us; time of last of each event, 0 if */
+  double exit_t;		/* ..it hasn't happened since reset */
+  double landed_t;
+  double out_t;			/* internal: first sample outside, 0 inside */
+} ZONE;
+
 typedef struct {
   pid_t server_pid;		/* PID of server */
   pid_t pype_pid;		/* PID of pype process */
 
+  /* sequence counters (odd while an update's in progress, see seqlock.h) */
+  volatile unsigned int seq;	/* server: eye pos, adc, timestamps, fixwins */
+  volatile unsigned int cfgseq;	/* pype: eye cal, smoothing, fixwin geometry */
+  volatile unsigned int xseq;	/* pype: external tracker sample */
+
   /* raw data (input and output) */
   char	din[NDIGIN];		/* status of digital input lines */
   char	din_changes[NDIGIN];	/* # of changes since last reset */
@@ -81,9 +167,12 @@ typedef struct {
 
   /* d/a buffers */
   unsigned int	adbuf_on;	/* flag to trigger a/d collect */
-  unsigned int	adbuf_ptr;	/* current point in ring buffers */
+  volatile unsigned int adbuf_head; /* samples stored since clear (server) */
+  volatile unsigned int adbuf_tail; /* samples drained by pype (pype) */
   unsigned int	adbuf_overflow;	/* overflow flag (INDICATES ERROR!!) */
+  volatile unsigned int adbuf_clear_req, adbuf_clear_ack; /* pype->server */
 
+  /* sample i (i = 0 at clear) lives in slot i % ADBUFLEN */
   double	adbuf_t[ADBUFLEN];	/* timestamps (us) */
   int		adbuf_x[ADBUFLEN];	/* eye x position trace */
   int		adbuf_y[ADBUFLEN];	/* eye y position trace */
@@ -95,6 +184,15 @@ typedef struct {
   FIXWIN	fixwin[NFIXWIN];
   int		fixbreak_tau_ms;	/* ms before break counts as break */
 
+  /* landing zones (server state, see zones.c) and their event
+   * ring: event i is in slot i % NZONEEV; never cleared, same
+   * rules as the ttl ring */
+  ZONE		zone[NZONES];
+  volatile unsigned int zone_ev_head;
+  double	zone_ev_t[NZONEEV];	/* timestamps (us) */
+  int		zone_ev_zone[NZONEEV];
+  int		zone_ev_type[NZONEEV];	/* ZONE_ENTER etc */
+
   /* joystick button states (usb joystick) */
   int		js_enabled;
   int		js[NJOYBUT];
@@ -102,7 +200,9 @@ typedef struct {
   int		js_y;
 
 
-  /* input from external eye tracker: x, y, pupil, new? */
+  /* input from external eye tracker: x, y, pupil, new? (xnew is
+   * bumped for each new sample)
+   */
   int		xx, xy, xpa, xnew;
 
   /* interupt generating elapsed time counter/alarm
@@ -116,6 +216,31 @@ typedef struct {
 
   int elrestart; // flag to force reconnect to eyelink
 
+  /* high-rate sampling -- config (pype, under cfgseq) */
+  int		ad_rate;		/* requested scan rate; 0 for 1/tick */
+  int		hs_decim[NADC];		/* store 1 per n scans (mean); 0 off */
+  int		ttl_mode[NADC];		/* TTL_OFF, TTL_RISING, TTL_FALLING */
+  int		ttl_thresh[NADC];	/* a/d units */
+
+  /* high-rate sampling -- state (server) */
+  int		ad_rate_actual;		/* actual scan rate (Hz) */
+  volatile unsigned int hs_head[NADC];	/* same as adbuf_head/tail, but */
+  volatile unsigned int hs_tail[NADC];	/* ..one ring per channel */
+  double	hsbuf_t[NADC][HSBUFLEN];	/* timestamps (us) */
+  int		hsbuf[NADC][HSBUFLEN];
+
+  /* ttl pulse onsets (server): event i is in slot i % NTTLEV; never
+   * cleared -- readers keep their own cursor into it */
+  volatile unsigned int ttl_head;
+  double	ttl_t[NTTLEV];		/* timestamps (us) */
+  int		ttl_chan[NTTLEV];
+
+  /* sampler loop latency (time from sample tick to end of loop) */
+  unsigned int looplat[NLATBIN];	/* histogram; last bin is overflow */
+  unsigned int looplat_max;		/* us */
+  unsigned int looplat_late;		/* loops longer than a sample period */
+  volatile unsigned int looplat_req, looplat_ack; /* reset (pype->server) */
+
 } DACQINFO;
 
 /* these are for backwards compatibility: */
@@ -1,8 +1,13 @@
-s/* title:   dummy_server.c
+/* title:   dummy_server.c
 ** author:  jamie mazer
 ** created: Wed Jan  8 17:21:15 2003 mazer 
 ** info:    shm interface to dummy COMEDI devices
 ** history:
+**
+** Sun Oct 18 18:10:26 2026 mazer
+**   synthesizes a high-rate a/d stream (see synth_read) whenever
+**   there's an ad_rate set (pype or --adrate), for testing hsamp.c
+**   and friends without a board
 */
 
 #include <sys/types.h>
@@ -44,8 +49,10 @@ s/* title:   dummy_server.c
 #include "systemio.h"
 #include "sigs.h"
 #include "psems.h"
+#include "seqlock.h"
 #include "usbjs.h"
-#include "debug.h"
+#include "hsamp.h"
+#include "zones.h"
 
 #define ANALOG		0	/* eye tracker mode flags */
 #define ISCAN		1
@@ -91,6 +98,14 @@ static v24_port_t *iscan_port = NULL;	/* iscan handle */
 
 static int	debugint = 0;
 
+// fake high-rate sampling
+static int	adrate = 0;	/* --adrate: scan rate if pype doesn't set one */
+static int	synth_on = 0;
+static double	synth_t0;	/* timestamp of scan #0 (us) */
+static unsigned long synth_nscans; /* scans generated since start */
+static int	synth_spike = 0;	/* scans left in current spike */
+static HSAMP	hs;
+
 static pid_t	pypepid = 0;
 
 
@@ -302,15 +317,82 @@ int ad_in(int chan)
   return(0);
 }
 
+void synth_start(int rate)
+{
+  synth_on = 0;
+  dacq_data->ad_rate_actual = 0;
+  hsamp_init(&hs, SAMP_RATE);
+  if (rate <= 0) {
+    return;
+  }
+  if (rate > MAXADRATE) {
+    rate = MAXADRATE;
+  }
+  hsamp_init(&hs, rate);
+  synth_t0 = timestamp();
+  synth_nscans = 0;
+  synth_on = 1;
+  dacq_data->ad_rate_actual = rate;
+  fprintf(stderr, "%s: synthesizing a/d at %d Hz\n", progname, rate);
+}
+
+/*
+ * Generate all the scans that would have come in from a board
+ * since the last call:
+ *   AIN0,1 - slow (0.5/0.3 Hz) sinusoids (eye x, y)
+ *   AIN2   - 1 Hz square wave (photodiode)
+ *   AIN3   - ~40 Hz poisson train of 250us pulses (spikes)
+ * All 0-2000 a/d units, so the default pype thresholds (500) work.
+ */
+void synth_read(DACQCFG *cfg, int store)
+{
+  static int scans[(MAXADRATE / 10) * NADC];
+  double t, t0, now;
+  int n, nscans, pulse;
+
+  now = timestamp();
+  nscans = (int)(((now - synth_t0) / hs.dt) - synth_nscans);
+  if (nscans <= 0) {
+    return;
+  }
+  if (nscans > (MAXADRATE / 10)) {
+    // we stalled -- skip ahead rather than fake up old data
+    synth_nscans += nscans - (MAXADRATE / 10);
+    nscans = MAXADRATE / 10;
+  }
+  pulse = (int)(0.5 + 250.0 / hs.dt);
+  if (pulse < 1) {
+    pulse = 1;
+  }
+
+  t0 = synth_t0 + (synth_nscans * hs.dt);
+  for (n = 0; n < nscans; n++) {
+    t = (t0 + (n * hs.dt)) / 1.0e6;
+    scans[(n * NADC) + 0] = (int)(1000.0 + 1000.0 * sin(2.0 * M_PI * 0.5 * t));
+    scans[(n * NADC) + 1] = (int)(1000.0 + 1000.0 * cos(2.0 * M_PI * 0.3 * t));
+    scans[(n * NADC) + 2] = (fmod(t, 1.0) < 0.5) ? 2000 : 0;
+    if (synth_spike == 0 &&
+	(random() / (double)RAND_MAX) < (40.0 * hs.dt / 1.0e6)) {
+      synth_spike = pulse;
+    }
+    if (synth_spike > 0) {
+      synth_spike--;
+      scans[(n * NADC) + 3] = 2000;
+    } else {
+      scans[(n * NADC) + 3] = 0;
+    }
+  }
+  hsamp_block(&hs, dacq_data, cfg, scans, nscans, NADC, t0, store);
+  synth_nscans += nscans;
+}
+
 void dig_in()
 {
   // just lock these down -- polarities are
   // from the old taks -- hardcoded to work in NAF...
-  LOCK(semid);
   dacq_data->din[0] = 0;	/* monkey bar NOT down */
   dacq_data->din[2] = 1;	/* user button 2 NOT down */
   dacq_data->din[3] = 1;	/* user button 1 NOT down */
-  UNLOCK(semid);
 }
 
 void dig_out()
@@ -419,7 +501,7 @@ int clock_gettime(int clk_id, struct timespec* t) {
 }
 #endif
 
-#define A(r,c) (dacq_data->eye_affine[(r)-1][(c)-1])
+#define A(r,c) (cfg.eye_affine[(r)-1][(c)-1])
 
 void mainloop(void)
 {
@@ -436,6 +518,10 @@ void mainloop(void)
   unsigned long msts, last_parent_check = 0;
   int ncores;
   pid_t pypeid;
+  DACQCFG cfg;
+  unsigned int cfglast = 1;
+  int xx, xy, xpa, xlast;
+  int rate, ad_rate_cur = -1;
 
   x = y = pa = -1.0;
   eyenew = sumx = sumy = 0;
@@ -445,9 +531,14 @@ void mainloop(void)
   }
   si = 0;
 
-  LOCK(semid);
+  // get initial config from pype (this is the only time we ever wait)
+  while (! seq_cfg_read(dacq_data, &cfg, &cfglast)) {
+    usleep(100);
+  }
+  xx = xy = xpa = 0;
+  xlast = dacq_data->xnew;
+
   k = dacq_data->dacq_pri;
-  UNLOCK(semid);
 
   errno = 0;
   if (setpriority(PRIO_PROCESS, 0, k) == 0 && errno == 0) {
@@ -483,10 +574,8 @@ void mainloop(void)
   fprintf(stderr, "%s: %.1f kHz sampling\n", progname, SAMP_RATE / 1000.0);
 
   /* signal client we're ready */
-  LOCK(semid);
-  dacq_data->servers_avail += 1;
   pypeid = dacq_data->pype_pid;
-  UNLOCK(semid);
+  ATOMIC_ADD(dacq_data->servers_avail, 1);
   fprintf(stderr, "%s: ready\n", progname);
 
   do {
@@ -506,17 +595,23 @@ void mainloop(void)
       printf("yo=%10d\n", dacq_data->eye_yoff);
       debugint = 0;
     }
-    LOCK(semid);
-    if (dacq_data->clock_reset) {
+    if (XCHG(dacq_data->clock_reset, 0)) {
       // this is basically a one-shot; client sets clock_reset to
       // force clock reset on next iteration through mainloop
-      UNLOCK(semid);
       dacq_data->ts0 = timestamp() / 1.0e6; /* secs */
-      dacq_data->clock_reset = 0;
-      LOCK(semid);
       last_usts = -1.0;
     }
-    UNLOCK(semid);
+
+    // pending requests from pype and config changes -- do these
+    // before waiting for the next sample period
+    seq_server_requests(dacq_data);
+    seq_cfg_read(dacq_data, &cfg, &cfglast);
+
+    rate = (cfg.ad_rate > 0) ? cfg.ad_rate : adrate;
+    if (rate != ad_rate_cur) {
+      ad_rate_cur = rate;
+      synth_start(rate);
+    }
 
     while (1) {
       usts = timestamp();
@@ -536,9 +631,14 @@ void mainloop(void)
       last_parent_check = msts;
     }
     
-    for (i=firstadc_chan; i<=lastadc_chan; i++) {
-      // sample all (in-use) converters fast as possible
-      dacq_data->adc[i] = ad_in(i);
+    if (synth_on) {
+      synth_read(&cfg, dacq_data->adbuf_on);
+    } else {
+      for (i=firstadc_chan; i<=lastadc_chan; i++) {
+	// sample all (in-use) converters fast as possible
+	dacq_data->adc[i] = ad_in(i);
+      }
+      hsamp_tick(&hs, dacq_data, &cfg, usts);
     }
     if (itracker == ISCAN) {	// maybe read iscan from serial port..
       while (iscan_read()) {
@@ -549,9 +649,7 @@ void mainloop(void)
     if (usbjs_dev > 0) {	// joystick, only if enabled
       if (usbjs_query(usbjs_dev, &jsbut, &jsnum, &jsval, &jstime)) {
 	if (jsbut && jsnum < NJOYBUT) {
-	  LOCK(semid);
 	  dacq_data->js[jsnum] = jsval; // button # jsnum: up or down?
-	  UNLOCK(semid);
 	} else if (jsbut == 0 && jsnum == 0) {
 	  dacq_data->js_x = jsval; // x motion; jsval=current position */
 	} else if (jsbut == 0 && jsnum == 1) {
@@ -561,8 +659,7 @@ void mainloop(void)
     }
 
     // try to reconnect to eyelink
-    if (dacq_data->elrestart) {
-      dacq_data->elrestart = 0;
+    if (XCHG(dacq_data->elrestart, 0)) {
       // only allow resets if initial connection was eyelink and
       // no longer currently connected (analog fallback mode)
       if (port != NULL && itracker == NONE) {
@@ -605,11 +702,12 @@ void mainloop(void)
 	 * In general, this means something running in a thread in the
 	 * parent process.. mouse, usb tracker etc..
 	 */
-	dacq_data->adc[0] = x = dacq_data->xx;
-	dacq_data->adc[1] = y = dacq_data->xy;
-	pa = dacq_data->xpa;
-	eyenew = dacq_data->xnew;
-	dacq_data->xnew = 0;
+	if ((eyenew = seq_xtracker(dacq_data, &xx, &xy, &xpa, &xlast)) < 0) {
+	  eyenew = 0;		/* pype's mid-update, use last sample */
+	}
+	dacq_data->adc[0] = x = xx;
+	dacq_data->adc[1] = y = xy;
+	pa = xpa;
 	break;
       }
 
@@ -639,24 +737,22 @@ void mainloop(void)
       rx = (x * A(1,1)) + (y * A(2,1)) + (1.0 * A(3,1));
       ry = (x * A(1,2)) + (y * A(2,2)) + (1.0 * A(3,2));
 
-      LOCK(semid);
-
       // 2nd: apply gain/offset
-      x = (dacq_data->eye_xgain * rx) + dacq_data->eye_xoff;
-      y = (dacq_data->eye_ygain * ry) + dacq_data->eye_yoff;
+      x = (cfg.eye_xgain * rx) + cfg.eye_xoff;
+      y = (cfg.eye_ygain * ry) + cfg.eye_yoff;
 
       // 3rd: apply supplemental rotation for ACM..
-      if (dacq_data->eye_rot != 0) {
+      if (cfg.eye_rot != 0) {
 	float r,th;
 	r = hypot(x, y);
-	th = atan2(y, x) - (M_PI * dacq_data->eye_rot / 180.);
+	th = atan2(y, x) - (M_PI * cfg.eye_rot / 180.);
 	x = r * cos(th);
 	y = r * sin(th);
       }
-    } else {
-      // pass through iscan out of bounds signal unchanged..
-      LOCK(semid);
     }
+    // (otherwise, pass through iscan out of bounds signal unchanged..)
+
+    SEQ_WRITE_BEGIN(dacq_data->seq);
 
     // stash these before they get changed..
     dacq_data->eye_rawx = F2I(x);
@@ -664,7 +760,7 @@ void mainloop(void)
 
     rx = x;
     ry = y;
-    if ((sumn = dacq_data->eye_smooth) > MAXSMOOTH) {
+    if ((sumn = cfg.eye_smooth) > MAXSMOOTH) {
       sumn = MAXSMOOTH;
     }
 
@@ -674,7 +770,6 @@ void mainloop(void)
 	  (itracker != ISCAN || x != ISCAN_NODATA || y != ISCAN_NODATA)) {
 	// if eye data is new and not out of bounds, then include it in
 	// the smoothing buffer and generate the next smoothed point.
-	UNLOCK(semid);
 	sumx += -sbx[si] + x;	/* pop */
 	sumy += -sby[si] + y;
 	sbx[si] = x;		/* push */
@@ -682,7 +777,6 @@ void mainloop(void)
 	si = (si + 1) % sumn;	/* advance pointer */
 	lsx = x = sumx / sumn;		/* compute smoothed mean */
 	lsy = y = sumy / sumn;
-	LOCK(semid);
       } else {
 	// Otherwise, just use the last smooth value available.
       	x = lsx; y = lsy;
@@ -693,7 +787,7 @@ void mainloop(void)
     dacq_data->eye_x = F2I(x);
     dacq_data->eye_y = F2I(y);
     dacq_data->eye_pa = pa;
-    UNLOCK(semid);
+    SEQ_WRITE_END(dacq_data->seq);
     
     /* read digital input lines */
     if (usbjs_dev >= 0) {
@@ -706,25 +800,24 @@ void mainloop(void)
        * Make joystick button 1 acts as bar (DIN#0); other buttons should
        * be read using dacq_jsbut() API function.
        */
-      LOCK(semid);
       last = dacq_data->din[0];
       dacq_data->din[0] = dacq_data->js[0];
       if (dacq_data->din[0] != last) {
-	dacq_data->din_changes[0] += 1;
-	if (dacq_data->din_intmask[0]) {
-	  dacq_data->int_class = INT_DIN;
+	ATOMIC_ADD(dacq_data->din_changes[0], 1);
+	if (XCHG(dacq_data->din_intmask[0], 0)) {
+	  /* ints must be re-enabled */
 	  dacq_data->int_arg = 0;
+	  dacq_data->int_class = INT_DIN;
 	  kill(pypepid, SIGUSR1);
 	}
       }
-      UNLOCK(semid);
 
       /* other buttons generate ints only if joyint is set: */
       for (button = 1; dacq_data->joyint && button < NJOYBUT; button++) {
-	if (dacq_data->js[button]) {
-	  dacq_data->joyint = 0;		/* force manual reset! */
-	  dacq_data->int_class = INT_JOYBUT;
+	if (dacq_data->js[button] && XCHG(dacq_data->joyint, 0)) {
+	  /* force manual reset! */
 	  dacq_data->int_arg = button;
+	  dacq_data->int_class = INT_JOYBUT;
 	  kill(pypepid, SIGUSR1);
 	}
       }
@@ -734,36 +827,36 @@ void mainloop(void)
     }
 
     /* set digital output lines, only if the strobe's been set */
-    LOCK(semid);
-    k = dacq_data->dout_strobe;
-    UNLOCK(semid);
-    if (k) {
+    if (dacq_data->dout_strobe) {
+      SEQ_BARRIER();		/* pype sets dout[] before the strobe */
       dig_out();
       /* reset the strobe (as if it were a latch */
-      LOCK(semid);
+      SEQ_BARRIER();
       dacq_data->dout_strobe = 0;
-      UNLOCK(semid);
     }
 
-    LOCK(semid);
+    SEQ_WRITE_BEGIN(dacq_data->seq);
     dacq_data->timestamp = msts; /* in 'ms' (for backwards compat) */
     dacq_data->usts = usts;	 /* us */
+    SEQ_WRITE_END(dacq_data->seq);
 
     /* check alarm status */
-    if (dacq_data->alarm_time && 
-	(dacq_data->timestamp >= dacq_data->alarm_time)) {
+    k = dacq_data->alarm_time;
+    if (k && msts >= k && CAS(dacq_data->alarm_time, k, 0)) {
       // alarm set and expired -- clear and send interupt to pype
-      dacq_data->alarm_time = 0;
-      dacq_data->int_class = INT_ALARM;
       dacq_data->int_arg = 0;
+      dacq_data->int_class = INT_ALARM;
       kill(pypepid, SIGUSR1);
     }
-    k = dacq_data->adbuf_on;
-    UNLOCK(semid);
 
-    if (k) {
-      LOCK(semid);
-      k = dacq_data->adbuf_ptr;
+    if (dacq_data->adbuf_on) {
+      // a/d buffers are a ring -- pype drains samples out as they
+      // come in (adbuf_tail), so we only lose data (and flag the
+      // overflow) if it falls a whole buffer behind
+      if (dacq_data->adbuf_head - dacq_data->adbuf_tail >= ADBUFLEN) {
+	dacq_data->adbuf_overflow++;
+      }
+      k = dacq_data->adbuf_head % ADBUFLEN;
       dacq_data->adbuf_t[k] = usts;
       dacq_data->adbuf_x[k] = rx; /* raw (unsmoothed) x pos */
       dacq_data->adbuf_y[k] = ry; /* raw (unsmoothed) y pos */
@@ -775,30 +868,23 @@ void mainloop(void)
       for (ii=0; ii <= lastadc_chan; ii++) {
 	dacq_data->adbufs[ii][k] = dacq_data->adc[ii];
       }
-      if (++dacq_data->adbuf_ptr > ADBUFLEN) {
-	dacq_data->adbuf_overflow++;
-	dacq_data->adbuf_ptr = 0;
-      }
-      UNLOCK(semid);
+      // publish sample -- everything below adbuf_head is valid
+      SEQ_BARRIER();
+      dacq_data->adbuf_head += 1;
     }
 
     /* check fixwins for in/out events */
     for (i = 0; i < NFIXWIN; i++) {
-      LOCK(semid);
-      k = dacq_data->fixwin[i].active;
-      UNLOCK(semid);
-      if (k) {
+      if (cfg.fixwin[i].active) {
 	float dx, dy;
-	LOCK(semid);
-	dx = dacq_data->eye_x - dacq_data->fixwin[i].cx;
-	dy = (dacq_data->eye_y - dacq_data->fixwin[i].cy) /
-	  dacq_data->fixwin[i].vbias;
-	UNLOCK(semid);
+	dx = dacq_data->eye_x - cfg.fixwin[i].cx;
+	dy = (dacq_data->eye_y - cfg.fixwin[i].cy) / cfg.fixwin[i].vbias;
 	
 	z = (dx * dx) + (dy * dy);
 	
-	LOCK(semid);
-	if (z < dacq_data->fixwin[i].rad2) {
+	k = 0;
+	SEQ_WRITE_BEGIN(dacq_data->seq);
+	if (z < cfg.fixwin[i].rad2) {
 	  // eye in fixwin -- stop counting transient breaks
 	  dacq_data->fixwin[i].state = INSIDE;
 	  dacq_data->fixwin[i].fcount = 0;
@@ -814,32 +900,36 @@ void mainloop(void)
 	  if (dacq_data->fixwin[i].fcount) {
 	    dacq_data->fixwin[i].nout += 1;
 	    if (dacq_data->fixwin[i].nout >
-		(dacq_data->fixbreak_tau_ms * SAMP_RATE / 1000)) {
+		(cfg.fixbreak_tau_ms * SAMP_RATE / 1000)) {
 	      // # ms outside exceeds fixbreak_tau_ms --> real fixbreak!
 	      if (dacq_data->fixwin[i].broke == 0) {
 		// save break time
 		dacq_data->fixwin[i].break_time =  dacq_data->timestamp;
 	      }
 	      dacq_data->fixwin[i].broke = 1;
-	      if (dacq_data->fixwin[i].genint) {
-		// alert parent process
-		dacq_data->int_class = INT_FIXWIN;
-		dacq_data->int_arg = 0;
-		dacq_data->fixwin[i].genint = 0;
-		kill(pypepid, SIGUSR1);
-		//fprintf(stderr,"das: sent int, disabled\n");
-	      }
+	      // alert parent process (once SEQ_WRITE_END'd)
+	      k = XCHG(dacq_data->fixwin[i].genint, 0); /* must be re-enabled */
 	    }
 	  }
 	}
-	UNLOCK(semid);
+	SEQ_WRITE_END(dacq_data->seq);
+	if (k) {
+	  dacq_data->int_arg = 0;
+	  dacq_data->int_class = INT_FIXWIN;
+	  kill(pypepid, SIGUSR1);
+	}
       }
     }
 
+    /* landing zones (see zones.c) */
+    if ((k = zones_tick(dacq_data, &cfg, usts, &ii)) >= 0) {
+      dacq_data->int_arg = k | (ii << 8);
+      dacq_data->int_class = INT_ZONE;
+      kill(pypepid, SIGUSR1);
+    }
+
     /* possibly bump up or down priority on the fly */
-    LOCK(semid);
     k = dacq_data->dacq_pri;
-    UNLOCK(semid);
     if (setpri && lastpri != k) {
       lastpri = k;
       errno = 0;
@@ -851,10 +941,10 @@ void mainloop(void)
 	resched(1);
       }
     }
-    LOCK(semid);
-    k = dacq_data->terminate;
-    UNLOCK(semid);
-  } while (! k);
+
+    /* loop latency (us) -- sample time to end of loop */
+    seq_looplat(dacq_data, timestamp() - usts);
+  } while (! dacq_data->terminate);
 
   fprintf(stderr, "%s: terminate signal received\n", progname);
   iscan_halt();
@@ -864,9 +954,7 @@ void mainloop(void)
   }
 
   /* no longer ready */
-  LOCK(semid);
-  dacq_data->servers_avail -= 1;
-  UNLOCK(semid);
+  ATOMIC_ADD(dacq_data->servers_avail, -1);
 }
 
 int main(int ac, char **av)
@@ -884,6 +972,7 @@ int main(int ac, char **av)
       {"usbjs",   optional_argument, 0, 'j'}, /* dev file for usbjs */
       {"swapxy",  optional_argument, 0, 's'}, /* swap xy channels? */
       {"arange",  optional_argument, 0, 'a'}, /* set dacq analog range */
+      {"adrate",  optional_argument, 0, 'r'}, /* a/d scan rate (Hz) */
       {0, 0, 0, 0}
     };
 
@@ -897,7 +986,7 @@ int main(int ac, char **av)
 	  progname);
   fprintf(stderr, "%s: pid=%d\n", progname, getpid());
 
-  while ((c = getopt_long(ac, av, "t:p:e:c:j:s:a:",
+  while ((c = getopt_long(ac, av, "t:p:e:c:j:s:a:r:",
 			  long_options, &option_index)) != -1) {
     switch (c)
       {
@@ -929,6 +1018,11 @@ int main(int ac, char **av)
 	  arange = f;
 	}
 	break;
+      case 'r':
+	if (sscanf(optarg, "%d", &i) == 1) {
+	  adrate = i;
+	}
+	break;
       default:
 	abort();
       }
@@ -960,9 +1054,7 @@ int main(int ac, char **av)
       fprintf(stderr, "%s: can't open joystick %s\n", progname, usbjs);
     } else {
       fprintf(stderr, "%s: joystick at %s configured\n", progname, usbjs);
-      LOCK(semid);
       dacq_data->js_enabled = 1;
-      UNLOCK(semid);
     }
   }
 
@@ -0,0 +1,176 @@
+/* title:   hsamp.c
+** author:  jamie mazer
+** created: Sun Oct 18 18:10:26 2026 mazer
+** info:    high-rate a/d sampling -- decimation and ttl edges
+** history:
+**
+** Sun Oct 18 19:02:11 2026 mazer
+**   ttl edges: same onset rules as vectorops.find_ttl() (strict
+**   threshold, state held at the threshold value), timestamps are
+**   linearly interpolated between the two samples straddling the
+**   threshold, and hsamp_tick() does the same thing once per tick
+**   when the a/d isn't being streamed.
+**
+** When the server's streaming the a/d (comedi command mode, or
+** dummy_server --synth) at more than one scan per SAMP_RATE tick,
+** each tick's worth of scans is handed to hsamp_block(), which:
+**
+** - leaves the last scan in adc[] for the usual once-per-tick
+**   processing (eye position, adbufs etc),
+**
+** - stores channels with hs_decim[c] > 0 in their own ring (hsbuf)
+**   at ad_rate/hs_decim[c] -- each stored sample is the mean of
+**   hs_decim[c] scans, stamped with the middle of the group,
+**
+** - timestamps threshold crossings on channels with ttl_mode[c] set
+**   into the ttl event ring (see ttl_edge).
+**
+** Timestamps are t0 (first scan in the block) + n * dt, so the
+** caller's responsible for keeping t0 on the timestamp() clock.
+*/
+
+#include <string.h>
+
+#include "dacqinfo.h"
+#include "seqlock.h"
+#include "hsamp.h"
+
+void hsamp_init(HSAMP *h, int rate)
+{
+  memset(h, 0, sizeof(HSAMP));
+  h->dt = 1.0e6 / rate;
+}
+
+static void ttl_push(DACQINFO *d, int chan, double t)
+{
+  unsigned int k;
+
+  k = d->ttl_head % NTTLEV;
+  d->ttl_t[k] = t;
+  d->ttl_chan[k] = chan;
+  SEQ_BARRIER();
+  d->ttl_head += 1;
+}
+
+/*
+ * Pulse onset detection for one sample on chan c, given the time of
+ * the previous sample. TTL_RISING pulses start when v goes above
+ * thresh, TTL_FALLING when it goes below and either way a pulse ends
+ * when v is back on the other side -- v == thresh doesn't change
+ * anything. The event time is where the line between the previous
+ * sample and this one crosses thresh. Nothing's pushed unless primed
+ * (ie, there's a previous sample in h->last[c]).
+ */
+static void ttl_edge(HSAMP *h, DACQINFO *d, DACQCFG *cfg,
+		     int c, int v, double t, double tprev, int primed)
+{
+  int th = cfg->ttl_thresh[c];
+  int on, off, last;
+  double f;
+
+  switch (cfg->ttl_mode[c])
+    {
+    case TTL_RISING:
+      on = v > th;
+      off = v < th;
+      break;
+    case TTL_FALLING:
+      on = v < th;
+      off = v > th;
+      break;
+    default:
+      h->ttl_in[c] = 0;
+      return;
+    }
+
+  if (on && ! h->ttl_in[c] && primed) {
+    last = h->last[c];
+    f = (v == last) ? 1.0 : (double)(th - last) / (double)(v - last);
+    if (f < 0.0) {
+      f = 0.0;
+    } else if (f > 1.0) {
+      f = 1.0;
+    }
+    ttl_push(d, c, tprev + f * (t - tprev));
+  }
+  if (on) {
+    h->ttl_in[c] = 1;
+  } else if (off) {
+    h->ttl_in[c] = 0;
+  }
+}
+
+static void hs_push(DACQINFO *d, int chan, double t, int v)
+{
+  unsigned int k;
+
+  if (d->hs_head[chan] - d->hs_tail[chan] >= HSBUFLEN) {
+    d->adbuf_overflow++;
+  }
+  k = d->hs_head[chan] % HSBUFLEN;
+  d->hsbuf_t[chan][k] = t;
+  d->hsbuf[chan][k] = v;
+  SEQ_BARRIER();
+  d->hs_head[chan] += 1;
+}
+
+void hsamp_block(HSAMP *h, DACQINFO *d, DACQCFG *cfg,
+		 int *scans, int nscans, int nchan, double t0, int store)
+{
+  int c, n, v, decim;
+  double t;
+
+  if (nscans <= 0) {
+    return;
+  }
+  if (nchan > NADC) {
+    nchan = NADC;
+  }
+
+  for (c = 0; c < nchan; c++) {
+    decim = store ? cfg->hs_decim[c] : 0;
+    if (decim <= 0) {
+      h->nsum[c] = 0;		/* next group starts when storage does */
+    }
+    for (n = 0; n < nscans; n++) {
+      v = scans[(n * nchan) + c];
+      t = t0 + (n * h->dt);
+
+      ttl_edge(h, d, cfg, c, v, t, t - h->dt, h->primed || n > 0);
+      h->last[c] = v;
+
+      if (decim > 0) {
+	if (h->nsum[c] == 0) {
+	  h->sum[c] = 0;
+	  h->tsum0[c] = t;
+	}
+	h->sum[c] += v;
+	if (++h->nsum[c] >= decim) {
+	  hs_push(d, c, h->tsum0[c] + (0.5 * (decim - 1) * h->dt),
+		  (int)(h->sum[c] / decim));
+	  h->nsum[c] = 0;
+	}
+      }
+    }
+    // last scan is the current value as far as everything else goes
+    d->adc[c] = scans[((nscans - 1) * nchan) + c];
+  }
+  h->tlast = t0 + ((nscans - 1) * h->dt);
+  h->primed = 1;
+}
+
+/*
+ * one-sample-per-tick version: edge detection only, on whatever's
+ * in adc[] right now (sampled at time t)
+ */
+void hsamp_tick(HSAMP *h, DACQINFO *d, DACQCFG *cfg, double t)
+{
+  int c;
+
+  for (c = 0; c < NADC; c++) {
+    ttl_edge(h, d, cfg, c, d->adc[c], t, h->tlast, h->primed);
+    h->last[c] = d->adc[c];
+  }
+  h->tlast = t;
+  h->primed = 1;
+}
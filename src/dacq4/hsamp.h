@@ -0,0 +1,26 @@
+/* title:   hsamp.h
+** author:  jamie mazer
+** created: Sun Oct 18 18:10:26 2026 mazer
+** info:    api for hsamp.c
+** history:
+**
+** Sun Oct 18 19:02:11 2026 mazer
+**   added hsamp_tick()
+*/
+
+typedef struct {
+  double dt;			/* us per scan */
+  int last[NADC];		/* previous scan (edge detection) */
+  double tlast;			/* time of last[] (us) */
+  int primed;			/* last[] valid? */
+  int ttl_in[NADC];		/* inside a ttl pulse? */
+  long sum[NADC];		/* decimation accumulators.. */
+  int nsum[NADC];
+  double tsum0[NADC];		/* ..time of first scan in group */
+} HSAMP;
+
+extern void hsamp_init(HSAMP *h, int rate);
+extern void hsamp_block(HSAMP *h, DACQINFO *d, DACQCFG *cfg,
+			int *scans, int nscans, int nchan,
+			double t0, int store);
+extern void hsamp_tick(HSAMP *h, DACQINFO *d, DACQCFG *cfg, double t);
@@ -0,0 +1,281 @@
+/* title:   seqbench.c
+** author:  jamie mazer
+** created: Sun Oct 18 16:40:05 2026 mazer
+** info:    server loop latency: semaphore vs seqlock shm access
+**
+** Runs a fake 1kHz server loop against a private DACQINFO block
+** while some "pype" processes hammer the block the way pype does
+** when it's polling the eye position and clock, and reports how
+** long each pass through the server loop took (same histogram the
+** real server keeps, see seq_looplat()).
+**
+**   usage: seqbench [sem|seq|both] [nsamps] [nreaders]
+**
+** sem: the old protocol (LOCK()/UNLOCK() around everything)
+** seq: the seqlock.h protocol
+*/
+
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <sys/mman.h>
+#include <unistd.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <signal.h>
+#include <time.h>
+
+#include "dacqinfo.h"
+#include "systemio.h"
+#include "psems.h"
+#include "seqlock.h"
+
+static DACQINFO *dacq_data = NULL;
+static int semid = -1;
+static volatile long sink;	/* keep reads from being optimized away */
+
+/*
+ * pype side -- poll eye position & clock; the first one also tweaks
+ * the config now and then (there's only ever one pype)
+ */
+static void reader(int lockfree, int writer)
+{
+  int x, y;
+  unsigned long ts;
+  unsigned int q;
+  long n;
+
+  for (n = 0; ! dacq_data->terminate; n++) {
+    if (lockfree) {
+      do {
+	q = seq_read_begin(&dacq_data->seq);
+	x = dacq_data->eye_x;
+	y = dacq_data->eye_y;
+	ts = dacq_data->timestamp;
+      } while (seq_read_retry(&dacq_data->seq, q));
+      sink = x + y + ts;
+      if (writer && (n % 1000) == 0) {
+	SEQ_WRITE_BEGIN(dacq_data->cfgseq);
+	dacq_data->fixwin[0].cx = n % 100;
+	SEQ_WRITE_END(dacq_data->cfgseq);
+      }
+    } else {
+      LOCK(semid);
+      x = dacq_data->eye_x;
+      UNLOCK(semid);
+      LOCK(semid);
+      y = dacq_data->eye_y;
+      UNLOCK(semid);
+      LOCK(semid);
+      ts = dacq_data->timestamp;
+      UNLOCK(semid);
+      sink = x + y + ts;
+      if (writer && (n % 1000) == 0) {
+	LOCK(semid);
+	dacq_data->fixwin[0].cx = n % 100;
+	UNLOCK(semid);
+      }
+    }
+  }
+  _exit(0);
+}
+
+/* server side -- one sample, same shm traffic as the old mainloop */
+static void sample_sem(double usts)
+{
+  int k, i;
+  float dx, dy;
+
+  LOCK(semid);
+  k = dacq_data->clock_reset;
+  UNLOCK(semid);
+  LOCK(semid);
+  k = dacq_data->eye_smooth;
+  UNLOCK(semid);
+  LOCK(semid);
+  dacq_data->eye_rawx = (int)usts & 0xff;
+  dacq_data->eye_rawy = (int)usts & 0x7f;
+  dacq_data->eye_x = (int)(dacq_data->eye_xgain * dacq_data->eye_rawx);
+  dacq_data->eye_y = (int)(dacq_data->eye_ygain * dacq_data->eye_rawy);
+  UNLOCK(semid);
+  LOCK(semid);
+  k = dacq_data->din[0];
+  UNLOCK(semid);
+  LOCK(semid);
+  k = dacq_data->dout_strobe;
+  UNLOCK(semid);
+  LOCK(semid);
+  dacq_data->timestamp = (unsigned long)(usts / 1000.0);
+  dacq_data->usts = usts;
+  k = dacq_data->adbuf_on;
+  UNLOCK(semid);
+  if (k) {
+    LOCK(semid);
+    k = dacq_data->adbuf_head % ADBUFLEN;
+    dacq_data->adbuf_t[k] = usts;
+    dacq_data->adbuf_x[k] = dacq_data->eye_x;
+    dacq_data->adbuf_y[k] = dacq_data->eye_y;
+    dacq_data->adbuf_head += 1;
+    UNLOCK(semid);
+  }
+  for (i = 0; i < NFIXWIN; i++) {
+    LOCK(semid);
+    k = dacq_data->fixwin[i].active;
+    UNLOCK(semid);
+    if (k) {
+      LOCK(semid);
+      dx = dacq_data->eye_x - dacq_data->fixwin[i].cx;
+      dy = dacq_data->eye_y - dacq_data->fixwin[i].cy;
+      UNLOCK(semid);
+      LOCK(semid);
+      dacq_data->fixwin[i].state = ((dx * dx + dy * dy) <
+				    dacq_data->fixwin[i].rad2);
+      UNLOCK(semid);
+    }
+  }
+  LOCK(semid);
+  k = dacq_data->dacq_pri;
+  UNLOCK(semid);
+  LOCK(semid);
+  k = dacq_data->terminate;
+  UNLOCK(semid);
+}
+
+static void sample_seq(double usts, DACQCFG *cfg, unsigned int *cfglast)
+{
+  int k, i;
+  float dx, dy;
+
+  k = XCHG(dacq_data->clock_reset, 0);
+  seq_server_requests(dacq_data);
+  seq_cfg_read(dacq_data, cfg, cfglast);
+
+  SEQ_WRITE_BEGIN(dacq_data->seq);
+  dacq_data->eye_rawx = (int)usts & 0xff;
+  dacq_data->eye_rawy = (int)usts & 0x7f;
+  dacq_data->eye_x = (int)(cfg->eye_xgain * dacq_data->eye_rawx);
+  dacq_data->eye_y = (int)(cfg->eye_ygain * dacq_data->eye_rawy);
+  dacq_data->timestamp = (unsigned long)(usts / 1000.0);
+  dacq_data->usts = usts;
+  SEQ_WRITE_END(dacq_data->seq);
+
+  if (dacq_data->adbuf_on) {
+    k = dacq_data->adbuf_head % ADBUFLEN;
+    dacq_data->adbuf_t[k] = usts;
+    dacq_data->adbuf_x[k] = dacq_data->eye_x;
+    dacq_data->adbuf_y[k] = dacq_data->eye_y;
+    SEQ_BARRIER();
+    dacq_data->adbuf_head += 1;
+  }
+  for (i = 0; i < NFIXWIN; i++) {
+    if (cfg->fixwin[i].active) {
+      dx = dacq_data->eye_x - cfg->fixwin[i].cx;
+      dy = dacq_data->eye_y - cfg->fixwin[i].cy;
+      SEQ_WRITE_BEGIN(dacq_data->seq);
+      dacq_data->fixwin[i].state = ((dx * dx + dy * dy) < cfg->fixwin[i].rad2);
+      SEQ_WRITE_END(dacq_data->seq);
+    }
+  }
+}
+
+static double pct(unsigned int *h, unsigned long n, double p)
+{
+  unsigned long c = 0;
+  int i;
+
+  for (i = 0; i < NLATBIN; i++) {
+    if ((c += h[i]) >= p * n) {
+      return((i + 1) * LATBIN_US);
+    }
+  }
+  return(NLATBIN * LATBIN_US);
+}
+
+static void run(int lockfree, int nsamps, int nreaders)
+{
+  DACQCFG cfg;
+  unsigned int cfglast = 1;
+  pid_t pids[64];
+  double t0, usts, next;
+  int i;
+
+  memset(dacq_data, 0, sizeof(DACQINFO));
+  dacq_data->eye_xgain = dacq_data->eye_ygain = 1.0;
+  dacq_data->adbuf_on = 1;
+  dacq_data->fixwin[0].active = 1;
+  dacq_data->fixwin[0].rad2 = 100;
+  if (! lockfree) {
+    psem_set(semid, 1);
+  }
+  memset(&cfg, 0, sizeof(cfg));
+  seq_cfg_read(dacq_data, &cfg, &cfglast);
+
+  fflush(stdout);
+  for (i = 0; i < nreaders; i++) {
+    if ((pids[i] = fork()) == 0) {
+      reader(lockfree, i == 0);
+    }
+  }
+  usleep(100000);
+
+  next = timestamp();
+  for (i = 0; i < nsamps; i++) {
+    /* wait for next sample tick, like the real server */
+    next += 1.0e6 / SAMP_RATE;
+    while ((usts = timestamp()) < next) {
+      usleep(50);
+    }
+    t0 = usts;
+    if (lockfree) {
+      sample_seq(usts, &cfg, &cfglast);
+    } else {
+      sample_sem(usts);
+    }
+    seq_looplat(dacq_data, timestamp() - t0);
+  }
+
+  dacq_data->terminate = 1;
+  for (i = 0; i < nreaders; i++) {
+    waitpid(pids[i], NULL, 0);
+  }
+
+  printf("%-4s %d samples, %d readers: "
+	 "p50 %4.0fus  p99 %5.0fus  p99.9 %5.0fus  max %6uus  late %u\n",
+	 lockfree ? "seq" : "sem", nsamps, nreaders,
+	 pct(dacq_data->looplat, nsamps, 0.50),
+	 pct(dacq_data->looplat, nsamps, 0.99),
+	 pct(dacq_data->looplat, nsamps, 0.999),
+	 dacq_data->looplat_max, dacq_data->looplat_late);
+}
+
+int main(int ac, char **av)
+{
+  char *mode = (ac > 1) ? av[1] : "both";
+  int nsamps = (ac > 2) ? atoi(av[2]) : 5000;
+  int nreaders = (ac > 3) ? atoi(av[3]) : 2;
+
+  if (nreaders > 64) {
+    nreaders = 64;
+  }
+  dacq_data = mmap(NULL, sizeof(DACQINFO), PROT_READ | PROT_WRITE,
+		   MAP_SHARED | MAP_ANONYMOUS, -1, 0);
+  if (dacq_data == MAP_FAILED) {
+    perror("mmap");
+    exit(1);
+  }
+  if ((semid = psem_init(0)) < 0) {	/* IPC_PRIVATE */
+    perror("psem_init");
+    exit(1);
+  }
+
+  if (strcmp(mode, "seq") != 0) {
+    run(0, nsamps, nreaders);
+  }
+  if (strcmp(mode, "sem") != 0) {
+    run(1, nsamps, nreaders);
+  }
+
+  psem_free(semid);
+  munmap(dacq_data, sizeof(DACQINFO));
+  exit(0);
+}
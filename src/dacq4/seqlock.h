@@ -0,0 +1,292 @@
+/* title:   seqlock.h
+** author:  jamie mazer
+** created: Sun Oct 18 15:20:11 2026 mazer
+** info:    lock-free access to the DACQINFO shm block
+**
+** The server and pype used to take the SysV semaphore (LOCK/UNLOCK)
+** around every access to the shm block -- about fifteen semop's per
+** sample in the server's mainloop plus one for every dacq_xxx() call
+** from python -- and the server would stall whenever pype got
+** preempted holding the lock. Instead:
+**
+** - Every field has a single writer. The server owns the sample
+**   state (eye_*, adc[], timestamps, din[], js*, fixwin state, the
+**   a/d buffers); pype owns the config (eye calibration, smoothing,
+**   fixwin geometry, dout[], flags).
+**
+** - Multi-word updates are published under a sequence counter: the
+**   writer bumps it to odd, writes, and bumps it back to even, and
+**   readers copy and retry if it was odd or changed underneath
+**   them. pype spins (the server never stays odd for more than a
+**   few instructions); the server never waits on pype -- if pype's
+**   in the middle of an update, it keeps using its last copy.
+**
+** - Flags both sides change (interrupt enables, alarm, strobes,
+**   counters) are updated with atomic exchange/compare-and-swap.
+**
+** - pype asks the server to reset server-owned state (a/d buffers,
+**   fixwin state, latency histogram) by bumping a request counter;
+**   the server does the reset at the top of the next sample and
+**   copies the request count to the matching ack counter.
+**
+** - The a/d buffers are a single-writer ring: each sample is stored
+**   before adbuf_head is advanced, with a barrier in between, so
+**   everything from adbuf_tail up to adbuf_head is always valid.
+**   pype advances adbuf_tail as it drains samples out.
+**
+** The semaphore's still used once at startup, so the server waits
+** for pype to finish initializing the shm block.
+*/
+
+#include <string.h>
+#include <sched.h>
+
+#define SEQ_BARRIER()		__sync_synchronize()
+#define XCHG(v, new)		__sync_lock_test_and_set(&(v), (new))
+#define CAS(v, old, new)	__sync_bool_compare_and_swap(&(v), (old), (new))
+#define ATOMIC_ADD(v, n)	__sync_add_and_fetch(&(v), (n))
+
+/* writer side -- single writer only! */
+#define SEQ_WRITE_BEGIN(s)	{ (s)++; SEQ_BARRIER(); }
+#define SEQ_WRITE_END(s)	{ SEQ_BARRIER(); (s)++; }
+
+/*
+ * reader side:
+ *
+ *   do {
+ *     q = seq_read_begin(&dacq_data->seq);
+ *     ...copy fields...
+ *   } while (seq_read_retry(&dacq_data->seq, q));
+ */
+static inline unsigned int seq_read_begin(volatile unsigned int *s)
+{
+  unsigned int q;
+  int n;
+
+  for (n = 0; (q = *s) & 1; n++) {
+    if (n > 1000) {
+      sched_yield();		/* writer got preempted?? */
+    }
+  }
+  SEQ_BARRIER();
+  return(q);
+}
+
+static inline int seq_read_retry(volatile unsigned int *s, unsigned int q)
+{
+  SEQ_BARRIER();
+  return(*s != q);
+}
+
+/* pype-owned part of a ZONE */
+typedef struct {
+  int shape;
+  int cx, cy;
+  float vbias;
+  float rin, rout;
+  float angle, subtense;
+  int dwell_ms, tau_ms;
+} ZONECFG;
+
+/* server's private copy of the pype-owned config */
+typedef struct {
+  float eye_xgain, eye_ygain;
+  int	eye_xoff, eye_yoff;
+  float eye_smooth;
+  float eye_affine[3][3];
+  float eye_rot;
+  int	fixbreak_tau_ms;
+  int	ad_rate;
+  int	hs_decim[NADC];
+  int	ttl_mode[NADC];
+  int	ttl_thresh[NADC];
+  struct {
+    int active;
+    int cx, cy;
+    float vbias;
+    int rad2;
+  } fixwin[NFIXWIN];
+  ZONECFG zone[NZONES];
+} DACQCFG;
+
+/*
+ * server: refresh cfg if pype's changed the config since the last
+ * call (*last is the cfgseq value cfg was read at; start with an
+ * odd value to force a read). Never waits -- if pype's halfway
+ * through an update, returns 0 and cfg is left alone.
+ */
+static inline int seq_cfg_read(DACQINFO *d, DACQCFG *cfg, unsigned int *last)
+{
+  DACQCFG c;
+  unsigned int q;
+  int i;
+
+  if ((q = d->cfgseq) == *last) {
+    return(1);
+  } else if (q & 1) {
+    return(0);
+  }
+  SEQ_BARRIER();
+  c.eye_xgain = d->eye_xgain;
+  c.eye_ygain = d->eye_ygain;
+  c.eye_xoff = d->eye_xoff;
+  c.eye_yoff = d->eye_yoff;
+  c.eye_smooth = d->eye_smooth;
+  memcpy(c.eye_affine, d->eye_affine, sizeof(c.eye_affine));
+  c.eye_rot = d->eye_rot;
+  c.fixbreak_tau_ms = d->fixbreak_tau_ms;
+  c.ad_rate = d->ad_rate;
+  for (i = 0; i < NADC; i++) {
+    c.hs_decim[i] = d->hs_decim[i];
+    c.ttl_mode[i] = d->ttl_mode[i];
+    c.ttl_thresh[i] = d->ttl_thresh[i];
+  }
+  for (i = 0; i < NFIXWIN; i++) {
+    c.fixwin[i].active = d->fixwin[i].active;
+    c.fixwin[i].cx = d->fixwin[i].cx;
+    c.fixwin[i].cy = d->fixwin[i].cy;
+    c.fixwin[i].vbias = d->fixwin[i].vbias;
+    c.fixwin[i].rad2 = d->fixwin[i].rad2;
+  }
+  for (i = 0; i < NZONES; i++) {
+    c.zone[i].shape = d->zone[i].shape;
+    c.zone[i].cx = d->zone[i].cx;
+    c.zone[i].cy = d->zone[i].cy;
+    c.zone[i].vbias = d->zone[i].vbias;
+    c.zone[i].rin = d->zone[i].rin;
+    c.zone[i].rout = d->zone[i].rout;
+    c.zone[i].angle = d->zone[i].angle;
+    c.zone[i].subtense = d->zone[i].subtense;
+    c.zone[i].dwell_ms = d->zone[i].dwell_ms;
+    c.zone[i].tau_ms = d->zone[i].tau_ms;
+  }
+  if (seq_read_retry(&d->cfgseq, q)) {
+    return(0);
+  }
+  *cfg = c;
+  *last = q;
+  return(1);
+}
+
+/*
+ * server: get latest sample from an external tracker (see
+ * dacq_set_xtracker). *last is the xnew count last time through.
+ * Returns 1 for a new sample, 0 for no new sample and -1 if pype's
+ * halfway through an update (x, y, pa unchanged).
+ */
+static inline int seq_xtracker(DACQINFO *d, int *x, int *y, int *pa, int *last)
+{
+  unsigned int q;
+  int xx, xy, xpa, n;
+
+  if ((q = d->xseq) & 1) {
+    return(-1);
+  }
+  SEQ_BARRIER();
+  xx = d->xx;
+  xy = d->xy;
+  xpa = d->xpa;
+  n = d->xnew;
+  if (seq_read_retry(&d->xseq, q)) {
+    return(-1);
+  }
+  *x = xx;
+  *y = xy;
+  *pa = xpa;
+  if (n != *last) {
+    *last = n;
+    return(1);
+  }
+  return(0);
+}
+
+/* clear a zone's server-owned state (inside SEQ_WRITE_BEGIN/END(seq)) */
+static inline void seq_zone_clear(ZONE *z)
+{
+  z->inside = 0;
+  z->landed = 0;
+  z->broke = 0;
+  z->nenter = 0;
+  z->enter_t = 0.0;
+  z->exit_t = 0.0;
+  z->landed_t = 0.0;
+  z->out_t = 0.0;
+}
+
+/* server: act on any pending reset requests from pype */
+static inline void seq_server_requests(DACQINFO *d)
+{
+  unsigned int r;
+  int i;
+
+  if ((r = d->adbuf_clear_req) != d->adbuf_clear_ack) {
+    d->adbuf_head = 0;
+    d->adbuf_tail = 0;		/* pype's waiting for the ack */
+    for (i = 0; i < NADC; i++) {
+      d->hs_head[i] = 0;
+      d->hs_tail[i] = 0;
+    }
+    d->adbuf_overflow = 0;
+    SEQ_BARRIER();
+    d->adbuf_clear_ack = r;
+  }
+
+  for (i = 0; i < NFIXWIN; i++) {
+    if ((r = d->fixwin[i].reset_req) != d->fixwin[i].reset_ack) {
+      SEQ_WRITE_BEGIN(d->seq);
+      d->fixwin[i].state = 0;
+      d->fixwin[i].broke = 0;
+      d->fixwin[i].break_time = 0;
+      d->fixwin[i].fcount = 0;
+      d->fixwin[i].nout = 0;
+      SEQ_WRITE_END(d->seq);
+      d->fixwin[i].reset_ack = r;
+    }
+    if ((r = d->fixwin[i].clear_req) != d->fixwin[i].clear_ack) {
+      // only if the eye's still inside -- otherwise it's a new break
+      if (d->fixwin[i].state) {
+	SEQ_WRITE_BEGIN(d->seq);
+	d->fixwin[i].broke = 0;
+	SEQ_WRITE_END(d->seq);
+      }
+      d->fixwin[i].clear_ack = r;
+    }
+  }
+
+  for (i = 0; i < NZONES; i++) {
+    if ((r = d->zone[i].reset_req) != d->zone[i].reset_ack) {
+      SEQ_WRITE_BEGIN(d->seq);
+      seq_zone_clear(&d->zone[i]);
+      SEQ_WRITE_END(d->seq);
+      d->zone[i].reset_ack = r;
+    }
+  }
+
+  if ((r = d->looplat_req) != d->looplat_ack) {
+    memset(d->looplat, 0, sizeof(d->looplat));
+    d->looplat_max = 0;
+    d->looplat_late = 0;
+    SEQ_BARRIER();
+    d->looplat_ack = r;
+  }
+}
+
+/* server: add one loop time (us) to the latency histogram */
+static inline void seq_looplat(DACQINFO *d, double us)
+{
+  int bin;
+
+  bin = (int)(us / LATBIN_US);
+  if (bin < 0) {
+    bin = 0;
+  } else if (bin >= NLATBIN) {
+    bin = NLATBIN - 1;
+  }
+  d->looplat[bin] += 1;
+  if (us > d->looplat_max) {
+    d->looplat_max = (unsigned int)us;
+  }
+  if (us > (1.0e6 / SAMP_RATE)) {
+    d->looplat_late += 1;
+  }
+}
@@ -0,0 +1,147 @@
+/* title:   zones.c
+** author:  jamie mazer
+** created: Sun Oct 18 20:31:07 2026 mazer
+** info:    server-side landing zones
+**
+** Generalized fixwins: every sample, the (calibrated, smoothed) eye
+** position is checked against each active zone in DACQINFO.zone[],
+** which can be
+**
+** - ZONE_CIRCLE: circle of radius rout, stretched vertically by vbias
+**   (same test as the fixwins), or
+**
+** - ZONE_SECTOR: annular sector rin..rout around (cx, cy), angle +-
+**   subtense degrees (same geometry as lzones.SectorLandingZone).
+**
+** and its state updated:
+**
+** - entering sets inside and counts an entry (ZONE_ENTER),
+**
+** - staying inside for dwell_ms sets landed (ZONE_LANDED),
+**
+** - leaving for more than tau_ms clears both (ZONE_EXIT); shorter
+**   excursions are ignored and the exit's timestamped at the first
+**   sample outside. It also sets broke, which (like a fixwin's)
+**   stays set until the zone's reset, even if the eye comes back.
+**
+** Each event is stamped with the sample time (us) in the zone's
+** state and pushed onto the zone event ring. If the event's bit is
+** set in the zone's genint mask, the mask's cleared (must be
+** re-enabled, just like fixwins) and the caller sends pype an
+** INT_ZONE.
+*/
+
+#include <math.h>
+
+#include "dacqinfo.h"
+#include "seqlock.h"
+#include "zones.h"
+
+static void zone_push(DACQINFO *d, int n, int ev, double t)
+{
+  unsigned int k;
+
+  k = d->zone_ev_head % NZONEEV;
+  d->zone_ev_t[k] = t;
+  d->zone_ev_zone[k] = n;
+  d->zone_ev_type[k] = ev;
+  SEQ_BARRIER();
+  d->zone_ev_head += 1;
+}
+
+/* is (x, y) inside zone c? */
+static int zone_hit(ZONECFG *c, int x, int y)
+{
+  float dx, dy, r2, a;
+
+  if (c->vbias <= 0.0) {
+    return(0);			/* dacq_zone() never sets this */
+  }
+  dx = x - c->cx;
+  dy = (y - c->cy) / c->vbias;
+  r2 = (dx * dx) + (dy * dy);
+  if (r2 >= c->rout * c->rout) {
+    return(0);
+  }
+  if (c->shape == ZONE_CIRCLE) {
+    return(1);
+  }
+  if (r2 <= c->rin * c->rin) {
+    return(0);
+  }
+  // angle from the sector's direction, wrapped to -180..180
+  a = fmod((180.0 / M_PI * atan2(dy, dx)) - c->angle, 360.0);
+  if (a > 180.0) {
+    a -= 360.0;
+  } else if (a < -180.0) {
+    a += 360.0;
+  }
+  return(fabs(a) <= c->subtense);
+}
+
+/*
+ * Check all the active zones against the current eye position
+ * (sample time t, us). Returns the zone that needs an interrupt
+ * sent (and the event in *ev), or -1 for none. Only one interrupt's
+ * sent per sample; anything else is still in the event ring.
+ */
+int zones_tick(DACQINFO *d, DACQCFG *cfg, double t, int *ev)
+{
+  int i, k, nev, x, y, fire = -1;
+  int evs[2];
+  double evt[2];
+  ZONECFG *c;
+  ZONE *z;
+
+  x = d->eye_x;
+  y = d->eye_y;
+  for (i = 0; i < NZONES; i++) {
+    c = &cfg->zone[i];
+    if (c->shape == ZONE_OFF) {
+      continue;
+    }
+    z = &d->zone[i];
+    nev = 0;
+    SEQ_WRITE_BEGIN(d->seq);
+    if (zone_hit(c, x, y)) {
+      z->out_t = 0.0;
+      if (! z->inside) {
+	z->inside = 1;
+	z->nenter += 1;
+	z->enter_t = t;
+	evt[nev] = t;
+	evs[nev++] = ZONE_ENTER;
+      }
+      if (! z->landed && (t - z->enter_t) >= (1000.0 * c->dwell_ms)) {
+	z->landed = 1;
+	z->landed_t = t;
+	evt[nev] = t;
+	evs[nev++] = ZONE_LANDED;
+      }
+    } else if (z->inside) {
+      if (z->out_t == 0.0) {
+	z->out_t = t;
+      }
+      if ((t - z->out_t) >= (1000.0 * c->tau_ms)) {
+	z->inside = 0;
+	z->landed = 0;
+	z->broke = 1;
+	z->exit_t = z->out_t;
+	z->out_t = 0.0;
+	evt[nev] = z->exit_t;
+	evs[nev++] = ZONE_EXIT;
+      }
+    }
+    SEQ_WRITE_END(d->seq);
+
+    for (k = 0; k < nev; k++) {
+      zone_push(d, i, evs[k], evt[k]);
+      if (fire < 0 && (d->zone[i].genint & (1 << evs[k])) &&
+	  XCHG(d->zone[i].genint, 0)) {
+	fire = i;
+	*ev = evs[k];
+      }
+    }
+  }
+  return(fire);
+}
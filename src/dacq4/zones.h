@@ -0,0 +1,7 @@
+/* title:   zones.h
+** author:  jamie mazer
+** created: Sun Oct 18 20:31:07 2026 mazer
+** info:    api for zones.c
+*/
+
+extern int zones_tick(DACQINFO *d, DACQCFG *cfg, double t, int *ev);
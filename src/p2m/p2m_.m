@@ -43,6 +43,11 @@ function pf = p2m_(pypefile, oldpf, loadby)
 % Fri Oct 22 12:54:54 2010 mazer 
 %   added wildcard support -- pypefile can contain wildcards and each
 %   file will get p2m'd
+%
+% Sun Oct 18 15:20:11 2026 mazer
+%   pype_expander now writes a single .mat file (rec + extradata)
+%   that's loaded in one call, instead of a .m script that fread()s
+%   a temp file for every vector.
 %  
 
 if nargin == 0
@@ -73,7 +78,7 @@ if ~exist('loadby', 'var')
 end
 
 
-tmpf = [tempname '.m'];
+tmpf = [tempname '.mat'];
 
 if isempty(oldpf)
   n = 0;
@@ -94,32 +99,31 @@ end
 
 
 rec = [];
-origdir = pwd;
 et = [];
 fprintf(2, 'loading: ');
 try
-  cd(tempdir)
-  try
-    tic;
-    eval(strrep(basename(tmpf),'.m',''));
-    et = [et toc];
-  catch
-    err = lasterror;
-    fprintf(2, '\n');
-    fprintf(2, 'ERROR loading %s into matlab.\n', pypefile);
-    fprintf(2, '%s\n', err.message);
-    fprintf(2, '\n');
-    rethrow(err);
-  end
-  for n = 1:length(rec)
-    rec(n).ttl_times = rec(n).spike_times;
-  end
-  cd(origdir);
+  tic;
+  s = load(tmpf);
+  et = [et toc];
 catch
-  cd(origdir);
+  err = lasterror;
+  fprintf(2, '\n');
+  fprintf(2, 'ERROR loading %s into matlab.\n', pypefile);
+  fprintf(2, '%s\n', err.message);
+  fprintf(2, '\n');
+  delete(tmpf);
+  rethrow(err);
 end
+delete(tmpf);
 
-%% delete(tmpf);
+rec = s.rec;
+if ~isempty(s.extradata)
+  extradata = s.extradata;
+end
+clear s;
+for n = 1:length(rec)
+  rec(n).ttl_times = rec(n).spike_times;
+end
 
 fprintf(2, '\n');
 
@@ -4,6 +4,9 @@
 """
 Tue May 10 10:35:20 2011 mazer
   just count # trials in pypefile
+
+Sun Oct 18 10:40:12 2026 mazer
+  use PypeFile.count() -- reads the index sidecar if available
 """
 
 from pype import *
@@ -11,13 +14,7 @@ from pypedata import *
 
 def count(fname):
 	pf = PypeFile(fname, filter=None)
-
-	recno = 0
-	while 1:
-		d = pf.nth(recno)
-		if d is None:
-			break
-		recno = recno + 1
+	recno = pf.count()
 	pf.close()
 	sys.stdout.write('%d\n' % recno)
 		
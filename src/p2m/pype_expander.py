@@ -39,6 +39,11 @@ Tue May 10 10:23:19 2011 mazer
 Wed May 11 13:14:31 2011 mazer
   got rid of Numeric dependency (numpy now)
 
+Sun Oct 18 15:20:11 2026 mazer
+  added .mat output mode (outfile ends in .mat): everything goes into
+  a single MAT-file (see mat5.py) that matlab can load() in one call,
+  instead of a .m script plus a temp file for every vector.
+
 """
 import sys, types, string, math, os
 import numpy
@@ -46,6 +51,7 @@ from pype import *
 from events import *
 from pypedata import *
 from tempfile import mkstemp
+import mat5
 from pypedebug import keyboard
 
 DEBUG=0
@@ -313,6 +319,162 @@ def expandRecord(fname, fp, n, d, xd):
 	fp.write("fprintf(2,'+');\n")
 
 
+# fields of each rec(n) in .mat files -- same as the .m output
+MATFIELDS = ['pype_recno', 'taskname', 'trialtime', 'result', 'rt',
+			 'record_id', 'userparams', 'params', 'rest', 'ev_t', 'ev_e',
+			 'spike_times', 'photo_times', 'realt', 'eyet',
+			 'raw_photo', 'raw_spike', 'plx_times', 'plx_channels',
+			 'plx_units', 'c0', 'c1', 'c2', 'c3', 'c4', 'c5', 'c6',
+			 'eyex', 'eyey', 'eyep', 'eyenew']
+
+def matValue(v):
+	# same conversion as printify(), but to a value for mat5
+	if type(v) in (types.IntType, types.LongType, types.FloatType):
+		return float(v)
+	elif type(v) is types.ListType or type(v) is types.TupleType:
+		if len(v) > 0:
+			return [matValue(x) for x in v]
+		else:
+			return None
+	else:
+		s = '%s' % (v,)
+		return string.join(string.split(s, "\n"), "")
+
+def matDict(dict):
+	# same conversion as writeDict()
+	s = {}
+	for k in dict.keys():
+		m = matlabify(k)
+		if type(dict[k]) is types.StringType:
+			n = 0
+		else:
+			try:
+				n = len(dict[k])
+			except TypeError:
+				n = 0
+		if n == 0:
+			s[m] = matValue(dict[k])
+		else:
+			v = dict[k]
+			s[m] = [matValue(v[j]) for j in range(n)]
+	return s
+
+def matVector(v):
+	# same as writeVector() -- column vector of doubles
+	if v is None or len(v) == 0:
+		return None
+	return numpy.array(v, numpy.float64)
+
+def matRecord(n, d):
+	d.compute()
+
+	r = {}
+	r['pype_recno'] = n
+	r['taskname'] = '%s' % d.taskname
+	r['trialtime'] = '%s' % d.trialtime
+	r['result'] = '%s' % d.result
+	try:
+		r['rt'] = int('%d' % d.rt)
+	except TypeError:
+		r['rt'] = '%s' % d.rt
+	r['record_id'] = int('%d' % d.rec[8])
+
+	if len(d.rest):
+		r['rest'] = [matValue(x) for x in d.rest]
+
+	# events: row vector of times and column cell array of names
+	r['ev_t'] = numpy.array([float(e[0]) for e in d.events],
+							numpy.float64).reshape((1, -1))
+	r['ev_e'] = numpy.array([e[1] for e in d.events],
+							numpy.object).reshape((-1, 1))
+
+	for (name, attr) in (('spike_times', 'spike_times'),
+						 ('photo_times', 'photo_times'),
+						 ('realt', 'realt'),
+						 ('eyet', 'eyet'),
+						 ('eyex', 'eyex'),
+						 ('eyey', 'eyey')):
+		try:
+			r[name] = matVector(getattr(d, attr))
+		except AttributeError:
+			pass
+
+	# params last -- decoding the eye data can update it (eyelag)
+	if d.userparams:
+		r['userparams'] = matDict(d.userparams)
+	r['params'] = matDict(d.params)
+
+	for (name, k) in (('raw_photo', 9), ('raw_spike', 10),
+					  ('eyep', 12), ('eyenew', 14)):
+		try:
+			r[name] = matVector(d.rec[k])
+		except IndexError:
+			pass
+
+	if (not d.plex_times is None) and len(d.plex_times) > 0:
+		r['plx_times'] = matVector(d.plex_times)
+		r['plx_channels'] = matVector(d.plex_channels)
+		r['plx_units'] = matVector(d.plex_units)
+	elif len(d.rec) > 13 and d.rec[13] is not None:
+		plist = d.rec[13]
+		r['plx_times'] = matVector([t for (t, c, u) in plist])
+		r['plx_channels'] = matVector([c for (t, c, u) in plist])
+		r['plx_units'] = matVector([u for (t, c, u) in plist])
+
+	for chn in range(0, 7):
+		try:
+			r['c%d' % chn] = matVector(d.rec[11][chn])
+		except IndexError:
+			pass
+
+	return r
+
+def matExtradata(extradata):
+	x = []
+	for n in range(len(extradata)):
+		e = {'id': matValue(extradata[n].id)}
+		if len(extradata[n].data):
+			e['data'] = [matValue(v) for v in extradata[n].data]
+		x.append(e)
+	return x
+
+def expandFileMat(fname, outfile, startat=0, maxn=None):
+	"""Like expandFile(), but write a single MAT-file.
+
+	The MAT-file contains the rec struct array and the extradata cell
+	array that the .m script would have created. Records before
+	startat are left empty (same as the .m script). The datafile's
+	read in one pass, the struct array's size gets filled in at the
+	end.
+
+	"""
+	pf = PypeFile(fname, filter=None)
+
+	out = mat5.MatFile(outfile)
+	out.begin_structs('rec', MATFIELDS)
+	sys.stderr.write('expanding: ')
+	sys.stderr.flush()
+	recno = 0
+	# expandFile() stops after maxn+1 records
+	while not maxn or recno < startat + maxn + 1:
+		d = pf.nth(recno)
+		if d is None:
+			break
+		elif recno < startat:
+			out.append_struct({})
+			sys.stderr.write('x')
+		else:
+			out.append_struct(matRecord(recno, d))
+			sys.stderr.write('.')
+		sys.stderr.flush()
+		recno = recno + 1
+	out.end_structs()
+	out.write('extradata', matExtradata(pf.extradata))
+	out.close()
+	pf.close()
+	if recno > 0:
+		sys.stderr.write('\n')
+
 def expandFile(fname, outfile, startat=0, maxn=None):
 	pf = PypeFile(fname, filter=None)
 
@@ -348,7 +510,7 @@ if __name__ == '__main__':
 	maxn = 0							# max number of trial to extract
 
 	if len(sys.argv) < 3:
-		sys.stderr.write("Usage: %s pypefile outfile [startat] [maxn]\n" %
+		sys.stderr.write("Usage: %s pypefile outfile[.mat] [startat] [maxn]\n" %
 						 sys.argv[0])
 		sys.exit(1)
 
@@ -357,5 +519,8 @@ if __name__ == '__main__':
 	if len(sys.argv) > 4:
 		maxn = int(sys.argv[4])
 
-	expandFile(sys.argv[1], sys.argv[2], startat=n, maxn=maxn)
+	if sys.argv[2][-4:] == '.mat':
+		expandFileMat(sys.argv[1], sys.argv[2], startat=n, maxn=maxn)
+	else:
+		expandFile(sys.argv[1], sys.argv[2], startat=n, maxn=maxn)
 	sys.exit(0)
@@ -0,0 +1,339 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""Streaming reader for the dacq a/d buffers
+
+The dacq server stores samples in a fixed size ring in shared memory
+(ADBUFLEN samples, see dacqinfo.h). AdStream runs a thread that drains
+new samples out of the ring while the trial's running and tells the
+server how far it's got (dacq_adbuf_tail), so the server only has to
+flag an overflow if we fall a whole ring (60s) behind -- trials can be
+any length.
+
+Drained samples go into per-channel numpy arrays that grow by doubling,
+so the arrays returned by now() are views onto storage that's never
+overwritten (a new trial gets new arrays) and don't need to be copied
+out at the end of the trial.
+
+If the server's doing high-rate sampling (see dacq4/hsamp.c), any
+channels being stored at high rate (HS_DECIM) come out of their own
+rings the same way and are available from now_hs().
+
+TTL pulse onsets the server's detected (dacq_ttl(), see dacq4/hsamp.c)
+while collecting are pulled out of the server's event ring along with
+the samples and are available per channel from now_ttl() -- this only
+ever touches new events, so it's cheap to call mid-trial.
+
+Author -- James A. Mazer (mazerj@gmail.com)
+
+"""
+
+import sys
+import threading
+import numpy as np
+
+if sys.platform.startswith('linux'):
+	from dacq import *
+else:
+	from dacqfallback import *
+
+class AdStream(object):
+	def __init__(self, period=0.05, nalloc=10000):
+		"""Start drain thread.
+
+		:param period: (s) how often to drain the ring
+
+		:param nalloc: (samples) initial size of per-trial storage
+
+		"""
+		self.period = period
+		self.nalloc = nalloc
+		self.error = None
+
+		# samples overwritten before we got to them (this trial)
+		self.lost = 0
+		# same for ttl events
+		self.ttl_lost = 0
+
+		# collecting ttl events? (between start() and stop())
+		self._ttl_on = 0
+
+		self._views = None
+		self._hsviews = None
+		self._lock = threading.Lock()
+		self._done = threading.Event()
+		self._reset()
+
+		self._thread = threading.Thread(target=self._run)
+		self._thread.setDaemon(1)
+		self._thread.start()
+
+	def __repr__(self):
+		return '<AdStream: %d samples>' % self._n
+
+	def start(self):
+		"""Clear buffers and start collecting samples.
+
+		Replaces dacq_adbuf_toggle(1).
+
+		"""
+		self._lock.acquire()
+		try:
+			self._reset()
+			dacq_adbuf_toggle(1)
+			self._ttl_on = 1
+		finally:
+			self._lock.release()
+
+	def stop(self):
+		"""Stop collecting samples and drain what's left.
+
+		Replaces dacq_adbuf_toggle(0).
+
+		:return: (bool) true if samples were lost (overflow)
+
+		"""
+		self._lock.acquire()
+		try:
+			overflow = dacq_adbuf_toggle(0)
+			self._drain()
+			self._ttl_on = 0
+			return (overflow > 0) or (self.lost > 0)
+		finally:
+			self._lock.release()
+
+	def clear(self):
+		"""Throw away everything collected so far.
+
+		Replaces dacq_adbuf_clear(). Arrays already returned by now()
+		are unaffected.
+
+		"""
+		self._lock.acquire()
+		try:
+			dacq_adbuf_clear()
+			self._reset()
+		finally:
+			self._lock.release()
+
+	def now(self):
+		"""Get everything collected since the last start()/clear().
+
+		:return: (tuple) (n, t, x, y, pa, new, ain), where t is in 'us'
+			and ain is a 2d (nchan, n) array of raw analog channels.
+			These are views onto the stream's storage, which is only
+			ever appended to, so they're safe to hang on to.
+
+		"""
+		self._check()
+		self._lock.acquire()
+		try:
+			self._drain()
+			n = self._n
+			return (n, self._t[:n], self._x[:n], self._y[:n],
+					self._pa[:n], self._new[:n], self._ain[:, :n])
+		finally:
+			self._lock.release()
+
+	def now_hs(self):
+		"""Get high-rate samples collected since the last start()/clear().
+
+		:return: (tuple) one (t, v) pair per a/d channel, t in 'us'.
+			Channels not being stored at high rate are empty. Same
+			rules as now() -- these are safe to hang on to.
+
+		"""
+		self._check()
+		self._lock.acquire()
+		try:
+			self._drain()
+			return tuple([(self._hs_t[c][:self._hs_n[c]],
+						   self._hs_v[c][:self._hs_n[c]])
+						  for c in range(len(self._hs_n))])
+		finally:
+			self._lock.release()
+
+	def now_ttl(self, chan):
+		"""Get ttl pulse onsets on chan since the last start().
+
+		:param chan: (int) a/d channel (2 is the photodiode, 3 spikes)
+
+		:return: (array) onset times in 'us' (same timebase as now()),
+			interpolated to the threshold crossing. Safe to hang on to.
+
+		"""
+		self._check()
+		self._lock.acquire()
+		try:
+			self._drain()
+			return self._ev_t[chan][:self._ev_n[chan]]
+		finally:
+			self._lock.release()
+
+	def close(self):
+		"""Stop drain thread."""
+		if self._thread is None:
+			return
+		self._done.set()
+		self._thread.join()
+		self._thread = None
+
+	def _check(self):
+		if self.error is not None:
+			e, self.error = self.error, None
+			raise IOError('AdStream: %s' % e)
+
+	def _reset(self):
+		# new arrays -- old ones might still be referenced
+		self._tail = 0
+		self._n = 0
+		self.lost = 0
+		self._alloc(self.nalloc)
+
+		nchan = dacq_adbuf_nchan()
+		self._hs_tail = [0] * nchan
+		self._hs_n = [0] * nchan
+		self._hs_t = [np.zeros(0, np.float64)] * nchan
+		self._hs_v = [np.zeros(0, np.int32)] * nchan
+
+		self._ttl_on = 0
+		self.ttl_lost = 0
+		self._ev_cursor = dacq_ttl_head()
+		self._ev_n = [0] * nchan
+		self._ev_t = [np.zeros(0, np.float64)] * nchan
+
+	def _alloc(self, size):
+		nchan = dacq_adbuf_nchan()
+		self._t = np.zeros(size, np.float64)
+		self._x = np.zeros(size, np.int32)
+		self._y = np.zeros(size, np.int32)
+		self._pa = np.zeros(size, np.int32)
+		self._new = np.zeros(size, np.int32)
+		self._ain = np.zeros((nchan, size), np.int32)
+
+	def _grow(self, size):
+		if size <= len(self._t):
+			return
+		size = max(size, 2 * len(self._t))
+		n = self._n
+		old = (self._t, self._x, self._y, self._pa, self._new, self._ain)
+		self._alloc(size)
+		self._t[:n] = old[0][:n]
+		self._x[:n] = old[1][:n]
+		self._y[:n] = old[2][:n]
+		self._pa[:n] = old[3][:n]
+		self._new[:n] = old[4][:n]
+		self._ain[:, :n] = old[5][:, :n]
+
+	def _segs(self, tail, k, ringlen):
+		# ring slots for k samples starting at sample #tail
+		a = tail % ringlen
+		if a + k <= ringlen:
+			return ((a, a + k),)
+		else:
+			return ((a, ringlen), (0, a + k - ringlen))
+
+	def _drain(self):
+		# caller must hold self._lock
+		return self._drain_ad() + self._drain_hs() + self._drain_ttl()
+
+	def _drain_ad(self):
+		if self._views is None:
+			self._views = dacq_adbuf_views()
+		(t, x, y, pa, new, ain) = self._views
+		ringlen = len(t)
+
+		head = dacq_adbuf_size()
+		k = head - self._tail
+		if k <= 0:
+			return 0
+		if k > ringlen:
+			# server's already reused these slots
+			self.lost = self.lost + (k - ringlen)
+			self._tail = head - ringlen
+			k = ringlen
+
+		self._grow(self._n + k)
+		n = self._n
+		for (a, b) in self._segs(self._tail, k, ringlen):
+			m = n + (b - a)
+			self._t[n:m] = t[a:b]
+			self._x[n:m] = x[a:b]
+			self._y[n:m] = y[a:b]
+			self._pa[n:m] = pa[a:b]
+			self._new[n:m] = new[a:b]
+			self._ain[:, n:m] = ain[:, a:b]
+			n = m
+		self._n = n
+		self._tail = head
+
+		# let server reuse the slots
+		dacq_adbuf_tail(head)
+		return k
+
+	def _drain_hs(self):
+		if self._hsviews is None:
+			self._hsviews = dacq_hs_views()
+		(t, v) = self._hsviews
+		ringlen = t.shape[1]
+
+		total = 0
+		for c in range(len(self._hs_n)):
+			head = dacq_hs_size(c)
+			k = head - self._hs_tail[c]
+			if k <= 0:
+				continue
+			if k > ringlen:
+				self.lost = self.lost + (k - ringlen)
+				self._hs_tail[c] = head - ringlen
+				k = ringlen
+
+			n = self._hs_n[c]
+			if n + k > len(self._hs_t[c]):
+				size = max(n + k, 2 * len(self._hs_t[c]), self.nalloc)
+				ot, ov = self._hs_t[c], self._hs_v[c]
+				self._hs_t[c] = np.zeros(size, np.float64)
+				self._hs_v[c] = np.zeros(size, np.int32)
+				self._hs_t[c][:n] = ot[:n]
+				self._hs_v[c][:n] = ov[:n]
+			for (a, b) in self._segs(self._hs_tail[c], k, ringlen):
+				m = n + (b - a)
+				self._hs_t[c][n:m] = t[c, a:b]
+				self._hs_v[c][n:m] = v[c, a:b]
+				n = m
+			self._hs_n[c] = n
+			self._hs_tail[c] = head
+			dacq_hs_tail(c, head)
+			total = total + k
+		return total
+
+	def _drain_ttl(self):
+		if not self._ttl_on:
+			return 0
+		(self._ev_cursor, t, chan, lost) = dacq_ttl_events(self._ev_cursor)
+		self.ttl_lost = self.ttl_lost + lost
+		if len(t) == 0:
+			return 0
+		for c in np.unique(chan):
+			if c < 0 or c >= len(self._ev_n):
+				continue
+			ct = t[chan == c]
+			n = self._ev_n[c]
+			m = n + len(ct)
+			if m > len(self._ev_t[c]):
+				old = self._ev_t[c]
+				self._ev_t[c] = np.zeros(max(m, 2 * len(old), 100), np.float64)
+				self._ev_t[c][:n] = old[:n]
+			self._ev_t[c][n:m] = ct
+			self._ev_n[c] = m
+		return len(t)
+
+	def _run(self):
+		while not self._done.wait(self.period):
+			self._lock.acquire()
+			try:
+				try:
+					self._drain()
+				except Exception, e:
+					self.error = e
+			finally:
+				self._lock.release()
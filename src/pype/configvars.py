@@ -55,6 +55,10 @@ def defaults(srcfile=None):
 
 	c.set('ARANGE',	'10.0',
 		  doc='set analog input volt. range (+-V)')
+	c.set('ADRATE', '0',
+		  doc='a/d scan rate (Hz) for high-rate sampling; 0 for off')
+	c.set('HS_DECIM', '0,0,0,0',
+		  doc='per-channel high-rate storage decimation (0 for off)')
 	c.set('FLIP_BAR', '0',
 		  doc='flip response  bar input polarity')
 	c.set('FLIP_SW1', '0',
@@ -171,6 +175,8 @@ def defaults(srcfile=None):
 		  doc='iconify udpy window on startup')
 	c.set('ONE_WINDOW', 0,
 		  doc='one window for GUI and UserDisplay?')
+	c.set('GUI_HZ', 50,
+		  doc='GUI refresh rate (Hz) while idling (0 for none)')
 
 	#####################################################
 	# Disable use of ELOG -- overides env-var $ELOG
@@ -239,6 +245,8 @@ FLIP_SW1		(0|1)	flip sign of user switch 1
 FLIP_SW2		(0|1)	flip sign of user switch 2
 ENABLE_SW1		(0|1)	enable switch 1 for manual rewards
 PPORT			(hex#)	parallel port (cage trainer); should start with 0x
+ADRATE			(#)		a/d scan rate (Hz, up to 20000) for high-rate sampling
+HS_DECIM		(#,..)	per-channel decimation for high-rate storage (0=off)
 
 Remote Data Acquisition
 -----------------------
@@ -253,6 +261,7 @@ DBERRS			(0|1)	drop into debugger after an error
 SPLASH			(0|1)	display splash screen
 PSYCH			(0|1)	psychophysics mode (also -p option on command line)
 USERDISPLAY_HIDE (0|1)	hide usder display window on startup
+GUI_HZ			(#)		GUI refresh rate (Hz) while waiting in idlefn(ms)
 TICKS_MAJOR		(0|1)	show major (5deg) tickmarks on userdisplay
 TICKS_MINOR		(0|1)	show minor (1deg) tickmarks on userdisplay
 ELOG			(0|1)	link to 'elog' electronic log/notebook system
@@ -82,6 +82,53 @@ def dacq_fixwin_break_time(n):
     #return long
     return 1
 
+ZONE_OFF = 0
+ZONE_CIRCLE = 1
+ZONE_SECTOR = 2
+ZONE_ENTER = 1
+ZONE_EXIT = 2
+ZONE_LANDED = 3
+
+def dacq_zone(n, shape, cx, cy, rin, rout, vbias, angle, subtense):
+    if n < 0:
+        return 32
+    return 1
+
+def dacq_zone_timing(n, dwell_ms, tau_ms):
+    return 1
+
+def dacq_zone_move(n, cx, cy):
+    return 1
+
+def dacq_zone_genint(n, mask):
+    return 0
+
+def dacq_zone_reset(n):
+    return 1
+
+def dacq_zone_state(n):
+    return 0
+
+def dacq_zone_count(n):
+    return 0
+
+def dacq_zone_time(n, which):
+    return 0.0
+
+def dacq_zone_ev_len():
+    return 1
+
+def dacq_zone_ev_head():
+    return 0
+
+def dacq_zone_ev_addr(which):
+    return 0
+
+def dacq_zone_events(cursor):
+    import numpy as np
+    return (cursor, np.zeros(0, np.float64),
+            np.zeros(0, np.int32), np.zeros(0, np.int32), 0)
+
 def dacq_adbuf_toggle(on):
     return 1
 
@@ -91,6 +138,9 @@ def dacq_adbuf_clear():
 def dacq_adbuf_size():
     return 1
 
+def dacq_adbuf_tail(n):
+    return 0
+
 def dacq_adbuf_t(ix):
     return 1
 
@@ -135,6 +185,70 @@ def dacq_adbuf_c3(ix):
 def dacq_adbuf_c4(ix):
     return 1
 
+def dacq_adbuf_len():
+    return 1
+
+def dacq_adbuf_nchan():
+    return 4
+
+def dacq_adbuf_addr(n):
+    return 0
+
+def dacq_adbuf_views():
+    import numpy as np
+    return (np.zeros(1, np.float64),
+            np.zeros(1, np.int32), np.zeros(1, np.int32),
+            np.zeros(1, np.int32), np.zeros(1, np.int32),
+            np.zeros((4, 1), np.int32))
+
+def dacq_ad_rate(hz):
+    return 0
+
+def dacq_hs_decim(chan, n):
+    return 0
+
+def dacq_ttl(chan, mode, thresh):
+    return 1
+
+def dacq_hs_len():
+    return 1
+
+def dacq_hs_size(chan):
+    return 0
+
+def dacq_hs_tail(chan, n):
+    return 0
+
+def dacq_hs_addr(chan, which):
+    return 0
+
+def dacq_hs_views():
+    import numpy as np
+    return (np.zeros((4, 1), np.float64), np.zeros((4, 1), np.int32))
+
+TTL_OFF = 0
+TTL_RISING = 1
+TTL_FALLING = 2
+
+def dacq_ttl_len():
+    return 1
+
+def dacq_ttl_head():
+    return 0
+
+def dacq_ttl_t(ix):
+    return 0.0
+
+def dacq_ttl_chan(ix):
+    return 0
+
+def dacq_ttl_addr(which):
+    return 0
+
+def dacq_ttl_events(cursor):
+    import numpy as np
+    return (cursor, np.zeros(0, np.float64), np.zeros(0, np.int32), 0)
+
 def dacq_eye_smooth(kn):
     return 1
 
@@ -176,3 +290,11 @@ def dacq_elrestart():
 
 def dacq_set_xtracker(x, y, pa):
     return
+
+def dacq_looplat(n):
+    if n == -1:
+        return 1
+    return 0
+
+def dacq_looplat_reset():
+    return
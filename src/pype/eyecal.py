@@ -0,0 +1,384 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""Vectorized eye calibration
+
+Numpy version of the calibration the dacq server applies to each raw
+eye tracker sample (see mainloop() in dacq4/comedi_server.c), in the
+same order:
+
+  affine -> gain/offset -> rotation -> smoothing
+
+Everything but the smoothing is linear in homogeneous coordinates, so
+EyeCal folds it into a single 3x3 matrix and whole traces (or stacks
+of trials) get calibrated, uncalibrated or recalibrated with one
+matrix multiply instead of one sample at a time.
+
+The traces saved in datafiles are calibrated but *not* smoothed (the
+server only smooths the current position it uses for fixation
+windows), so the usual offline job -- take a session recorded with
+one calibration and redo it with a better one -- is just recal(),
+and recal_file() does that for a whole datafile, caching the result
+in a sidecar file (datafile + '.ecal') that's reused as long as the
+datafile and calibration haven't changed.
+
+Author -- James A. Mazer (mazerj@gmail.com)
+
+"""
+
+import os
+import types
+import cPickle
+import numpy as np
+
+# passed through uncalibrated by the server (see comedi_server.c)
+ISCAN_NODATA = 99999
+
+_CACHE_VERSION = 1
+
+class EyeCal(object):
+	def __init__(self, affine=None, xgain=1.0, ygain=1.0,
+				 xoff=0, yoff=0, rot=0.0, smooth=0):
+		"""Eye calibration.
+
+		Parameters are the same as the pype 'ical' params (see
+		PypeApp.eyeset()), so the offsets are what's *subtracted*
+		after the gain.
+
+		:param affine: (3x3 array) affine transform, applied to [x y 1]
+			row vectors; None for identity
+
+		:param xgain, ygain: (float) gains
+
+		:param xoff, yoff: (pixels) offsets
+
+		:param rot: (degrees) supplemental rotation
+
+		:param smooth: (samples) running average length (0 or 1 for
+			no smoothing)
+
+		"""
+		if affine is None:
+			affine = np.identity(3)
+		self.affine = np.array(affine, np.float).reshape((3, 3))
+		self.xgain = float(xgain)
+		self.ygain = float(ygain)
+		self.xoff = float(xoff)
+		self.yoff = float(yoff)
+		self.rot = float(rot)
+		self.smooth = int(smooth)
+		self._m = None
+		self._minv = None
+
+	def __repr__(self):
+		return ('<EyeCal: gain=(%g,%g) off=(%g,%g) rot=%g smooth=%d>' %
+				(self.xgain, self.ygain, self.xoff, self.yoff,
+				 self.rot, self.smooth))
+
+	def key(self):
+		"""Hashable summary of the calibration (for caching)."""
+		return (tuple(self.affine.flatten()), self.xgain, self.ygain,
+				self.xoff, self.yoff, self.rot, self.smooth)
+
+	def __eq__(self, other):
+		return isinstance(other, EyeCal) and self.key() == other.key()
+
+	def __ne__(self, other):
+		return not self.__eq__(other)
+
+	def matrix(self, affine=True, offset=True):
+		"""Combined transform: [x' y' 1] = [x y 1] * matrix()
+
+		:param affine: (bool) include the affine stage
+
+		:param offset: (bool) include the offsets
+
+		:return: (3x3 array)
+
+		"""
+		a = np.pi * self.rot / 180.0
+		g = np.array([[self.xgain, 0.0, 0.0],
+					  [0.0, self.ygain, 0.0],
+					  [0.0, 0.0, 1.0]])
+		if offset:
+			g[2, 0] = -self.xoff
+			g[2, 1] = -self.yoff
+		r = np.array([[np.cos(a), -np.sin(a), 0.0],
+					  [np.sin(a), np.cos(a), 0.0],
+					  [0.0, 0.0, 1.0]])
+		m = np.dot(g, r)
+		if affine:
+			m = np.dot(self.affine, m)
+		return m
+
+	def apply(self, x, y, new=None):
+		"""Raw tracker units -> calibrated pixels.
+
+		:param x, y: (arrays) raw traces, any (matching) shape; for
+			2d stacks of trials, time runs along the last axis
+
+		:param new: (array) eyenew flags (only used for smoothing);
+			None for all new
+
+		:return: (tuple) (x, y) float arrays; the server truncates
+			these to ints when it stores them
+
+		"""
+		if self._m is None:
+			self._m = self.matrix()
+		(x, y) = _transform(self._m, x, y)
+		if self.smooth > 1:
+			(x, y) = (smooth(x, self.smooth, new), smooth(y, self.smooth, new))
+		return (x, y)
+
+	def invert(self, x, y, affine=True, offset=True):
+		"""Calibrated pixels -> raw tracker units.
+
+		Smoothing can't be undone, but it never needs to be: saved
+		traces aren't smoothed.
+
+		:param x, y: (arrays) calibrated traces
+
+		:param affine: (bool) undo the affine stage too; False gives
+			the (post-affine) coordinates PypeRecord.compute(raw=1)
+			has always returned
+
+		:param offset: (bool) undo the offsets
+
+		:return: (tuple) (x, y) float arrays
+
+		"""
+		if affine and offset:
+			if self._minv is None:
+				self._minv = np.linalg.inv(self.matrix())
+			m = self._minv
+		else:
+			m = np.linalg.inv(self.matrix(affine=affine, offset=offset))
+		return _transform(m, x, y)
+
+	def recal(self, new, x, y):
+		"""Recalibrate traces calibrated with this calibration.
+
+		:param new: (EyeCal) calibration to use instead
+
+		:param x, y: (arrays) traces calibrated with self
+
+		:return: (tuple) (x, y) as if they'd been recorded with new
+
+		"""
+		m = np.dot(np.linalg.inv(self.matrix()), new.matrix())
+		(x, y) = _transform(m, x, y)
+		if new.smooth > 1:
+			(x, y) = (smooth(x, new.smooth), smooth(y, new.smooth))
+		return (x, y)
+
+def _transform(m, x, y):
+	# [x' y' 1] = [x y 1] * m, leaving ISCAN_NODATA samples alone
+	x = np.asarray(x, np.float)
+	y = np.asarray(y, np.float)
+	xo = (x * m[0, 0]) + (y * m[1, 0]) + m[2, 0]
+	yo = (x * m[0, 1]) + (y * m[1, 1]) + m[2, 1]
+	nodata = (x == ISCAN_NODATA) & (y == ISCAN_NODATA)
+	if np.any(nodata):
+		xo[nodata] = ISCAN_NODATA
+		yo[nodata] = ISCAN_NODATA
+	return (xo, yo)
+
+def smooth(v, n, new=None):
+	"""Running average, the way the dacq server does it.
+
+	Each new sample is replaced by the mean of the last n new samples;
+	other samples hold the last smoothed value. The server's average
+	starts out full of zeros, so the first n-1 samples are pulled
+	towards zero (the server's average carries over from the previous
+	trial, so these won't match the online values exactly).
+
+	:param v: (array) trace; for 2d stacks time runs along the last axis
+
+	:param n: (int) number of samples to average
+
+	:param new: (array) eyenew flags; None for all new
+
+	:return: (array) smoothed trace
+
+	"""
+	v = np.asarray(v, np.float)
+	if n <= 1 or v.shape[-1] == 0:
+		return v.copy()
+	if v.ndim > 1:
+		if new is None:
+			new = [None] * v.shape[0]
+		return np.array([smooth(v[k], n, new[k]) for k in range(v.shape[0])])
+
+	ok = v != ISCAN_NODATA
+	if new is not None:
+		ok = ok & (np.asarray(new) != 0)
+	ix = np.flatnonzero(ok)
+	c = np.concatenate((np.zeros(n), np.cumsum(v[ix])))
+	s = (c[n:] - c[:-n]) / n
+
+	# forward fill samples that weren't used (0 until the first one)
+	out = np.zeros(len(v))
+	k = np.where(ok, np.cumsum(ok) - 1, -1)
+	k = np.maximum.accumulate(k)
+	out[k >= 0] = s[k[k >= 0]]
+	return out
+
+def from_params(params, smoothing=False):
+	"""Get the calibration a trial was recorded with.
+
+	:param params: (dict) trial parameters (PypeRecord.params)
+
+	:param smoothing: (bool) include the rig's eye_smooth setting
+
+	:return: (EyeCal)
+
+	"""
+	def get(names, default):
+		for name in names:
+			if name in params:
+				return params[name]
+		return default
+
+	a = get(('affinem_',), None)
+	if type(a) is types.StringType:
+		a = map(float, a.split(','))
+	if a is not None and len(np.ravel(a)) != 9:
+		a = None
+	if smoothing:
+		n = int(get(('eye_smooth',), 0))
+	else:
+		n = 0
+	return EyeCal(affine=a,
+				  xgain=float(get(('@eye_xgain', 'xgain_'), 1.0)),
+				  ygain=float(get(('@eye_ygain', 'ygain_'), 1.0)),
+				  xoff=float(get(('@eye_xoff', 'xoff_'), 0)),
+				  yoff=float(get(('@eye_yoff', 'yoff_'), 0)),
+				  rot=float(get(('@eye_rot', 'rot_'), 0.0)),
+				  smooth=n)
+
+def _concat(vs):
+	lens = [len(v) for v in vs]
+	if len(vs):
+		return (np.concatenate([np.asarray(v, np.float) for v in vs]), lens)
+	return (np.zeros(0), lens)
+
+def _split(v, lens):
+	return np.split(v, np.cumsum(lens)[:-1]) if len(lens) else []
+
+def recal_trials(cals, new, xs, ys):
+	"""Recalibrate a bunch of (ragged) trials at once.
+
+	Trials recorded with the same calibration are done together in a
+	single transform (in a session that's usually all of them).
+
+	:param cals: (list of EyeCal) calibration each trial was recorded with
+
+	:param new: (EyeCal) calibration to use instead
+
+	:param xs, ys: (lists of arrays) calibrated traces
+
+	:return: (tuple) (xs, ys) lists of recalibrated traces
+
+	"""
+	groups = {}
+	for k in range(len(cals)):
+		groups.setdefault(cals[k].key(), []).append(k)
+	xo = [None] * len(xs)
+	yo = [None] * len(ys)
+	for ks in groups.values():
+		(x, lens) = _concat([xs[k] for k in ks])
+		(y, lens) = _concat([ys[k] for k in ks])
+		m = np.dot(np.linalg.inv(cals[ks[0]].matrix()), new.matrix())
+		(x, y) = _transform(m, x, y)
+		for (k, xk, yk) in zip(ks, _split(x, lens), _split(y, lens)):
+			if new.smooth > 1:
+				(xk, yk) = (smooth(xk, new.smooth), smooth(yk, new.smooth))
+			xo[k] = xk
+			yo[k] = yk
+	return (xo, yo)
+
+def _cache_load(fname, st, key):
+	try:
+		f = open(fname + '.ecal', 'rb')
+		try:
+			c = cPickle.load(f)
+		finally:
+			f.close()
+	except Exception:
+		return None
+	if (type(c) is not types.DictType or
+		c.get('version') != _CACHE_VERSION or
+		c.get('size') != st.st_size or
+		c.get('mtime') != st.st_mtime or
+		c.get('key') != key):
+		return None
+	return c['traces']
+
+def _cache_save(fname, st, key, traces):
+	c = {
+		'version': _CACHE_VERSION,
+		'size': st.st_size,
+		'mtime': st.st_mtime,
+		'key': key,
+		'traces': traces,
+		}
+	try:
+		tmp = '%s.ecal.%d' % (fname, os.getpid())
+		f = open(tmp, 'wb')
+		try:
+			cPickle.dump(c, f, 2)
+		finally:
+			f.close()
+		os.rename(tmp, fname + '.ecal')
+	except (IOError, OSError):
+		# read-only directory etc -- just don't cache
+		pass
+
+def recal_file(fname, new, cache=True):
+	"""Recalibrate all the eye traces in a datafile.
+
+	Each trial's traces are taken back through the calibration it was
+	recorded with (from its params) and pushed through new. The
+	result's cached in a sidecar file (fname + '.ecal') and reused
+	as long as the datafile's unchanged and new is the same
+	calibration.
+
+	:param fname: (string) datafile (anything PypeFile can read,
+		except composites -- no caching for those)
+
+	:param new: (EyeCal) calibration to apply
+
+	:param cache: (bool) use/update the sidecar
+
+	:return: (list) one (x, y) pair per trial (in pixels, same
+		sampling as the saved traces)
+
+	"""
+	from pypedata import PypeFile
+
+	if '+' in fname:
+		st = None
+	else:
+		if not os.path.exists(fname) and os.path.exists(fname + '.gz'):
+			fname = fname + '.gz'
+		st = os.stat(fname)
+	key = new.key()
+	if cache and st is not None:
+		traces = _cache_load(fname, st, key)
+		if traces is not None:
+			return traces
+
+	pf = PypeFile(fname, quiet=1)
+	cals = []
+	xs = []
+	ys = []
+	for d in pf.records():
+		cals.append(from_params(d.params))
+		xs.append(d.rec[4])
+		ys.append(d.rec[5])
+	(xs, ys) = recal_trials(cals, new, xs, ys)
+	traces = zip(xs, ys)
+
+	if cache and st is not None:
+		_cache_save(fname, st, key, traces)
+	return traces
@@ -0,0 +1,198 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""Frame flip timing
+
+FrameBuffer.flip() timestamps every flip twice: when flip() is called
+(the frame's ready to go) and when the page flip returns (the frame's
+on its way to the screen). Times are in ms on the dacq clock (raw
+CLOCK_MONOTONIC, same as dacq_ts(); leave t0 at 0), so they line up
+with encodes, eye traces and photodiode pulses, but with sub-ms
+resolution.
+
+Flip intervals go into a fixed size ring for live stats and each
+interval is classified against the refresh period (measured by
+FrameBuffer.calcfps()):
+
+  dropped -- the frame was ready in time (flip() called less than a
+             period after the last flip) but still missed one or more
+             refreshes; the driver/compositor's fault
+  late    -- flip() itself wasn't called until after the next
+             refresh should have happened; either the task took too
+             long drawing the frame or it just wasn't animating (no
+             way to tell from here, so these aren't counted as drops)
+
+Between start() and stop() every flip is also saved to per-trial
+vectors (see trial()), which PypeApp.record_write() stores in rec[16]
+so missed frames can be looked at offline.
+
+Author -- James A. Mazer (mazerj@gmail.com)
+
+"""
+
+import numpy as np
+import monotonic
+
+# an interval is a missed refresh if it's more than this many periods
+_MISSFRAC = 1.5
+
+class FlipTimer(object):
+	def __init__(self, nring=1024, period=None, t0=0.0):
+		"""Flip timer.
+
+		:param nring: (int) number of intervals kept for stats
+
+		:param period: (ms) refresh period; None until measured
+
+		:param t0: (s) clock zero (monotonic time); 0 to match the
+			dacq clock (dacq_ts() isn't offset by dacq_ts0())
+
+		"""
+		self.nring = nring
+		self.period = period
+		self.t0 = t0
+		self._ring = np.zeros(nring, np.float)
+		self.reset()
+		self._trial = None
+		self._saved = ([], [], [])
+
+	def __repr__(self):
+		s = self.stats()
+		return '<FlipTimer: %d flips, %d dropped, %d late>' % \
+			   (s['flips'], s['dropped'], s['late'])
+
+	def clock(self):
+		"""Current time (ms)."""
+		return 1000.0 * (monotonic.monotonic() - self.t0)
+
+	def reset(self):
+		"""Clear the ring and stats (not the trial vectors)."""
+		self._n = 0
+		self._tcall = None
+		self._tlast = None
+		self.nflips = 0
+		self.ndropped = 0				# missed refreshes, not frames
+		self.nlate = 0
+		self.last = None
+
+	def called(self):
+		"""Note that flip() was called (frame ready)."""
+		self._tcall = self.clock()
+
+	def flipped(self):
+		"""Note that the page flip's done.
+
+		:return: (tuple) (t, interval, nmissed); t in ms, interval is
+			None for the first flip, nmissed is the number of refreshes
+			the frame missed (negative if late, see above)
+
+		"""
+		t = self.clock()
+		tcall = self._tcall
+		if tcall is None:
+			tcall = t
+		self._tcall = None
+
+		interval = None
+		nmissed = 0
+		if self._tlast is not None:
+			interval = t - self._tlast
+			self._ring[self._n % self.nring] = interval
+			self._n = self._n + 1
+			if self.period and interval > (_MISSFRAC * self.period):
+				nmissed = int(round(interval / self.period)) - 1
+				if (tcall - self._tlast) < self.period:
+					self.ndropped = self.ndropped + nmissed
+				else:
+					self.nlate = self.nlate + 1
+					nmissed = -nmissed
+		self._tlast = t
+		self.nflips = self.nflips + 1
+		self.last = (t, interval, nmissed)
+
+		if self._trial is not None:
+			self._trial[0].append(t)
+			self._trial[1].append(tcall)
+			self._trial[2].append(nmissed)
+		return self.last
+
+	def intervals(self):
+		"""Most recent intervals (ms), oldest first."""
+		if self._n <= self.nring:
+			return self._ring[:self._n].copy()
+		k = self._n % self.nring
+		return np.concatenate((self._ring[k:], self._ring[:k]))
+
+	def measure(self):
+		"""Set the refresh period from the intervals in the ring.
+
+		Uses the mean of the intervals within 2sd of the median, so a
+		few hiccups don't throw it off.
+
+		:return: (ms) period, or None if there's not enough data
+
+		"""
+		v = self.intervals()
+		if len(v) < 2:
+			return None
+		m = np.median(v)
+		sd = np.std(v)
+		if sd > 0:
+			v = v[np.abs(v - m) < (2 * sd)]
+		if len(v) < 1 or np.mean(v) <= 0:
+			return None
+		self.period = float(np.mean(v))
+		return self.period
+
+	def stats(self):
+		"""Live stats.
+
+		:return: (dict) flips, dropped (refreshes) and late counts
+			since reset(), and fps plus mean, sd and max interval (ms)
+			over the ring
+
+		"""
+		v = self.intervals()
+		if len(v):
+			(mean, sd, mx) = (np.mean(v), np.std(v), np.max(v))
+		else:
+			(mean, sd, mx) = (0.0, 0.0, 0.0)
+		if self.period:
+			fps = 1000.0 / self.period
+		else:
+			fps = 0.0
+		return {
+			'flips': self.nflips,
+			'dropped': self.ndropped,
+			'late': self.nlate,
+			'period': self.period,
+			'fps': fps,
+			'interval_mean': mean,
+			'interval_sd': sd,
+			'interval_max': mx,
+			}
+
+	def start(self):
+		"""Start saving per-trial vectors (drops what was there)."""
+		self._trial = ([], [], [])
+
+	def stop(self):
+		"""Stop saving per-trial vectors (keeps what's there)."""
+		if self._trial is not None:
+			self._saved = self._trial
+		self._trial = None
+
+	def trial(self):
+		"""Per-trial vectors from the last start().
+
+		:return: (tuple) (t, tcall, nmissed) arrays: flip times (ms),
+			times flip() was called (ms) and missed refreshes per flip
+			(see flipped())
+
+		"""
+		if self._trial is not None:
+			v = self._trial
+		else:
+			v = self._saved
+		return (np.array(v[0], np.float),
+				np.array(v[1], np.float),
+				np.array(v[2], np.int))
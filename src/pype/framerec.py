@@ -0,0 +1,286 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""Frame capture recorder
+
+Records what went out on the display without getting in the way of
+the frame: FrameBuffer.flip() reads the back buffer (glReadPixels)
+into one of a pool of preallocated buffers and hands it off to a
+writer thread, which does the flipping, downscaling, compression and
+disk i/o. zlib and PIL release the GIL while they work, so a thread's
+enough to keep this off the main loop.
+
+All frames go into one archive file:
+
+  header: 'PYPEFRAMES1\\n'
+  frames: struct _FRAMEHDR (frame number, flip time (ms), record id,
+		  width, height, codec, data length) followed by the data
+
+codecs are 'raw' (RGB, top row first), 'zlib' (same, compressed) or
+'jpeg'. Use read_frames() to get them back.
+
+Opening an existing archive appends to it, and frame numbers pick up
+where the archive left off, so turning recording off and back on
+during a run never clobbers (or renumbers) frames already saved. A
+partial frame at the end (crash) is dropped first.
+
+If the writer falls behind and the pool runs dry, the drop policy
+decides: 'drop' (default) skips the new frame, 'block' waits for a
+buffer (ie, slows down the display loop -- only for offline renders).
+
+Author -- James A. Mazer (mazerj@gmail.com)
+
+"""
+
+import os
+import time
+import zlib
+import struct
+import threading
+import cStringIO
+import Queue
+import numpy as np
+
+MAGIC = 'PYPEFRAMES1\n'
+CODECS = ('raw', 'zlib', 'jpeg')
+
+_FRAMEHDR = '<IdiHHBI'
+
+class FrameRecorderError(Exception): pass
+
+class FrameRecorder(object):
+	def __init__(self, fname, size, roi=None, scale=1, nbuf=8,
+				 policy='drop', codec='zlib', quality=90):
+		"""Open archive and start writer thread.
+
+		:param fname: (string) output file
+
+		:param size: (pair) framebuffer (w, h) in pixels
+
+		:param roi: (tuple) (x, y, w, h) region to record, GL
+			coordinates (0,0 is the lower left corner); None for the
+			whole screen
+
+		:param scale: (int) keep every scale'th pixel (downsampling)
+
+		:param nbuf: (int) number of capture buffers
+
+		:param policy: (string) 'drop' or 'block' (see above)
+
+		:param codec: (string) 'raw', 'zlib' or 'jpeg'
+
+		:param quality: (int) jpeg quality
+
+		"""
+		if not codec in CODECS:
+			raise FrameRecorderError, 'unknown codec: %s' % codec
+		if not policy in ('drop', 'block'):
+			raise FrameRecorderError, 'unknown drop policy: %s' % policy
+		if roi is None:
+			roi = (0, 0, size[0], size[1])
+		self.fname = fname
+		self.roi = tuple(map(int, roi))
+		self.scale = max(1, int(scale))
+		self.policy = policy
+		self.codec = codec
+		self.quality = quality
+
+		(self._fp, self.nframes) = _open(fname)
+		self.nframes0 = self.nframes		# frames already in archive
+		self.nwritten = 0
+		self.ndropped = 0
+		self._lat = []				# submit -> written (s)
+		self._readback = []			# acquire -> submit (s)
+
+		(x, y, w, h) = self.roi
+		self._free = Queue.Queue()
+		for n in range(nbuf):
+			self._free.put(np.zeros((h, w, 3), np.uint8))
+		self._todo = Queue.Queue()
+		self._t0 = {}
+
+		self.error = None
+		self._thread = threading.Thread(target=self._run)
+		self._thread.setDaemon(1)
+		self._thread.start()
+
+	def __repr__(self):
+		return '<FrameRecorder "%s": %d frames, %d dropped>' % \
+			   (self.fname, self.nframes, self.ndropped)
+
+	def acquire(self):
+		"""Get a free buffer to read a frame into.
+
+		:return: (array) (h, w, 3) uint8 buffer, or None if the
+			frame should be dropped (policy='drop')
+
+		"""
+		if self.error is not None:
+			e, self.error = self.error, None
+			raise FrameRecorderError, e
+		try:
+			buf = self._free.get(self.policy == 'block')
+		except Queue.Empty:
+			self.ndropped += 1
+			return None
+		self._t0[id(buf)] = time.time()
+		return buf
+
+	def submit(self, buf, t, recno):
+		"""Queue a filled buffer for writing.
+
+		:param buf: (array) buffer from acquire(), holding the frame
+			as read by glReadPixels (bottom row first)
+
+		:param t: (ms) flip time (see FrameBuffer.flips)
+
+		:param recno: (int) record id (trial) the frame belongs to
+
+		:return: (int) frame number in the archive
+
+		"""
+		now = time.time()
+		self._readback.append(now - self._t0.get(id(buf), now))
+		n = self.nframes
+		self.nframes += 1
+		self._todo.put((n, t, recno, now, buf))
+		return n
+
+	def release(self, buf):
+		"""Give back a buffer without writing it."""
+		self._free.put(buf)
+
+	def close(self):
+		"""Write out everything queued and close the archive.
+
+		:return: (dict) stats for this recorder (see stats())
+
+		"""
+		if self._thread is not None:
+			self._todo.put(None)
+			self._thread.join()
+			self._thread = None
+			self._fp.close()
+		return self.stats()
+
+	def stats(self):
+		"""Capture statistics.
+
+		:return: (dict) frames, written, dropped, plus mean and max
+			readback time (acquire to submit) and latency (submit to
+			on disk) in ms
+
+		"""
+		def ms(v):
+			if len(v):
+				v = 1000.0 * np.array(v)
+				return (np.mean(v), np.max(v))
+			return (0.0, 0.0)
+		(rbmean, rbmax) = ms(self._readback)
+		(latmean, latmax) = ms(self._lat)
+		return {
+			'frames': self.nframes - self.nframes0,
+			'written': self.nwritten,
+			'dropped': self.ndropped,
+			'readback_mean': rbmean,
+			'readback_max': rbmax,
+			'latency_mean': latmean,
+			'latency_max': latmax,
+			}
+
+	def _encode(self, a):
+		# a is top row first
+		if self.codec == 'raw':
+			return a.tostring()
+		elif self.codec == 'zlib':
+			return zlib.compress(a.tostring(), 1)
+		else:
+			import PIL.Image
+			f = cStringIO.StringIO()
+			PIL.Image.fromarray(a).save(f, 'JPEG', quality=self.quality)
+			return f.getvalue()
+
+	def _run(self):
+		while 1:
+			item = self._todo.get()
+			if item is None:
+				break
+			(n, t, recno, tsub, buf) = item
+			try:
+				try:
+					# glReadPixels is bottom row first
+					a = np.ascontiguousarray(buf[::-self.scale, ::self.scale])
+					data = self._encode(a)
+					self._fp.write(struct.pack(_FRAMEHDR, n, t, recno,
+											   a.shape[1], a.shape[0],
+											   CODECS.index(self.codec),
+											   len(data)))
+					self._fp.write(data)
+					self.nwritten += 1
+					self._lat.append(time.time() - tsub)
+				except Exception, e:
+					self.error = e
+			finally:
+				self._free.put(buf)
+
+def _open(fname):
+	# open archive for writing, appending to it if it's already there
+	#  -> (fp, next frame number)
+	if not os.path.isfile(fname) or os.path.getsize(fname) == 0:
+		# new (or /dev/null etc)
+		fp = open(fname, 'wb')
+		fp.write(MAGIC)
+		return (fp, 0)
+
+	fp = open(fname, 'r+b')
+	if fp.read(len(MAGIC)) != MAGIC:
+		fp.close()
+		raise FrameRecorderError, '%s: not a frame archive' % fname
+	hlen = struct.calcsize(_FRAMEHDR)
+	size = os.path.getsize(fname)
+	end = fp.tell()
+	nframes = 0
+	while end + hlen <= size:
+		h = fp.read(hlen)
+		(n, t, recno, w, ht, codec, nbytes) = struct.unpack(_FRAMEHDR, h)
+		if end + hlen + nbytes > size:
+			break
+		fp.seek(nbytes, 1)
+		end = end + hlen + nbytes
+		nframes = n + 1
+	fp.seek(end)
+	fp.truncate()
+	return (fp, nframes)
+
+def read_frames(fname):
+	"""Read back frames from an archive.
+
+	:param fname: (string) archive file
+
+	:return: (generator) (frameno, t, recno, frame) tuples, where
+		frame is an (h, w, 3) uint8 array, top row first
+
+	"""
+	fp = open(fname, 'rb')
+	try:
+		if fp.read(len(MAGIC)) != MAGIC:
+			raise FrameRecorderError, '%s: not a frame archive' % fname
+		hlen = struct.calcsize(_FRAMEHDR)
+		while 1:
+			h = fp.read(hlen)
+			if len(h) < hlen:
+				break
+			(n, t, recno, w, ht, codec, nbytes) = struct.unpack(_FRAMEHDR, h)
+			data = fp.read(nbytes)
+			if len(data) < nbytes:
+				break					# truncated (crash?)
+			codec = CODECS[codec]
+			if codec == 'zlib':
+				data = zlib.decompress(data)
+			if codec == 'jpeg':
+				import PIL.Image
+				a = np.asarray(PIL.Image.open(cStringIO.StringIO(data)))
+			else:
+				a = np.fromstring(data, np.uint8).reshape((ht, w, 3))
+			yield (n, t, recno, a)
+	finally:
+		fp.close()
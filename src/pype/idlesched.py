@@ -0,0 +1,269 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""Idle scheduler
+
+Keeps track of what PypeApp.idlefn() is waiting for -- the actions
+queued with queue_action() (a heap, so the next one's always on top)
+and the idlefn(ms) deadline -- and sleeps until the earliest of:
+
+  - the deadline
+  - the next queued action
+  - the next GUI refresh tick (GUI_HZ config var)
+  - a signal (dacq interupts come in as SIGUSR1)
+
+instead of spinning on the clock. Signals wake up select() via
+signal.set_wakeup_fd(), so an interupt that shows up just before
+the select() still ends the sleep right away.
+
+Every wakeup for a deadline or queued action is compared against
+its deadline and the lateness (ms) goes into a ring for stats().
+
+Times are in ms on the dacq clock (raw CLOCK_MONOTONIC; leave t0 at
+0), same as dacq_ts(), but with sub-ms resolution.
+
+Author -- James A. Mazer (mazerj@gmail.com)
+
+"""
+
+import os
+import time
+import fcntl
+import heapq
+import select
+import signal
+import numpy as np
+import monotonic
+
+class IdleScheduler(object):
+	def __init__(self, hz=50.0, t0=0.0, nstats=1000):
+		"""Idle scheduler.
+
+		:param hz: (Hz) GUI refresh rate while sleeping; 0 to only wake
+			up for deadlines, actions and signals
+
+		:param t0: (s) clock zero (monotonic time); 0 to match the
+			dacq clock (dacq_ts() isn't offset by dacq_ts0())
+
+		:param nstats: (int) number of wakeups kept for stats
+
+		"""
+		self.t0 = t0
+		self.setrate(hz)
+		self.nstats = nstats
+		self._heap = []
+		self._seq = 0
+		self._wakefd = None
+		self.reset()
+
+	def __repr__(self):
+		return '<IdleScheduler: %gHz, %d queued, %d sleeps>' % \
+			   (self.hz, len(self._heap), self.nsleeps)
+
+	def __len__(self):
+		return len(self._heap)
+
+	def clock(self):
+		"""Current time (ms)."""
+		return 1000.0 * (monotonic.monotonic() - self.t0)
+
+	def setrate(self, hz):
+		"""Set GUI refresh rate (Hz; 0 for none)."""
+		self.hz = float(hz)
+		if self.hz > 0:
+			self.tick = 1000.0 / self.hz
+		else:
+			self.tick = None
+
+	def arm(self):
+		"""Wake up sleeps on any signal.
+
+		Has to be called from the main thread, after the signal
+		handlers are installed.
+
+		:return: (bool) success; without this sleeps still end on
+			signals, just not ones that arrive right before select()
+
+		"""
+		if self._wakefd is not None:
+			return 1
+		try:
+			(r, w) = os.pipe()
+			for fd in (r, w):
+				fcntl.fcntl(fd, fcntl.F_SETFL,
+							fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+			signal.set_wakeup_fd(w)
+		except (AttributeError, ValueError, OSError):
+			return 0
+		self._wakefd = (r, w)
+		return 1
+
+	def reset(self):
+		"""Clear stats (not the queue)."""
+		self.nsleeps = 0
+		self.nsignals = 0
+		self.slept = 0.0
+		self._t0 = self.clock()
+		self._lat = {
+			'deadline': (np.zeros(self.nstats, np.float), [0]),
+			'action': (np.zeros(self.nstats, np.float), [0]),
+			}
+
+	def queue(self, t, action):
+		"""Queue action to run at (or after) time t.
+
+		:param t: (ms) when to run
+
+		:param action: (callable) no args
+
+		:return: (tuple) (t, action) handle for remove()
+
+		"""
+		handle = (t, action)
+		heapq.heappush(self._heap, (t, self._seq, handle))
+		self._seq = self._seq + 1
+		return handle
+
+	def remove(self, handle):
+		"""Unqueue action.
+
+		:param handle: (tuple) from queue()
+
+		:return: (bool) 1 if it was queued
+
+		"""
+		for k in range(len(self._heap)):
+			if self._heap[k][2] is handle:
+				del self._heap[k]
+				heapq.heapify(self._heap)
+				return 1
+		return 0
+
+	def clear(self):
+		"""Unqueue everything."""
+		self._heap = []
+
+	def next(self):
+		"""Deadline (ms) of next queued action, or None."""
+		if len(self._heap):
+			return self._heap[0][0]
+		return None
+
+	def due(self, now=None):
+		"""Unqueue actions whose time has come.
+
+		:return: (list) actions, in deadline order
+
+		"""
+		if now is None:
+			now = self.clock()
+		actions = []
+		while len(self._heap) and self._heap[0][0] <= now:
+			(t, seq, (t, action)) = heapq.heappop(self._heap)
+			self._log('action', now - t)
+			actions.append(action)
+		return actions
+
+	def sleep(self, deadline=None, tick=1):
+		"""Sleep until deadline, next queued action, GUI tick or signal.
+
+		:param deadline: (ms) absolute; None for no deadline
+
+		:param tick: (bool) wake up for GUI refreshes
+
+		:return: (bool) 1 if deadline's still in the future (ie, keep
+			going), 0 once it's passed
+
+		"""
+		now = self.clock()
+		if deadline is not None and now >= deadline:
+			return 0
+		until = deadline
+		t = self.next()
+		if t is not None and (until is None or t < until):
+			until = t
+		if tick and self.tick is not None and \
+			   (until is None or (now + self.tick) < until):
+			until = now + self.tick
+		if until is None:
+			# nothing to wait for but a signal
+			until = now + 1000.0
+
+		dt = max(0.0, (until - now) / 1000.0)
+		try:
+			if self._wakefd is not None:
+				(r, w, x) = select.select([self._wakefd[0]], [], [], dt)
+				if r:
+					self.nsignals = self.nsignals + 1
+					try:
+						while os.read(self._wakefd[0], 64):
+							pass
+					except OSError:
+						pass
+			else:
+				time.sleep(dt)
+		except select.error:
+			# interupted by a signal (EINTR)
+			self.nsignals = self.nsignals + 1
+		t = self.clock()
+		self.nsleeps = self.nsleeps + 1
+		self.slept = self.slept + (t - now)
+		return deadline is None or t < deadline
+
+	def waited(self, deadline, now=None):
+		"""Note that a wait for deadline is done (for stats)."""
+		if now is None:
+			now = self.clock()
+		self._log('deadline', now - deadline)
+
+	def _log(self, kind, late):
+		(v, n) = self._lat[kind]
+		v[n[0] % len(v)] = late
+		n[0] = n[0] + 1
+
+	def latencies(self, kind='deadline'):
+		"""Most recent wakeup latencies (ms), oldest first.
+
+		:param kind: (string) 'deadline' (idlefn(ms)) or 'action'
+			(queue_action())
+
+		"""
+		(v, n) = self._lat[kind]
+		if n[0] <= len(v):
+			return v[:n[0]].copy()
+		k = n[0] % len(v)
+		return np.concatenate((v[k:], v[:k]))
+
+	def stats(self):
+		"""Live stats.
+
+		:return: (dict) sleeps and signal wakeups since reset(), the
+			fraction of time spent asleep, and for deadline and action
+			wakeups: count plus mean, sd, 95th percentile and max
+			latency (ms) over the ring
+
+		"""
+		elapsed = self.clock() - self._t0
+		if elapsed > 0:
+			idle = self.slept / elapsed
+		else:
+			idle = 0.0
+		s = {
+			'hz': self.hz,
+			'queued': len(self._heap),
+			'sleeps': self.nsleeps,
+			'signals': self.nsignals,
+			'idle': idle,
+			}
+		for kind in self._lat.keys():
+			v = self.latencies(kind)
+			s[kind] = self._lat[kind][1][0]
+			if len(v):
+				(mean, sd, p95, mx) = (np.mean(v), np.std(v),
+									   np.percentile(v, 95), np.max(v))
+			else:
+				(mean, sd, p95, mx) = (0.0, 0.0, 0.0, 0.0)
+			s[kind + '_mean'] = mean
+			s[kind + '_sd'] = sd
+			s[kind + '_p95'] = p95
+			s[kind + '_max'] = mx
+		return s
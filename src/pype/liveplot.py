@@ -0,0 +1,482 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""Out-of-process online plots
+
+The RT histogram, PSTH and eye trace windows are drawn by a separate
+plotting process, so redrawing them never adds to the inter-trial
+interval (or gets slower as the session goes on). pype just sends
+each trial's numbers down a pipe:
+
+  ('rt', rt)                   one reaction time (ms)
+  ('rtrange', minrt, maxrt)    acceptable RT window (ms)
+  ('psth', spikes)             spike times (ms) relative to PSTH_TRIG
+  ('eyes', traces)             decimated eye/photo/spike traces (see
+                               LivePlot.eyes())
+  ('clear', name)              clear 'rt' or 'psth'
+  ('show', name, on)           show/hide 'rt', 'psth' or 'eyes' window
+  ('quit',)
+
+Messages are queued and pickled by a sender thread. If the plotter
+falls behind, the queue fills up and new messages are dropped rather
+than holding up pype (LivePlot.ndropped).
+
+The plotter keeps fixed-size binned histograms (Hist), updated in
+place as data comes in, and only redraws windows that are showing
+and have changed, at most every REDRAW ms.
+
+Author -- James A. Mazer (mazerj@gmail.com)
+
+"""
+
+import sys
+import os
+import threading
+import subprocess
+import cPickle
+import Queue
+import numpy as np
+
+REDRAW = 100						# min ms between redraws
+
+RTBINS = (0, 2000, 100)				# lo, hi (ms), nbins
+PSTHBINS = (-100, 1900, 40)
+
+class Hist(object):
+	def __init__(self, lo, hi, nbins, clip=0):
+		"""Fixed-bin histogram, updated incrementally.
+
+		Values outside [lo, hi) aren't binned (unless clip is set, in
+		which case they go in the first/last bin), but are always
+		counted in the running mean and sd (and nover/nunder).
+
+		"""
+		self.edges = np.linspace(lo, hi, nbins + 1)
+		self.counts = np.zeros(nbins, np.int)
+		self.clip = clip
+		self.clear()
+
+	def clear(self):
+		self.counts[:] = 0
+		self.n = 0
+		self.nover = 0
+		self.nunder = 0
+		self._sum = 0.0
+		self._sumsq = 0.0
+
+	def add(self, v):
+		v = np.atleast_1d(np.asarray(v, np.float))
+		if len(v) == 0:
+			return
+		(lo, hi) = (self.edges[0], self.edges[-1])
+		self.nunder = self.nunder + np.sum(v < lo)
+		self.nover = self.nover + np.sum(v >= hi)
+		if self.clip:
+			# last edge is inclusive for np.histogram, so stay below it
+			v = np.clip(v, lo, hi - 1e-6 * (hi - lo))
+		self.counts += np.histogram(v, bins=self.edges)[0]
+		self.n = self.n + len(v)
+		self._sum = self._sum + np.sum(v)
+		self._sumsq = self._sumsq + np.sum(v * v)
+
+	def mean(self):
+		if self.n:
+			return self._sum / self.n
+		return 0.0
+
+	def std(self):
+		if self.n:
+			return np.sqrt(max(0.0, self._sumsq / self.n - self.mean() ** 2))
+		return 0.0
+
+def decimate(t, v, npts):
+	"""Min/max decimation for plotting.
+
+	Each block of samples is replaced by its min and max, so spikes
+	and saccades don't disappear the way they would with v[::skip].
+
+	:param t, v: (arrays) time base and trace
+
+	:param npts: (int) max number of points to return
+
+	:return: (tuple) (t, v) float32 arrays
+
+	"""
+	t = np.asarray(t)
+	v = np.asarray(v)
+	n = min(len(t), len(v))
+	k = int(np.ceil(2.0 * n / max(2, npts)))
+	if k <= 1:
+		return (t[:n].astype(np.float32), v[:n].astype(np.float32))
+	m = n // k
+	tb = t[:m*k].reshape((m, k))
+	vb = v[:m*k].reshape((m, k))
+	td = np.empty(2 * m, np.float32)
+	vd = np.empty(2 * m, np.float32)
+	td[0::2] = tb[:, 0]
+	td[1::2] = tb[:, -1]
+	vd[0::2] = vb.min(axis=1)
+	vd[1::2] = vb.max(axis=1)
+	return (td, vd)
+
+def _droproot():
+	# don't run matplotlib as root (see pype.py)
+	if os.geteuid() == 0 and os.getuid() != 0:
+		os.setuid(os.getuid())
+
+class LivePlot(object):
+	def __init__(self, maxqueue=64, npts=1000):
+		"""Start plotting process.
+
+		:param maxqueue: (int) max messages waiting to be sent
+
+		:param npts: (int) points per trace for eyes()
+
+		"""
+		self.npts = npts
+		self.nsent = 0
+		self.ndropped = 0
+		self.error = None
+		self._q = Queue.Queue(maxqueue)
+		try:
+			self._proc = subprocess.Popen([sys.executable,
+										   os.path.abspath(__file__)],
+										  stdin=subprocess.PIPE,
+										  preexec_fn=_droproot,
+										  close_fds=True)
+		except OSError, e:
+			self._proc = None
+			self.error = e
+			return
+		self._thread = threading.Thread(target=self._run)
+		self._thread.setDaemon(1)
+		self._thread.start()
+
+	def __repr__(self):
+		return '<LivePlot: %d sent, %d dropped>' % (self.nsent, self.ndropped)
+
+	def _run(self):
+		while 1:
+			msg = self._q.get()
+			try:
+				cPickle.dump(msg, self._proc.stdin, 2)
+				self._proc.stdin.flush()
+				self.nsent += 1
+			except (IOError, OSError), e:
+				# plotter's gone (closed by hand or crashed)
+				self.error = e
+				break
+			if msg[0] == 'quit':
+				break
+
+	def send(self, *msg):
+		"""Queue a message for the plotter (never blocks).
+
+		:return: (bool) 1 if queued, 0 if dropped
+
+		"""
+		if self._proc is None or self.error is not None:
+			return 0
+		try:
+			self._q.put_nowait(msg)
+			return 1
+		except Queue.Full:
+			self.ndropped += 1
+			return 0
+
+	def show(self, name, on=1):
+		"""Show or hide plot window ('rt', 'psth' or 'eyes')."""
+		return self.send('show', name, on)
+
+	def clear(self, name):
+		"""Clear 'rt' or 'psth' histogram."""
+		return self.send('clear', name)
+
+	def rt(self, rt, minrt=None, maxrt=None):
+		"""Add a reaction time (ms) to the RT histogram."""
+		if minrt is not None:
+			self.send('rtrange', minrt, maxrt)
+		return self.send('rt', float(rt))
+
+	def psth(self, spikes):
+		"""Add a trial's spikes (ms, relative to trigger) to the PSTH."""
+		return self.send('psth', np.asarray(spikes, np.float32))
+
+	def eyes(self, t, x, y, photo, spikes, raster, start, stop):
+		"""Plot a trial's traces.
+
+		Traces are decimated to npts before they're sent.
+
+		:param t, x, y: (arrays) eye traces
+
+		:param photo, spikes: (lists) (t, v) pairs of photodiode and
+			spike channel traces
+
+		:param raster: (array) spike times
+
+		:param start, stop: (ms) time range to show
+
+		:return: (bool) queued
+
+		"""
+		if len(t) < 1:
+			return 0
+		t0 = t[0]
+		t = np.asarray(t) - t0
+		(tx, xd) = decimate(t, x, self.npts)
+		(ty, yd) = decimate(t, y, self.npts)
+		p = [decimate(np.asarray(tt) - t0, v, self.npts) for (tt, v) in photo]
+		s = [decimate(np.asarray(tt) - t0, v, self.npts) for (tt, v) in spikes]
+		return self.send('eyes', {
+			'x': (tx, xd),
+			'y': (ty, yd),
+			'photo': p,
+			'spikes': s,
+			# subtract t0 in float64 -- raw ms are too big for float32
+			'raster': (np.asarray(raster, np.float64) - t0).astype(np.float32),
+			'range': (start - t0, stop - t0),
+			})
+
+	def close(self):
+		"""Shut down the plotter."""
+		if self._proc is None:
+			return
+		try:
+			self._q.put(('quit',), timeout=1.0)
+			self._thread.join(1.0)
+			self._proc.stdin.close()
+		except (Queue.Full, IOError, OSError):
+			pass
+		self._proc = None
+
+##############################################################
+# everything below runs in the plotting process
+
+class _View(object):
+	def __init__(self, root, title, clear=0):
+		import Tkinter
+		from matplotlib.figure import Figure
+		from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+		self.top = Tkinter.Toplevel(root)
+		self.top.title(title)
+		self.top.protocol('WM_DELETE_WINDOW', lambda: self.show(0))
+		if clear:
+			Tkinter.Button(self.top, text='Clear',
+						   command=self._clear).pack(side=Tkinter.TOP,
+													 expand=0,
+													 fill=Tkinter.X)
+		self.fig = Figure(figsize=(5, 4))
+		self.canvas = FigureCanvasTkAgg(self.fig, master=self.top)
+		self.canvas.get_tk_widget().pack(side=Tkinter.TOP,
+										 fill=Tkinter.BOTH, expand=1)
+		self.visible = 1
+		self.dirty = 1
+		self.show(0)
+
+	def show(self, on):
+		if on:
+			self.top.deiconify()
+			self.dirty = 1
+		else:
+			self.top.withdraw()
+		self.visible = on
+
+	def _clear(self):
+		self.clear()
+		self.dirty = 1
+
+	def redraw(self):
+		if self.visible and self.dirty:
+			self.update()
+			self.canvas.draw()
+			self.dirty = 0
+
+class _HistView(_View):
+	def __init__(self, root, title, bins, color, xlabel, ylabel, clip=0):
+		_View.__init__(self, root, title, clear=1)
+		self.h = Hist(*bins, clip=clip)
+		self.ax = self.fig.add_subplot(1, 1, 1)
+		e = self.h.edges
+		self.bars = self.ax.bar(e[:-1], self.h.counts, width=e[1] - e[0],
+								color=color, edgecolor=color)
+		self.ax.set_xlabel(xlabel)
+		self.ax.set_ylabel(ylabel)
+		self.ax.set_xlim(e[0], e[-1])
+		self.msg = self.ax.text(0.5, 0.5, '', transform=self.ax.transAxes,
+								color='red', horizontalalignment='center',
+								verticalalignment='center')
+
+	def clear(self):
+		self.h.clear()
+
+	def update(self):
+		for (b, n) in zip(self.bars, self.h.counts):
+			b.set_height(n)
+		self.ax.set_ylim(0, max(1, self.h.counts.max()) * 1.1)
+
+class _RTView(_HistView):
+	def __init__(self, root):
+		# rts past the end of RTBINS go in the last bin (and get
+		# counted in the corner), rather than vanishing
+		_HistView.__init__(self, root, 'Reaction Times', RTBINS, 'grey',
+						   'Reaction Time (ms)', 'n=0', clip=1)
+		self.fit, = self.ax.plot([], [], 'r-', linewidth=2)
+		self.stats = self.ax.text(0.02, 0.98, '', color='red',
+								  horizontalalignment='left',
+								  verticalalignment='top',
+								  transform=self.ax.transAxes)
+		self.span = None
+		self.rtrange = None
+
+	def update(self):
+		_HistView.update(self)
+		h = self.h
+		self.ax.set_ylabel('n=%d' % h.n)
+		if h.n == 0 or h.std() <= 0:
+			self.msg.set_text('SPACE INTENTIONALLY BLANK')
+			self.stats.set_text('')
+			self.fit.set_data([], [])
+		else:
+			self.msg.set_text('')
+			(mu, sd) = (h.mean(), h.std())
+			s = '$\\mu=%.0fms$\n$\\sigma=%.0fms$' % (mu, sd)
+			if h.nover:
+				s = s + '\n%d > %dms' % (h.nover, h.edges[-1])
+			self.stats.set_text(s)
+			e = h.edges
+			x = np.linspace(e[0], e[-1], 200)
+			# normal pdf, scaled to counts/bin
+			g = np.exp(-0.5 * ((x - mu) / sd) ** 2) / (sd * np.sqrt(2 * np.pi))
+			g = g * np.sum(h.counts) * (e[1] - e[0])
+			self.fit.set_data(x, g)
+		if self.rtrange is not None:
+			(minrt, maxrt) = self.rtrange
+			if self.span is not None:
+				self.span.remove()
+			self.span = self.ax.axvspan(minrt, maxrt, color='b', alpha=0.25)
+			# never hide the overflow bin
+			self.ax.set_xlim(-10, min(1.25 * maxrt, h.edges[-1]))
+
+class _PSTHView(_HistView):
+	def __init__(self, root):
+		_HistView.__init__(self, root, 'psth', PSTHBINS, 'blue',
+						   'Time (ms)', 'nspikes')
+
+	def update(self):
+		_HistView.update(self)
+		if self.h.n == 0:
+			self.msg.set_text('NO SPIKE DATA')
+		else:
+			self.msg.set_text('')
+
+class _EyeView(_View):
+	def __init__(self, root):
+		_View.__init__(self, root, 'Eye Traces')
+		self.axes = [self.fig.add_subplot(4, 1, n + 1) for n in range(4)]
+		for (a, label) in zip(self.axes,
+							  ('X=RED Y=GRN', 'photo', 'spikes', 'raster')):
+			a.set_ylabel(label)
+		self.traces = None
+
+	def clear(self):
+		pass
+
+	def set(self, traces):
+		self.traces = traces
+		self.dirty = 1
+
+	def _lines(self, a, pairs, fmt='-'):
+		colors = 'krgbckrgbckrgbc'
+		while len(a.lines) > len(pairs):
+			a.lines[-1].remove()
+		while len(a.lines) < len(pairs):
+			a.plot([], [], colors[len(a.lines) % len(colors)] + fmt)
+		for (l, (t, v)) in zip(a.lines, pairs):
+			l.set_data(t, v)
+		a.relim()
+		a.autoscale_view()
+
+	def update(self):
+		d = self.traces
+		if d is None:
+			return
+		(start, stop) = d['range']
+		if not self.axes[0].lines:
+			self.axes[0].plot([], [], 'r-')
+			self.axes[0].plot([], [], 'g-')
+		self.axes[0].lines[0].set_data(*d['x'])
+		self.axes[0].lines[1].set_data(*d['y'])
+		self.axes[0].relim()
+		self.axes[0].autoscale_view()
+		self._lines(self.axes[1], d['photo'])
+		self._lines(self.axes[2], d['spikes'])
+		r = d['raster']
+		self._lines(self.axes[3], [(r, 0.0 * r)], fmt='.')
+		self.axes[3].set_ylim(-1, 1)
+		for n in (0, 1, 3):
+			self.axes[n].set_xlim(start, stop)
+
+def _reader(f, q):
+	while 1:
+		try:
+			msg = cPickle.load(f)
+		except (EOFError, IOError, cPickle.UnpicklingError):
+			msg = ('quit',)
+		q.put(msg)
+		if msg[0] == 'quit':
+			return
+
+def main():
+	import matplotlib
+	matplotlib.use('TkAgg')
+	import Tkinter
+
+	root = Tkinter.Tk()
+	root.withdraw()
+	views = {
+		'rt': _RTView(root),
+		'psth': _PSTHView(root),
+		'eyes': _EyeView(root),
+		}
+
+	q = Queue.Queue()
+	t = threading.Thread(target=_reader, args=(sys.stdin, q))
+	t.setDaemon(1)
+	t.start()
+
+	def poll():
+		while 1:
+			try:
+				msg = q.get_nowait()
+			except Queue.Empty:
+				break
+			if msg[0] == 'quit':
+				root.quit()
+				return
+			elif msg[0] == 'rt':
+				views['rt'].h.add(msg[1])
+				views['rt'].dirty = 1
+			elif msg[0] == 'rtrange':
+				views['rt'].rtrange = msg[1:]
+				views['rt'].dirty = 1
+			elif msg[0] == 'psth':
+				views['psth'].h.add(msg[1])
+				views['psth'].dirty = 1
+			elif msg[0] == 'eyes':
+				views['eyes'].set(msg[1])
+				if not views['eyes'].visible:
+					views['eyes'].show(1)
+			elif msg[0] == 'clear':
+				views[msg[1]].clear()
+				views[msg[1]].dirty = 1
+			elif msg[0] == 'show':
+				views[msg[1]].show(msg[2])
+		for v in views.values():
+			v.redraw()
+		root.after(REDRAW, poll)
+
+	root.after(REDRAW, poll)
+	root.mainloop()
+
+if __name__ == '__main__':
+	main()
@@ -1,8 +1,18 @@
 # -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
 
-"""Pure python/pype landing zone (aka fixwin) implementation.
+"""Landing zone (aka fixwin) implementations.
 
-Not really for public consumption.
+LandingZone and SectorLandingZone are pure python/pype -- they only
+see the eye when a task loop calls inside(). Not really for public
+consumption.
+
+CircleZone and SectorZone are the same thing done by the dacq server
+(see dacq4/zones.c): checked every sample, so dwell times and
+entry/exit times are good to the sample and short visits aren't
+missed. They work as drop-in replacements for LandingZone and
+SectorLandingZone, and also support the FixWin api (on/off/move,
+broke/break_time, interupts), so they can stand in for a FixWin too.
+Unlike FixWin, there can be lots of them at once (dacq_zone(-1)).
 
 Author -- James A. Mazer (mazerj@gmail.com)
 
@@ -149,3 +159,236 @@ class SectorLandingZone(object):
 			self.app.udpy.icon(self.icon)
 			self.icon = None
 
+class Zone(object):
+	"""
+	Server-side landing zone (see dacq4/zones.c). Use CircleZone or
+	SectorZone instead of instantiating this directly.
+
+	The zone's turned on when it's created and off when it's
+	deleted (or off() is called). Times are in ms on the dacq_ts()
+	clock.
+
+	"""
+
+	_used = []							# zone numbers in use
+
+	EVENTS = {
+		'enter': ZONE_ENTER,
+		'exit': ZONE_EXIT,
+		'landed': ZONE_LANDED,
+		}
+
+	def __init__(self, app, shape, x, y, rin, rout, vbias=1.0,
+				 angle=0.0, subtense=180.0, fixtime=0, tau=0):
+		self.app = app
+		self.icon = None
+		self.zone = None
+		if vbias <= 0:
+			raise FatalPypeError, 'lzones: vbias must be > 0'
+		for n in range(dacq_zone(-1, 0, 0, 0, 0, 0, 0, 0, 0)):
+			if not n in Zone._used:
+				Zone._used.append(n)
+				self.zone = n
+				break
+		if self.zone is None:
+			raise FatalPypeError, 'lzones: no free dacq zones'
+		self.shape = shape
+		self.x, self.y = x, y
+		self.rin, self.rout = rin, rout
+		self.vbias = vbias
+		self.angle, self.subtense = angle, subtense
+		self.fixtime = fixtime
+		self.tau = tau
+		self.on()
+
+	def __del__(self):
+		self.off()
+		self.clear()
+		if self.zone is not None and self.zone in Zone._used:
+			Zone._used.remove(self.zone)
+			self.zone = None
+
+	def on(self):
+		"""Tell comedi_server to monitor zone (resets state).
+
+		:return: nothing
+
+		"""
+		dacq_zone_timing(self.zone, int(round(self.fixtime)),
+						 int(round(self.tau)))
+		dacq_zone(self.zone, self.shape, int(round(self.x)),
+				  int(round(self.y)), self.rin, self.rout, self.vbias,
+				  self.angle, self.subtense)
+		self._cursor = dacq_zone_ev_head()
+
+	def off(self):
+		"""Tell comedi_server to stop monitoring zone.
+
+		:return: nothing
+
+		"""
+		if self.zone is not None:
+			dacq_zone(self.zone, ZONE_OFF, 0, 0, 0, 0, 0, 0, 0)
+
+	def reset(self):
+		"""Clear zone state (inside/landed/broke, times) but keep monitoring."""
+		dacq_zone_reset(self.zone)
+		self._cursor = dacq_zone_ev_head()
+
+	def move(self, x, y, size=-1):
+		"""Move live zone without resetting it (pursuit etc).
+
+		:param x,y: (pixels) new position (absolute)
+
+		:param size: (pixels) new outer radius; -1 for no change
+			(changing the size does reset the zone)
+
+		:return: nothing
+
+		"""
+		self.x, self.y = x, y
+		if size is not None and size > 0 and size != self.rout:
+			self.rout = size
+			self.on()
+		else:
+			dacq_zone_move(self.zone, int(round(x)), int(round(y)))
+
+	def set(self, x=None, y=None, size=None):
+		"""Change size and position; call on() to update the server."""
+		if x is not None: self.x = x
+		if y is not None: self.y = y
+		if size is not None: self.rout = size
+
+	def get(self):
+		return self.x, self.y, self.rout
+
+	def interupts(self, enable=0, events=('exit',)):
+		"""Enable or disable interupts from this zone.
+
+		Like FixWin.interupts(), but any of the zone's events can
+		generate an interupt (ZoneEvent exception, app.zone_int is
+		(zone, event)); the default's the equivalent of a fixation
+		break. Interupts are latched off once one's sent and pype
+		has to have interupts enabled too (app.interupts()).
+
+		:param enable: (bool)
+
+		:param events: (list) any of 'enter', 'exit' and 'landed'
+
+		:return: nothing
+
+		"""
+		mask = 0
+		if enable:
+			for e in events:
+				mask = mask | (1 << Zone.EVENTS[e])
+		dacq_zone_genint(self.zone, mask)
+
+	def inside(self, t=None, x=None, y=None):
+		"""Has the eye landed in the zone?
+
+		With fixtime=0 that's the same as being inside (FixWin
+		semantics). t, x and y are ignored -- they're only here for
+		LandingZone compatibility; the server's already looked at
+		every sample.
+
+		:return: (boolean)
+
+		"""
+		return (dacq_zone_state(self.zone) & 2) >> 1
+
+	def entered(self):
+		"""Is the eye in the zone (landed or not)?"""
+		return dacq_zone_state(self.zone) & 1
+
+	def broke(self):
+		"""Has the eye left the zone since on()/reset()?
+
+		Latched like FixWin.broke() -- stays set if the eye comes
+		back in, until the zone's reset.
+
+		"""
+		return (dacq_zone_state(self.zone) & 4) >> 2
+
+	def break_time(self):
+		"""Time the eye last left the zone (ms; 0 if it hasn't)."""
+		return dacq_zone_time(self.zone, ZONE_EXIT)
+
+	def enter_time(self):
+		"""Time the eye last entered the zone (ms; 0 if it hasn't)."""
+		return dacq_zone_time(self.zone, ZONE_ENTER)
+
+	def landed_time(self):
+		"""Time the eye last landed in the zone (ms; 0 if it hasn't)."""
+		return dacq_zone_time(self.zone, ZONE_LANDED)
+
+	def count(self):
+		"""Number of entries since on()/reset()."""
+		return dacq_zone_count(self.zone)
+
+	def events(self):
+		"""Events for this zone since the last call (or on()/reset()).
+
+		:return: (list) (t, event) pairs, t in ms, event one of
+			'enter', 'exit' or 'landed'
+
+		"""
+		names = dict([(v, k) for (k, v) in Zone.EVENTS.items()])
+		(self._cursor, t, zone, ev, lost) = dacq_zone_events(self._cursor)
+		if lost:
+			Logger('lzones: %d zone events lost\n' % lost)
+		ix = zone == self.zone
+		return zip((t[ix] / 1000.0).tolist(), [names[e] for e in ev[ix]])
+
+	def clear(self):
+		if self.icon:
+			self.app.udpy.icon(self.icon)
+			self.icon = None
+
+class CircleZone(Zone):
+	"""
+	Server-side version of LandingZone (and FixWin): circle of
+	radius size around (x, y), stretched vertically by vbias.
+
+	Eyes must stay inside the zone for fixtime ms before it's
+	considered a landing; excursions outside shorter than tau ms
+	are ignored.
+
+	"""
+
+	def __init__(self, x, y, size, fixtime, app, vbias=1.0, tau=0):
+		Zone.__init__(self, app, ZONE_CIRCLE, x, y, 0, size, vbias=vbias,
+					  fixtime=fixtime, tau=tau)
+
+	def draw(self, color='grey', dash=None, text=None, clear=None):
+		self.clear()
+		if not clear:
+			self.icon = self.app.udpy.icon(self.x, self.y,
+										   2*self.rout, 2*self.rout*self.vbias,
+										   color=color, type=2, dash=dash)
+
+class SectorZone(Zone):
+	"""
+	Server-side version of SectorLandingZone: annular sector
+	around (xo, yo) from inner_pix to outer_pix, angle_deg +-
+	subtense_deg.
+
+	"""
+
+	def __init__(self, xo, yo, inner_pix, outer_pix, angle_deg, subtense_deg,
+				 fixtime_ms, app, tau=0):
+		Zone.__init__(self, app, ZONE_SECTOR, xo, yo, inner_pix, outer_pix,
+					  angle=angle_deg, subtense=subtense_deg,
+					  fixtime=fixtime_ms, tau=tau)
+
+	def draw(self, color='grey', dash=None, text=None, clear=None):
+		# box at the middle of the sector
+		r = (self.rin + self.rout) / 2.0
+		a = math.pi * self.angle / 180.0
+		self.clear()
+		if not clear:
+			self.icon = self.app.udpy.icon(self.x + r * math.cos(a),
+										   self.y + r * math.sin(a),
+										   self.rout - self.rin,
+										   self.rout - self.rin,
+										   color=color, type=1, dash=dash)
@@ -0,0 +1,231 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""Minimal MATLAB v5 MAT-file writer
+
+Just enough of the level 5 MAT-file format to dump pype data for
+p2m: numeric arrays (1d vectors become column vectors), strings,
+cell arrays (lists/tuples), structs (dicts) and struct arrays. Big
+struct arrays can be streamed out one element at a time with
+MatFile.begin_structs()/append_struct()/end_structs(), so the whole
+thing never has to be in memory. Everything's written little-endian
+with numpy -- no scipy required.
+
+Author -- James A. Mazer (mazerj@gmail.com)
+
+"""
+
+import sys
+import time
+import struct
+import types
+import numpy as np
+
+# data types
+miINT8 = 1
+miUINT8 = 2
+miINT16 = 3
+miUINT16 = 4
+miINT32 = 5
+miUINT32 = 6
+miSINGLE = 7
+miDOUBLE = 9
+miINT64 = 12
+miUINT64 = 13
+miMATRIX = 14
+
+# array classes
+mxCELL_CLASS = 1
+mxSTRUCT_CLASS = 2
+mxCHAR_CLASS = 4
+mxDOUBLE_CLASS = 6
+
+# numpy dtype -> (array class, data type)
+_NUMERIC = {
+	'f8': (mxDOUBLE_CLASS, miDOUBLE),
+	'f4': (7, miSINGLE),
+	'i1': (8, miINT8),
+	'u1': (9, miUINT8),
+	'i2': (10, miINT16),
+	'u2': (11, miUINT16),
+	'i4': (12, miINT32),
+	'u4': (13, miUINT32),
+	'i8': (14, miINT64),
+	'u8': (15, miUINT64),
+	}
+
+# matlab's namelengthmax
+MAXNAME = 63
+
+def _tag(mitype, nbytes):
+	return struct.pack('<II', mitype, nbytes)
+
+def _subelement(mitype, data):
+	return _tag(mitype, len(data)) + data + ('\0' * (-len(data) % 8))
+
+def _array_header(mxclass, dims, name):
+	return (_subelement(miUINT32, struct.pack('<II', mxclass, 0)) +
+			_subelement(miINT32, np.asarray(dims, '<i4').tostring()) +
+			_subelement(miINT8, name))
+
+def _matrix(body):
+	return _tag(miMATRIX, len(body)) + body
+
+def _numeric(a, name):
+	a = np.asarray(a)
+	if a.dtype.kind == 'b':
+		a = a.astype(np.float64)
+	key = '%s%d' % (a.dtype.kind, a.dtype.itemsize)
+	if not key in _NUMERIC:
+		a = a.astype(np.float64)
+		key = 'f8'
+	(mxclass, mitype) = _NUMERIC[key]
+	if a.ndim == 0:
+		dims = (1, 1)
+	elif a.ndim == 1:
+		# vectors are columns, like fread() etc in matlab
+		dims = (len(a), 1)
+	else:
+		dims = a.shape
+	if a.size == 0:
+		dims = (0, 0)
+	data = a.astype(a.dtype.newbyteorder('<')).tostring(order='F')
+	return _matrix(_array_header(mxclass, dims, name) +
+				   _subelement(mitype, data))
+
+def _char(s, name):
+	if type(s) is types.UnicodeType:
+		data = s.encode('utf-16-le')
+	else:
+		data = np.frombuffer(s, np.uint8).astype('<u2').tostring()
+	n = len(data) / 2
+	if n == 0:
+		dims = (0, 0)
+	else:
+		dims = (1, n)
+	return _matrix(_array_header(mxCHAR_CLASS, dims, name) +
+				   _subelement(miUINT16, data))
+
+def _cell(items, name, dims=None):
+	# items in column-major order; default is a 1xN cell array
+	if len(items) == 0:
+		dims = (0, 0)
+	elif dims is None:
+		dims = (1, len(items))
+	return _matrix(_array_header(mxCELL_CLASS, dims, name) +
+				   ''.join([element(v) for v in items]))
+
+def _fieldnames(fields):
+	namelen = max([len(f) for f in fields] + [0]) + 1
+	return (_subelement(miINT32, struct.pack('<i', namelen)) +
+			_subelement(miINT8, ''.join([f.ljust(namelen, '\0')
+										 for f in fields])))
+
+def _struct_header(fields, n, name):
+	for f in fields:
+		if len(f) > MAXNAME:
+			raise ValueError, 'mat5: field name too long: %s' % f
+	return (_array_header(mxSTRUCT_CLASS, (1, n), name) +
+			_fieldnames(fields))
+
+class StructArray(object):
+	"""1xN struct array -- list of dicts sharing the same fields."""
+	def __init__(self, fields, elements):
+		self.fields = list(fields)
+		self.elements = elements
+
+def element(value, name=''):
+	"""Encode python value as a MAT-file array (miMATRIX) element.
+
+	:param value: None (empty), number, numpy array, string, list or
+		tuple (cell array), object array (cell array of the same
+		shape), dict (struct) or StructArray
+
+	:param name: (string) variable name ('' for cell/struct contents)
+
+	:return: (string) encoded element
+
+	"""
+	if value is None:
+		return _numeric(np.zeros((0, 0)), name)
+	elif type(value) in (types.IntType, types.LongType,
+						 types.FloatType, types.BooleanType):
+		# plain python numbers are always doubles
+		return _numeric(np.float64(value), name)
+	elif type(value) in (types.StringType, types.UnicodeType):
+		return _char(value, name)
+	elif type(value) in (types.ListType, types.TupleType):
+		return _cell(value, name)
+	elif type(value) is types.DictType:
+		return element(StructArray(value.keys(), [value]), name)
+	elif isinstance(value, np.ndarray) and value.dtype == np.object:
+		# object arrays are cell arrays of the same shape
+		if value.ndim < 2:
+			value = value.reshape((1, -1))
+		return _cell(list(value.flatten(order='F')), name, value.shape)
+	elif isinstance(value, StructArray):
+		body = [_struct_header(value.fields, len(value.elements), name)]
+		for e in value.elements:
+			for f in value.fields:
+				body.append(element(e.get(f)))
+		return _matrix(''.join(body))
+	else:
+		return _numeric(value, name)
+
+class MatFile(object):
+	def __init__(self, fname, text=None):
+		"""Create new (level 5) MAT-file for writing.
+
+		:param fname: (string) output file name
+
+		:param text: (string) descriptive text for the file header
+
+		"""
+		if text is None:
+			text = 'MATLAB 5.0 MAT-file, Platform: %s, Created on: %s' % \
+				   (sys.platform, time.ctime())
+		self.fp = open(fname, 'wb')
+		self.fp.write(text[:116].ljust(116) + ('\0' * 8) +
+					  struct.pack('<H', 0x0100) + 'IM')
+		self._structs = None
+
+	def write(self, name, value):
+		"""Write variable (see element() for supported types)."""
+		self.fp.write(element(value, name))
+
+	def begin_structs(self, name, fields, n=None):
+		"""Start streaming out a 1xn struct array, one element at a time
+		(via append_struct()) -- call end_structs() when done. If n is
+		None, it's however many get appended.
+		"""
+		pos = self.fp.tell()
+		self.fp.write(_tag(miMATRIX, 0))
+		self.fp.write(_struct_header(fields, n or 0, name))
+		self._structs = (pos, list(fields), n, [0])
+
+	def append_struct(self, d):
+		"""Write next element of struct array (missing fields -> [])."""
+		(pos, fields, n, count) = self._structs
+		for f in fields:
+			self.fp.write(element(d.get(f)))
+		count[0] = count[0] + 1
+
+	def end_structs(self):
+		(pos, fields, n, count) = self._structs
+		if n is not None and count[0] != n:
+			raise ValueError, 'mat5: wrote %d of %d structs' % (count[0], n)
+		end = self.fp.tell()
+		# now we know the size of the whole element..
+		self.fp.seek(pos)
+		self.fp.write(_tag(miMATRIX, end - pos - 8))
+		if n is None:
+			# ..and the number of elements: second dim, after the
+			# element tag, array flags and dims tag
+			self.fp.seek(pos + 8 + 16 + 8 + 4)
+			self.fp.write(struct.pack('<i', count[0]))
+		self.fp.seek(end)
+		self._structs = None
+
+	def close(self):
+		if self.fp is not None:
+			self.fp.close()
+			self.fp = None
@@ -0,0 +1,78 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""In-process metrics registry
+
+Named values (timings, counters, eye position, task state) that the
+hot paths update as they go, and that the http server (pypehttpd)
+reads from its own threads to serve /metrics and the /events feed.
+
+There's no lock: pype's main thread is the only writer and every
+update is a single dict store, counter bump or deque append, all of
+which are atomic under the GIL. Readers copy what they want (also
+single operations) and get either the old value or the new one,
+never half of each. seq goes up on every update, so a reader can
+tell when something's changed without comparing values.
+
+Per-trial metrics are published as one dict with trial(), which
+keeps the last few around for history().
+
+Author -- James A. Mazer (mazerj@gmail.com)
+
+"""
+
+import time
+import collections
+
+class Metrics(object):
+	def __init__(self, nhistory=100):
+		"""Metrics registry.
+
+		:param nhistory: (int) number of trials kept for history()
+
+		"""
+		self.seq = 0
+		self._v = {}
+		self._history = collections.deque(maxlen=nhistory)
+
+	def __repr__(self):
+		return '<Metrics: %d values, seq=%d>' % (len(self._v), self.seq)
+
+	def set(self, name, value):
+		"""Set (or replace) a value."""
+		self._v[name] = value
+		self.seq += 1
+
+	def incr(self, name, n=1):
+		"""Bump a counter (starts at 0)."""
+		self._v[name] = self._v.get(name, 0) + n
+		self.seq += 1
+
+	def get(self, name, default=None):
+		return self._v.get(name, default)
+
+	def trial(self, **kw):
+		"""Publish metrics for the trial that just finished.
+
+		Goes in as one value ('trial'), so readers never see a mix
+		of two trials.
+
+		"""
+		kw['time'] = time.time()
+		self._history.append(kw)
+		self.set('trial', kw)
+
+	def history(self):
+		"""Recent trials (oldest first)."""
+		return list(self._history)
+
+	def snapshot(self):
+		"""Everything, as of now.
+
+		:return: (dict) seq, time and a copy of the values
+
+		"""
+		return {
+			'seq': self.seq,
+			'time': time.time(),
+			'metrics': dict(self._v),
+			}
@@ -20,6 +20,16 @@ the validator function should return the actual valid of
 the string -- ie, for is_int, return a validated integer
 (not a string, but an actual integer).
 
+Validators are re-run on every query unless they're marked with a
+true 'cacheable' attribute, in which case the validated value is
+cached (see ParamTable._lookup) and only recomputed when the slot
+changes. Only mark validators whose result depends on nothing but
+the string (not random draws, the filesystem..):
+
+  is_int.cacheable = 1
+
+All the deterministic built-in validators below are marked.
+
 Author -- James A. Mazer (mazerj@gmail.com)
 
 """
@@ -62,6 +72,18 @@ def _unpack_slot(slot):
 
 	return (name, default, validate, descr, runlock)
 
+def _validates(validate):
+	# tuple and dict slots are radio buttons, not validated
+	return validate and not (isinstance(validate, types.TupleType) or
+							 isinstance(validate, types.DictType))
+
+def _copyval(v):
+	if isinstance(v, types.ListType):
+		return v[:]
+	elif isinstance(v, np.ndarray):
+		return v.copy()
+	return v
+
 class ParamTable(object):
 	_list = []
 
@@ -78,6 +100,21 @@ class ParamTable(object):
 		self._file = file
 		self._allowalt = allowalt
 
+		# name -> (default, validate, runlock) for real (non-title)
+		# slots, in table order
+		self._index = {}
+		self._order = []
+		for slot in self._table:
+			(name, default, validate, descr, runlock) = _unpack_slot(slot)
+			if default is not None and not name in self._index:
+				self._index[name] = (default, validate, runlock)
+				self._order.append(name)
+
+		# name -> (raw, validity, value, queryv value); filled in on
+		# demand and invalidated by the widgets when they change
+		# (see _lookup)
+		self._snap = {}
+
 		# got to check for duplicates before this table's added
 		# into the global list.
 		for slot in self._table:
@@ -141,6 +178,8 @@ class ParamTable(object):
 									buttontype = 'radiobutton',
 									labelpos = 'w',
 									label_text = name + ':',
+									command = lambda v, n=name:
+											self._invalidate(n),
 									pady=0, padx=2)
 				e.pack(anchor=W)
 				for v in validate:
@@ -155,6 +194,8 @@ class ParamTable(object):
 									buttontype = 'radiobutton',
 									labelpos = 'w',
 									label_text = name + ':',
+									command = lambda v, n=name:
+											self._invalidate(n),
 									pady=0, padx=2)
 				if descr:
 					self.balloon.bind(e, '%d: %s' % (nrow, descr))
@@ -172,6 +213,8 @@ class ParamTable(object):
 								   labelpos = 'w',
 								   label_text = name + ':',
 								   validate = validate,
+								   modifiedcommand = lambda n=name:
+										self._invalidate(n),
 								   value = default)
 				if descr:
 					self.balloon.bind(e, '%d: %s' % (nrow, descr))
@@ -274,27 +317,65 @@ class ParamTable(object):
 		else:
 			d = {}
 
-		for slot in self._table:
-			(name, default, validate, descr, runlock) = _unpack_slot(slot)
-			if default is None:
-				continue
-			v = self.query(name)
+		for name in self._order:
+			(default, validate, runlock) = self._index[name]
+			(raw, r, v, vq) = self._lookup(name)
 			if evaluate:
 				# Wed Mar 11 11:08:13 2009 mazer
 				# store raw string version of param in dictionary in addition
 				# to the evaluated version for future reference..  only do
 				# this if evaluating
-				d[name+'_raw_'] = v
-				if validate and not (isinstance(validate, types.TupleType) or
-									 isinstance(validate, types.DictType)):
-					(r, v) = apply(validate, (v,), {"evaluate": 1})
+				d[name+'_raw_'] = raw
+				if _validates(validate):
 					if (runlock == _KEEPLOCKED) and (not readonly):
 						continue
 					elif r != VALID:
 						return (0, name)
-			d[name] = v
+				d[name] = v
+			else:
+				d[name] = raw
 		return (1, d)
 
+	def _invalidate(self, name=None):
+		# drop name (or everything) from the snapshot
+		if name is None:
+			self._snap.clear()
+		else:
+			self._snap.pop(name, None)
+
+	def _lookup(self, name):
+		# Current (raw, validity, value, queryv value) for slot
+		# name. Widget reads are only done when the widget's
+		# changed since the last lookup. Validation is too for
+		# cacheable validators (see module docstring); anything
+		# else is re-run (on the cached string) every time.
+		# Mutable values are copied so callers can't modify the
+		# snapshot.
+		try:
+			(raw, r, v, vq) = self._snap[name]
+		except KeyError:
+			(raw, r, v, vq) = self._snap[name] = self._evaluate(name)
+		else:
+			(default, validate, runlock) = self._index[name]
+			if _validates(validate) and \
+				   not getattr(validate, 'cacheable', 0):
+				return self._evaluate(name, raw)
+		return (raw, r, _copyval(v), _copyval(vq))
+
+	def _evaluate(self, name, raw=None):
+		(default, validate, runlock) = self._index[name]
+		if raw is None:
+			raw = self.query(name)
+		if _validates(validate):
+			(r, v) = apply(validate, (raw,), {"evaluate": 1})
+			if r != VALID:
+				(rq, vq) = apply(validate, (default,), {"evaluate": 1})
+			else:
+				vq = v
+		else:
+			(r, v, vq) = (VALID, raw, raw)
+		return (raw, r, v, vq)
+
 	def lockfield(self, name, toggle=None, state=DISABLED):
 		"""Lock specififed row of table.
 
@@ -349,21 +430,11 @@ class ParamTable(object):
 		:return: (variable) validated current value -- might not be string!
 
 		"""
-		for slot in self._table:
-			(name, default, validate, descr, runlock) = _unpack_slot(slot)
-			if default is None:
-				continue
-			if name is qname:
-				v = self.query(name)
-				if validate and not (isinstance(validate, types.TupleType) or
-									 isinstance(validate, types.DictType)):
-					(r, v) = apply(validate, (v,), {"evaluate": 1})
-					if r != VALID:
-						(r, v) = apply(validate, (default,), {"evaluate": 1})
-				return v
-		warn('ptable:queryv',
-			 'No value associated with "%s".' % qname)
-		return None
+		if not qname in self._index:
+			warn('ptable:queryv',
+				 'No value associated with "%s".' % qname)
+			return None
+		return self._lookup(qname)[3]
 
 	def set(self, name, value):
 		"""Set current value for named row.
@@ -378,6 +449,7 @@ class ParamTable(object):
 
 		"""
 		self._entries[name].setentry(value)
+		self._invalidate(name)
 
 	def save(self, file=None, remove=1):
 		"""Save state for table to file.
@@ -450,6 +522,7 @@ class ParamTable(object):
 	def _load(self, file=None):
 		# try all the load methods in order until one works..
 		# or if none work, return 0..
+		self._invalidate()
 		for method in (self._load_cfg, self._load_txt, self._load_pickle):
 			if method(file=file):
 				if not method  == self._load_cfg:
@@ -663,6 +736,39 @@ class ParamTable(object):
 						except KeyError:
 							e.configure(state=NORMAL)
 
+def queryv_benchmark(pt, n=1000):
+	"""Time ParamTable.queryv() with and without the snapshot.
+
+	Queries every slot in table pt n times, once forcing a widget
+	read and validation on each call (what queryv() always used to
+	do, less the linear search for the slot) and once served from
+	the snapshot, and reports the per-call cost.
+
+	:param pt: (ParamTable) table to query (eg, app.rig_common)
+
+	:param n: (int) repetitions
+
+	:return: (tuple) (uncached, cached) per-call times (us)
+
+	"""
+	import time
+
+	names = pt._order
+	result = []
+	for cached in (False, True):
+		pt._invalidate()
+		t0 = time.time()
+		for k in range(n):
+			for name in names:
+				if not cached:
+					pt._invalidate(name)
+				pt.queryv(name)
+		t = 1e6 * (time.time() - t0) / max(1, n * len(names))
+		print '%-8s %s: %8.2f us/call (%d slots)' % \
+			  (cached and 'cached' or 'uncached', pt.tablename, t, len(names))
+		result.append(t)
+	return tuple(result)
+
 # helper functions for creating rows in the parameter table:
 
 def psection(name):
@@ -1215,3 +1321,22 @@ def is_list(s, evaluate=None):
 
 	return r
 
+# built-in validators that only look at the string -- safe to cache
+# (is_dir, is_file, is_newfile, is_param and is_iparam aren't)
+is_any.cacheable = 1
+is_boolean.cacheable = 1
+is_int.cacheable = 1
+is_posint.cacheable = 1
+is_negint.cacheable = 1
+is_gteq_zero.cacheable = 1
+is_lteq_zero.cacheable = 1
+is_rgb.cacheable = 1
+is_rgba.cacheable = 1
+is_gray.cacheable = 1
+is_rgba2.cacheable = 1
+is_float.cacheable = 1
+is_percent.cacheable = 1
+is_angle_degree.cacheable = 1
+is_cdf.cacheable = 1
+is_pdf.cacheable = 1
+is_list.cacheable = 1
@@ -27,6 +27,7 @@ import asyncore
 import threading
 import glob
 import cPickle
+import copy
 import math
 import numpy as np
 
@@ -84,6 +85,12 @@ from events import *
 from guitools import *
 from pypeerrors import *
 from pypedata import *
+from recwriter import RecordWriter
+from adstream import AdStream
+from idlesched import IdleScheduler
+from liveplot import LivePlot
+from metrics import Metrics
+from vectorops import find_ttl
 if sys.platform.startswith('linux'):
     from dacq import *
 else:
@@ -219,6 +226,12 @@ def _base_ptables():
         pyesno('save_ain5', 0, 'save raw AIN 5'),
         pyesno('save_ain6', 0, 'save raw AIN 6'),
         pyesno('save_ain7', 0, 'save raw AIN 7'),
+        pyesno('save_binary', 0,
+              'save sample vectors as typed binary arrays (smaller/faster)'),
+        pyesno('save_zlib', 0,
+              'compress binary sample vectors (save_binary only)'),
+        pyesno('fsync_records', 0,
+              'fsync datafile after each trial (else only at end of run)'),
 
         ptitle('Reward calibration (read-only: set in Config file)'),
         pslot_ro('drop_slope', '0', is_float,
@@ -404,6 +417,8 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         self.record_id = 1
         self.record_buffer = []
         self.record_file = None
+        self._recwriter = None
+        self.metrics = Metrics()        # for pypehttpd's /metrics etc
         self._last_eyepos = 0
         self._allowabort = 0
         self._rewardlock = thread.allocate_lock()
@@ -594,26 +609,29 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         tog_udpy.pack(expand=0, fill=X, side=TOP)
         self.balloon.bind(tog_udpy, "show/hide USER display window")
 
+        # RT histogram, psth and eye trace windows live in a separate
+        # plotting process (see liveplot.py), so drawing them doesn't
+        # add to the ITI
+        self.plots = LivePlot()
+
         # reaction time plot window
+        v = IntVar()
         b = Checkbutton(c2pane, text='RT hist',
                         relief=RAISED, anchor=W,
-                        background='lightblue')
+                        background='lightblue', variable=v,
+                        command=lambda v=v: self.plots.show('rt', v.get()))
         b.pack(expand=0, fill=X, side=TOP, pady=2)
-        pw = DockWindow(checkbutton=b, title='Reaction Times')
-        Button(pw, text='Clear',
-               command=self.update_rt).pack(side=TOP, expand=1, fill=X)
-        self.rthist = EmbeddedFigure(pw)
         self.update_rt()
 
         if not self.training and not self.psych:
             # psth plot window -- only for recording sessions
+            v = IntVar()
             b = Checkbutton(c2pane, text='psth', relief=RAISED, anchor=W,
-                            background='lightblue')
+                            background='lightblue', variable=v,
+                            command=lambda v=v: self.plots.show('psth',
+                                                                v.get()))
             b.pack(expand=0, fill=X, side=TOP, pady=2)
-            pw = DockWindow(checkbutton=b, title='psth')
-            Button(pw, text='Clear',
-                   command=self.update_psth).pack(side=TOP, expand=1, fill=X)
-            self.psth = EmbeddedFigure(pw)
+            self.psth = 1
             self.update_psth()
         else:
             self.psth = None
@@ -912,6 +930,16 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         root_take()
 
         self.dacq_going = 1
+
+        # drains the a/d ring in the background while recording
+        self._adstream = AdStream()
+
+        # high-rate sampling (see dacq4/hsamp.c); server picks these
+        # up on its next sample tick
+        dacq_ad_rate(self.config.iget('ADRATE'))
+        for (n, decim) in enumerate(self.config.get('HS_DECIM').split(',')):
+            dacq_hs_decim(n, int(decim))
+
         self.eyeset()
         if self.eyemouse:
             # this sets the gain/offset exactly for the current
@@ -1005,7 +1033,10 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         # you can FixBreak and BarTransition to work..
         self.clear_pending_ints()
         self.lastint_ts = None          # exact time of last interupt
-        self.idle_queue = []
+
+        # idlefn() sleeps (instead of spinning) until the next queued
+        # action, deadline, interupt or GUI refresh
+        self.idler = IdleScheduler(hz=self.config.fget('GUI_HZ'))
 
         # catch interupts from the das_server process indicating
         # bar state transitions and fixation breaks
@@ -1019,6 +1050,7 @@ class PypeApp(object):                  # !SINGLETON CLASS!
 
         # setup interupt handler
         signal.signal(signal.SIGUSR1, self._int_handler)
+        self.idler.arm()
 
         # we're now ready to receive interupts, but they won't come
         # through until you do in your task:
@@ -1172,18 +1204,12 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         """
 
         if remove:
-            try:
-                self.idle_queue.remove(remove)
-                return 1
-            except ValueError:
-                # not in the cue
-                return 0
+            return self.idler.remove(remove)
         if inms is None:
-            self.idle_queue = []
+            self.idler.clear()
             return []
         else:
-            self.idle_queue.append((dacq_ts()+inms, action,))
-            return self.idle_queue[-1]
+            return self.idler.queue(self.idler.clock()+inms, action)
 
     def _whereami(self):
         import pygame
@@ -2503,6 +2529,10 @@ class PypeApp(object):                  # !SINGLETON CLASS!
                 # it for now..
                 Logger('pype: stray fixbreak caught\n')
                 pass
+            except ZoneEvent:
+                # same deal for landing zone interupts
+                Logger('pype: stray zone event caught\n')
+                pass
         
 
     def idlefn(self, ms=None, update=1, fast=None):
@@ -2512,9 +2542,9 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         by everything.  Whenever the program's looping or busy waiting
         for something (bar to go up/down, timer to expire etc), the
         app should just call idlefn().  The optional ms arg will run
-        the idle function for the indicated amount of time -- this is
-        not accurate; it just uses the tk after() command, so it's
-        X11 limited and only approximate.
+        the idle function for the indicated amount of time, sleeping
+        in between GUI refreshes (see _idlewait()) -- this is good to
+        a ms or so, but don't use it for frame timing.
 
         This function is also responsible for monitoring the GUI's
         keyboard queue and handling key events.  Right now only some
@@ -2539,14 +2569,13 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         if self._post_alarm:
             self._post_alarm = 0
             raise Alarm
+        if self._post_zone:
+            self._post_zone = 0
+            raise ZoneEvent
 
-        if len(self.idle_queue):
-            now = dacq_ts()
-            # note: work with copy, to avoid problems with 'remove' below..
-            for (deadline, action) in self.idle_queue[:]:
-                if (deadline - now) <= 0:
-                    self.idle_queue.remove((deadline, action))
-                    action()
+        if len(self.idler):
+            for action in self.idler.due():
+                action()
 
         if fast:
             return
@@ -2557,12 +2586,15 @@ class PypeApp(object):                  # !SINGLETON CLASS!
             tank, ndropped = self.plex.drain()
             if tank is None:
                 Logger('pype: lost plexon signal.. this is bad..')
+                self.metrics.set('plex_ok', 0)
+            else:
+                self.metrics.set('plex_ok', 1)
+                if ndropped:
+                    self.metrics.incr('plex_dropped', ndropped)
 
         if self.tk is None:
             if not ms is None:
-                t = Timer()
-                while t.ms() < ms:
-                    pass
+                self._idlewait(ms, fast=1)
         elif ms is None:
             # If gamepad/joystick attached -- use as follows:
             #  0,1,2,3 --> SIMULATED DIGITAL I/O LINES (comedi_server handles)
@@ -2656,6 +2688,7 @@ class PypeApp(object):                  # !SINGLETON CLASS!
                 self.proxybar = ss
 
             x, y = self.eyepos()
+            self.metrics.set('eye', (x, y))
             if (x is not None) and (y is not None):
                 self.udpy.eye_at(x, y,
                                  barup=self.barup(),
@@ -2670,9 +2703,23 @@ class PypeApp(object):                  # !SINGLETON CLASS!
             self._show_stateinfo()
 
         else:
-            t = Timer()
-            while t.ms() < ms:
-                self.idlefn()
+            self._idlewait(ms)
+
+    def _idlewait(self, ms, fast=None):
+        """Run idlefn() for ms, sleeping between calls.
+
+        Wakes up for queued actions, interupts and GUI refreshes
+        (GUI_HZ), so this doesn't peg the cpu, but doesn't hold up
+        the GUI or queued actions either. How late the wakeups are
+        is in self.idler.stats().
+
+        """
+        deadline = self.idler.clock() + ms
+        while 1:
+            self.idlefn(fast=fast)
+            if not self.idler.sleep(deadline, tick=not fast):
+                break
+        self.idler.waited(deadline)
 
     def _drain(self):
         """Open solenoid to drain juicer.
@@ -2998,7 +3045,9 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         self._post_bartransition = 0
         self._post_joytransition = 0
         self._post_alarm = 0
+        self._post_zone = 0
         self._joypad_intbut = None
+        self.zone_int = None            # (zone, event) for last ZoneEvent
 
     def interupts(self, enable=None, queue=None):
         """Enable or disable interupts from comedi_server.
@@ -3060,6 +3109,8 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         #   2: fixwin break (arg is meaningless -- always 0)
         #   3: alarm expired (arg is meaningless -- always 0)
         #   4: joypad/stick transition (button # > 1)
+        #   5: landing zone event (arg is zone | (event << 8), see
+        #      lzones.Zone)
         self.lastint_ts = dacq_ts()
 
         if iclass == 1:
@@ -3088,6 +3139,13 @@ class PypeApp(object):                  # !SINGLETON CLASS!
                 self._post_alarm = 1
             else:
                 raise Alarm
+        elif iclass == 5:
+            dacq_release()
+            self.zone_int = (iarg & 0xff, iarg >> 8)
+            if self._queue_ints:
+                self._post_zone = 1
+            else:
+                raise ZoneEvent
         else:
             sys.stderr.write('Stray SIGUSR1: iclass=%d iarg=%d\n',
                              (iclass, iarg))
@@ -3203,6 +3261,12 @@ class PypeApp(object):                  # !SINGLETON CLASS!
 
         """
         self.unloadtask()
+        self._record_close()
+
+        try:
+            self.plots.close()
+        except AttributeError:
+            pass
 
         if self._testpat: del self._testpat
 
@@ -3218,6 +3282,7 @@ class PypeApp(object):                  # !SINGLETON CLASS!
                 os.system("xset -display %s +dpms" % d)
 
         if self.dacq_going:
+            self._adstream.close()
             dacq_stop()
             dacq_going = 0
 
@@ -3365,6 +3430,9 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         # - log full 'time of day' for start event
         self.encode('TOD_START %f' % time.time())
 
+        # timestamp every flip from here to record_write()
+        self.fb.flips.start()
+
         self.recording = 1
 
         # save recording start time -- this is used to ensure
@@ -3461,18 +3529,33 @@ class PypeApp(object):                  # !SINGLETON CLASS!
 
         """
         if on:
-            dacq_adbuf_toggle(1)
+            self._ttl_config()
+            self._adstream.start()
             self.encode(EYE_START)
             self._eyetrace = 1
         elif self._eyetrace:
             # only allow turn off once..
             self.encode(EYE_STOP)
-            if dacq_adbuf_toggle(0):
+            if self._adstream.stop():
                 self.encode(EYE_OVERFLOW)
+                self.metrics.incr('eye_overflows')
                 Logger('pype: warning -- eyetrace overflowed\n')
                 warn(MYNAME(), 'eye trace overflow')
             self._eyetrace = 0
 
+    def _ttl_config(self):
+        # server-side pulse detection on the photodiode (ain2) and
+        # spike (ain3) channels; same rules as _find_ttl(), including
+        # the backwards polarity. Only used for get_spikes_now() --
+        # record_write() still runs _find_ttl() on the saved traces.
+        for (chan, name) in ((2, 'photo'), (3, 'spike')):
+            thresh = int(self.rig_common.queryv(name + '_thresh'))
+            polarity = int(self.rig_common.queryv(name + '_polarity'))
+            if polarity > 0:
+                dacq_ttl(chan, TTL_FALLING, thresh)
+            else:
+                dacq_ttl(chan, TTL_RISING, thresh)
+
     def encode(self, code=None, ts=None):
         """Insert event code into the per-trial timestream.
 
@@ -3521,22 +3604,14 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         final data -- this is only an approximation, particularly if
         you're still recording data when you call this.
 
-        :return: (array) array of spike times
-
-        """
-        n = dacq_adbuf_size()
-        t = np.zeros(n, np.float)
-        s0 = np.zeros(n, np.int)
+        Spikes are detected by the dacq server as it samples (see
+        _ttl_config), so this only has to pick up the ones that have
+        come in since the last call, not rescan the whole trial.
 
-        for i in range(0,n):
-            t[i] = dacq_adbuf_t(i) / 1000.0
-            s0[i] = dacq_adbuf_c3(i)
+        :return: (array) array of spike times (ms)
 
-        spike_thresh = int(self.rig_common.queryv('spike_thresh'))
-        spike_polarity = int(self.rig_common.queryv('spike_polarity'))
-        spike_times = _find_ttl(t, s0, spike_thresh, spike_polarity)
-
-        return spike_times
+        """
+        return self._adstream.now_ttl(3) / 1000.0
 
     def find_saccades(self, thresh=2, mindur=25, maxthresh=None,
                       start=None, stop=None):
@@ -3598,21 +3673,11 @@ class PypeApp(object):                  # !SINGLETON CLASS!
                 time)
 
         """
-        n = dacq_adbuf_size()
-        t = np.zeros(n, np.float)
-        x = np.zeros(n, np.int)
-        y = np.zeros(n, np.int)
-
-        for i in range(0,n):
-            t[i] = dacq_adbuf_t(i) / 1000.0
-            if raw:
-                x[i] = dacq_adbuf_c0(i)
-                y[i] = dacq_adbuf_c1(i)
-            else:
-                x[i] = dacq_adbuf_x(i)
-                y[i] = dacq_adbuf_y(i)
+        (n, t, x, y, pa, new, ain) = self._adstream.now()
+        if raw:
+            (x, y) = (ain[0], ain[1])
 
-        return (t, x, y)
+        return (t / 1000.0, x.copy(), y.copy())
 
     def get_phototrace_now(self):
         """Query current photo trace - note: was get_photo_now().
@@ -3621,15 +3686,9 @@ class PypeApp(object):                  # !SINGLETON CLASS!
                 current time)
 
         """
-        n = dacq_adbuf_size()
-        t = np.zeros(n, np.float)
-        p = np.zeros(n, np.int)
+        (n, t, x, y, pa, new, ain) = self._adstream.now()
 
-        for i in range(0,n):
-            t[i] = dacq_adbuf_t(i) / 1000.0
-            p[i] = dacq_adbuf_c2(i)
-
-        return (t, p)
+        return (t / 1000.0, ain[2].copy())
 
     def get_events_now(self):
         """Query current event stream (encodes).
@@ -3666,6 +3725,8 @@ class PypeApp(object):                  # !SINGLETON CLASS!
 
         """
 
+        t_start = self.idler.clock()
+
         if (self.record_file == '/dev/null' and
                     self.sub_common.queryv('fast_tmp')):
             fast_tmp = 1
@@ -3678,85 +3739,98 @@ class PypeApp(object):                  # !SINGLETON CLASS!
 
         # stop eye recording, just in case user forgot.
         self.eyetrace(0)
+        self.fb.flips.stop()
 
         # clear the idlefn queue, just in case..
         self.queue_action()
 
         tag = self.dotrialtag(reset=1)
 
-        n = dacq_adbuf_size()
-        self.eyebuf_t = np.zeros(n, np.float)
-        self.eyebuf_x = np.zeros(n, np.int)
-        self.eyebuf_y = np.zeros(n, np.int)
-        self.eyebuf_pa = np.zeros(n, np.int)
-        self.eyebuf_new = np.zeros(n, np.int)
-        p0 = np.zeros(n, np.int)
-        s0 = np.zeros(n, np.int)
-
-# ain0/1 (raw eye signal) should always be saved
-#        if self.rig_common.queryv('save_ain0'):
-#            ain0 = np.zeros(n, np.int)
-#        else:
-#            ain0 = None
-#
-#        if self.rig_common.queryv('save_ain1'):
-#            ain1 = np.zeros(n, np.int)
-#        else:
-#            ain1 = None
-
-        ain0 = np.zeros(n, np.int)
-        ain1 = np.zeros(n, np.int)
-
-        if self.rig_common.queryv('save_ain5'):
-            ain5 = np.zeros(n, np.int)
-        else:
-            ain5 = None
-
-        if self.rig_common.queryv('save_ain6'):
-            ain6 = np.zeros(n, np.int)
-        else:
-            ain6 = None
-
-        if self.rig_common.queryv('save_ain7'):
-            ain7 = np.zeros(n, np.int)
-        else:
-            ain7 = None
+        (n, t, x, y, pa, new, ain) = self._adstream.now()
+        hs = self._adstream.now_hs()
 
         # be careful here -- if you're trying to look at the photodiode
         # signals, you'd better not set fast_tmp=1...
         ndups = 0
         if not fast_tmp or self._show_eyetrace.get():
-            for i in range(0,n):
-                # convert dacq_adbuf_t() in 'us' to 'ms' for saving
-                self.eyebuf_t[i] = dacq_adbuf_t(i) / 1000.0
-                self.eyebuf_x[i] = dacq_adbuf_x(i)
-                self.eyebuf_y[i] = dacq_adbuf_y(i)
-                self.eyebuf_pa[i] = dacq_adbuf_pa(i)
-                self.eyebuf_new[i] = dacq_adbuf_new(i)
-                ain0[i] = dacq_adbuf_c0(i)
-                ain1[i] = dacq_adbuf_c1(i)
-                p0[i] = dacq_adbuf_c2(i) # photo diode
-                s0[i] = dacq_adbuf_c3(i) # spike detect
-                if not ain5 is None:
-                    ain5[i] = dacq_adbuf_c5(i)
-                if not ain6 is None:
-                    ain6[i] = dacq_adbuf_c6(i)
-                if not ain7 is None:
-                    ain7[i] = dacq_adbuf_c7(i)
+            # already drained out of the shm ring into private storage
+            # by the adstream, so no copy needed; convert t from 'us'
+            # to 'ms' for saving
+            self.eyebuf_t = t / 1000.0
+            self.eyebuf_x = x
+            self.eyebuf_y = y
+            self.eyebuf_pa = pa
+            self.eyebuf_new = new
 
             ###############################################################3
             # (starting) Thu Oct 21 14:38:49 2010 mazer
             # look for duplicates in the time stream -- this means
             # something's wrong with comedi_server or passing doubles
             # around...
-            for i in range(1, n):
-                if self.eyebuf_t[i-1] == self.eyebuf_t[i]:
-                    ndups = ndups + 1
+            ndups = np.sum(np.diff(self.eyebuf_t) == 0)
             if ndups > 0:
                 sys.stderr.write("warning: %d duplicate timestamp(s)\n" % ndups)
             #
             ###############################################################3
+        else:
+            self.eyebuf_t = np.zeros(n, np.float)
+            self.eyebuf_x = np.zeros(n, np.int)
+            self.eyebuf_y = np.zeros(n, np.int)
+            self.eyebuf_pa = np.zeros(n, np.int)
+            self.eyebuf_new = np.zeros(n, np.int)
+            ain = np.zeros(ain.shape, np.int)
+            hs = ()
+
+        # ain0/1 (raw eye signal) should always be saved
+        ain0 = ain[0]
+        ain1 = ain[1]
+        p0 = ain[2]                     # photo diode
+        s0 = ain[3]                     # spike detect
+
+        # high-rate channels (HS_DECIM) as a flat (t0, v0, t1, v1, ..)
+        # tuple, t in 'ms'; None's for channels that weren't stored
+        ain_hs = ()
+        for (hs_t, hs_v) in hs:
+            if len(hs_t):
+                ain_hs = ain_hs + (hs_t / 1000.0, hs_v)
+            else:
+                ain_hs = ain_hs + (None, None)
+
+        # flip times (ms) and missed refreshes for each frame this
+        # trial (see fliptimer.py)
+        (flip_t, flip_tcall, flip_missed) = self.fb.flips.trial()
+        if len(flip_t) and len(self.record_buffer) and \
+               not (self.record_buffer[0][0] - 1 <= flip_t[0] <=
+                    self.record_buffer[-1][0] + 1):
+            # flips and encodes are supposed to share a clock..
+            Logger('pype: warning -- flip times outside trial '
+                   '(%.0f not in %d-%d ms)\n' %
+                   (flip_t[0], self.record_buffer[0][0],
+                    self.record_buffer[-1][0]))
+
+        # optional extra channels -- None if not requested or not
+        # sampled by the dacq server
+        nchan = ain.shape[0]
+
+        if nchan > 5 and self.rig_common.queryv('save_ain5'):
+            ain5 = ain[5]
+        else:
+            ain5 = None
+
+        if nchan > 6 and self.rig_common.queryv('save_ain6'):
+            ain6 = ain[6]
+        else:
+            ain6 = None
+
+        if nchan > 7 and self.rig_common.queryv('save_ain7'):
+            ain7 = ain[7]
+        else:
+            ain7 = None
 
+        # saved pulse times still come from the saved traces, so
+        # they're exactly what offline reanalysis of the same traces
+        # gets -- the server-side ttl queue (see _ttl_config) is only
+        # for mid-trial use (get_spikes_now)
         photo_thresh = int(self.rig_common.queryv('photo_thresh'))
         photo_polarity = int(self.rig_common.queryv('photo_polarity'))
         self.photo_times = _find_ttl(self.eyebuf_t, p0,
@@ -3813,13 +3887,19 @@ class PypeApp(object):                  # !SINGLETON CLASS!
                                 ((self.eyebuf_t, s0), (ut, a0), ),
                                 self.spike_times)
 
-        self.udpy.info("|spikes:%3d|syncs:%3d|dups:%3d|" %
-                       (len(self.spike_times), len(self.photo_times), ndups,))
+        self.udpy.info("|spikes:%3d|syncs:%3d|dups:%3d|drops:%3d|late:%3d|"
+                       "wake:%.1fms|" %
+                       (len(self.spike_times), len(self.photo_times), ndups,
+                        np.sum(flip_missed[flip_missed > 0]),
+                        np.sum(flip_missed < 0),
+                        self.idler.stats()['deadline_p95'],))
 
         # Completely wipe the buffers -- don't let them accidently
         # get read TWICE!!  They're saved as self/app.eyebuf_[xyt]
         # in case you wawnt them for something..
-        dacq_adbuf_clear()
+        eye_lost = self._adstream.lost
+        ttl_lost = self._adstream.ttl_lost
+        self._adstream.clear()
 
         # insert these into the param dictionary for later retrieval
         params['PypeBuildDate']  = pypeversion.PypeBuildDate
@@ -3875,6 +3955,16 @@ class PypeApp(object):                  # !SINGLETON CLASS!
             #               naming scheme (01a, 02a, 02b etc..)
             #               (added: rec[13] 31-oct-2005 JAM)
             #  rec[14]      eyenew data (added: Fri Apr  8 15:27:34 2011 mazer )
+            #  rec[15]      TUPLE of high-rate analog channel data (ADRATE
+            #               and HS_DECIM): (t0, v0, t1, v1, ..) with
+            #               timestamps in ms; None's for channels that
+            #               weren't stored (added: Sun Oct 18 2026 mazer)
+            #  rec[16]      TUPLE of frame flip timing: (t, tcall, nmissed)
+            #               VECTORs with the time of each flip, the time
+            #               flip() was called (both ms) and the number of
+            #               refreshes it missed (<0 if flip() was called
+            #               late, see fliptimer.py)
+            #               (added: Sun Oct 18 2026 mazer)
 
             if self.xdacq == 'tdt':
                 # insert tdt tank info into the parameter table for this
@@ -3892,35 +3982,70 @@ class PypeApp(object):                  # !SINGLETON CLASS!
                 info[2]['tdt_block'] = str(block.encode('ascii'))
                 info[2]['tdt_tnum'] = tnum
 
+            # the record's pickled later by the writer thread, so
+            # snapshot everything the task (or the next trial) might
+            # still change -- params, taskinfo, the encode list
+            info = copy.deepcopy(info)
+            record_buffer = list(self.record_buffer)
+
+            # binary records take the arrays as-is (see
+            # labeled_dump_binary), otherwise convert to lists
+            save_binary = self.rig_common.queryv('save_binary')
+            if save_binary:
+                tolist = lambda v: v
+            else:
+                tolist = _tolist
+
             rec = [
                 ENCODE,
                 info,
-                self.record_buffer,
-                _tolist(self.eyebuf_t),
-                _tolist(self.eyebuf_x),
-                _tolist(self.eyebuf_y),
-                _tolist(self.photo_times),
-                _tolist(self.spike_times),
+                record_buffer,
+                tolist(self.eyebuf_t),
+                tolist(self.eyebuf_x),
+                tolist(self.eyebuf_y),
+                tolist(self.photo_times),
+                tolist(self.spike_times),
                 self.record_id,
-                _tolist(p0),              # photo diode trace (analog)
-                _tolist(s0),              # spike detect trace (TTL)
+                tolist(p0),               # photo diode trace (analog)
+                tolist(s0),               # spike detect trace (TTL)
                 (
-                    _tolist(ain0),   # analog input channel 0
-                    _tolist(ain1),   # analog input channel 1
+                    tolist(ain0),    # analog input channel 0
+                    tolist(ain1),    # analog input channel 1
                     None,            # photo diode trace (dup!)
                     None,            # spike detect trace (dup!)
-                    _tolist(ain5),   # analog input channel 5
-                    _tolist(ain6),   # analog input channel 6
-                    _tolist(ain7),   # analog input channel 7
+                    tolist(ain5),    # analog input channel 5
+                    tolist(ain6),    # analog input channel 6
+                    tolist(ain7),    # analog input channel 7
                     ),
-                _tolist(self.eyebuf_pa),
+                tolist(self.eyebuf_pa),
                 self.xdacq_data_store,
-                _tolist(self.eyebuf_new),
+                tolist(self.eyebuf_new),
+                tuple([tolist(v) for v in ain_hs]),
+                (tolist(flip_t), tolist(flip_tcall), tolist(flip_missed)),
                 ]
 
-            f = open(self.record_file, 'a')
-            labeled_dump('encode', rec, f, 1)
-            f.close()
+            self._record_out('encode', rec, binary=save_binary,
+                             compress=self.rig_common.queryv('save_zlib'))
+
+        if self._recwriter is not None:
+            w = self._recwriter.stats()
+        else:
+            w = {'last': None, 'stall': None}
+        idle = self.idler.stats()
+        self.metrics.trial(record_id=self.record_id,
+                           result=resultcode, rt=rt,
+                           record_write_ms=self.idler.clock() - t_start,
+                           write_latency_ms=w['last'],
+                           write_stall_ms=w['stall'],
+                           flips=len(flip_t),
+                           drops=int(np.sum(flip_missed[flip_missed > 0])),
+                           late=int(np.sum(flip_missed < 0)),
+                           wake_p95_ms=idle['deadline_p95'],
+                           wake_max_ms=idle['deadline_max'],
+                           eye_lost=eye_lost,
+                           ttl_lost=ttl_lost,
+                           spikes=len(self.spike_times),
+                           plots_dropped=self.plots.ndropped)
 
         self.record_id = self.record_id + 1
 
@@ -3961,9 +4086,36 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         """
         if self.record_file:
             rec = [NOTE, tag, note]
-            f = open(self.record_file, 'a')
-            labeled_dump('note', rec, f, 1)
-            f.close()
+            self._record_out('note', rec)
+
+    def _record_out(self, label, rec, binary=0, compress=0):
+        """Queue record for writing to current datafile.
+
+        Records are written by a background thread (see recwriter.py)
+        that keeps the datafile open until _record_close().
+
+        """
+        if (self._recwriter is not None and
+                self._recwriter.fname != self.record_file):
+            self._record_close()
+        if self._recwriter is None:
+            self._recwriter = RecordWriter(
+                self.record_file,
+                fsync=self.rig_common.queryv('fsync_records'))
+        self._recwriter.write(label, rec, binary, compress)
+
+    def _record_close(self):
+        """Durably flush and close current datafile (if open).
+
+        """
+        if self._recwriter is not None:
+            w = self._recwriter
+            self._recwriter = None
+            w.close()
+            s = w.stats()
+            Logger('pype: %s: %d recs, write latency %.1fms mean, '
+                   '%.1fms max, %.1fms stalled\n' %
+                   (w.fname, s['n'], s['mean'], s['max'], s['stall']))
 
     def _guess_fallback(self):
         """Guess next filename/number by looking at files in CWD.
@@ -4060,12 +4212,17 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         """
 
         self.record_note('pype', 'run ends')
+        self._record_close()
         self.record_file = None
         self._set_recfile()
 
     def _record_selectfile(self, fname=None):
         import filebox
 
+        # make sure anything pending for the last datafile is
+        # on disk before (possibly) unlinking it below
+        self._record_close()
+
         if not fname is None:
             self.record_file = fname
         else:
@@ -4145,8 +4302,6 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         self._show_eyetrace_stop = stop
 
     def _plotEyetraces(self, t, x, y, p0, s0, raster):
-        import pylab
-
         if len(t) < 1:
             return
 
@@ -4160,103 +4315,35 @@ class PypeApp(object):                  # !SINGLETON CLASS!
         else:
             stop = t[-1]
 
-        t0 = t[0]
-        skip = 1
-
-        pylab.ion()
-        pylab.figure(99)
-        pylab.clf()
-
-        pylab.subplot(4, 1, 1)
-        pylab.plot(t[::skip] - t0, x[::skip], 'r-',
-                   t[::skip] - t0, y[::skip], 'g-')
-        pylab.xlim(start - t0, stop - t0)
-        pylab.ylabel('X=RED Y=GRN')
-
-        colors = 'krgbckrgbckrgbc'
-
-        pylab.subplot(4, 1, 2)
-        n = 0
-        for (tt, p) in p0:
-            pylab.plot(tt[::skip] - t0, p, colors[n]+'-')
-            pylab.hold(True)
-            n += 1
-        pylab.hold(False)
-        pylab.xlim(start - t0, stop - t0)
-        pylab.ylabel('photo')
-
-        pylab.subplot(4, 1, 3)
-        n = 0
-        for (tt, s) in s0:
-            pylab.plot(tt[::skip] - t0, s, colors[n]+'-')
-            pylab.hold(True)
-            n += 1
-        pylab.hold(False)
-        #pylab.xlim(start - t0, stop - t0)
-        pylab.ylabel('spikes')
-
-        pylab.subplot(4, 1, 4)
-        raster = np.array(raster) - t0
-        pylab.plot(raster, 0.0 * raster, 'k.')
-        pylab.ylim(-1,1)
-        pylab.xlim(start - t0, stop - t0)
-        pylab.ylabel('raster')
-        pylab.draw()
+        # decimated and drawn by the plotter process
+        self.plots.eyes(t, x, y, p0, s0, raster, start, stop)
 
     def update_rt(self, infotuple=None):
-        import pylab
+        """Update (or clear, no args) the RT histogram.
+
+        app.rtdata keeps all the RTs for the run; the histogram
+        itself is binned and drawn by the plotter process.
 
+        """
         if infotuple is None:
             self.rtdata = []
+            self.plots.clear('rt')
         else:
             resultcode, rt, params, taskinfo = infotuple
             if rt > 0:
                 self.rtdata.append(rt)
-
-        self.rthist.fig.clf()
-
-        a = self.rthist.fig.add_subplot(1,1,1)
-        h = np.array(self.rtdata)
-        if len(h) == 0 or np.std(h) <= 0:
-            a.text(0.5, 0.5, 'SPACE INTENTIONALLY BLANK',
-                   transform=a.transAxes, color='red',
-                   horizontalalignment='center', verticalalignment='center')
-        else:
-            n, bins, patches = a.hist(h, facecolor='grey')
-            a.text(0.02, 1-0.02,
-                   '$\\mu=%.0fms$\n$\\sigma=%.0fms$' % (np.mean(h), np.std(h),),
-                   horizontalalignment='left', verticalalignment='top',
-                   color='red', transform=a.transAxes)
-
-            x = np.linspace(bins[0], bins[-1], 25)
-            g = pylab.normpdf(x, np.mean(h), np.std(h))
-            g = g * np.sum(n) / np.sum(g)
-            a.plot(x, g, 'r-', linewidth=2)
-            a.axvspan(self.sub_common.queryv('minrt'),
-                      self.sub_common.queryv('maxrt'),
-                      color='b', alpha=0.25)
-            a.axis([-10, 1.25*self.sub_common.queryv('maxrt'), None, None])
-            
-        a.set_ylabel('n=%d' % len(h))
-        a.set_xlabel('Reaction Time (ms)')
-
-        try:
-            self.rthist.drawnow()
-        except:
-            if warn(MYNAME(),
-                    'Probably must delete ~/.matlibplot', once=True):
-                reporterror()
+                self.plots.rt(rt,
+                              self.sub_common.queryv('minrt'),
+                              self.sub_common.queryv('maxrt'))
 
     def update_psth(self, data=None, trigger=PSTH_TRIG):
         """
         Note: this only adds to the psth if the trigger event is present.
         """
-        import pylab
-
         if self.psth is None: return
 
         if data is None:
-            self.psthdata = np.array([])
+            self.plots.clear('psth')
         else:
             spike_times = np.array(data[0])
             events = data[1]
@@ -4265,28 +4352,7 @@ class PypeApp(object):                  # !SINGLETON CLASS!
                 # no trigger event.. don't update..
                 return
             else:
-                self.psthdata = np.concatenate((self.psthdata, spike_times-t0,))
-
-        self.psth.fig.clf()
-        a = self.psth.fig.add_subplot(1,1,1)
-        if len(self.psthdata) == 0:
-            a.text(0.5, 0.5, 'NO SPIKE DATA',
-                   transform=a.transAxes, color='red',
-                   horizontalalignment='center', verticalalignment='center')
-        else:
-            # how histogram first 2s of data in 50 ms bins; this really
-            # should be settable by the task..
-            a.hist(self.psthdata, facecolor='blue',
-                   bins=40, range=(-100, 1900))
-        a.set_xlabel('Time (ms)')
-        a.set_ylabel('nspikes')
-
-        try:
-            self.psth.drawnow()
-        except:
-            if warn('matlibplot error',
-                    'Probably must delete ~/.matlibplot', once=True):
-                reporterror()
+                self.plots.psth(spike_times-t0)
 
     def makeFixWin(self, x, y, tweak=0):
         """Helper function for creating new fixation window in std way.
@@ -4333,9 +4399,13 @@ def _hostconfigfile():
     h = socket.gethostname().split('.')[0]
     return pyperc('Config.%s' % h)
 
-def _find_ttl(t, x, thresh=500, polarity=1):
+def _find_ttl(t, x, thresh=500, polarity=1, hysteresis=0, minwidth=0):
     """Find TTL pulses in x.
 
+    Thin wrapper around vectorops.find_ttl() (see there for details
+    and vectorops.benchmark_ttl() for a comparison against the original
+    sample-by-sample loop).
+
     *NB* this is backwards (ie, polarity=1 means negative going), but
     it's too late to change now..
 
@@ -4346,28 +4416,16 @@ def _find_ttl(t, x, thresh=500, polarity=1):
     :param polarity: (in) >0 for negative going, <=0 for positive
         going pulses.
 
+    :param hysteresis: (a2d units) optional hysteresis for pulse offset
+
+    :param minwidth: (ms) optional minimum pulse width
+
     :return: (list) time in ms of first samples above or below
         threshold (depending on value of polarity)
 
     """
-
-    times = []
-    inpulse = 0
-    if polarity > 0:
-        for i in range(0, len(t)):
-            if (not inpulse) and (x[i] < thresh):
-                times.append(t[i])
-                inpulse = 1
-            elif inpulse and (x[i] > thresh):
-                inpulse = 0
-    else:
-        for i in range(0, len(t)):
-            if (not inpulse) and (x[i] > thresh):
-                times.append(t[i])
-                inpulse = 1
-            elif inpulse and (x[i] < thresh):
-                inpulse = 0
-    return times
+    return find_ttl(t, x, thresh, polarity,
+                    hysteresis=hysteresis, minwidth=minwidth).tolist()
 
 def _safeLookup(dict, key, default):
     """Dictionary look up with a default value.
@@ -14,10 +14,14 @@ import posix
 import math
 import time
 import cPickle
+import cStringIO
+import zlib
+import mmap
 
 from vectorops import *
 from pype import *
 import re
+import eyecal
 
 import numpy as np
 
@@ -35,11 +39,164 @@ def labeled_dump(label, obj, f, bin=0):
 	f.write('<<<%s>>>\n' % label)
 	cPickle.dump(obj, f, bin)
 
+# label suffix for records written by labeled_dump_binary()
+_BINTAG = ':bin'
+
+# slots of an ENCODE record that hold sample vectors (see PypeRecord);
+# rec[11] and rec[15] are tuples of raw analog channels, rec[16]
+# the frame flip timing vectors
+_VECSLOTS = (3, 4, 5, 6, 7, 9, 10, 11, 12, 14, 15, 16)
+_TUPSLOTS = (11, 15, 16)
+
+def _binvec(v):
+	"""Vector -> compact little-endian contiguous ndarray (None if it's
+	not something that can be stored as a flat typed array).
+
+	Integers go in the smallest int type that holds them, floats in
+	float32 if that's lossless, float64 otherwise (_load_binary()
+	turns them back into int/float64 arrays).
+
+	"""
+	if v is None:
+		return None
+	try:
+		a = np.asarray(v)
+	except (ValueError, TypeError):
+		return None
+	if a.ndim != 1:
+		return None
+	if a.dtype.kind in 'iub':
+		# smallest int type that holds the data (a/d samples are
+		# usually 12-16 bits)
+		if len(a) == 0:
+			return np.ascontiguousarray(a, '<i4')
+		(lo, hi) = (a.min(), a.max())
+		for dtype, nbits in (('<i2', 15), ('<i4', 31)):
+			if lo >= -(1 << nbits) and hi < (1 << nbits):
+				return np.ascontiguousarray(a, dtype)
+		return np.ascontiguousarray(a, '<i8')
+	elif a.dtype.kind == 'f':
+		a4 = np.ascontiguousarray(a, '<f4')
+		if np.array_equal(a4, a):
+			return a4
+		return np.ascontiguousarray(a, '<f8')
+	return None
+
+def _shuffle(a):
+	# byte planes (all the low bytes, then the next..) -- neighbouring
+	# samples mostly share their high bytes, so this zips much better
+	return a.view(np.uint8).reshape((-1, a.itemsize)).T.tostring()
+
+def _unshuffle(s, dtype, count):
+	dtype = np.dtype(dtype)
+	b = np.fromstring(s, np.uint8).reshape((dtype.itemsize, count))
+	return np.ascontiguousarray(b.T).view(dtype).reshape(count)
+
+def labeled_dump_binary(label, rec, f, compress=0):
+	"""Binary version of labeled_dump() for ENCODE records.
+
+	The sample vectors (eye t/x/y, photo and spike times, raw photo
+	and spike traces, raw analog channels, pupil and eyenew) are
+	pulled out of the record and written after the pickled remainder
+	as compact typed arrays (see _binvec), so nothing gets boxed into
+	python ints/floats on either end. With compress set, each array's
+	byte-shuffled and zlib'd too (about 3x smaller again for eye and
+	a/d traces). labeled_load() reads these records back
+	transparently, but the vectors come back as numpy arrays instead
+	of lists.
+
+	"""
+	rec = list(rec)
+	for slot in _TUPSLOTS:
+		if len(rec) > slot and rec[slot] is not None:
+			rec[slot] = list(rec[slot])
+
+	layout = []
+	arrays = []
+	nbytes = 0
+	for slot in _VECSLOTS:
+		if slot >= len(rec):
+			break
+		if slot in _TUPSLOTS:
+			if rec[slot] is None:
+				continue
+			vecs = [(n, rec[slot][n]) for n in range(len(rec[slot]))]
+		else:
+			vecs = [(None, rec[slot])]
+		for (sub, v) in vecs:
+			a = _binvec(v)
+			if a is None:
+				# None or something odd -- leave it in the pickle
+				continue
+			if compress:
+				(data, codec) = (zlib.compress(_shuffle(a), 1), 'zlib')
+			else:
+				(data, codec) = (a.tostring(), None)
+			layout.append((slot, sub, a.dtype.str, len(a), nbytes,
+						   len(data), codec))
+			arrays.append(data)
+			nbytes = nbytes + len(data)
+			if sub is None:
+				rec[slot] = None
+			else:
+				rec[slot][sub] = None
+
+	f.write('<<<%s%s>>>\n' % (label, _BINTAG))
+	cPickle.dump((rec, layout, nbytes), f, 2)
+	for data in arrays:
+		f.write(data)
+
+def _load_binary(f, mapped=None):
+	"""Read back the body of a labeled_dump_binary() record.
+
+	If f is a cStringIO view of mmap'd file `mapped`, the arrays are
+	read straight out of the map. Either way, vectors come back as
+	new (writable) int or float64 arrays.
+
+	"""
+	(rec, layout, nbytes) = cPickle.load(f)
+	if mapped is None:
+		buf = f.read(nbytes)
+		base = 0
+		if len(buf) < nbytes:
+			raise EOFError
+	else:
+		buf = mapped
+		base = f.tell()
+		if (base + nbytes) > len(mapped):
+			raise EOFError
+		f.seek(nbytes, 1)
+	for l in layout:
+		(slot, sub, dtype, count, offset) = l[:5]
+		if len(l) > 5 and l[6] == 'zlib':
+			s = buf[base+offset:base+offset+l[5]]
+			v = _unshuffle(zlib.decompress(s), dtype, count)
+		else:
+			v = np.frombuffer(buf, dtype, count, base + offset)
+		if v.dtype.kind == 'f':
+			v = v.astype(np.float64)
+		else:
+			v = v.astype(np.int)
+		if sub is None:
+			rec[slot] = v
+		else:
+			rec[slot][sub] = v
+	for slot in _TUPSLOTS:
+		if len(rec) > slot and rec[slot] is not None:
+			rec[slot] = tuple(rec[slot])
+	return rec
+
+def _labeled_body(label, f, mapped):
+	if label.endswith(_BINTAG):
+		return label[:-len(_BINTAG)], _load_binary(f, mapped)
+	return label, cPickle.load(f)
+
 if Numeric is None:
-	def labeled_load(f):
+	def labeled_load(f, mapped=None):
 		"""Wrapper for cPickle.load.
 
-		Inverse of labeled_dump().
+		Inverse of labeled_dump() and labeled_dump_binary(). `mapped`
+		is the mmap that f (a cStringIO) is reading from, if any.
 
 		"""
 
@@ -48,13 +205,14 @@ if Numeric is None:
 			if not l:
 				return None, None
 			if l.startswith('<<<') and l.endswith('>>>\n'):
-				return l[3:-4], cPickle.load(f)
+				return _labeled_body(l[3:-4], f, mapped)
 else:
-	def labeled_load(f):
+	def labeled_load(f, mapped=None):
 		"""Wrapper for cPickle.load.
 
-		Inverse of labeled_dump(). This one works with old 32bit
-		Numeric-based pypefiles, but requires Numeric be installed!
+		Inverse of labeled_dump() and labeled_dump_binary(). This one
+		works with old 32bit Numeric-based pypefiles, but requires
+		Numeric be installed!
 
 		"""
 
@@ -93,7 +251,7 @@ else:
 				if not l:
 					return None, None
 				if l.startswith('<<<') and l.endswith('>>>\n'):
-					return l[3:-4], cPickle.load(f)
+					return _labeled_body(l[3:-4], f, mapped)
 		finally:
 			Numeric.array_constructor = ac
 
@@ -175,6 +333,19 @@ class PypeRecord(object):
 		#				naming scheme (01a, 02a, 02b etc..)
 		#				(added: rec[13] 31-oct-2005 JAM)
 		#  rec[14]		eyenew data (added: Fri Apr	 8 15:27:34 2011 mazer )
+		#  rec[15]		TUPLE of high-rate analog channel data:
+		#				(t0, v0, t1, v1, ..), timestamps in ms, None's
+		#				for channels that weren't stored at high rate
+		#				(added: Sun Oct 18 2026 mazer)
+		#  rec[16]		TUPLE of frame flip timing: (t, tcall, nmissed),
+		#				flip times and times flip() was called (ms),
+		#				and refreshes missed by each flip (<0 when
+		#				flip() was called late, see fliptimer.py)
+		#				(added: Sun Oct 18 2026 mazer)
+		#
+		#  In records written with labeled_dump_binary() (rig param
+		#  'save_binary') the VECTORs and LISTs of time stamps above are
+		#  numpy arrays (int or float64) instead of lists.
 
 		self.file = file
 		self.recnum = recnum
@@ -285,170 +456,257 @@ class PypeRecord(object):
 		file.write("================================\n")
 
 
+	# compute() doesn't actually compute anything anymore, these
+	# attributes are filled in on first access (see __getattr__) by
+	# the corresponding _compute_xxx() method and then cached, so
+	# analyses that only look at, say, events and spike_times never
+	# pay for decoding the eye traces.
+	_lazy = {
+		'events': '_compute_events',
+		't0': '_compute_events',
+		'photo_times': '_compute_ttl',
+		'spike_times': '_compute_ttl',
+		'plex_times': '_compute_plexon',
+		'plex_channels': '_compute_plexon',
+		'plex_units': '_compute_plexon',
+		'plex_ids': '_compute_plex_ids',
+		'eyet': '_compute_eye',
+		'realt': '_compute_eye',
+		'eyex': '_compute_eye',
+		'eyey': '_compute_eye',
+		'eyevalid': '_compute_eye',
+		'_eyedt': '_compute_eye',
+		'israw': '_compute_eye',
+		'gaps_t': '_compute_gaps',
+		'gaps_y': '_compute_gaps',
+		'gapdurs': '_compute_gaps',
+		'eyedxdt': '_compute_velocity',
+		'eyedydt': '_compute_velocity',
+		'eyedxydt': '_compute_velocity',
+		'hs_t': '_compute_hs',
+		'hs': '_compute_hs',
+		'flip_t': '_compute_flips',
+		'flip_tcall': '_compute_flips',
+		'flip_missed': '_compute_flips',
+		}
+
+	def __getattr__(self, name):
+		# only gets called for attributes that don't exist (yet)
+		if not name in PypeRecord._lazy or not self.__dict__.get('computed'):
+			raise AttributeError(name)
+		getattr(self, PypeRecord._lazy[name])()
+		try:
+			return self.__dict__[name]
+		except KeyError:
+			raise AttributeError(name)
+
 	def compute(self, velocity=None, gaps=None, raw=None, nooffset=None):
 		"""
 		Note: All eye info is maintained here in PIXELS.
 			  Use pix2deg() and deg2pix() below to convert.
+
+		Fields (events, spike_times, eyet etc) are actually decoded
+		on first access, so some errors (PypedataTimeError) don't show
+		up until the eye data is used. params is final as soon as
+		this returns, though (eye tracker lag is worked out here).
 		"""
 		if not self.computed:
-			# this is new 13-apr-2001:
-			if 'eyelag' in self.params:
-				lag = float(self.params['eyelag'])
-			else:
-				lag = 0
-
-			# all pype files should have these (may be [] if not collected)
-
-			#Tue Aug 20 16:08:29 2013 mazer
-			# if an event 'name' is not a string, then assume it's a list
-			# or tuple and expand on the fly into multiple events with
-			# a shared timestamp -- this was originally done in by
-			# p2m/pype_expander.py when generating matlab files, but this
-			# is actually the correct place to do it..
-			times = []
-			events = []
-			for (t, e) in self.rec[2]:
-				if type(e) is types.StringType:
-					times.append(t)
-					events.append(e)
-				else:
-					for ee in e:
-						times.append(t)
-						events.append(ee)
-			self.events = zip(times, events)
-
-
-			self.eyet = np.array(self.rec[3], np.float) # ms
-			self.realt = np.array(self.rec[3], np.float) # ms
-			dt = diff(self.eyet)
-			if sum(np.where(np.less(dt, 0), 1, 0)) > 0:
-				raise PypedataTimeError
-			self.eyex = np.array(self.rec[4], np.float) # dva
-			self.eyey = np.array(self.rec[5], np.float) # dva
-
-			if self.params['eyetracker'] == 'ISCAN':
-				# Tue Jun  7 15:39:09 2011 mazer : NEW
-				#  estimate eye tracker rate directly from data:
-				#	one frame for sample&hold camera, one frame for
-				#	framegrabber and one more frame because it seems
-				#	correct (check with Rikki Razdan again??)
-
-				# find points where x or y has changed
-				dxy= (np.diff(self.eyex)!=0) & (np.diff(self.eyey)!=0)
-				# compute sampling interval (si)
-				si = np.median(diff(np.array(self.realt)[np.where(dxy)]))
-				si = 1000.0 / (60.0 * np.round((1000.0 / si) / 60.0))
-				lag = 3.0 * round(si)
-				self.params['eyelag_user'] = lag
-				self.params['eyelag'] = lag
-
-			if lag > 0:
-				# correct for eye tracker delay, if any..
-				self.eyet = self.eyet - lag
-				if PypeRecord._reportcorrection:
-					# report this correction only ONCE!!
-					sys.stderr.write('NOTE: fixing %.1f ms eye lag\n' % lag)
-					PypeRecord._reportcorrection = None
+			self._options = (velocity, gaps, raw, nooffset)
+			self._lag = self._compute_eyelag()
 			self.params['lagcorrected'] = 1
-			self.eyevalid = None
-			self.photo_times = np.array(self.rec[6], np.int)
-			self.spike_times = np.array(self.rec[7], np.int)
-
-			#Tue Jun  2 12:19:23 2009 mazer
-			# Strip out false spikes generated by inaccurate TTL event
-			# detection algorithm; this is also now done by p2mLoad to avoid
-			# having to regenerate existing p2m files. Same thing for
-			# photo_times...
-			t = find_events(self.events, EYE_START)
-			if len(t) > 0:
-				if len(self.spike_times) and abs(self.spike_times[0] - t[0]) < 5:
-					self.spike_times = self.spike_times[1::]
-				if len(self.photo_times) and abs(self.photo_times[0] - t[0]) < 5:
-					self.photo_times = self.photo_times[1::]
-
-			if len(self.rec) > 13 and self.rec[13] is not None:
-				plist = self.rec[13]
-				times, channels, units, ids = [], [], [], []
-				for (t, c, u) in plist:
-					times.append(t)
-					channels.append(c)
-					units.append(u)
-					ids.append("%03d%c" % (c, chr(ord('a')+u-1)))
-				self.plex_times = np.array(times, np.int)
-				self.plex_channels = np.array(channels, np.int)
-				self.plex_units = np.array(units, np.int)
-				self.plex_ids = ids[::]
-			else:
-				self.plex_times = None
-
-
-			t = find_events(self.events, START)
-			if len(t) == 0:
-				sys.stderr.write('warning: no START event, guessing..\n')
-				# just use the first event as a reference point...
-				self.t0 = self.events[0][0]
-			else:
-				self.t0 = t[0]
-			self.eyet = self.eyet - self.t0
-			self.realt = self.realt - self.t0
-			self.photo_times = self.photo_times - self.t0
-			self.spike_times = self.spike_times - self.t0
-
-			# Sun Dec  4 10:08:01 2005 mazer -- NOTE:
-			# not necessary to align -- it's already been
-			# done by the PlexNet.py module (START code is
-			# same time as the TTL trigger/gate linegoing high and
-			# all timestamps are stored in the data file relative to
-			# that trigger event)
-			#
-			# self.plex_times = self.plex_times - self.t0
+			self.computed = 1
 
-			self.events = align_events(self.events, self.t0)
+		return self
 
-			if gaps:
-				gaps = np.nonzero(np.where(np.greater(dt, 1),
-													 1,0))
-				self.gaps_t = np.take(self.eyet, gaps)
-				self.gaps_y = self.gaps_t * 0
-				self.gapdurs = np.take(self.eyet, gaps+1) - self.gaps_t
+	def _compute_events(self):
+		# all pype files should have these (may be [] if not collected)
+
+		#Tue Aug 20 16:08:29 2013 mazer
+		# if an event 'name' is not a string, then assume it's a list
+		# or tuple and expand on the fly into multiple events with
+		# a shared timestamp -- this was originally done in by
+		# p2m/pype_expander.py when generating matlab files, but this
+		# is actually the correct place to do it..
+		times = []
+		events = []
+		for (t, e) in self.rec[2]:
+			if type(e) is types.StringType:
+				times.append(t)
+				events.append(e)
 			else:
-				self.gaps_t = None
-				self.gaps_y = None
-
-			if raw and ('@eye_rot' in self.params):
-				if self.params['@eye_rot'] != 0:
-					self.israw = None
+				for ee in e:
+					times.append(t)
+					events.append(ee)
+		events = zip(times, events)
+
+		t = find_events(events, START)
+		if len(t) == 0:
+			sys.stderr.write('warning: no START event, guessing..\n')
+			# just use the first event as a reference point...
+			self.t0 = events[0][0]
+		else:
+			self.t0 = t[0]
+		self.events = align_events(events, self.t0)
+
+	def _compute_ttl(self):
+		photo_times = np.array(self.rec[6], np.int) - self.t0
+		spike_times = np.array(self.rec[7], np.int) - self.t0
+
+		#Tue Jun  2 12:19:23 2009 mazer
+		# Strip out false spikes generated by inaccurate TTL event
+		# detection algorithm; this is also now done by p2mLoad to avoid
+		# having to regenerate existing p2m files. Same thing for
+		# photo_times...
+		t = find_events(self.events, EYE_START)
+		if len(t) > 0:
+			if len(spike_times) and abs(spike_times[0] - t[0]) < 5:
+				spike_times = spike_times[1::]
+			if len(photo_times) and abs(photo_times[0] - t[0]) < 5:
+				photo_times = photo_times[1::]
+		self.photo_times = photo_times
+		self.spike_times = spike_times
+
+	def _compute_plexon(self):
+		# Sun Dec  4 10:08:01 2005 mazer -- NOTE:
+		# not necessary to align -- it's already been
+		# done by the PlexNet.py module (START code is
+		# same time as the TTL trigger/gate linegoing high and
+		# all timestamps are stored in the data file relative to
+		# that trigger event)
+		if len(self.rec) > 13 and self.rec[13] is not None:
+			plist = np.array(self.rec[13], np.int).reshape((-1, 3))
+			self.plex_times = plist[:,0]
+			self.plex_channels = plist[:,1]
+			self.plex_units = plist[:,2]
+		else:
+			self.plex_times = None
+
+	def _compute_plex_ids(self):
+		if self.plex_times is not None:
+			self.plex_ids = ["%03d%c" % (c, chr(ord('a')+u-1))
+							 for (c, u) in zip(self.plex_channels,
+											   self.plex_units)]
+
+	def _compute_hs(self):
+		# high-rate channels: one entry per a/d channel, None if the
+		# channel wasn't stored (or the record predates rec[15])
+		self.hs_t = []
+		self.hs = []
+		if len(self.rec) > 15 and self.rec[15] is not None:
+			r = self.rec[15]
+			for n in range(0, len(r), 2):
+				if r[n] is None:
+					self.hs_t.append(None)
+					self.hs.append(None)
 				else:
-					if nooffset:
-						self.eyex = self.eyex / self.params['@eye_xgain']
-						self.eyey = self.eyey / self.params['@eye_ygain']
-						self.israw = 1
-					else:
-						self.eyex = ((self.eyex + self.params['@eye_xoff']) /
-									 self.params['@eye_xgain'])
-						self.eyey = ((self.eyey + self.params['@eye_yoff']) /
-									 self.params['@eye_ygain'])
-						self.israw = 1
-			else:
-				self.israw = None
-
-			if velocity:
-				dt = dt / 1000.
-				dx = diff(self.eyex) / dt
-				dy = diff(self.eyey) / dt
-				dxy = ((dx**2) + (dy**2))**0.5
-
-				self.eyedxdt = dx
-				self.eyedydt = dy
-				self.eyedxydt = dxy
-			else:
-				self.eyedxdt = None
-				self.eyedydt = None
-				self.eyedxydt = None
+					self.hs_t.append(np.array(r[n], np.float) - self.t0)
+					self.hs.append(np.array(r[n+1], np.int))
+
+	def _compute_flips(self):
+		# frame flip timing, empty if the record predates rec[16]
+		if len(self.rec) > 16 and self.rec[16] is not None:
+			(t, tcall, nmissed) = self.rec[16]
+			self.flip_t = np.array(t, np.float) - self.t0
+			self.flip_tcall = np.array(tcall, np.float) - self.t0
+			self.flip_missed = np.array(nmissed, np.int)
+		else:
+			self.flip_t = np.zeros(0, np.float)
+			self.flip_tcall = np.zeros(0, np.float)
+			self.flip_missed = np.zeros(0, np.int)
 
-			self.computed = 1
+	def _compute_eyelag(self):
+		# eye tracker lag (ms); updates params for ISCAN files, so
+		# this runs in compute(), not with the (lazy) eye traces
 
-		return self
+		# this is new 13-apr-2001:
+		if 'eyelag' in self.params:
+			lag = float(self.params['eyelag'])
+		else:
+			lag = 0
+
+		if self.params['eyetracker'] == 'ISCAN':
+			# Tue Jun  7 15:39:09 2011 mazer : NEW
+			#  estimate eye tracker rate directly from data:
+			#	one frame for sample&hold camera, one frame for
+			#	framegrabber and one more frame because it seems
+			#	correct (check with Rikki Razdan again??)
+			realt = np.array(self.rec[3], np.float) # ms
+			eyex = np.array(self.rec[4], np.float)
+			eyey = np.array(self.rec[5], np.float)
+
+			# find points where x or y has changed
+			dxy= (np.diff(eyex)!=0) & (np.diff(eyey)!=0)
+			# compute sampling interval (si)
+			si = np.median(diff(realt[np.where(dxy)]))
+			si = 1000.0 / (60.0 * np.round((1000.0 / si) / 60.0))
+			lag = 3.0 * round(si)
+			self.params['eyelag_user'] = lag
+			self.params['eyelag'] = lag
+		return lag
+
+	def _compute_eye(self):
+		(velocity, gaps, raw, nooffset) = self._options
+		lag = self._lag
+
+		eyet = np.array(self.rec[3], np.float) # ms
+		realt = np.array(self.rec[3], np.float) # ms
+		dt = diff(eyet)
+		if sum(np.where(np.less(dt, 0), 1, 0)) > 0:
+			raise PypedataTimeError
+		eyex = np.array(self.rec[4], np.float) # dva
+		eyey = np.array(self.rec[5], np.float) # dva
+
+		if lag > 0:
+			# correct for eye tracker delay, if any..
+			eyet = eyet - lag
+			if PypeRecord._reportcorrection:
+				# report this correction only ONCE!!
+				sys.stderr.write('NOTE: fixing %.1f ms eye lag\n' % lag)
+				PypeRecord._reportcorrection = None
+
+		if raw and ('@eye_rot' in self.params):
+			# undo gain/offset/rotation (but not the affine, raw has
+			# always meant post-affine)
+			cal = eyecal.from_params(self.params)
+			(eyex, eyey) = cal.invert(eyex, eyey, affine=False,
+									   offset=not nooffset)
+			self.israw = 1
+		else:
+			self.israw = None
+
+		self._eyedt = dt
+		self.eyet = eyet - self.t0
+		self.realt = realt - self.t0
+		self.eyex = eyex
+		self.eyey = eyey
+		self.eyevalid = None
+
+	def _compute_gaps(self):
+		if self._options[1]:
+			dt = self._eyedt
+			gaps = np.nonzero(np.where(np.greater(dt, 1),
+												 1,0))
+			self.gaps_t = np.take(self.eyet, gaps)
+			self.gaps_y = self.gaps_t * 0
+			self.gapdurs = np.take(self.eyet, gaps+1) - self.gaps_t
+		else:
+			self.gaps_t = None
+			self.gaps_y = None
+
+	def _compute_velocity(self):
+		if self._options[0]:
+			dt = self._eyedt / 1000.
+			dx = diff(self.eyex) / dt
+			dy = diff(self.eyey) / dt
+			dxy = ((dx**2) + (dy**2))**0.5
+
+			self.eyedxdt = dx
+			self.eyedydt = dy
+			self.eyedxydt = dxy
+		else:
+			self.eyedxdt = None
+			self.eyedydt = None
+			self.eyedxydt = None
 
 	def spikes(self, pattern=None):
 		# select spikes from specified channel; channel is specified
@@ -481,39 +739,560 @@ class PypeRecord(object):
 
 		return pattern, ts
 
+# size of raw reads for the in-process file readers below
+_BUFSIZE = 8 << 20
+
+# bump this if the layout of the index sidecar files changes
+_INDEX_VERSION = 1
+
+class GzipReader(object):
+	"""In-process reader for (possibly multi-member) gzip files.
+
+	Minimal file-like object (read/tell/seek/close) that keeps track
+	of the uncompressed offset. The start of each gzip member is a
+	'seek point' where decompression can be restarted from scratch,
+	so seeking means restarting at the nearest seek point at or
+	before the target and decompressing forward from there. Files
+	written by gzip(1) have a single member (seek point 0), so for
+	those random access still costs a decompress (but no unpickling)
+	of everything before the target.
+
+	"""
+	def __init__(self, fname, seekpoints=None, bufsize=_BUFSIZE):
+		self.fname = fname
+		self.bufsize = bufsize
+		self.fp = open(fname, 'rb')
+		# list of (compressed, uncompressed) offset pairs
+		self.seekpoints = [(0, 0)]
+		if seekpoints:
+			for sp in seekpoints:
+				self._addseek(tuple(sp))
+		self._restart((0, 0))
+
+	def _addseek(self, sp):
+		if not sp in self.seekpoints:
+			self.seekpoints.append(sp)
+			self.seekpoints.sort()
+
+	def _restart(self, sp):
+		(coff, uoff) = sp
+		self.fp.seek(coff)
+		self._coff = coff				# compressed offset of next raw read
+		self._z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		self._buf = ''
+		self._bp = 0					# read pointer into _buf
+		self._pos = uoff				# uncompressed offset of _buf[0]
+		self._eof = 0
+
+	def _inflate(self):
+		"""Decompress next raw block; returns list of output strings."""
+		data = self.fp.read(self.bufsize)
+		if not data:
+			self._eof = 1
+			return [self._z.flush()]
+		uend = self._pos + len(self._buf)
+		out = []
+		self._coff = self._coff + len(data)
+		while data:
+			s = self._z.decompress(data)
+			out.append(s)
+			uend = uend + len(s)
+			data = self._z.unused_data
+			if data:
+				if not data.strip('\0'):
+					# zero padding after last member
+					break
+				# end of a member and start of a new one
+				self._addseek((self._coff - len(data), uend))
+				self._z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		return out
+
+	def _fill(self):
+		out = self._inflate()
+		self._buf = self._buf[self._bp:] + ''.join(out)
+		self._pos = self._pos + self._bp
+		self._bp = 0
+
+	def _skipto(self, pos):
+		# discard decompressed data until pos is in (or at end of) _buf
+		while (self._pos + len(self._buf)) < pos and not self._eof:
+			self._pos = self._pos + len(self._buf)
+			self._buf = ''
+			self._bp = 0
+			self._fill()
+		self._bp = min(pos - self._pos, len(self._buf))
+
+	def tell(self):
+		return self._pos + self._bp
+
+	def seek(self, pos, whence=0):
+		if whence == 1:
+			pos = self.tell() + pos
+		elif whence != 0:
+			raise IOError('GzipReader: only absolute/relative seeks')
+		if pos < self._pos:
+			self._restart(max([sp for sp in self.seekpoints if sp[1] <= pos]))
+		self._skipto(pos)
+
+	def read(self, n=-1):
+		while (n < 0 or (len(self._buf) - self._bp) < n) and not self._eof:
+			self._fill()
+		if n < 0:
+			n = len(self._buf) - self._bp
+		s = self._buf[self._bp:(self._bp+n)]
+		self._bp = self._bp + len(s)
+		return s
+
+	def close(self):
+		if self.fp is not None:
+			self.fp.close()
+			self.fp = None
+
+def _find_member(fp, pos, window=1 << 20):
+	"""Find probable start of a gzip member at or after pos.
+
+	Looks for a gzip header (1f 8b 08) that's followed by something
+	zlib's willing to inflate. Returns None if there's nothing in the
+	window.
+
+	"""
+	fp.seek(pos)
+	data = fp.read(window)
+	k = 0
+	while 1:
+		k = data.find('\x1f\x8b\x08', k)
+		if k < 0:
+			return None
+		try:
+			z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+			z.decompress(data[k:k+(64 << 10)])
+			return pos + k
+		except zlib.error:
+			k = k + 1
+
+def _inflate_span(fname, start, stop, strict, bufsize=_BUFSIZE):
+	"""Inflate gzip members from compressed offset start up to the
+	first member boundary at or after stop.
+
+	Returns (data, end, members), where end is the compressed offset
+	where inflating stopped and members is a list of (compressed,
+	uncompressed) offsets of the members found (uncompressed offsets
+	relative to start). If start isn't really the start of a member
+	(and strict isn't set), returns None instead of raising zlib.error.
+
+	"""
+	fp = open(fname, 'rb')
+	try:
+		fp.seek(start)
+		z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		out = []
+		n = 0
+		coff = start
+		members = [(start, 0)]
+		while 1:
+			data = fp.read(bufsize)
+			if not data:
+				out.append(z.flush())
+				return (''.join(out), coff, members)
+			coff = coff + len(data)
+			while data:
+				try:
+					s = z.decompress(data)
+				except zlib.error:
+					if strict:
+						raise
+					return None
+				out.append(s)
+				n = n + len(s)
+				data = z.unused_data
+				if data:
+					if not data.strip('\0'):
+						# zero padding after last member
+						break
+					mstart = coff - len(data)
+					if mstart >= stop:
+						return (''.join(out), mstart, members)
+					members.append((mstart, n))
+					z = zlib.decompressobj(16 + zlib.MAX_WBITS)
+	finally:
+		fp.close()
+
+def _member_starts(fname, chunk=4*_BUFSIZE):
+	"""Find probable gzip member starts, roughly chunk bytes apart.
+
+	Always includes 0; a list of just [0] means no member boundaries
+	were found (single member file).
+
+	"""
+	size = os.path.getsize(fname)
+	starts = [0]
+	fp = open(fname, 'rb')
+	try:
+		pos = chunk
+		while pos < size:
+			s = _find_member(fp, pos)
+			if s is None:
+				pos = pos + chunk
+			else:
+				starts.append(s)
+				pos = s + chunk
+	finally:
+		fp.close()
+	return starts
+
+class ParallelGzipReader(object):
+	"""Sequential reader for multi-member gzip files that inflates
+	several members at once on worker threads (zlib lets go of the
+	GIL while it's inflating).
+
+	The file is cut into spans of ~chunk compressed bytes at probable
+	member starts. Each span is inflated independently; if a span's
+	start turns out to be bogus (the previous span ran past it), it's
+	redone from where the previous span really ended, so output is
+	always the same as a plain sequential inflate. A span can't end
+	inside a member, so a file with only one member (e.g., written by
+	gzip(1)) would come back as a single span holding the whole
+	inflated file -- use _gzip_reader() to get a streaming GzipReader
+	for those instead.
+
+	Supports read/tell/close only (no seeking).
+
+	"""
+	def __init__(self, fname, nthreads=4, chunk=4*_BUFSIZE, starts=None):
+		from multiprocessing.pool import ThreadPool
+
+		self.fname = fname
+		self.nthreads = nthreads
+		self.seekpoints = [(0, 0)]
+		self._size = os.path.getsize(fname)
+
+		if starts is None:
+			starts = _member_starts(fname, chunk)
+		self._starts = starts
+		self._nextstart = 0				# next span to submit
+		self._pending = {}				# span start -> AsyncResult
+		self._pool = ThreadPool(nthreads)
+
+		self._cpos = 0					# compressed offset of next span
+		self._buf = ''
+		self._bp = 0					# read pointer into _buf
+		self._pos = 0					# uncompressed offset of _buf[0]
+		self._eof = 0
+
+	def _stop(self, start):
+		for s in self._starts:
+			if s > start:
+				return s
+		return self._size
+
+	def _submit(self):
+		while (len(self._pending) < (2 * self.nthreads) and
+			   self._nextstart < len(self._starts)):
+			s = self._starts[self._nextstart]
+			self._pending[s] = self._pool.apply_async(
+				_inflate_span, (self.fname, s, self._stop(s), s == 0))
+			self._nextstart = self._nextstart + 1
+
+	def _fill(self):
+		if self._cpos >= self._size:
+			self._eof = 1
+			return
+		self._submit()
+
+		r = self._pending.pop(self._cpos, None)
+		if r is None:
+			res = None
+		else:
+			res = r.get()
+		if res is None:
+			# previous span ran past a bogus start -- do this one
+			# here (strict, so real errors get raised)
+			res = _inflate_span(self.fname, self._cpos,
+								self._stop(self._cpos), 1)
+		(data, end, members) = res
+
+		base = self._pos + len(self._buf)
+		for (c, u) in members:
+			if not (c, base + u) in self.seekpoints:
+				self.seekpoints.append((c, base + u))
+		self._buf = self._buf[self._bp:] + data
+		self._pos = self._pos + self._bp
+		self._bp = 0
+		self._cpos = end
+
+		# forget spans that started inside the one just used
+		for s in self._pending.keys():
+			if s < end:
+				del self._pending[s]
+		while (self._nextstart < len(self._starts) and
+			   self._starts[self._nextstart] < end):
+			self._nextstart = self._nextstart + 1
+
+	def tell(self):
+		return self._pos + self._bp
+
+	def read(self, n=-1):
+		while (n < 0 or (len(self._buf) - self._bp) < n) and not self._eof:
+			self._fill()
+		if n < 0:
+			n = len(self._buf) - self._bp
+		s = self._buf[self._bp:(self._bp+n)]
+		self._bp = self._bp + len(s)
+		return s
+
+	def close(self):
+		if self._pool is not None:
+			self._pool.terminate()
+			self._pool = None
+			self._pending = {}
+
+def _gzip_reader(fname, nthreads=1):
+	"""Sequential reader for gzip file fname.
+
+	Uses a ParallelGzipReader if nthreads > 1 and the file has member
+	boundaries to split on, otherwise a streaming GzipReader (so a
+	single member file never gets inflated into memory in one go).
+
+	"""
+	if nthreads > 1:
+		starts = _member_starts(fname)
+		if len(starts) > 1:
+			return ParallelGzipReader(fname, nthreads, starts=starts)
+	return GzipReader(fname)
+
+def _open_datafile(fname, nthreads=1):
+	"""Open plain or gzip'd datafile for raw (unpickled) reads."""
+	if fname[-3:] == '.gz':
+		return _gzip_reader(fname, nthreads)
+	return open(fname, 'rb')
+
+class ChainReader(object):
+	"""Read a list of datafiles (plain or .gz) back to back, like
+	cat(1) or gunzip -c, but without the subprocess.
+	"""
+	def __init__(self, fnames, nthreads=1):
+		self.fnames = fnames[::]
+		self.nthreads = nthreads
+		self._k = 0
+		self._pos = 0
+		self.fp = _open_datafile(self.fnames[0], nthreads)
+
+	def tell(self):
+		return self._pos
+
+	def read(self, n=-1):
+		out = []
+		while self.fp is not None and n != 0:
+			s = self.fp.read(n)
+			if not s:
+				self.fp.close()
+				self._k = self._k + 1
+				if self._k < len(self.fnames):
+					self.fp = _open_datafile(self.fnames[self._k], self.nthreads)
+				else:
+					self.fp = None
+				continue
+			out.append(s)
+			self._pos = self._pos + len(s)
+			if n > 0:
+				n = n - len(s)
+		return ''.join(out)
+
+	def close(self):
+		if self.fp is not None:
+			self.fp.close()
+			self.fp = None
+
+def _scan_records(fp, bufsize=_BUFSIZE):
+	"""Generator for (offset, label, record) triples in a pype datafile.
+
+	Reads fp (GzipReader or any other file-like object) in big blocks
+	and unpickles out of a cStringIO buffer, so cPickle stays on its
+	fast path even for non-file readers and every record's byte offset
+	is known (for the index sidecars). A record that straddles the end
+	of the buffer just gets retried once more data's been read.
+
+	"""
+	buf = ''
+	base = 0							# file offset of buf[0]
+	pos = 0								# parse position in buf
+	eof = 0
+	while 1:
+		sio = cStringIO.StringIO(buf)
+		sio.seek(pos)
+		try:
+			label, rec = labeled_load(sio)
+		except ImportError:
+			raise
+		except Exception:
+			# probably a truncated record, unless there's no more data
+			if eof:
+				raise
+			label, rec = None, None
+		if label is None:
+			if eof:
+				return
+			more = fp.read(max(bufsize, len(buf) - pos))
+			if not more:
+				eof = 1
+			buf = buf[pos:] + more
+			base = base + pos
+			pos = 0
+			continue
+		yield (base + pos, label, rec)
+		pos = sio.tell()
+
+def _scan_mapped(fp):
+	"""Generator for (offset, label, record) triples in a plain
+	(uncompressed) pype datafile.
+
+	The file is mmap'd and unpickled in place; vectors in binary
+	records (see labeled_dump_binary) are copied straight out of the
+	map.
+	If the file grows while it's being read (ie, pype's still
+	writing it), the new data gets mapped too.
+
+	"""
+	pos = 0
+	while 1:
+		size = os.fstat(fp.fileno()).st_size
+		if size <= pos:
+			return
+		mm = mmap.mmap(fp.fileno(), size, access=mmap.ACCESS_READ)
+		sio = cStringIO.StringIO(mm)
+		sio.seek(pos)
+		while 1:
+			try:
+				label, rec = labeled_load(sio, mm)
+			except ImportError:
+				raise
+			except Exception:
+				# truncated record is ok if more data's been written
+				if os.fstat(fp.fileno()).st_size == size:
+					raise
+				label, rec = None, None
+			if label is None:
+				break
+			yield (pos, label, rec)
+			pos = sio.tell()
+		if os.fstat(fp.fileno()).st_size == size:
+			return
+
+def _parse_trialtime(trialtime):
+	"""Parse 'trialtime' note -> (parsed_trialtime, tracker_guess)."""
+	if trialtime is None:
+		return 'nd', ('unknown', -1, -1)
+	# year, month, day, hour, min, sec, 1-7, 1-365, daylight sav?
+	trialtime2 = time.strptime(trialtime, '%d-%b-%Y %H:%M:%S')
+	# try to detect if this is an iscan file? Anything after
+	# 01-jun-2000.	After 13-apr-2001, there should be an
+	# eye tracker parameter stored in the datafile..
+	year = trialtime2[0]
+	month = trialtime2[1]
+	if (year > 2000) or (year == 2000 and month >= 6):
+		return trialtime2, ('iscan', 120, 24)
+	else:
+		return trialtime2, ('coil', 1000, 0)
+
+def benchmark_readers(fname, nthreads=4):
+	"""Compare datafile readers on fname (plain or .gz).
+
+	Times a full pass through the file with the old popen reader
+	(gunzip or cat pipe + labeled_load) and the in-process readers
+	(GzipReader and ParallelGzipReader for .gz files, the mmap
+	scanner for plain files) and checks they all find the same
+	records.
+
+	"""
+	import time
+
+	def piped():
+		if fname[-3:] == '.gz':
+			fp = posix.popen('gunzip --quiet <%s 2>/dev/null' % fname, 'r')
+		else:
+			fp = posix.popen('cat %s' % fname, 'r')
+		while 1:
+			try:
+				label, rec = labeled_load(fp)
+			except EOFError:
+				label = None
+			if label is None:
+				break
+			yield (None, label, rec)
+		fp.close()
+
+	def run(name, gen):
+		t0 = time.time()
+		labels = [label for (offset, label, rec) in gen]
+		return labels, time.time() - t0
+
+	ref, tref = run('popen', piped())
+	print '%-22s %6d recs %7.2fs' % ('popen', len(ref), tref)
+
+	if fname[-3:] == '.gz':
+		readers = (('GzipReader', GzipReader(fname)),
+				   ('ParallelGzipReader(%d)' % nthreads,
+					ParallelGzipReader(fname, nthreads)))
+	else:
+		readers = (('mmap', open(fname, 'rb')),)
+	for (name, fp) in readers:
+		if name == 'mmap':
+			labels, t = run(name, _scan_mapped(fp))
+		else:
+			labels, t = run(name, _scan_records(fp))
+		fp.close()
+		if labels != ref:
+			print '%-22s MISMATCH (%d vs %d recs)' % (name, len(labels), len(ref))
+		else:
+			print '%-22s %6d recs %7.2fs (%.1fx)' % (name, len(labels), t, tref / t)
+
 class PypeFile(object):
-	def __init__(self, fname, filter=None, status=None, quiet=None):
+	"""Pype datafile reader.
+
+	Records are read sequentially, but the first complete pass through
+	a (non-composite) file leaves an index sidecar (datafile + '.idx')
+	with the byte offset, result code and record id of each trial
+	(plus gzip seek points for .gz files). When a valid index is
+	available (datafile size and mtime unchanged), nth(), last(),
+	count() and records() seek straight to the requested trial
+	instead of unpickling everything in front of it.
+
+	Everything's read in-process: .gz files are inflated with zlib
+	(with nthreads > 1, multi-member .gz files are inflated in
+	parallel on the first pass) and composite files ('a+b+c', any mix
+	of plain and .gz) are just read back to back.
+
+	"""
+	def __init__(self, fname, filter=None, status=None, quiet=None,
+				 index=True, nthreads=1):
+		self.datafile = None
+		self.nthreads = nthreads
 		flist = fname.split('+')
 		if len(flist) > 1:
-			if flist[0][-3:] == '.gz':
-				cmd = 'gunzip --quiet -c %s ' % string.join(flist,' ')
-			else:
-				cmd = 'cat %s ' % string.join(flist,' ')
-			self.fp = posix.popen(cmd, 'r')
+			self.fp = ChainReader(flist, nthreads)
 			if not quiet:
 				sys.stderr.write('compositing: %s\n' % fname)
 			self.fname = fname
+			self.zfname = None
 		elif fname[-3:] == '.gz':
-			# it appears MUCH faster to open a pipe to gunzip
-			# than to use the zlib/gzip module..
-			self.fp = posix.popen('gunzip --quiet <%s 2>/dev/null' % fname, 'r')
 			if not quiet:
 				sys.stderr.write('decompressing: %s\n' % fname)
 			self.fname = fname[:-3]
 			self.zfname = fname[::]
+			self.datafile = self.zfname
 		elif not posixpath.exists(fname) and posixpath.exists(fname+'.gz'):
 			# if .gz file exists and the named file does not,
 			# try using the .gz file instead...
 			self.fname = fname
 			self.zfname = fname+'.gz'
-			self.fp = posix.popen('gunzip --quiet <%s 2>/dev/null' %
-								  self.zfname, 'r')
+			self.datafile = self.zfname
 			if not quiet:
 				sys.stderr.write('decompressing: %s\n' % self.zfname)
 		else:
 			self.fname = fname
 			self.zfname = None
-			self.fp = open(self.fname, 'r')
+			self.datafile = self.fname
+
 		self.cache = []
 		self.status = status
 		self.filter = filter
@@ -521,10 +1300,240 @@ class PypeFile(object):
 		self.taskname = None
 		self.extradata = []
 		self.counter = 0
+		self._scanned = None			# see _need_index()
+
+		# index state: the loaded index (if any), the partial index
+		# built up by the sequential reader, a separate reader for
+		# seeks and a few caches for indexed access
+		self.index = None
+		self._ixbuild = None
+		self._ixfp = None
+		self._ixmm = None
+		self._ixsel = None
+		self._ixuserparams = (None, None)
+		if self.datafile:
+			self._stat = os.stat(self.datafile)
+			if index:
+				self.index = self._load_index()
+				if self.index is None:
+					self._ixbuild = {'records': [], 'notes': [],
+									 'offsets': [], 'userparams': None}
+			if self.index is None:
+				self.fp = self._rawopen(seekable=0)
+				if self.zfname:
+					self._records = _scan_records(self.fp)
+				else:
+					self._records = _scan_mapped(self.fp)
+			else:
+				self.fp = None
+				self._records = None
+		else:
+			self._records = _scan_records(self.fp)
 
 	def __repr__(self):
 		return '<PypeFile:%s (%d recs)>' % (self.fname, len(self.cache))
 
+	def _rawopen(self, seekable=1):
+		if self.zfname:
+			if self.index is not None:
+				return GzipReader(self.zfname, self.index['seekpoints'])
+			elif not seekable:
+				return _gzip_reader(self.zfname, self.nthreads)
+			return GzipReader(self.zfname)
+		else:
+			return open(self.fname, 'rb')
+
+	def _load_index(self):
+		"""Load index sidecar, if it exists and is still valid."""
+		try:
+			f = open(self.datafile + '.idx', 'rb')
+			try:
+				ix = cPickle.load(f)
+			finally:
+				f.close()
+		except Exception:
+			# missing, unreadable or corrupt -- just rebuild
+			return None
+		if (type(ix) is not types.DictType or
+			ix.get('version') != _INDEX_VERSION or
+			ix.get('size') != self._stat.st_size or
+			ix.get('mtime') != self._stat.st_mtime):
+			return None
+		return ix
+
+	def _index_add(self, offset, kind, rec=None, trialtime=None):
+		"""Add record to the index being built by the sequential reader."""
+		ix = self._ixbuild
+		if ix is None or offset is None:
+			return
+		ix['offsets'].append(offset)
+		if kind == ENCODE:
+			if len(rec) > 8:
+				record_id = rec[8]
+			else:
+				record_id = None
+			# length gets filled in when index is finalized
+			ix['records'].append((offset, None, 'encode', rec[1][0],
+								  record_id, self.taskname, trialtime,
+								  ix['userparams'], len(ix['notes'])))
+		elif kind == 'userparams':
+			ix['userparams'] = offset
+		elif kind == 'note':
+			ix['notes'].append((offset, None))
+
+	def _index_finish(self):
+		"""Sequential reader hit EOF -- finalize and save index."""
+		ix = self._ixbuild
+		self._ixbuild = None
+		if ix is None or self.fp is None:
+			return
+		try:
+			st = os.stat(self.datafile)
+		except OSError:
+			return
+		if (st.st_size != self._stat.st_size or
+			st.st_mtime != self._stat.st_mtime):
+			# file changed under us (still being written?)
+			return
+
+		# each record runs up to the start of the next one
+		if self.zfname:
+			end = self.fp.tell()
+		else:
+			end = st.st_size
+		offsets = ix['offsets'] + [end]
+		lengths = {}
+		for n in range(len(offsets) - 1):
+			lengths[offsets[n]] = offsets[n+1] - offsets[n]
+
+		records = []
+		for r in ix['records']:
+			if r[7] is None:
+				userparams = None
+			else:
+				userparams = (r[7], lengths[r[7]])
+			records.append((r[0], lengths[r[0]]) + r[2:7] +
+						   (userparams, r[8]))
+		notes = []
+		for r in ix['notes']:
+			notes.append((r[0], lengths[r[0]]))
+
+		if self.zfname:
+			seekpoints = self.fp.seekpoints[::]
+		else:
+			seekpoints = None
+
+		self.index = {
+			'version': _INDEX_VERSION,
+			'size': st.st_size,
+			'mtime': st.st_mtime,
+			'seekpoints': seekpoints,
+			'records': records,
+			'notes': notes,
+			}
+		try:
+			tmp = '%s.idx.%d' % (self.datafile, os.getpid())
+			f = open(tmp, 'wb')
+			try:
+				cPickle.dump(self.index, f, 2)
+			finally:
+				f.close()
+			os.rename(tmp, self.datafile + '.idx')
+		except (IOError, OSError):
+			# read-only directory etc -- index is still good for
+			# this session, just not cached
+			pass
+
+	def _need_index(self):
+		"""Make sure index is available, finishing sequential pass if
+		needed. Returns false if file can't be indexed (composites).
+		"""
+		if self.index is None and self._ixbuild is not None:
+			(n, last) = (0, None)
+			while 1:
+				d = self._next(cache=0)
+				if d is None:
+					break
+				if (not self.filter) or (d.result == self.filter):
+					(n, last) = (n + 1, d)
+			if self.index is None:
+				# file changed during the pass (still being written?),
+				# so no index -- hang on to what the pass found for
+				# count()/last() and start over for nth()
+				self._scanned = (n, last)
+				self._rescan()
+		return self.index is not None
+
+	def _rescan(self):
+		"""Back to the start of the file for sequential reads."""
+		self.close()
+		self.cache = []
+		self.counter = 0
+		self.extradata = []
+		self.userparams = None
+		self.taskname = None
+		self.fp = self._rawopen(seekable=0)
+		if self.zfname:
+			self._records = _scan_records(self.fp)
+		else:
+			self._records = _scan_mapped(self.fp)
+
+	def _read_at(self, offset, length):
+		if self._ixfp is None:
+			self._ixfp = self._rawopen()
+			if not self.zfname:
+				self._ixmm = mmap.mmap(self._ixfp.fileno(), self.index['size'],
+									   access=mmap.ACCESS_READ)
+		try:
+			if self.zfname:
+				self._ixfp.seek(offset)
+				return labeled_load(cStringIO.StringIO(self._ixfp.read(length)))
+			else:
+				sio = cStringIO.StringIO(self._ixmm)
+				sio.seek(offset)
+				return labeled_load(sio, self._ixmm)
+		except ImportError:
+			self._fatal_unpickle_error()
+
+	def _selected(self):
+		"""Absolute record numbers for trials matching filter."""
+		if self._ixsel is None:
+			self._ixsel = []
+			for k in range(len(self.index['records'])):
+				if (not self.filter) or \
+					   self.index['records'][k][3] == self.filter:
+					self._ixsel.append(k)
+		return self._ixsel
+
+	def _load_extradata(self, n):
+		while len(self.extradata) < n:
+			label, rec = self._read_at(*self.index['notes'][len(self.extradata)])
+			self.extradata.append(Note(rec))
+
+	def _load(self, k):
+		"""Load k'th trial (absolute record number) using index."""
+		(offset, length, label, result, record_id,
+		 taskname, trialtime, userparams, nnotes) = self.index['records'][k]
+
+		self._load_extradata(nnotes)
+		if userparams is None:
+			self.userparams = None
+		elif self._ixuserparams[0] == userparams:
+			self.userparams = self._ixuserparams[1]
+		else:
+			self.userparams = self._read_at(*userparams)[1][2]
+			self._ixuserparams = (userparams, self.userparams)
+		self.taskname = taskname
+
+		label, rec = self._read_at(offset, length)
+		trialtime2, tracker_guess = _parse_trialtime(trialtime)
+		return PypeRecord(self, k,
+						  rec, trialtime=trialtime,
+						  parsed_trialtime=trialtime2,
+						  tracker_guess=tracker_guess,
+						  userparams=self.userparams,
+						  taskname=self.taskname)
+
 	def _fatal_unpickle_error(self):
 		exc_type, exc_value, exc_traceback = sys.exc_info()
 		sys.stderr.write('Missing module <%s> during unpickling.\n' % exc_value)
@@ -553,6 +1562,12 @@ class PypeFile(object):
 				# and thread interaction?
 				pass
 			self.fp = None
+		if not self._ixfp is None:
+			self._ixfp.close()
+			self._ixfp = None
+			# just drop the map -- any arrays still pointing into it
+			# hold their own reference
+			self._ixmm = None
 
 	def _next(self, cache=1, runinfo=None):
 		if self.fp is None:
@@ -561,31 +1576,27 @@ class PypeFile(object):
 		trialtime = None
 		while 1:
 			try:
-				label, rec = labeled_load(self.fp)
+				offset, label, rec = next(self._records, (None, None, None))
 			except EOFError:
-				label, rec = None, None
+				# truncated last record
+				offset, label, rec = None, None, None
 			except ImportError:
 				# this is usually caused by pickling a data structure that
 				# depends on Numeric
 				self._fatal_unpickle_error()
 
 			if label == None:
+				self._index_finish()
 				self.close()
 				return None
 			if label == WARN:
 				sys.stderr.write('WARNING: %s\n' % rec)
 			if label == ANNOTATION:
 				# for the moment, do nothing about this..
-				pass
+				self._index_add(offset, label)
 			elif rec[0] == ENCODE:
-				try:
-					xxx=trialtime2
-				except UnboundLocalError:
-					trialtime2 = 'nd'
-				try:
-					xxx=tracker_guess
-				except UnboundLocalError:
-					tracker_guess = ('unknown', -1, -1)
+				(trialtime2, tracker_guess) = _parse_trialtime(trialtime)
+				self._index_add(offset, ENCODE, rec, trialtime)
 				p = PypeRecord(self, self.counter,
 							   rec, trialtime=trialtime,
 							   parsed_trialtime=trialtime2,
@@ -599,39 +1610,45 @@ class PypeFile(object):
 						self.cache.append(p)
 				return p
 			elif (rec[0] == 'NOTE' and rec[1] == 'task_is'):
+				self._index_add(offset, rec[1])
 				self.taskname = rec[2]
 			elif (rec[0] == 'NOTE' and rec[1] == 'pype' and
 				  rec[2] == 'run starts'):
+				self._index_add(offset, rec[1])
 				if runinfo:
 					return 1
 			elif (rec[0] == 'NOTE' and rec[1] == 'pype' and
 				  rec[2] == 'run ends'):
-				pass
+				self._index_add(offset, rec[1])
 			elif rec[0] == 'NOTE' and rec[1] == 'trialtime':
+				self._index_add(offset, rec[1])
 				(n, trialtime) = rec[2]
 				# for some reason unclear to me, trialtime is an 'instance'
 				# and not a string.. the % hack makes it into a string..
 				trialtime = "%s" % trialtime
-				# year, month, day, hour, min, sec, 1-7, 1-365, daylight sav?
-				trialtime2 = time.strptime(trialtime, '%d-%b-%Y %H:%M:%S')
-				# try to detect if this is an iscan file? Anything after
-				# 01-jun-2000.	After 13-apr-2001, there should be an
-				# eye tracker parameter stored in the datafile..
-				# only do this on first record.
-				year = trialtime2[0]
-				month = trialtime2[1]
-				if (year > 2000) or (year == 2000 and month >= 6):
-					tracker_guess = ('iscan', 120, 24)
-				else:
-					tracker_guess = ('coil', 1000, 0)
 			elif rec[0] == 'NOTE' and rec[1] == 'userparams':
+				self._index_add(offset, 'userparams')
 				self.userparams = rec[2]
 			else:
 				#sys.stderr.write('stashed: <type=%s>\n' % label)
+				self._index_add(offset, 'note')
 				self.extradata.append(Note(rec))
 
 	def nth(self, n, free=1):
 		"""Load or return (if cached) nth record."""
+		if self.index is not None:
+			if n < len(self.cache) and self.cache[n] is not None:
+				rec = self.cache[n]
+				if free:
+					self.cache[n] = None
+				return rec
+			sel = self._selected()
+			if n >= len(sel):
+				# same state as hitting EOF on sequential read
+				self._load_extradata(len(self.index['notes']))
+				return None
+			return self._load(sel[n])
+
 		while len(self.cache) <= n:
 			if self._next() is None:
 				return None
@@ -646,11 +1663,168 @@ class PypeFile(object):
 
 	def last(self):
 		"""Get last record."""
+		if self._need_index():
+			n = len(self._selected()) - 1
+			return (self.nth(n), n)
+		if self._scanned is not None:
+			(n, last) = self._scanned
+			return (last, n - 1)
 		while 1:
 			d = self._next()
 			if d is None: break
 		return (self.cache[-1], len(self.cache)-1)
 
+	def count(self):
+		"""Count trials in file (only those matching filter, if set).
+
+		Uses the index (if there's no index yet, one pass through the
+		file builds it without caching records; if the file changes
+		during that pass, this is the count from the pass); composite
+		files have to be read and cached in full.
+		"""
+		if self._need_index():
+			return len(self._selected())
+		if self._scanned is not None:
+			return self._scanned[0]
+		while 1:
+			d = self._next()
+			if d is None: break
+		return len(self.cache)
+
+	def records(self, result=None):
+		"""Generator for trials, optionally only those with the
+		specified result code (ie, 'C' or 'E').
+
+		With an index, non-matching trials are skipped without being
+		unpickled.
+		"""
+		if self.index is not None:
+			for k in self._selected():
+				if result is None or self.index['records'][k][3] == result:
+					yield self._load(k)
+		else:
+			n = 0
+			while 1:
+				d = self.nth(n)
+				if d is None:
+					break
+				if result is None or d.result == result:
+					yield d
+				n = n + 1
+
+def trial_summary(d):
+	"""Compact per-trial summary -- default worker function for batch().
+
+	:param d: (PypeRecord) computed record
+
+	:return: (dict) result code, rt, record id, aligned events and
+		spike and photodiode times (ms re START).
+
+	"""
+	if len(d.rec) > 8:
+		record_id = d.rec[8]
+	else:
+		record_id = None
+	return {
+		'result': d.result,
+		'rt': d.rt,
+		'record_id': record_id,
+		'events': d.events,
+		'spike_times': d.spike_times,
+		'photo_times': d.photo_times,
+		}
+
+def _batch_count(args):
+	(fname, filter) = args
+	pf = PypeFile(fname, filter=filter, quiet=1)
+	# count from the index sidecar only -- counting a file without
+	# one means decoding every record, and the chunk has to do that
+	# again anyway. None means not indexed: the whole file is one
+	# chunk (which leaves an index behind for next time).
+	if pf.index is not None:
+		n = pf.count()
+	else:
+		n = None
+	pf.close()
+	return n
+
+def _batch_chunk(args):
+	(fname, start, stop, filter, fn) = args
+	pf = PypeFile(fname, filter=filter, quiet=1)
+	out = []
+	n = start
+	while stop is None or n < stop:
+		d = pf.nth(n)
+		if d is None:
+			break
+		out.append((n, fn(d.compute())))
+		n = n + 1
+	pf.close()
+	return out
+
+def batch(files, fn=trial_summary, filter=None, nprocs=None,
+		  chunksize=50, maxpending=None):
+	"""Decode records from a list of datafiles on a process pool.
+
+	Files with a valid index sidecar (see PypeFile) are split into
+	chunks of trials that are loaded, computed and reduced with fn()
+	by the worker processes; files without one go to a single worker
+	as one chunk, which indexes them on the way through. Results come back in
+	file and record order and at most maxpending chunks are in flight
+	(or waiting to be consumed) at any time, so memory use stays
+	bounded no matter how many files there are.
+
+	:param files: (list or string) datafile names or a glob pattern
+
+	:param fn: (function) fn(d) -> value for each computed PypeRecord;
+		must be a module-level function (it gets pickled)
+
+	:param filter: (string) only trials with this result code
+
+	:param nprocs: (int) number of worker processes (default: #cpus)
+
+	:param chunksize: (int) trials per work unit
+
+	:param maxpending: (int) max chunks in flight (default: 2*nprocs)
+
+	:return: generator for (fname, recnum, value) triples
+
+	"""
+	import glob
+	import multiprocessing
+
+	if type(files) is types.StringType:
+		files = sorted(glob.glob(files))
+	if nprocs is None:
+		nprocs = multiprocessing.cpu_count()
+	if maxpending is None:
+		maxpending = 2 * nprocs
+
+	pool = multiprocessing.Pool(nprocs)
+	try:
+		counts = pool.map(_batch_count, [(f, filter) for f in files])
+		jobs = []
+		for (f, n) in zip(files, counts):
+			if n is None:
+				jobs.append((f, 0, None, filter, fn))
+			else:
+				for start in range(0, n, chunksize):
+					jobs.append((f, start, min(start + chunksize, n),
+								 filter, fn))
+
+		pending = []
+		while jobs or pending:
+			while jobs and len(pending) < maxpending:
+				job = jobs.pop(0)
+				pending.append((job[0],
+								pool.apply_async(_batch_chunk, (job,))))
+			(f, r) = pending.pop(0)
+			for (n, value) in r.get():
+				yield (f, n, value)
+	finally:
+		pool.terminate()
+		pool.join()
+
 def count_spikes(spike_times, start, stop):
 	n = 0
 	for t in spike_times:
@@ -704,6 +1878,246 @@ def deg2pix(d, deg):
 		return float(deg) * float(d.params['pix_per_dva'])
 
 
+SACCADE_DTYPE = np.dtype([
+	('trial', np.int32),
+	('t0', np.float64), ('t1', np.float64),
+	('t2', np.float64), ('t3', np.float64),
+	('t0i', np.int64), ('t1i', np.int64),
+	('t2i', np.int64), ('t3i', np.int64),
+	('fx', np.float64), ('fy', np.float64), ('fv', np.int8),
+	('l_fx', np.float64), ('l_fy', np.float64), ('l_fv', np.int8),
+	])
+
+FIXATION_DTYPE = np.dtype([
+	('trial', np.int32),
+	('start_ix', np.int64), ('stop_ix', np.int64),
+	('start_ms', np.float64), ('stop_ms', np.float64),
+	('xpos', np.float64), ('ypos', np.float64),
+	])
+
+def _eyetraces(trials):
+	"""Normalize input to find_saccades_batch()/findfix_batch().
+
+	:return: (list) (t, x, y, valid/None) tuple for each trial
+
+	"""
+	if type(trials) is types.TupleType:
+		(t, x, y, valid) = trials
+		if np.ndim(t) < 2:
+			return [trials]
+		# stack of trials as 2d (trial x sample) arrays
+		if valid is None:
+			valid = [None] * len(t)
+		return zip(t, x, y, valid)
+	if hasattr(trials, 'eyet'):
+		trials = [trials]
+	traces = []
+	for d in trials:
+		if type(d) is types.TupleType:
+			traces.append(d)
+		else:
+			traces.append((d.eyet, d.eyex, d.eyey, d.eyevalid))
+	return traces
+
+def _segments(lens):
+	"""Start index and segment number for concatenated traces.
+
+	:param lens: (array) length of each trace
+
+	:return: (tuple) (starts, stops, seg), where seg gives the trace
+		number for each element of the concatenated vector.
+
+	"""
+	stops = np.cumsum(lens)
+	starts = stops - lens
+	seg = np.repeat(np.arange(len(lens)), lens)
+	return starts, stops, seg
+
+def _velocity(t, x, y, starts):
+	"""Eye speed (pix/ms) for concatenated traces.
+
+	:return: (array) speed between successive samples, one shorter
+		than the input for each trace (ie, starts - k for trace k).
+
+	"""
+	keep = np.ones(len(t) - 1, np.bool)
+	keep[starts[1:] - 1] = False
+	dx = np.diff(x)[keep]
+	dy = np.diff(y)[keep]
+	dt = np.diff(t)[keep]
+	return ((dx**2 + dy ** 2) ** .5) / dt
+
+def _segmean(c, a, b):
+	"""Mean of v[a:b] given c = cumsum(v) with a leading zero."""
+	return (c[b] - c[a]) / (b - a)
+
+def _cumsum0(v):
+	return np.concatenate(([0.0], np.cumsum(v, dtype=np.float)))
+
+def find_saccades_batch(trials, thresh=2, mindur=25, maxthresh=None):
+	"""Find all saccades in a stack of trials.
+
+	Vectorized version of find_saccades() -- same algorithm and
+	parameters (see find_saccades() for the details), but all trials
+	are concatenated and run through the velocity/threshold/debounce
+	steps together. Only the (much shorter) lists of threshold
+	crossings are handled per saccade.
+
+	The state machine in the original is reduced to: a velocity
+	sample is a possible saccade *onset* if it's over thresh (and
+	under maxthresh) and a possible *offset* if it's at or under
+	thresh and stays there for the next mindur ms. Onsets and offsets
+	can't overlap, so after the first fixation the real ones are
+	just the first of each run of same-kind candidates.
+
+	Trials with fewer than two (decimated) samples are skipped.
+
+	:param trials: (list) PypeRecords or (t, x, y, valid/None) tuples,
+		or a single (t, x, y, valid/None) tuple of 2d (trial x sample)
+		arrays.
+
+	:return: (structured array, SACCADE_DTYPE) one row per saccade,
+		ordered by trial and time. 'trial' is the index into trials,
+		the rest of the fields are as in find_saccades(). If there
+		wasn't a previous fixation, l_fx and l_fy are nan and l_fv is
+		-1.
+
+	"""
+	traces = []
+	for (k, (t, x, y, valid)) in enumerate(_eyetraces(trials)):
+		t = np.asarray(t, np.float)
+		if len(t) < 2:
+			continue
+		# decimate from actual FS down to 120hz (ie, 8ms sampling period)
+		dec = max(1, int(0.5 + (8.0 / mean(diff(t)))))
+		if (len(t) + dec - 1) / dec < 2:
+			continue
+		if valid is not None and len(valid) == 0:
+			valid = None
+		traces.append((k, t, x, y, valid, dec))
+	if not traces:
+		return np.zeros(0, SACCADE_DTYPE)
+
+	trial = np.array([tr[0] for tr in traces])
+	dec = np.array([tr[5] for tr in traces])
+	raw = np.array([len(tr[1]) for tr in traces])
+	rawstart = np.cumsum(raw) - raw
+
+	eyet = np.concatenate([tr[1] for tr in traces])
+	eyex = np.concatenate([np.asarray(tr[2], np.float) for tr in traces])
+	eyey = np.concatenate([np.asarray(tr[3], np.float) for tr in traces])
+	hasvalid = np.array([tr[4] is not None for tr in traces])
+	if hasvalid.any():
+		eyevalid = np.concatenate([np.zeros(len(tr[1])) if tr[4] is None
+								   else np.asarray(tr[4], np.float)
+								   for tr in traces])
+		cv = _cumsum0(eyevalid)
+
+	# decimated samples
+	ix = np.concatenate([np.arange(rawstart[k], rawstart[k] + raw[k], dec[k])
+						 for k in range(len(traces))])
+	ndec = (raw + dec - 1) / dec
+	dstart = np.cumsum(ndec) - ndec
+	t = eyet[ix]
+
+	# smoothed velocity; vstart[k]+k == dstart[k], so index i into
+	# v for trace k is decimated sample i+k and raw sample
+	# rawstart[k] + (i-vstart[k])*dec[k]
+	(vstart, vstop, seg) = _segments(ndec - 1)
+	v = _velocity(t, eyex[ix], eyey[ix], dstart)
+	v = smooth_boxcar(v, 2, vstart)
+
+	if maxthresh is None:
+		# this will NEVER be exceeded..
+		mt = (np.maximum.reduceat(v, vstart) * 10)[seg]
+	else:
+		mt = maxthresh
+
+	above = v > thresh
+	onset = above & (v < mt)
+
+	# offsets have to stay below thresh for ~mindur ms -- count
+	# samples over thresh in the look-ahead window
+	look = np.array([int(0.5 + float(mindur) / d) for d in dec])
+	i = np.arange(len(v))
+	hi = np.maximum(np.minimum(i + look[seg], vstop[seg]), i + 1)
+	nabove = np.concatenate(([0], np.cumsum(above)))
+	skip = (v < mt) & ((nabove[hi] - nabove[i + 1]) > 0)
+	offset = (v <= thresh) & ~skip
+
+	# find a fixation to get started..
+	fix = np.flatnonzero((v < thresh) & (v < mt))
+	p = np.searchsorted(fix, vstart)
+	ix0 = vstop.copy()
+	ok = p < len(fix)
+	ix0[ok] = np.minimum(fix[p[ok]], vstop[ok])
+
+	# real onsets/offsets are the first of each run of candidates
+	ev = np.flatnonzero(onset | offset)
+	ev = ev[ev >= ix0[seg[ev]]]
+	es = seg[ev]
+	on = onset[ev]
+	prev = np.concatenate(([False], on[:-1]))
+	prev[np.concatenate(([True], es[1:] != es[:-1]))] = False
+	keep = on != prev
+	ev = ev[keep]
+	es = es[keep]
+	on = on[keep]
+
+	# each onset ends a fixation that started at ix0 or the last offset
+	q = np.flatnonzero(on)
+	qs = es[q]
+	qp = np.maximum(q - 1, 0)
+	first = (q == 0) | (es[qp] != qs)
+	fstart = np.where(first, ix0[qs], ev[qp])
+	fstop = ev[q]
+
+	def rawix(i, k):
+		return (i - vstart[k]) * dec[k]
+
+	a = rawstart[qs] + rawix(fstart, qs)
+	b = rawstart[qs] + rawix(fstop, qs)
+	fx = _segmean(_cumsum0(eyex), a, b)
+	fy = _segmean(_cumsum0(eyey), a, b)
+	fv = np.ones(len(q), np.int8)
+	if hasvalid.any():
+		fv = np.where(hasvalid[qs], (cv[b] - cv[a]) == 0, 1)
+
+	# one saccade per onset after the first (t0-t2 from the last one)..
+	this = np.flatnonzero(~first)
+	last = this - 1
+
+	# ..plus the one that was still going when the trace ran out
+	lastev = np.flatnonzero(np.concatenate((es[1:] != es[:-1],
+											[True]))[:len(es)])
+	lastev = lastev[~on[lastev]]
+	lastev = lastev[v[vstop[es[lastev]] - 1] <= thresh]
+	endon = np.cumsum(on)[lastev] - 1
+
+	k = np.concatenate((qs[this], es[lastev]))
+	s = np.zeros(len(k), SACCADE_DTYPE)
+	s['trial'] = trial[k]
+	i0 = np.concatenate((fstart[last], fstart[endon]))
+	i1 = np.concatenate((fstop[last], fstop[endon]))
+	i2 = np.concatenate((fstart[this], ev[lastev]))
+	i3 = np.concatenate((fstop[this], vstop[es[lastev]] - 1))
+	for (n, iv) in enumerate((i0, i1, i2, i3)):
+		s['t%d' % n] = t[iv + k]
+		s['t%di' % n] = rawix(iv, k)
+	cur = np.concatenate((this, endon))
+	s['fx'] = fx[cur]
+	s['fy'] = fy[cur]
+	s['fv'] = fv[cur]
+	old = np.concatenate((last, endon - 1))
+	none = np.concatenate((np.zeros(len(last), np.bool), first[endon]))
+	s['l_fx'] = np.where(none, np.nan, fx[old])
+	s['l_fy'] = np.where(none, np.nan, fy[old])
+	s['l_fv'] = np.where(none, -1, fv[old])
+
+	s = s[(s['t3'] - s['t2']) > 0]
+	return s[np.argsort(s['trial'], kind='mergesort')]
+
+
 def find_saccades(d, thresh=2, mindur=25, maxthresh=None):
 	"""Find all saccades in a trial.
 
@@ -744,6 +2158,11 @@ def find_saccades(d, thresh=2, mindur=25, maxthresh=None):
 
 	- cleaned up and added docs..
 
+	- *Sun Oct 18 14:02:37 2026 mazer*
+
+	- vectorized -- this is now a wrapper for find_saccades_batch()
+	  (original kept as _find_saccades_loop())
+
 	:param d: (PypeData object OR (t, x, y, valid/None) tuple) Input
 		data either in the form of a PypeData object or raw x,y,z,valid data
 		stream. Valid is either none, or a boolean vector indicating the
@@ -776,6 +2195,18 @@ def find_saccades(d, thresh=2, mindur=25, maxthresh=None):
 	   SUPPLIED.
 
 	"""
+	return [_saccade_tuple(s) for s in
+			find_saccades_batch([d], thresh, mindur, maxthresh).tolist()]
+
+def _saccade_tuple(s):
+	(t0, t1, t2, t3, t0i, t1i, t2i, t3i, fx, fy, fv, lfx, lfy, lfv) = s[1:]
+	if lfv < 0:
+		# no previous fixation
+		(lfx, lfy, lfv) = (None, None, None)
+	return (t0, t1, t2, t3, t0i, t1i, t2i, t3i, fx, fy, fv, lfx, lfy, lfv)
+
+def _find_saccades_loop(d, thresh=2, mindur=25, maxthresh=None):
+	"""Original (pure python) saccade detector; see find_saccades()."""
 
 	if type(d) is types.TupleType:
 		# set eyevalid to None if you're not using calibration info..
@@ -884,6 +2315,94 @@ def find_saccades(d, thresh=2, mindur=25, maxthresh=None):
 	return SacList
 
 
+def findfix_batch(trials, thresh=2, dur=50, anneal=10, start=None, stop=None):
+	"""Find fixation periods in a stack of trials.
+
+	Vectorized version of findfix() -- same algorithm and parameters,
+	but all trials are concatenated and handled together. Fixations
+	are just runs of (calibrated) samples at or below threshold, so
+	they can be picked out with a few array ops instead of stepping
+	through the velocity trace.
+
+	:param trials: (list) PypeRecords or (t, x, y, valid/None) tuples,
+		or a single (t, x, y, valid/None) tuple of 2d (trial x sample)
+		arrays.
+
+	:return: (structured array, FIXATION_DTYPE) one row per fixation,
+		ordered by trial and time. 'trial' is the index into trials,
+		the rest are the fields of the tuples returned by findfix().
+
+	"""
+	traces = []
+	for (k, (t, x, y, valid)) in enumerate(_eyetraces(trials)):
+		a = start or 0
+		b = stop
+		if b is None:
+			b = len(t)
+		if b - a < 2:
+			continue
+		traces.append((k, a, np.asarray(t[a:b], np.float),
+					   np.asarray(x[a:b], np.float),
+					   np.asarray(y[a:b], np.float), valid))
+	if not traces:
+		return np.zeros(0, FIXATION_DTYPE)
+
+	trial = np.array([tr[0] for tr in traces])
+	offset = np.array([tr[1] for tr in traces])
+	(rawstart, rawstop, rawseg) = _segments(np.array([len(tr[2])
+													  for tr in traces]))
+	eyet = np.concatenate([tr[2] for tr in traces])
+	eyex = np.concatenate([tr[3] for tr in traces])
+	eyey = np.concatenate([tr[4] for tr in traces])
+
+	# velocity sample i of trace k is raw sample i+k
+	(vstart, vstop, seg) = _segments(rawstop - rawstart - 1)
+	v = smooth_boxcar(_velocity(eyet, eyex, eyey, rawstart), 2, vstart)
+
+	# NB: eyevalid is indexed by velocity sample, not offset by start
+	# (same as the original findfix)
+	invalid = np.zeros(len(v), np.bool)
+	for (k, tr) in enumerate(traces):
+		if tr[5] is not None:
+			n = vstop[k] - vstart[k]
+			invalid[vstart[k]:vstop[k]] = \
+			  np.logical_not(np.asarray(tr[5])[:n])
+	ok = ~invalid & (v <= thresh)
+
+	# runs of ok samples -- keep the ones that end on a velocity
+	# spike (not on invalid data) or run to the end of the trace
+	edge = np.concatenate(([True], seg[1:] != seg[:-1]))
+	s = np.flatnonzero(ok & ~(np.concatenate(([False], ok[:-1])) & ~edge))
+	e = np.flatnonzero(ok & ~(np.concatenate((ok[1:], [False])) &
+							  ~np.concatenate((edge[1:], [True])))) + 1
+	k = seg[s]
+	atend = e == vstop[k]
+	keep = np.where(atend, (e - s) >= 2,
+					~invalid[np.minimum(e, len(v) - 1)])
+	a = s + k
+	b = np.where(atend, e - 2, e - 1) + k
+	keep &= (eyet[b] - eyet[a]) > dur
+	a = a[keep]
+	b = b[keep]
+	k = k[keep]
+
+	# merge fixations separated by less than anneal ms
+	new = np.concatenate(([True], (k[1:] != k[:-1]) |
+						  ((eyet[a[1:]] - eyet[b[:-1]]) > anneal)))[:len(a)]
+	a = a[new]
+	b = b[np.concatenate((new[1:], [True]))[:len(b)]]
+	k = k[new]
+
+	f = np.zeros(len(a), FIXATION_DTYPE)
+	f['trial'] = trial[k]
+	f['start_ix'] = a - rawstart[k] + offset[k]
+	f['stop_ix'] = b - rawstart[k] + offset[k]
+	f['start_ms'] = eyet[a]
+	f['stop_ms'] = eyet[b]
+	f['xpos'] = _segmean(_cumsum0(eyex), a, b)
+	f['ypos'] = _segmean(_cumsum0(eyey), a, b)
+	return f
+
 def findfix(d, thresh=2, dur=50, anneal=10, start=None, stop=None):
 	"""
 	Find fixation periods in trial. Threshold is velocity (pix/ms)
@@ -905,7 +2424,15 @@ def findfix(d, thresh=2, dur=50, anneal=10, start=None, stop=None):
 
 	Note: 100 deg/sec -> 1800pix/sec -> 1.8pix/ms
 
+	This is a wrapper for findfix_batch() (the original loop is kept
+	as _findfix_loop()).
+
 	"""
+	return [tuple(f[1:]) for f in
+			findfix_batch([d], thresh, dur, anneal, start, stop).tolist()]
+
+def _findfix_loop(d, thresh=2, dur=50, anneal=10, start=None, stop=None):
+	"""Original (pure python) fixation finder; see findfix()."""
 
 	# calculate v (velocity profile from XY position)
 	start, stop, v = fixvel(d, start=start, stop=stop)
@@ -945,6 +2472,91 @@ def findfix(d, thresh=2, dur=50, anneal=10, start=None, stop=None):
 
 	return fixations
 
+def benchmark_saccades(fname=None, ntrials=100, nmax=3):
+	"""Compare find_saccades()/findfix() to the original loops.
+
+	Runs both versions on every record in datafile fname (or on
+	ntrials synthetic 5s eye traces with saccades and blinks, if
+	fname isn't given), checks they find the same saccades and
+	fixations and prints the run time of each.
+
+	"""
+	import time
+
+	if fname:
+		pf = PypeFile(fname, quiet=1)
+		trials = [d.compute() for d in pf.records()]
+		pf.close()
+	else:
+		trials = []
+		for n in range(ntrials):
+			t = np.arange(5000.0)
+			x = np.zeros(len(t))
+			y = np.zeros(len(t))
+			for k in sorted(np.random.randint(0, len(t), 15)):
+				x[k:] = np.random.randint(-200, 200)
+				y[k:] = np.random.randint(-200, 200)
+			for k in np.random.randint(0, len(t) - 100, 2):
+				y[k:k+np.random.randint(20, 100)] = 5000
+			x = x + np.random.randint(-1, 2, len(t))
+			y = y + np.random.randint(-1, 2, len(t))
+			trials.append((t, x, y, None))
+
+	class _d:
+		def __init__(self, tr):
+			(self.eyet, self.eyex, self.eyey, self.eyevalid) = tr
+
+	def same(a, b):
+		if len(a) != len(b):
+			return 0
+		for (x, y) in zip(a, b):
+			for (u, v) in zip(x, y):
+				if (u is None) != (v is None):
+					return 0
+				if u is not None and not np.allclose(u, v):
+					return 0
+		return 1
+
+	for (name, old, new, batched, args) in \
+			(('find_saccades', _find_saccades_loop, find_saccades,
+			  find_saccades_batch, {'maxthresh': 100}),
+			 ('findfix', _findfix_loop, findfix, findfix_batch, {})):
+		recs = trials
+		if name == 'findfix':
+			recs = [_d(tr) if type(tr) is types.TupleType else tr
+					for tr in trials]
+		nbad = 0
+		nfound = 0
+		for d in recs:
+			a = old(d, **args)
+			b = new(d, **args)
+			nfound = nfound + len(b)
+			if not same(a, b):
+				nbad = nbad + 1
+		if nbad:
+			print '%s: MISMATCH in %d/%d trials' % (name, nbad, len(recs))
+
+		t0 = time.time()
+		for k in range(nmax):
+			for d in recs:
+				old(d, **args)
+		tloop = (time.time() - t0) / nmax
+
+		t0 = time.time()
+		for k in range(nmax):
+			for d in recs:
+				new(d, **args)
+		tvec = (time.time() - t0) / nmax
+
+		t0 = time.time()
+		for k in range(nmax):
+			batched(recs, **args)
+		tbatch = (time.time() - t0) / nmax
+
+		print '%s %d trials, %d found: loop %.2fs numpy %.2fs (%.0fx) batch %.2fs (%.0fx)' % \
+			  (name, len(recs), nfound, tloop, tvec, tloop / max(tvec, 1e-9),
+			   tbatch, tloop / max(tbatch, 1e-9))
+
 def find_events(events, event):
 	"""Returns a list of event times which match pattern.
 
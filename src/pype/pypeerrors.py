@@ -26,6 +26,7 @@ class BarTransition(Exception): pass
 class JoyTransition(Exception): pass
 class FixBreak(Exception): pass
 class Alarm(Exception): pass
+class ZoneEvent(Exception): pass
 class EmergencyAbort(Exception): pass
 
 # for obsolete function calls
@@ -1,23 +1,75 @@
 # -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
 
+"""Built in HTTP server
+
+  /               human readable status page (tally etc)
+  /metrics        JSON snapshot of app.metrics, plus task state
+  /trials         JSON list of recent per-trial metrics
+  /events         server-sent-events feed of /metrics snapshots,
+                  sent whenever something changes (at most hz times
+                  a second: /events?hz=2)
+
+The JSON endpoints allow cross-origin requests, so one dashboard
+page can poll (or listen to) a whole room full of rigs.
+
+Author -- James A. Mazer (mazerj@gmail.com)
+
+"""
+
 import sys
 import threading
 import socket
 import string
 import time
+import json
+import urlparse
 from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
 from pype import getapp
+
+# seconds between keepalives on idle /events streams
+_KEEPALIVE = 10.0
+
+def _jsonable(o):
+	# numpy scalars and arrays
+	if hasattr(o, 'tolist'):
+		return o.tolist()
+	return str(o)
+
+def _dumps(o):
+	return json.dumps(o, default=_jsonable)
+
+def snapshot():
+	"""Metrics snapshot plus current task state."""
+	app = getapp()
+	s = app.metrics.snapshot()
+	s['host'] = socket.gethostname().split('.')[0]
+	s['state'] = {
+		'running': app.running,
+		'task': app.task_name,
+		'record_file': app.record_file,
+		'record_id': app.record_id,
+		}
+	return s
 #from guitools import Logger
 
 class PypeHandler(BaseHTTPRequestHandler):
 	def do_GET(self):
+		url = urlparse.urlparse(self.path)
+		cmd = url.path
+		#print 'cmd: <%s>' % cmd
+
+		if cmd == '/metrics':
+			return self._json(snapshot())
+		elif cmd == '/trials':
+			return self._json(getapp().metrics.history())
+		elif cmd == '/events':
+			return self._events(urlparse.parse_qs(url.query))
+
 		self.send_response(200)
 		self.send_header('Content-type','text/html')
 		self.end_headers()
-		
-		cmd = self.path
-		#print 'cmd: <%s>' % cmd
-		
+
 		if cmd == '/':
 			h = socket.gethostname().split('.')[0]
 			s = string.replace(getapp().last_tally, '\n', '<br>\n')
@@ -36,18 +88,66 @@ class PypeHandler(BaseHTTPRequestHandler):
 			self.wfile.write('Unknown command: %s\n' % cmd);
 		return
 
+	def _json(self, obj):
+		s = _dumps(obj)
+		self.send_response(200)
+		self.send_header('Content-type', 'application/json')
+		self.send_header('Content-length', str(len(s)))
+		self.send_header('Access-Control-Allow-Origin', '*')
+		self.send_header('Cache-Control', 'no-cache')
+		self.end_headers()
+		self.wfile.write(s)
+
+	def _events(self, query):
+		try:
+			hz = float(query.get('hz', ['2'])[0])
+		except ValueError:
+			hz = 2.0
+		dt = 1.0 / max(0.1, min(hz, 100.0))
+
+		self.send_response(200)
+		self.send_header('Content-type', 'text/event-stream')
+		self.send_header('Access-Control-Allow-Origin', '*')
+		self.send_header('Cache-Control', 'no-cache')
+		self.end_headers()
+
+		metrics = getapp().metrics
+		seq = None
+		tlast = time.time()
+		try:
+			while 1:
+				if metrics.seq != seq:
+					s = snapshot()
+					seq = s['seq']
+					self.wfile.write('id: %d\ndata: %s\n\n' % (seq, _dumps(s)))
+					self.wfile.flush()
+					tlast = time.time()
+				elif (time.time() - tlast) > _KEEPALIVE:
+					self.wfile.write(': keepalive\n\n')
+					self.wfile.flush()
+					tlast = time.time()
+				time.sleep(dt)
+		except (socket.error, IOError):
+			# client went away
+			pass
+
 	def log_message(self, format, *args):
 		# stop logging to stdout
 		return
 
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+	# /events streams tie up a thread for as long as they're open
+	daemon_threads = True
+
 class PypeHTTPServer():
 	def __init__(self, app):
 		self.app = app
 		self.server = None
 
 	def start(self):
-		self.server = HTTPServer(('', self.app.config.iget('HTTP_PORT')),
-								 PypeHandler)
+		self.server = _ThreadingHTTPServer(('',
+											self.app.config.iget('HTTP_PORT')),
+										   PypeHandler)
 		self.server_thread = threading.Thread(target=self.non_int_serve_forever)
 		self.server_thread.daemon = True
 		self.server_thread.start()
@@ -0,0 +1,189 @@
+# -*- Mode: Python; tab-width: 4; py-indent-offset: 4; -*-
+
+"""Background writer for pype datafiles
+
+Keeps the datafile open for the duration of a run and does the
+pickling, writing and flushing of records on a separate thread, so
+a slow disk (or a big record) doesn't hold up the start of the next
+trial. Records are written in the order they're queued. The queue
+is bounded -- if the disk falls too far behind, write() blocks until
+there's room again (the time spent waiting is reported by stats()).
+
+The writer's a daemon thread, so anything still open at exit gets
+flushed and closed by an atexit handler -- records queued before a
+crash (or a sys.exit() from a hotkey) still make it to disk.
+
+Author -- James A. Mazer (mazerj@gmail.com)
+
+"""
+
+import os
+import sys
+import time
+import atexit
+import threading
+import Queue
+
+# writers that haven't been closed yet (see _close_all)
+_open = []
+
+class RecordWriter(object):
+	def __init__(self, fname, maxqueue=32, fsync=0):
+		"""Open datafile for appending and start writer thread.
+
+		:param fname: (string) datafile name
+
+		:param maxqueue: (int) max number of records waiting to be written
+
+		:param fsync: (bool) fsync after every record? Otherwise the
+			file is only fsync'd on flush() and close().
+
+		"""
+		self.fname = fname
+		self.fsync = fsync
+		self.error = None
+
+		# write latency (s) -- time from write() to data in the file
+		self.nwritten = 0
+		self.last_latency = 0.0
+		self.max_latency = 0.0
+		self.sum_latency = 0.0
+		self.stall = 0.0
+
+		self._fp = open(fname, 'ab')
+		self._q = Queue.Queue(maxqueue)
+		self._thread = threading.Thread(target=self._run)
+		self._thread.setDaemon(1)
+		self._thread.start()
+		_open.append(self)
+
+	def __repr__(self):
+		return '<RecordWriter:%s (%d recs)>' % (self.fname, self.nwritten)
+
+	def _check(self):
+		if self.error is not None:
+			e, self.error = self.error, None
+			raise IOError('RecordWriter: %s: %s' % (self.fname, e))
+
+	def _put(self, item):
+		if self._thread is None:
+			raise IOError('RecordWriter: %s: closed' % self.fname)
+		t0 = time.time()
+		self._q.put(item)
+		self.stall = self.stall + (time.time() - t0)
+
+	def write(self, label, obj, binary=0, compress=0):
+		"""Queue labeled record for writing.
+
+		Don't modify obj after calling this, it's pickled later,
+		by the writer thread.
+
+		:param binary: (bool) use labeled_dump_binary() instead of
+			labeled_dump() -- ENCODE records only.
+
+		:param compress: (bool) zlib the binary vectors
+
+		"""
+		self._check()
+		self._put((time.time(), label, obj, binary, compress))
+
+	def flush(self, durable=1):
+		"""Wait for everything queued so far to be written.
+
+		:param durable: (bool) also fsync the file
+
+		"""
+		done = threading.Event()
+		self._put((None, durable, done, None, None))
+		done.wait()
+		self._check()
+
+	def close(self):
+		"""Flush (durably), stop writer thread and close the file."""
+		if self._thread is None:
+			return
+		try:
+			self.flush(durable=1)
+		finally:
+			self._q.put(None)
+			self._thread.join()
+			self._thread = None
+			self._fp.close()
+			if self in _open:
+				_open.remove(self)
+
+	def stats(self):
+		"""Get write stats.
+
+		:return: (dict) number of records written, last, mean and
+			max latency (ms) and total time write() spent blocked on
+			a full queue (ms).
+
+		"""
+		if self.nwritten:
+			mean = 1000.0 * self.sum_latency / self.nwritten
+		else:
+			mean = 0.0
+		return {
+			'n': self.nwritten,
+			'last': 1000.0 * self.last_latency,
+			'mean': mean,
+			'max': 1000.0 * self.max_latency,
+			'stall': 1000.0 * self.stall,
+			}
+
+	def _sync(self):
+		self._fp.flush()
+		os.fsync(self._fp.fileno())
+
+	def _run(self):
+		# delayed import -- pypedata imports pype, which imports us..
+		from pypedata import labeled_dump, labeled_dump_binary
+
+		while 1:
+			item = self._q.get()
+			if item is None:
+				return
+			try:
+				if item[0] is None:
+					# flush request: (None, durable, event, None, None)
+					(t0, durable, done, x, y) = item
+					try:
+						if durable:
+							self._sync()
+						else:
+							self._fp.flush()
+					finally:
+						done.set()
+					continue
+
+				(t0, label, obj, binary, compress) = item
+				if binary:
+					labeled_dump_binary(label, obj, self._fp, compress)
+				else:
+					labeled_dump(label, obj, self._fp, 1)
+				if self.fsync:
+					self._sync()
+				else:
+					# readers (pypedata) should always see whole records
+					self._fp.flush()
+			except Exception, e:
+				# reported back on next write()/flush()
+				self.error = e
+				continue
+
+			dt = time.time() - t0
+			self.nwritten = self.nwritten + 1
+			self.last_latency = dt
+			self.max_latency = max(self.max_latency, dt)
+			self.sum_latency = self.sum_latency + dt
+
+def _close_all():
+	# atexit: don't lose records still sitting in the queue
+	for w in _open[:]:
+		try:
+			w.close()
+		except Exception, e:
+			sys.stderr.write('RecordWriter: %s: %s\n' % (w.fname, e))
+
+atexit.register(_close_all)
@@ -15,6 +15,9 @@ import time
 import string
 import types
 import math
+import collections
+
+from fliptimer import FlipTimer
 
 try:
 	from guitools import Logger
@@ -170,6 +173,9 @@ class FrameBuffer(object):
 		self.eyefn = eyefn
 
 		self.record = 0
+		# FrameRecorder options (roi, scale, nbuf, policy, codec..)
+		self.recopts = {}
+		self._recorder = None
 		self._font = None
 		
 		if fbw:
@@ -288,10 +294,12 @@ class FrameBuffer(object):
 			self._sync_high = None
 			self.syncinfo = None
 
-		# Timer initialized and used by flip() method for
-		# checking for frame rate glitches. To enage the
-		# timer check, set maxfliptime to some positive value
-		# min ms in your task:
+		# Every flip is timestamped by self.flips (see fliptimer.py)
+		# for checking for frame rate glitches. To get a warning
+		# for long flips, set maxfliptime to some positive value
+		# (ms) in your task. fliptimer is the time of the last
+		# flip (ms).
+		self.flips = FlipTimer()
 		self.maxfliptime = 0
 		self.fliptimer = None
 
@@ -371,6 +379,13 @@ class FrameBuffer(object):
 			del self._sync_high
 		except AttributeError:
 			pass
+		try:
+			self._recclose()
+		except AttributeError:
+			pass
+		if texcache is not None:
+			# textures go with the GL context
+			texcache.clear(gl=False)
 		if pygame:
 			pygame.display.quit()
 
@@ -380,7 +395,8 @@ class FrameBuffer(object):
 		Try to determine the approximate frame rate automatically.
 		X11R6 doesn't provide a way to set or query the current video
 		frame rate. To circumvent this, we just flip the page a few
-		times and compute the median inter-frame interval.
+		times and compute the median inter-frame interval. The
+		result's also used by self.flips to spot dropped frames.
 
 		*NB* This is always going to be a rought estimate, you
 		should always adjust the /etc/X11/XFConfig-4 file to set the
@@ -400,40 +416,28 @@ class FrameBuffer(object):
 		self.flip()
 
 		# page flip for up to a second..
-		intervals = []
-		self.flip()
-		start = time.time()
-		a = start
-		while time.time()-start <= 1:
+		self.flips.reset()
+		self.flips.period = None
+		start = self.flips.clock()
+		while self.flips.clock()-start <= 1000:
 			self.flip()
-			b = time.time()
-			intervals.append(1000*(b-a))
-			a = b
 
 		self.sync_mode = oldsync
 
-		if len(intervals) <= 1:
+		if len(self.flips.intervals()) <= 1:
 			Logger('sprite: failed to estimate frames per second, using 60Hz\n')
+			self.flips.period = 1000.0 / 60
 			return 60
 
-		# compute estimated frame rate (Hz) based on median inter-frame
-		# interval
-		# this is ROUGH median - if len(intervals) is odd, then it's
-		# not quite right, but it should be close enough..
-		sd = np.std(intervals)
-		m = np.mean(intervals)
-		k = []
-		for i in intervals:
-			if sd == 0 or abs(i-m) < (2*sd):
-				k.append(i)
-		if len(k) < 1:
+		# estimated frame rate (Hz) based on the mean inter-frame
+		# interval, ignoring outliers
+		km = self.flips.measure()
+		self.flips.reset()
+		if km is None:
 			Logger('sprite: calcfps - no photodiode? Assuming 60\n')
+			self.flips.period = 1000.0 / 60
 			return 60
-		km = np.mean(k)
-		if km > 0.0:
-			return round(1000.0 / km)
-		else:
-			return -1.0
+		return round(1000.0 / km)
 
 	def set_gamma(self, r, g=None, b=None):
 		"""Set hardware gamma correction values (if possible).
@@ -571,6 +575,8 @@ class FrameBuffer(object):
 			# directly to the frame buffer and does it's own flip..)
 			return
 
+		self.flips.called()
+
 		if self.eyefn:
 			(x, y) = self.eyefn()
 			self.rectangle(x, y, 3, 3, (255, 1, 1, 128))
@@ -578,43 +584,92 @@ class FrameBuffer(object):
 		# make sure all stimuli are written to the surface.
 		ogl.glFinish()
 
+		if self.record:
+			# grab the back buffer before it goes away..
+			recbuf = self._capture()
+		else:
+			recbuf = None
+
 		if not self.screen is None:
 			pygame.display.flip()
 			if self.app:
 				self.app.encode(MARKFLIP)
 
-		if self.fliptimer is None:
-			self.fliptimer = time.time()
-		else:
-			t = time.time()
-			if self.maxfliptime:
-				elapsed = t - self.fliptimer
-				if elapsed > self.maxfliptime:
-					Logger('warning: %dms flip\n' % elapsed)
-			self.fliptimer = t
+		(self.fliptimer, elapsed, nmissed) = self.flips.flipped()
+		if self.maxfliptime and elapsed is not None and \
+			   elapsed > self.maxfliptime:
+			Logger('warning: %dms flip\n' % elapsed)
 
-		if self.record:
+		if recbuf is not None:
+			# ..and let the recorder's thread deal with it
 			from pype import PypeApp
-			recno = PypeApp().record_id
-			fname = PypeApp().record_file
-			if fname is None:
-				return
-			if fname.startswith('/dev/null'):
-				fname = 'null'
-			ms = int(round(1000.0*(time.time())))
-			f = '%s_%04d_%020d.jpg' % (fname, recno, ms)
-			self.snapshot(f)
-			PypeApp().encode('SNAPSHOT ' + f)
+			n = self._recorder.submit(recbuf, self.fliptimer,
+									  PypeApp().record_id)
+			PypeApp().encode('SNAPSHOT %s %d' % (self._recorder.fname, n))
+
+	def _capture(self):
+		# Read the back buffer into a free FrameRecorder buffer; the
+		# recorder (one archive per datafile) is opened on demand.
+		from pype import PypeApp
+		from framerec import FrameRecorder
+
+		fname = PypeApp().record_file
+		if fname is None:
+			return None
+		if fname.startswith('/dev/null'):
+			# not saving anything, so no archive either
+			fname = '/dev/null'
+		else:
+			fname = fname + '.frames'
+		if self._recorder and self._recorder.fname != fname:
+			self._recclose()
+		if self._recorder is None:
+			self._recorder = FrameRecorder(fname,
+										   (self.physicalw, self.physicalh),
+										   **self.recopts)
+
+		buf = self._recorder.acquire()
+		if buf is not None:
+			(x, y, w, h) = self._recorder.roi
+			ogl.glPixelStorei(ogl.GL_PACK_ALIGNMENT, 1)
+			ogl.glReadBuffer(ogl.GL_BACK)
+			try:
+				ogl.glReadPixels(x, y, w, h, ogl.GL_RGB, ogl.GL_UNSIGNED_BYTE,
+								 array=buf)
+			except TypeError:
+				# older PyOpenGL -- can't read into an existing array
+				a = ogl.glReadPixels(x, y, w, h,
+									 ogl.GL_RGB, ogl.GL_UNSIGNED_BYTE)
+				buf[::] = np.fromstring(a, np.uint8).reshape(buf.shape)
+		return buf
+
+	def _recclose(self):
+		if self._recorder:
+			st = self._recorder.close()
+			Logger('Wrote %d frames to %s (%d dropped, '
+				   'readback %.1f/%.1fms, latency %.1f/%.1fms mean/max)\n' %
+				   (st['written'], self._recorder.fname, st['dropped'],
+					st['readback_mean'], st['readback_max'],
+					st['latency_mean'], st['latency_max']))
+			self._recorder = None
 
 	def recordtog(self, state=None):
+		"""Toggle recording of displayed frames.
+
+		While recording's on, every flip is captured into a frame
+		archive next to the datafile (datafile + '.frames'; see
+		framerec.py and recopts) and a SNAPSHOT event with the
+		archive name and frame number goes into the trial's events.
+
+		"""
 		if state is None:
 			self.record = not self.record
 		else:
 			self.record = state
 		if self.record:
-			os.system('/bin/rm -f /tmp/pype*.jpg')
 			sys.stderr.write('[Recording is ON]\n')
 		else:
+			self._recclose()
 			sys.stderr.write('[Recording is OFF]\n')
 
 	def checklshift(self):
@@ -1015,6 +1070,7 @@ class ScaledSprite(object):
 		self.contrast = contrast
 		self.texture = None
 		self.pim = None
+		self._dirty = 1
 
 		# for backward compatibilty
 		dwidth, dheight = width, height
@@ -1120,9 +1176,43 @@ class ScaledSprite(object):
 								   inverty=0)
 		self.xx, self.yy = genaxes(self.dw, self.dh, self.w, self.h,
 								   inverty=1)
-		self.array = pygame.surfarray.pixels3d(self.im)
-		self.alpha = pygame.surfarray.pixels_alpha(self.im)
+		self._array = pygame.surfarray.pixels3d(self.im)
+		self._alpha = pygame.surfarray.pixels_alpha(self.im)
+		self._pix = pygame.surfarray.pixels2d(self.im)
 		self.im.set_colorkey((0,0,0,0))
+		self._dirty = 1
+
+	# Any access to the pixel data through .array or .alpha is assumed
+	# to be a write, so the texture cache knows to re-upload the
+	# sprite. Code that draws straight into .im, or hangs on to an
+	# old .array and writes into it later, should call touch() (see
+	# TextureCache.verify for tracking down missing touch()es).
+
+	def _get_array(self):
+		self._dirty = 1
+		return self._array
+
+	def _set_array(self, a):
+		self._dirty = 1
+		self._array = a
+
+	array = property(_get_array, _set_array)
+
+	def _get_alpha(self):
+		self._dirty = 1
+		return self._alpha
+
+	def _set_alpha(self, a):
+		self._dirty = 1
+		self._alpha = a
+
+	alpha = property(_get_alpha, _set_alpha)
+
+	def touch(self):
+		"""Flag image data as changed (see TextureCache).
+
+		"""
+		self._dirty = 1
 
 	def __del__(self):
 		"""Sprite clean up.
@@ -1133,6 +1223,8 @@ class ScaledSprite(object):
 
 		"""
 		self.render(clear=1)
+		if texcache is not None:
+			texcache.drop(self)
 
 	def __repr__(self):
 		return ('<ScaledSprite "%s"@(%d,%d) V%dx%d D%dx%d depth=%d on=%d>' %
@@ -1257,6 +1349,7 @@ class ScaledSprite(object):
 		start = (self.X(x1),self.Y(y1))
 		stop = (self.X(x2),self.Y(y2))
 		pygame.draw.line(self.im, C(color), start, stop, width)
+		self.touch()
 
 	def fill(self, color):
 		"""Fill sprite with specficied color.
@@ -1471,6 +1564,7 @@ class ScaledSprite(object):
 		mask = np.where(np.less(np.hypot(self.ax-x,self.ay+y), r), 1, 0)
 		a = pygame.surfarray.pixels2d(self.im)
 		a[::] = mask * a
+		self.touch()
 
 	def alpha_aperture(self, r, x=0, y=0):
 		"""Apply hard-edged circular vignette/mask in place using
@@ -1534,6 +1628,7 @@ class ScaledSprite(object):
 			bgi = bg
 		i[::] = ((alpha * i.astype(np.float)) +
 				((1.0-alpha) * bgi)).astype(np.uint8)
+		self.touch()
 		self.alpha[::] = 255;
 
 	def dim(self, mult, meanval=128.0):
@@ -1556,6 +1651,7 @@ class ScaledSprite(object):
 		pixs = pygame.surfarray.pixels3d(self.im)
 		pixs[::] = (float(meanval) + ((1.0-mult) *
 			   (pixs.astype(np.float)-float(meanval)))).astype(np.uint8)
+		self.touch()
 
 	def thresh(self, threshval):
 		Logger('Warning: Sprite.thresh --> Sprite.threshold\n')
@@ -1574,6 +1670,7 @@ class ScaledSprite(object):
 		"""
 		pixs = pygame.surfarray.pixels3d(self.im)
 		pixs[::] = np.where(np.less(pixs, threshval), 1, 255).astype(np.uint8)
+		self.touch()
 
 	def on(self):
 		"""Make sprite visible.
@@ -1663,16 +1760,14 @@ class ScaledSprite(object):
 
 			if self.texture:
 				# pre-rendered sprite...
-				tex = self.texture
+				(tex, tc) = (self.texture, None)
 			else:
-				rgba = pygame.image.tostring(self.im, 'RGBA', 1)
-				tex = _texture_create(rgba, self.w, self.h)
+				# cached texture, re-uploaded only if the sprite's changed
+				(tex, tc) = texcache.get(self)
 			_texture_blit(self.fb, tex, x, y,
 						  rotation=self.rotation,
 						  contrast=self.contrast,
-						  xscale=self.xscale, yscale=self.yscale)
-			if not self.texture:
-				_texture_del(tex)
+						  xscale=self.xscale, yscale=self.yscale, tc=tc)
 
 			if flip:
 				fb.flip()
@@ -1683,9 +1778,15 @@ class ScaledSprite(object):
 	def render(self, clear=False):
 		"""Render image data into GL texture memory for speed.
 
+		Pins a snapshot of the current image data: blit() uses it
+		until the next render(), even if the sprite changes. This
+		isn't needed for speed anymore (see TextureCache), only if
+		you want the snapshot behavior.
+
 		"""
 		if self.texture:
 			_texture_del(self.texture)
+			self.texture = None
 		if not clear:
 			s = pygame.image.tostring(self.im, 'RGBA', 1)
 			self.texture = _texture_create(s, self.w, self.h)
@@ -2145,7 +2246,7 @@ class DisplayList(object):
 
 	"""
 
-	def __init__(self, fb, comedi=True):
+	def __init__(self, fb, comedi=True, batch=True):
 		"""Instantiation method.
 
 		:param fb: framebuffer associated with this list. This is sort
@@ -2154,6 +2255,9 @@ class DisplayList(object):
 				for clearing and flipping the framebuffer after
 				updates.
 
+		:param batch: (boolean) draw sprites with vertex arrays
+				(QuadBatch) instead of one blit() at a time
+
 		"""
 
 		if comedi:
@@ -2167,6 +2271,12 @@ class DisplayList(object):
 		self.timer = Timer()
 		self.trigger = None
 		self.action = None
+		if batch:
+			self.batch = QuadBatch()
+		else:
+			self.batch = None
+		# sprites with on/off times still pending (depth order)
+		self._timed = []
 
 
 	def __del__(self):
@@ -2212,8 +2322,15 @@ class DisplayList(object):
 			for ix in range(0, len(self.sprites)):
 				if s.depth > self.sprites[ix].depth:
 					self.sprites.insert(ix, s)
-					return
-			self.sprites.append(s)
+					break
+			else:
+				self.sprites.append(s)
+			if not (on is None and off is None):
+				self._findtimed()
+
+	def _findtimed(self):
+		self._timed = [s for s in self.sprites
+					   if not (s._ontime is None and s._offtime is None)]
 
 	def delete(self, s=None):
 		"""Delete single or multiple sprites from display list.
@@ -2234,6 +2351,7 @@ class DisplayList(object):
 				self.delete(i)
 		else:
 			self.sprites.remove(s)
+		self._findtimed()
 
 	def clear(self):
 		"""Delete all sprites from the display list.
@@ -2306,20 +2424,29 @@ class DisplayList(object):
 			else:
 				self.fb.clear()
 
-		# draw sprites in depth order
+		# run on/off timers -- only sprites that still have one
 		encodes = []
-		for s in self.sprites:
-			if (not s._ontime is None) and s._timer.ms() > s._ontime:
-				# turn sprite on and clear on trigger
-				s._ontime = None
-				s.on()
-				encodes.append(s._onev)
-			elif (not s._offtime is None) and s._timer.ms() > s._offtime:
-				# turn sprite off and clear off trigger
-				s._offtime = None
-				s.off()
-				encodes.append(s._offev)
-			s.blit()
+		if self._timed:
+			for s in self._timed:
+				if (not s._ontime is None) and s._timer.ms() > s._ontime:
+					# turn sprite on and clear on trigger
+					s._ontime = None
+					s.on()
+					encodes.append(s._onev)
+				elif (not s._offtime is None) and s._timer.ms() > s._offtime:
+					# turn sprite off and clear off trigger
+					s._offtime = None
+					s.off()
+					encodes.append(s._offev)
+			if encodes:
+				self._findtimed()
+
+		# draw sprites in depth order
+		if self.batch:
+			self.batch.draw(self.fb, self.sprites)
+		else:
+			for s in self.sprites:
+				s.blit()
 
 		# possibly flip screen..
 		if flip:
@@ -2377,8 +2504,357 @@ def _texture_create(rgbastr, w, h):
 	ogl.glPopAttrib(ogl.GL_TEXTURE_BIT)
 	return (textureid, w, h)
 
+class _TexEntry(object):
+	# one cached sprite texture: its own GL texture, or a cell in
+	# an atlas page (page is not None)
+	def __init__(self, tex, x0=0, y0=0, tc=None, nbytes=0,
+				 page=None, cell=None):
+		self.tex = tex					# (textureid, w, h)
+		self.x0 = x0					# sprite's offset in texture
+		self.y0 = y0
+		self.tc = tc					# texture coords (atlas only)
+		self.nbytes = nbytes
+		self.page = page
+		self.cell = cell
+		self.shadow = None				# copy of pixels last uploaded
+
+class _AtlasPage(object):
+	def __init__(self, textureid, size, cellsize):
+		self.textureid = textureid
+		self.cellsize = cellsize		# incl. 1 pixel border all round
+		n = size / cellsize
+		self.free = [(i * cellsize, j * cellsize)
+					 for j in range(n) for i in range(n)]
+
+class TextureCache(object):
+	def __init__(self, maxbytes=128*1024*1024, atlas=64, atlassize=1024,
+				 verify=False):
+		"""GL texture cache for Sprite.blit().
+
+		Each sprite's image data stays in texture memory between
+		blits and is only re-uploaded when it's changed -- and then
+		only the band of rows that changed (glTexSubImage2D). Small
+		sprites share big textures (atlas pages) instead of getting
+		one each. Least recently used textures get thrown out when
+		the total goes over maxbytes.
+
+		Sprites flag themselves as changed when .array or .alpha are
+		accessed (or with Sprite.touch()); that's what decides when
+		to re-upload. For debugging, verify also compares the pixels
+		against a copy of what's in the texture on every blit, to
+		catch writes the flag can't see (drawing straight into .im,
+		old references to .array etc) -- eg, set texcache.verify
+		to find a task that should be calling touch().
+
+		:param maxbytes: (bytes) texture memory budget (atlas pages
+				themselves, atlassize^2*4 bytes each, aren't counted)
+
+		:param atlas: (pixels) sprites up to this size go into atlas
+				pages; 0 to disable
+
+		:param atlassize: (pixels) atlas page size
+
+		:param verify: (bool) debug: check for unflagged changes
+
+		"""
+		self.maxbytes = maxbytes
+		self.atlas = atlas
+		self.atlassize = atlassize
+		self.verify = verify
+		self.clear(gl=False)
+
+	def __repr__(self):
+		return ('<TextureCache: %d textures %dKB, %d atlas pages>' %
+				(len(self._entries), self.nbytes / 1024,
+				 sum(map(len, self._pages.values()))))
+
+	def clear(self, gl=True):
+		"""Throw everything away.
+
+		:param gl: (bool) delete the GL textures too; False if the GL
+				context is already gone
+
+		"""
+		if gl:
+			for e in self._entries.values():
+				if e.page is None:
+					_texture_del(e.tex)
+			for pages in self._pages.values():
+				for page in pages:
+					_texture_del((page.textureid,))
+		self._entries = collections.OrderedDict()	# sprite id -> entry
+		self._pages = {}						# cellsize -> [pages]
+		self._pinned = None						# see pin()
+		self.nbytes = 0
+		# stats: blits, full and partial uploads
+		self.hits = 0
+		self.uploads = 0
+		self.partial = 0
+
+	def pin(self):
+		"""Hold on to everything get() hands out until unpin().
+
+		For drawing a batch of sprites: without this, fetching a
+		later sprite could evict (or reuse the atlas cell of) the
+		texture of an earlier one that hasn't been drawn yet. The
+		cache can go over maxbytes while pinned.
+
+		"""
+		self._pinned = set()
+
+	def unpin(self):
+		"""Done drawing the batch -- evict down to maxbytes."""
+		self._pinned = None
+		self._evict()
+
+	def drop(self, s):
+		"""Release sprite's texture (if any)."""
+		e = self._entries.pop(getattr(s, '_id', None), None)
+		if e is not None:
+			self._free(e)
+
+	def get(self, s):
+		"""Get up to date texture for sprite.
+
+		:param s: (ScaledSprite)
+
+		:return: (tuple) (texture, tc) -- args for _texture_blit()
+
+		"""
+		e = self._entries.pop(s._id, None)
+		if e is not None and (e.tex[1], e.tex[2]) != (s.w, s.h):
+			# resized (rotate/scale)
+			self._free(e)
+			e = None
+
+		if e is None:
+			e = self._alloc(s)
+			e.shadow = s._pix.copy()
+			self.uploads += 1
+		elif s._dirty or self.verify:
+			rows = np.flatnonzero(np.any(s._pix != e.shadow, axis=0))
+			if len(rows):
+				(r0, r1) = (int(rows[0]), int(rows[-1]) + 1)
+				self._upload(e, s, r0, r1)
+				e.shadow[:, r0:r1] = s._pix[:, r0:r1]
+				if r1 - r0 < s.h:
+					self.partial += 1
+				else:
+					self.uploads += 1
+			else:
+				self.hits += 1
+		else:
+			self.hits += 1
+		s._dirty = 0
+
+		self._entries[s._id] = e				# most recently used
+		if self._pinned is not None:
+			self._pinned.add(s._id)
+		else:
+			self._evict()
+		return (e.tex, e.tc)
+
+	def _evict(self):
+		# least recently used first, but never the one just fetched
+		while self.nbytes > self.maxbytes and len(self._entries) > 1:
+			self._free(self._entries.popitem(last=False)[1])
+
+	def _alloc(self, s):
+		cellsize = 8
+		while cellsize < max(s.w, s.h):
+			cellsize = cellsize * 2
+		if cellsize > self.atlas:
+			rgba = pygame.image.tostring(s.im, 'RGBA', 1)
+			e = _TexEntry(_texture_create(rgba, s.w, s.h),
+						  nbytes=s.w * s.h * 4)
+		else:
+			# cell has a one pixel transparent border so linear
+			# filtering doesn't pull in the neighbors
+			cellsize = cellsize + 2
+			(page, cell) = self._cell(cellsize)
+			n = float(self.atlassize)
+			(x0, y0) = (cell[0] + 1, cell[1] + 1)
+			e = _TexEntry((page.textureid, s.w, s.h), x0=x0, y0=y0,
+						  tc=(x0 / n, y0 / n, (x0 + s.w) / n, (y0 + s.h) / n),
+						  nbytes=cellsize * cellsize * 4,
+						  page=page, cell=cell)
+			self._subimage(page.textureid, cell[0], cell[1],
+						   cellsize, cellsize, '\0' * (cellsize * cellsize * 4))
+			self._upload(e, s, 0, s.h)
+		self.nbytes += e.nbytes
+		return e
+
+	def _cell(self, cellsize):
+		pages = self._pages.setdefault(cellsize, [])
+		for page in pages:
+			if page.free:
+				return (page, page.free.pop())
+		n = self.atlassize
+		page = _AtlasPage(_texture_create('\0' * (n * n * 4), n, n)[0],
+						  n, cellsize)
+		pages.append(page)
+		return (page, page.free.pop())
+
+	def _free(self, e):
+		if e.page is None:
+			_texture_del(e.tex)
+		else:
+			e.page.free.append(e.cell)
+		self.nbytes -= e.nbytes
+
+	def _upload(self, e, s, r0, r1):
+		# surface rows r0..r1-1 -> texture; the texture's flipped
+		# (row 0 is the bottom of the sprite)
+		if r0 == 0 and r1 == s.h:
+			im = s.im
+		else:
+			im = s.im.subsurface((0, r0, s.w, r1 - r0))
+		self._subimage(e.tex[0], e.x0, e.y0 + (s.h - r1), s.w, r1 - r0,
+					   pygame.image.tostring(im, 'RGBA', 1))
+
+	def _subimage(self, textureid, x, y, w, h, rgbastr):
+		ogl.glPushAttrib(ogl.GL_TEXTURE_BIT)
+		ogl.glBindTexture(ogl.GL_TEXTURE_2D, textureid)
+		ogl.glTexSubImage2D(ogl.GL_TEXTURE_2D, 0, x, y, w, h,
+							ogl.GL_RGBA, ogl.GL_UNSIGNED_BYTE, rgbastr)
+		ogl.glPopAttrib()
+
+# shared by all sprites (see ScaledSprite.blit)
+texcache = TextureCache()
+
+class QuadBatch(object):
+	def __init__(self):
+		"""Retained-mode sprite drawing for DisplayList.
+
+		Each visible sprite is a textured quad (position, scale,
+		rotation, contrast -- same as _texture_blit) in a set of
+		numpy vertex/texcoord/color arrays. Every frame the per-sprite
+		parameters are compared to last frame's and only the quads
+		that changed get their vertices recomputed; then the whole
+		lot goes to the card with one glDrawArrays() per run of
+		sprites sharing a texture (small sprites share atlas pages,
+		see TextureCache), instead of a glBegin/glEnd block and
+		matrix/attribute push/pop per sprite.
+
+		Anything in the list that isn't a ScaledSprite (PolySprite,
+		TextSprite..) is still drawn with its own blit(), in order.
+
+		"""
+		self._ids = None
+		self._p = None
+		self._v = np.zeros((0, 2), np.float32)
+		self._t = np.zeros((0, 2), np.float32)
+		self._c = np.zeros((0, 4), np.float32)
+		# stats: quads drawn/recomputed and draw calls, last frame
+		self.nquads = 0
+		self.nchanged = 0
+		self.ndraws = 0
+
+	def draw(self, fb, sprites):
+		"""Draw sprites (bottom to top).
+
+		:param fb: (FrameBuffer)
+
+		:param sprites: (list) sprites in drawing order
+
+		"""
+		quads = []
+		others = []
+		for s in sprites:
+			if isinstance(s, ScaledSprite):
+				if s._on and not s.fb is None:
+					quads.append(s)
+			else:
+				others.append((len(quads), s))
+
+		n = len(quads)
+		texids = [None] * n
+		p = np.empty((n, 10), np.float64)
+		# keep this frame's textures until they've been drawn
+		texcache.pin()
+		try:
+			self._draw(fb, quads, others, texids, p)
+		finally:
+			texcache.unpin()
+
+	def _draw(self, fb, quads, others, texids, p):
+		n = len(quads)
+		for k in range(n):
+			s = quads[k]
+			if s.texture:
+				(tex, tc) = (s.texture, (0.0, 0.0, 1.0, 1.0))
+			else:
+				(tex, tc) = texcache.get(s)
+				if tc is None:
+					tc = (0.0, 0.0, 1.0, 1.0)
+			texids[k] = tex[0]
+			p[k] = (s.x, s.y, tex[1] * s.xscale, tex[2] * s.yscale,
+					s.rotation, s.contrast) + tuple(tc)
+		p[:, 0] += fb.hw
+		p[:, 1] += fb.hh
+
+		ids = [q._id for q in quads]
+		if ids == self._ids:
+			changed = np.flatnonzero(np.any(p != self._p, axis=1))
+		else:
+			self._v = np.zeros((4 * n, 2), np.float32)
+			self._t = np.zeros((4 * n, 2), np.float32)
+			self._c = np.ones((4 * n, 4), np.float32)
+			changed = np.arange(n)
+		if len(changed):
+			self._quads(p[changed], changed)
+		(self._ids, self._p) = (ids, p)
+		self.nquads = n
+		self.nchanged = len(changed)
+		self.ndraws = 0
+
+		ogl.glPushClientAttrib(ogl.GL_CLIENT_VERTEX_ARRAY_BIT)
+		ogl.glPushAttrib(ogl.GL_TEXTURE_BIT | ogl.GL_CURRENT_BIT)
+		try:
+			ogl.glEnableClientState(ogl.GL_VERTEX_ARRAY)
+			ogl.glEnableClientState(ogl.GL_TEXTURE_COORD_ARRAY)
+			ogl.glEnableClientState(ogl.GL_COLOR_ARRAY)
+			ogl.glVertexPointer(2, ogl.GL_FLOAT, 0, self._v)
+			ogl.glTexCoordPointer(2, ogl.GL_FLOAT, 0, self._t)
+			ogl.glColorPointer(4, ogl.GL_FLOAT, 0, self._c)
+			a = 0
+			for (b, s) in others + [(n, None)]:
+				self._drawrange(texids, a, b)
+				if s is not None:
+					s.blit()
+				a = b
+		finally:
+			ogl.glPopAttrib()
+			ogl.glPopClientAttrib()
+
+	def _quads(self, p, rows):
+		# vertices for quads `rows` from their params p (see draw)
+		(cx, cy, w, h, rot, contrast, u0, v0, u1, v1) = p.T
+		theta = np.pi * rot / 180.0
+		(c, s) = (np.cos(theta)[:, np.newaxis], np.sin(theta)[:, np.newaxis])
+		dx = np.array((-0.5, 0.5, 0.5, -0.5)) * w[:, np.newaxis]
+		dy = np.array((-0.5, -0.5, 0.5, 0.5)) * h[:, np.newaxis]
+		ix = (4 * rows[:, np.newaxis] + np.arange(4)).ravel()
+		self._v[ix, 0] = (cx[:, np.newaxis] + dx * c - dy * s).ravel()
+		self._v[ix, 1] = (cy[:, np.newaxis] + dx * s + dy * c).ravel()
+		self._t[ix, 0] = np.array((u0, u1, u1, u0)).T.ravel()
+		self._t[ix, 1] = np.array((v0, v0, v1, v1)).T.ravel()
+		self._c[ix, 3] = np.repeat(contrast, 4)
+
+	def _drawrange(self, texids, a, b):
+		# one draw call per run of quads with the same texture
+		while a < b:
+			k = a + 1
+			while k < b and texids[k] == texids[a]:
+				k = k + 1
+			ogl.glBindTexture(ogl.GL_TEXTURE_2D, texids[a])
+			ogl.glDrawArrays(ogl.GL_QUADS, 4 * a, 4 * (k - a))
+			self.ndraws += 1
+			a = k
+
 def _texture_blit(fb, texture, x, y,
-				  rotation=0, draw=1, contrast=1.0, xscale=1.0, yscale=1.0):
+				  rotation=0, draw=1, contrast=1.0, xscale=1.0, yscale=1.0,
+				  tc=None):
 	"""Transfer (BLIT) GL texture to display.
 
 	(x, y) are center coords, where (0,0) is screen center.
@@ -2390,6 +2866,10 @@ def _texture_blit(fb, texture, x, y,
 	and/or GL_TEXTURE_MAG_FILTER (default is GL_LINEAR). First is
 	for scaling down, second scaling up.
 
+	tc is the (u0, v0, u1, v1) texture coordinate box to draw, for
+	textures that are part of a bigger texture (an atlas cell);
+	None for the whole texture.
+
 	:note: INTERNAL USE ONLY
 
 	"""
@@ -2413,7 +2893,11 @@ def _texture_blit(fb, texture, x, y,
 		ogl.glRotate(rotation, 0, 0, 1.0)
 		ogl.glTranslate(-x, -y, 0)
 
-	ic = ((0,0), (1,0), (1,1), (0,1))
+	if tc is None:
+		ic = ((0,0), (1,0), (1,1), (0,1))
+	else:
+		(u0, v0, u1, v1) = tc
+		ic = ((u0,v0), (u1,v0), (u1,v1), (u0,v1))
 	oc = ((cx, cy), (cx+nw, cy), (cx+nw, cy+nh), (cx, cy+nh))
 
 	ogl.glBegin(ogl.GL_QUADS)
@@ -2779,6 +3263,41 @@ def drawtest(fb, s):
 	fb.flip()
 
 
+def displaylist_benchmark(fb, counts=(100, 500, 2000), nframes=100, size=8):
+	"""Time DisplayList.update() with and without QuadBatch.
+
+	Draws n small noise sprites (a tenth of them moving each frame)
+	and reports frames/sec. Run with LIBGL_ALWAYS_SOFTWARE=1 to
+	benchmark on the Mesa software renderer.
+
+	"""
+	for n in counts:
+		sprites = []
+		for k in range(n):
+			s = Sprite(size, size,
+					   x=int(np.random.uniform(-fb.hw, fb.hw)),
+					   y=int(np.random.uniform(-fb.hh, fb.hh)),
+					   fb=fb, on=1)
+			s.noise(0.5)
+			sprites.append(s)
+		for batch in (False, True):
+			dl = DisplayList(fb, comedi=False, batch=batch)
+			dl.add(sprites)
+			dl.update()
+			ogl.glFinish()
+			t0 = time.time()
+			for k in range(nframes):
+				for s in sprites[::10]:
+					s.rmove(1, 0)
+				dl.update()
+				ogl.glFinish()
+			t = time.time() - t0
+			print '%5d sprites %-9s %7.1f fps' % \
+				  (n, batch and 'batched' or 'immediate', nframes / t)
+			dl.delete()
+		del sprites
+	fb.flip()
+
 def tickbox(x, y, width, height, lwidth, color, fb):
 	fs = 1.50
 	pts = np.array(( (0, 1), (0, fs), (0, -1), (0, -fs),
@@ -2790,7 +3309,6 @@ def tickbox(x, y, width, height, lwidth, color, fb):
 	return s
 
 if __name__ == '__main__':
-	from simpletimer import Timer
 	from spritetools import *
 
 	def drawtest2(fb):
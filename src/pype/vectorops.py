@@ -48,14 +48,61 @@ def zeros(v):
 		v = np.array(v, np.float)
 	return len(v)-len(np.nonzero(v))
 
-def smooth_boxcar(v, kn=1):
+def smooth_boxcar(v, kn=1, starts=None):
 	"""Smooth vector using a boxcar (square) filter (ie, running
 	average), where kn=1 is a 3pt average, kn=2 is a 5pt average etc..
 
+	Vectorized version of the original loop (kept below as
+	_smooth_boxcar_loop()); sums are accumulated in the same order,
+	so for kn <= 3 the results are identical (otherwise they can
+	differ in the last bit or so).
+
+	:param starts: (vector) optional start indices of independent
+		traces concatenated together in v -- the window is clipped at
+		the trace boundaries just like it is at the ends of v.
+
 	"""
 	if not isinstance(v, np.ndarray):
 		v = np.array(v, np.float)
 	n = len(v)
+	if n == 0 or kn < 1:
+		return _smooth_boxcar_loop(v, kn)
+	v = np.asarray(v, np.float)
+	if starts is None:
+		starts = [0]
+	starts = np.asarray(starts)
+	stops = np.append(starts[1:], n)
+
+	# whole window: mean(v[ix-kn:ix+kn])
+	vout = np.zeros(n)
+	if n >= 2 * kn:
+		inner = vout[kn:(n-kn+1)]
+		for k in range(-kn, kn):
+			inner += v[(kn+k):(n-kn+1+k)]
+		inner /= 2 * kn
+
+	# redo samples within kn of the start or end of a trace, where
+	# the window is clipped
+	ix = np.concatenate((np.add.outer(starts, np.arange(kn)).ravel(),
+						 np.add.outer(stops, np.arange(-kn, 0)).ravel()))
+	seg = np.searchsorted(starts, ix, 'right') - 1
+	ok = (ix >= starts[seg]) & (ix < stops[seg])
+	ix = np.unique(ix[ok])
+	seg = np.searchsorted(starts, ix, 'right') - 1
+	a = np.maximum(ix - kn, starts[seg])
+	b = np.minimum(ix + kn, stops[seg])
+	vedge = np.zeros(len(ix))
+	for k in range(-kn, kn):
+		j = ix + k
+		vedge += np.where((j >= a) & (j < b), v[np.clip(j, 0, n-1)], 0.0)
+	vout[ix] = vedge / (b - a)
+	return vout
+
+def _smooth_boxcar_loop(v, kn=1):
+	"""Original (pure python) boxcar filter; see smooth_boxcar()."""
+	if not isinstance(v, np.ndarray):
+		v = np.array(v, np.float)
+	n = len(v)
 	vout = np.zeros(v.shape)
 	for ix in range(0, n):
 		a = ix - kn
@@ -94,3 +141,125 @@ def nanround(n, digits=0):
         n = round(n, digits)
     return n
 
+
+def find_ttl(t, x, thresh=500, polarity=1, hysteresis=0, minwidth=0):
+	"""Find TTL pulses in x (vectorized).
+
+	Drop-in replacement for the original sample-by-sample loop in
+	pype._find_ttl() (kept below as _find_ttl_loop()). With the default
+	hysteresis and minwidth it returns exactly the same timestamps.
+
+	*NB* polarity is backwards (ie, polarity=1 means negative going),
+	but it's too late to change now..
+
+	:param t: (vector) sample times (ms)
+
+	:param x: (vector) waveform from dacq device
+
+	:param thresh: (a2d units) threshold for detecting pulse onsets
+
+	:param polarity: (int) >0 for negative going, <=0 for positive
+		going pulses.
+
+	:param hysteresis: (a2d units) pulse doesn't end until signal goes
+		this far back past thresh (0 for none).
+
+	:param minwidth: (ms) discard pulses shorter than this (0 for no
+		limit). Pulses still going at the end of the trace are kept.
+
+	:return: (array) time of first sample of each pulse
+
+	"""
+	t = np.asarray(t)
+	x = np.asarray(x)
+	if len(x) == 0:
+		return t[:0]
+
+	hysteresis = abs(hysteresis)
+	if polarity > 0:
+		on = x < thresh
+		off = x > (thresh + hysteresis)
+	else:
+		on = x > thresh
+		off = x < (thresh - hysteresis)
+
+	# samples between the on and off levels hold the previous state;
+	# carry the index of the last sample with a defined state forward
+	# (-1 means nothing's happened yet and the initial state is 'off')
+	ix = np.where(on | off, np.arange(len(x)), -1)
+	ix = np.maximum.accumulate(ix)
+	inpulse = (ix >= 0) & on[ix]
+
+	prev = np.concatenate(([False], inpulse[:-1]))
+	onsets = np.flatnonzero(inpulse & ~prev)
+
+	if minwidth > 0 and len(onsets):
+		# rising and falling edges alternate, so the kth offset
+		# always belongs to the kth onset
+		offsets = np.flatnonzero(prev & ~inpulse)
+		width = np.empty(len(onsets))
+		width.fill(np.inf)
+		width[:len(offsets)] = t[offsets] - t[onsets[:len(offsets)]]
+		onsets = onsets[width >= minwidth]
+
+	return t[onsets]
+
+def _find_ttl_loop(t, x, thresh=500, polarity=1):
+	"""Original (pure python) TTL detector; see find_ttl()."""
+	times = []
+	inpulse = 0
+	if polarity > 0:
+		for i in range(0, len(t)):
+			if (not inpulse) and (x[i] < thresh):
+				times.append(t[i])
+				inpulse = 1
+			elif inpulse and (x[i] > thresh):
+				inpulse = 0
+	else:
+		for i in range(0, len(t)):
+			if (not inpulse) and (x[i] > thresh):
+				times.append(t[i])
+				inpulse = 1
+			elif inpulse and (x[i] < thresh):
+				inpulse = 0
+	return times
+
+def benchmark_ttl(secs=60, fs=1000, nmax=10):
+	"""Compare find_ttl() to the original loop on synthetic traces.
+
+	Generates a noisy secs-long trace sampled at fs Hz with random
+	pulses (both polarities), checks the two give identical results
+	and prints the per-trace run time of each.
+
+	"""
+	import time
+
+	n = int(secs * fs)
+	t = np.arange(n) * (1000.0 / fs)
+	x = 2000 + np.random.randint(-50, 50, n)
+	for k in np.random.randint(0, n - 5, n / 200):
+		x[k:k+np.random.randint(1, 5)] = 0
+	# a few samples exactly at threshold to exercise the 'hold' case
+	x[np.random.randint(0, n, n / 500)] = 500
+
+	for polarity, trace in ((1, x), (0, 4000 - x)):
+		thresh = 500 if polarity > 0 else 3500
+		old = _find_ttl_loop(t, trace, thresh, polarity)
+		new = find_ttl(t, trace, thresh, polarity)
+		if not np.array_equal(np.array(old), new):
+			print 'polarity=%d: MISMATCH (%d vs %d pulses)' % \
+				  (polarity, len(old), len(new))
+
+		t0 = time.time()
+		for k in range(nmax):
+			_find_ttl_loop(t, trace, thresh, polarity)
+		tloop = (time.time() - t0) / nmax
+
+		t0 = time.time()
+		for k in range(nmax):
+			find_ttl(t, trace, thresh, polarity)
+		tvec = (time.time() - t0) / nmax
+
+		print 'polarity=%d %ds@%dHz %d pulses: loop %.2fms numpy %.2fms (%.0fx)' % \
+			  (polarity, secs, fs, len(new), 1000.0 * tloop, 1000.0 * tvec,
+			   tloop / max(tvec, 1e-9))